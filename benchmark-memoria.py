@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark de memória do plano
+
+Gera um HD simulado com cria-muito-arquivo.py (sempre com a mesma semente),
+grava o plano dele com maestro.py --save-plan e carrega esse plano em
+processos separados, cada um guardando as operações de um jeito:
+
+- "Path + dict": um Path e um dicionário por arquivo, como uma lista de
+  arquivos com a linha do relatório de cada um;
+- "PlanOp": uma tupla de PlanOp por arquivo, com os caminhos completos;
+- "PlanTable": a tabela em colunas que Plan.load() monta.
+
+Para cada um é medido o pico de memória (RSS máximo do processo, via wait4),
+descontado o de um processo que só importa o maestro, e dividido pelo
+número de arquivos. A gravação do plano, que também varre o HD, é medida
+junto.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import argparse
+import subprocess
+from pathlib import Path
+
+PASTA = Path(__file__).resolve().parent
+
+
+def ler_operacoes(plano: Path):
+    """Percorre as operações do plano como dicionários, pulando o cabeçalho."""
+    with open(plano, encoding="utf-8") as f:
+        f.readline()
+        for linha in f:
+            yield json.loads(linha)
+
+
+# Representação -> função que carrega o plano nela
+REPRESENTACOES = {
+    "base": lambda maestro, plano: None,
+    "Path + dict": lambda maestro, plano: [(Path(op["source"]), op) for op in ler_operacoes(plano)],
+    "PlanOp": lambda maestro, plano: tuple(maestro.PlanOp(**op) for op in ler_operacoes(plano)),
+    "PlanTable": lambda maestro, plano: maestro.Plan.load(plano).ops,
+}
+
+
+def rodar(comando: list) -> int:
+    """
+    Roda o comando e retorna o RSS máximo do processo em KiB. No Linux o
+    filho herda o pico de RSS do pai no fork, por isso este processo não
+    gera o HD nem importa o maestro: tudo roda em filhos.
+    """
+    processo = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    erros = processo.stderr.read()
+    # wait4 devolve o uso de recursos do filho, inclusive o pico de RSS
+    _, status, uso = os.wait4(processo.pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"{' '.join(comando)} falhou:\n{erros.decode(errors='replace')}")
+    return uso.ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de memória do plano")
+    parser.add_argument("--pasta", type=Path,
+                        help="Onde gerar o HD simulado (padrão: a pasta temporária do sistema)")
+    parser.add_argument("--arquivos", type=int, default=100000)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--profundidade", type=int, default=3)
+    parser.add_argument("--ramificacao", type=int, default=10)
+    # Usado pelos processos filhos: carrega o plano numa representação e sai
+    parser.add_argument("--carregar", nargs=2, metavar=("REPRESENTACAO", "PLANO"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.carregar:
+        sys.path.insert(0, str(PASTA))
+        import maestro
+        nome, plano = args.carregar
+        REPRESENTACOES[nome](maestro, Path(plano))
+        return
+
+    pasta = (args.pasta or Path(tempfile.gettempdir())) / "maestro_benchmark_memoria"
+    shutil.rmtree(pasta, ignore_errors=True)
+    try:
+        origem, plano = pasta / "origem", pasta / "plano.jsonl"
+        # O conteúdo não muda o tamanho do plano: arquivos vazios bastam
+        rodar([
+            sys.executable, str(PASTA / "cria-muito-arquivo.py"), "--pasta", str(origem),
+            "--arquivos", str(args.arquivos), "--semente", str(args.semente),
+            "--profundidade", str(args.profundidade), "--ramificacao", str(args.ramificacao),
+            "--tamanho-max", "0"
+        ])
+        print(f"\n{args.arquivos} arquivos, semente {args.semente}\n")
+        print(f"{'representação':<16}{'RSS (MiB)':>12}{'acima da base':>16}{'bytes/arquivo':>16}")
+
+        rss = rodar([sys.executable, str(PASTA / "maestro.py"), "-o", str(origem),
+                     "-d", str(pasta / "destino"), "--save-plan", str(plano)])
+        print(f"{'--save-plan':<16}{rss / 1024:>12.1f}")
+        arquivos = sum(1 for _ in ler_operacoes(plano))
+
+        base = None
+        for nome in REPRESENTACOES:
+            rss = rodar([sys.executable, __file__, "--carregar", nome, str(plano)])
+            base = rss if base is None else base
+            acima = (rss - base) * 1024
+            print(f"{nome:<16}{rss / 1024:>12.1f}{acima / 2**20:>16.1f}{acima / arquivos:>16.0f}")
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
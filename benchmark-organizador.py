@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos organizadores
+
+Gera um HD simulado com cria-muito-arquivo.py (sempre com a mesma semente)
+e roda o maestro.py, suas variações de motor e o maestro-eficiente.py nos
+modos dry-run, cópia e movimentação, em tmpfs (/dev/shm) e em disco. Cada
+execução é um processo separado que parte de uma cópia nova do HD, e para
+cada uma são medidos:
+
+- tempo e arquivos/s;
+- pico de memória (RSS máximo do processo, via wait4);
+- chamadas de sistema, contadas com strace -c quando --syscalls é passado
+  (numa execução extra, já que o strace deixa o processo bem mais lento).
+
+Com --saida os resultados vão para um JSON; com --comparar um JSON anterior
+é lido e o script termina com erro se algum cenário ficou mais lento que a
+tolerância, o que serve para pegar regressões de desempenho.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+import importlib.util
+from pathlib import Path
+
+PASTA = Path(__file__).resolve().parent
+
+spec = importlib.util.spec_from_file_location("cria_muito_arquivo", PASTA / "cria-muito-arquivo.py")
+gerador = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gerador)
+
+# Cenário -> (script, opções extras)
+CENARIOS = {
+    "maestro": ("maestro.py", []),
+    "maestro --workers 4": ("maestro.py", ["--workers", "4"]),
+    "maestro --scan-threads 4": ("maestro.py", ["--scan-threads", "4"]),
+    "maestro --engine async": ("maestro.py", ["--engine", "async"]),
+    "maestro-eficiente": ("maestro-eficiente.py", []),
+}
+
+# Modo -> opções de linha de comando
+MODOS = {
+    "dry-run": ["--dry-run"],
+    "copia": ["--copia"],
+    "mover": [],
+}
+
+
+def rodar(comando: list):
+    """Roda o comando respondendo "s" às confirmações; retorna (segundos, RSS máximo em KiB)."""
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(
+        comando, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    processo.stdin.write(b"s\n" * 10)
+    processo.stdin.close()
+    erros = processo.stderr.read()
+    # wait4 devolve o uso de recursos do filho, inclusive o pico de RSS
+    _, status, uso = os.wait4(processo.pid, 0)
+    tempo = time.perf_counter() - inicio
+    processo.returncode = os.waitstatus_to_exitcode(status)
+    if processo.returncode != 0:
+        raise RuntimeError(f"{' '.join(comando)} falhou:\n{erros.decode(errors='replace')}")
+    return tempo, uso.ru_maxrss
+
+
+def contar_syscalls(comando: list) -> int:
+    """Roda o comando sob strace -c -f e soma a coluna de chamadas."""
+    with tempfile.NamedTemporaryFile("r", suffix=".strace") as saida:
+        rodar(["strace", "-c", "-f", "-o", saida.name] + comando)
+        total = 0
+        for linha in saida:
+            partes = linha.split()
+            # % time, seconds, usecs/call, calls, [errors], syscall
+            if len(partes) >= 5 and partes[-1] != "total" and partes[3].isdigit():
+                try:
+                    float(partes[0])
+                except ValueError:
+                    continue
+                total += int(partes[3])
+        return total
+
+
+def preparar(modelo: Path, trabalho: Path):
+    """Recria a origem a partir do HD modelo e apaga o destino anterior."""
+    shutil.rmtree(trabalho, ignore_errors=True)
+    shutil.copytree(modelo, trabalho / "origem", copy_function=shutil.copy2)
+    return trabalho / "origem", trabalho / "destino"
+
+
+def medir(alvo: Path, args) -> list:
+    """Roda todos os cenários e modos em alvo; retorna a lista de resultados."""
+    modelo = alvo / "modelo"
+    trabalho = alvo / "execucao"
+    shutil.rmtree(modelo, ignore_errors=True)
+    gerador.gerar(
+        modelo, args.arquivos, args.semente, args.profundidade, args.ramificacao,
+        args.tamanho_max, args.distribuicao, args.duplicados, args.colisoes
+    )
+
+    resultados = []
+    for cenario in args.cenarios:
+        script, extras = CENARIOS[cenario]
+        for modo in args.modos:
+            tempos = []
+            rss = 0
+            for _ in range(args.repeticoes):
+                origem, destino = preparar(modelo, trabalho)
+                comando = [sys.executable, str(PASTA / script), "-o", str(origem), "-d", str(destino)]
+                comando += MODOS[modo] + extras
+                tempo, pico = rodar(comando)
+                tempos.append(tempo)
+                rss = max(rss, pico)
+            syscalls = None
+            if args.syscalls:
+                origem, destino = preparar(modelo, trabalho)
+                syscalls = contar_syscalls(comando)
+            tempo = min(tempos)
+            resultados.append({
+                "cenario": cenario,
+                "alvo": str(alvo.parent),
+                "modo": modo,
+                "arquivos": args.arquivos,
+                "segundos": round(tempo, 4),
+                "arquivos_por_s": round(args.arquivos / tempo, 1),
+                "pico_rss_kib": rss,
+                "syscalls": syscalls,
+            })
+            mostrar(resultados[-1])
+    shutil.rmtree(trabalho, ignore_errors=True)
+    shutil.rmtree(modelo, ignore_errors=True)
+    return resultados
+
+
+def mostrar(r: dict):
+    syscalls = "-" if r["syscalls"] is None else str(r["syscalls"])
+    print(f"{r['cenario']:<28}{r['alvo']:<16}{r['modo']:<9}{r['segundos']:>10.3f}"
+          f"{r['arquivos_por_s']:>12.0f}{r['pico_rss_kib'] / 1024:>10.1f}{syscalls:>11}")
+
+
+def comparar(resultados: list, anterior: Path, tolerancia: float) -> list:
+    """Retorna as linhas dos cenários mais lentos que no JSON anterior além da tolerância."""
+    base = {
+        (r["cenario"], r["alvo"], r["modo"]): r
+        for r in json.loads(anterior.read_text(encoding="utf-8"))
+    }
+    regressoes = []
+    for r in resultados:
+        antes = base.get((r["cenario"], r["alvo"], r["modo"]))
+        if antes and r["segundos"] > antes["segundos"] * (1 + tolerancia):
+            regressoes.append(
+                f"{r['cenario']} ({r['modo']}, {r['alvo']}): "
+                f"{antes['segundos']:.3f}s -> {r['segundos']:.3f}s"
+            )
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos organizadores")
+    parser.add_argument("--alvos", type=Path, nargs="+",
+                        help="Pastas onde gerar e organizar o HD (padrão: /dev/shm e a pasta temporária do sistema)")
+    parser.add_argument("--cenarios", nargs="+", choices=list(CENARIOS), default=list(CENARIOS),
+                        help="Organizadores a medir")
+    parser.add_argument("--modos", nargs="+", choices=list(MODOS), default=list(MODOS),
+                        help="Modos a medir")
+    parser.add_argument("--repeticoes", type=int, default=3,
+                        help="Execuções por cenário; vale o melhor tempo")
+    parser.add_argument("--syscalls", action="store_true",
+                        help="Conta as chamadas de sistema com strace (execução extra por cenário)")
+    parser.add_argument("--saida", type=Path, help="Grava os resultados neste JSON")
+    parser.add_argument("--comparar", type=Path, help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2,
+                        help="Quanto mais lento (fração) conta como regressão ao comparar")
+    # Parâmetros do HD simulado, os mesmos de cria-muito-arquivo.py
+    parser.add_argument("--arquivos", type=int, default=2000)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--profundidade", type=int, default=2)
+    parser.add_argument("--ramificacao", type=int, default=5)
+    parser.add_argument("--tamanho-max", type=int, default=10240)
+    parser.add_argument("--distribuicao", choices=["uniforme", "lognormal"], default="uniforme")
+    parser.add_argument("--duplicados", type=float, default=0.0)
+    parser.add_argument("--colisoes", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.syscalls and not shutil.which("strace"):
+        print("strace não encontrado; instale-o ou rode sem --syscalls")
+        sys.exit(1)
+
+    alvos = args.alvos
+    if not alvos:
+        alvos = [Path(tempfile.gettempdir())]
+        if Path("/dev/shm").is_dir():
+            alvos.insert(0, Path("/dev/shm"))
+
+    print(f"\n{args.arquivos} arquivos, semente {args.semente}, melhor de {args.repeticoes}\n")
+    print(f"{'cenário':<28}{'alvo':<16}{'modo':<9}{'tempo (s)':>10}{'arquivos/s':>12}"
+          f"{'RSS (MiB)':>10}{'syscalls':>11}")
+    resultados = []
+    for alvo in alvos:
+        pasta = alvo / "maestro_benchmark"
+        try:
+            resultados += medir(pasta, args)
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    if args.saida:
+        args.saida.write_text(json.dumps(resultados, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\nResultados gravados em {args.saida}")
+    if args.comparar:
+        regressoes = comparar(resultados, args.comparar, args.tolerancia)
+        if regressoes:
+            print(f"\nRegressões (mais de {args.tolerancia:.0%} mais lento):")
+            for linha in regressoes:
+                print(f"  {linha}")
+            sys.exit(1)
+        print("\nNenhuma regressão encontrada.")
+
+
+if __name__ == "__main__":
+    main()
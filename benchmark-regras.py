@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark de classificação por regras
+
+Mede quanto custa classificar um arquivo com o RuleSet do maestro conforme
+o número de regras cresce: só as regras embutidas, e depois elas somadas a
+centenas de regras por extensão e por glob (metade por prefixo, como
+"IMG_12*", metade por sufixo, como "*.e12"). Para comparar, as mesmas
+regras são testadas uma a uma, em ordem, como faria um laço simples.
+
+Os nomes vêm de cria-muito-arquivo.py (mesma semente, mesmas extensões e
+nomes base), sem criar nenhum arquivo.
+"""
+
+import sys
+import time
+import random
+import string
+import argparse
+import importlib.util
+from pathlib import Path
+
+PASTA = Path(__file__).resolve().parent
+sys.path.insert(0, str(PASTA))
+import maestro
+
+spec = importlib.util.spec_from_file_location("cria_muito_arquivo", PASTA / "cria-muito-arquivo.py")
+gerador = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gerador)
+
+
+def gerar_nomes(quantidade: int, semente: int) -> list:
+    """Nomes no formato de cria-muito-arquivo.py: base_xxxxx.ext."""
+    rnd = random.Random(semente)
+    return [
+        rnd.choice(gerador.nomes_base) + "_"
+        + "".join(rnd.choices(string.ascii_lowercase + string.digits, k=5))
+        + rnd.choice(gerador.all_exts)
+        for _ in range(quantidade)
+    ]
+
+
+def gerar_regras(quantidade: int) -> list:
+    """quantidade regras por extensão e outras tantas por glob, antes das embutidas."""
+    regras = [maestro.Rule(f"Ext_{n}", extensions=[f".e{n}"]) for n in range(quantidade)]
+    for n in range(quantidade):
+        glob = f"{gerador.nomes_base[n % len(gerador.nomes_base)]}_{n}*" if n % 2 else f"*.e{n}"
+        regras.append(maestro.Rule(f"Glob_{n}", globs=[glob]))
+    return regras + maestro.default_rules()
+
+
+def por_regras(regras: maestro.RuleSet, nomes: list):
+    for nome in nomes:
+        regras.match(nome, maestro.split_extension(nome), 1000, 0, nome)
+
+
+def uma_a_uma(regras: maestro.RuleSet, nomes: list):
+    for nome in nomes:
+        ext = maestro.split_extension(nome)
+        for regra in regras.rules:
+            if ((regra.extensions is None or ext in regra.extensions)
+                    and regra.accepts(nome, 1000, 0, nome)):
+                break
+
+
+def medir(funcao, regras, nomes: list, repeticoes: int) -> float:
+    """Melhor tempo por arquivo, em microssegundos."""
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(regras, nomes)
+        tempo = time.perf_counter() - inicio
+        melhor = tempo if melhor is None else min(melhor, tempo)
+    return melhor / len(nomes) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de classificação por regras")
+    parser.add_argument("--arquivos", type=int, default=20000)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--regras", type=int, nargs="+", default=[0, 10, 100, 500],
+                        help="Regras extras por extensão e por glob em cada medição")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    nomes = gerar_nomes(args.arquivos, args.semente)
+    print(f"\n{args.arquivos} nomes, semente {args.semente}, melhor de {args.repeticoes}\n")
+    print(f"{'regras':>8}{'compilar (s)':>14}{'RuleSet (µs)':>15}{'uma a uma (µs)':>17}")
+    for quantidade in args.regras:
+        inicio = time.perf_counter()
+        regras = maestro.RuleSet(gerar_regras(quantidade))
+        compilar = time.perf_counter() - inicio
+        rapido = medir(por_regras, regras, nomes, args.repeticoes)
+        lento = medir(uma_a_uma, regras, nomes, args.repeticoes)
+        print(f"{len(regras.rules):>8}{compilar:>14.3f}{rapido:>15.2f}{lento:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark de varredura de diretórios
+
+Compara o tempo para listar todos os arquivos de uma árvore com os.walk,
+com a varredura serial do maestro (os.scandir) e com o ParallelScanner em
+diferentes números de threads.
+
+A árvore padrão é a criada por cria-muito-arquivo.py (HD_SIMULADO_GRANDE).
+Com --frio o cache de páginas do Linux é esvaziado antes de cada medição
+(exige root), simulando a primeira varredura de um disco ou de um
+compartilhamento de rede, que é onde as threads fazem diferença.
+"""
+
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import maestro
+
+
+def esvaziar_cache():
+    """Descarta o cache de páginas, dentries e inodes (Linux, root)."""
+    os.sync()
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def contar_os_walk(raiz: Path, destino: Path) -> int:
+    total = 0
+    for pasta, subpastas, arquivos in os.walk(raiz):
+        subpastas[:] = [s for s in subpastas if Path(pasta, s) != destino]
+        total += len(arquivos)
+    return total
+
+
+def contar_maestro(raiz: Path, destino: Path, threads: int) -> int:
+    return sum(1 for _ in maestro.iter_dir_entries(raiz, destino, threads=threads))
+
+
+def medir(funcao, repeticoes: int, frio: bool):
+    """Retorna (melhor tempo, arquivos encontrados) de várias execuções."""
+    melhor = None
+    arquivos = 0
+    for _ in range(repeticoes):
+        if frio:
+            esvaziar_cache()
+        inicio = time.perf_counter()
+        arquivos = funcao()
+        tempo = time.perf_counter() - inicio
+        melhor = tempo if melhor is None else min(melhor, tempo)
+    return melhor, arquivos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de varredura de diretórios")
+    parser.add_argument("raiz", nargs="?", type=Path, default=Path("HD_SIMULADO_GRANDE"),
+                        help="Árvore a varrer (padrão: a criada por cria-muito-arquivo.py)")
+    parser.add_argument("--threads", type=int, nargs="+", default=[2, 4, 8, 16],
+                        help="Números de threads a testar no ParallelScanner")
+    parser.add_argument("--repeticoes", type=int, default=3,
+                        help="Execuções por método; vale o melhor tempo")
+    parser.add_argument("--frio", action="store_true",
+                        help="Esvazia o cache do sistema antes de cada execução (Linux, root)")
+    args = parser.parse_args()
+
+    raiz = args.raiz.resolve()
+    if not raiz.is_dir():
+        print(f"Pasta {raiz} não encontrada. Rode antes: python cria-muito-arquivo.py")
+        sys.exit(1)
+    # Destino fictício, só para exercitar a exclusão da pasta de destino
+    destino = raiz / "_organizado"
+
+    metodos = [
+        ("os.walk", lambda: contar_os_walk(raiz, destino)),
+        ("maestro serial", lambda: contar_maestro(raiz, destino, 1)),
+    ] + [
+        (f"maestro {n} threads", lambda n=n: contar_maestro(raiz, destino, n))
+        for n in args.threads
+    ]
+
+    print(f"\nVarrendo {raiz} ({'cache frio' if args.frio else 'cache quente'}, "
+          f"melhor de {args.repeticoes})\n")
+    print(f"{'método':<22}{'tempo (s)':>12}{'arquivos/s':>14}{'vs os.walk':>12}")
+    base = None
+    for nome, funcao in metodos:
+        tempo, arquivos = medir(funcao, args.repeticoes, args.frio)
+        base = base or tempo
+        print(f"{nome:<22}{tempo:>12.3f}{arquivos / tempo:>14.0f}{base / tempo:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
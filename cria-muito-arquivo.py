@@ -1,13 +1,10 @@
 import os
 import random
 import pathlib
+import shutil
 import string
-import time
-from datetime import datetime, timedelta
-
-# Pasta raiz do HD simulado
-root = pathlib.Path("HD_SIMULADO_GRANDE")
-root.mkdir(exist_ok=True)
+import argparse
+from datetime import datetime, timedelta, timezone
 
 # Categorias e extensões fornecidas
 CATEGORIES = {
@@ -36,31 +33,125 @@ nomes_base = ["relatorio","foto","video","arquivo","backup","nota","print","plan
 # Subpastas comuns
 pastas = ["Downloads", "Documentos", "Fotos", "Videos", "Musicas", "Backup", "Projetos", "Coisas_Aleatorias"]
 
-# Função para gerar datas aleatórias nos últimos 5 anos
-def random_date():
-    start = datetime.now() - timedelta(days=5*365)
-    end = datetime.now()
-    return start + (end - start) * random.random()
-
-# Criar 1000 arquivos
-num_arquivos = 1000
-for _ in range(num_arquivos):
-    # Escolhe pasta aleatória
-    p = root / random.choice(pastas) / ('Sub_' + str(random.randint(1, 5)))
-    p.mkdir(parents=True, exist_ok=True)
-    
-    # Escolhe extensão aleatória
-    e = random.choice(all_exts)
-    
-    # Gera nome aleatório
-    nome = random.choice(nomes_base) + '_' + ''.join(random.choices(string.ascii_lowercase + string.digits, k=5)) + e
-    
-    # Cria arquivo com tamanho aleatório (0 a 10KB)
-    file_path = p / nome
-    file_path.write_bytes(os.urandom(random.randint(0, 10240)))
-    
-    # Define datas de modificação e criação aleatórias
-    ts = time.mktime(random_date().timetuple())
-    os.utime(file_path, (ts, ts))  # (access_time, modified_time)
-
-print(f"{num_arquivos} arquivos criados com sucesso na pasta {root.resolve()}")
\ No newline at end of file
+# Datas são sorteadas antes desta, para que a mesma semente gere sempre o mesmo HD
+DATA_FINAL = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+# Função para gerar datas aleatórias nos últimos anos
+def random_date(rnd: random.Random, anos: int = 5):
+    start = DATA_FINAL - timedelta(days=anos*365)
+    return start + (DATA_FINAL - start) * rnd.random()
+
+# Bytes aleatórios reproduzíveis pela semente (os.urandom não é)
+def bytes_aleatorios(rnd: random.Random, n: int) -> bytes:
+    return rnd.getrandbits(8 * n).to_bytes(n, "little") if n else b""
+
+# Sorteia um tamanho em bytes conforme a distribuição
+def sortear_tamanho(rnd: random.Random, distribuicao: str, tamanho_max: int) -> int:
+    if distribuicao == "lognormal":
+        # Muitos arquivos pequenos e poucos grandes, mediana em 1/20 do máximo
+        return min(tamanho_max, int(rnd.lognormvariate(0, 1.5) * tamanho_max / 20))
+    return rnd.randint(0, tamanho_max)
+
+def gerar(
+    root: pathlib.Path,
+    num_arquivos: int = 1000,
+    semente: int = None,
+    profundidade: int = 2,
+    ramificacao: int = 5,
+    tamanho_max: int = 10240,
+    distribuicao: str = "uniforme",
+    duplicados: float = 0.0,
+    colisoes: float = 0.0,
+    anos: int = 5,
+    extensoes: list = None,
+    nomes: list = None
+) -> int:
+    """
+    Cria num_arquivos arquivos aleatórios sob root e retorna a semente usada.
+
+    Cada arquivo vai para uma das pastas comuns e, abaixo dela, para
+    profundidade-1 níveis de Sub_1..Sub_<ramificacao>. duplicados é a
+    fração de arquivos com o mesmo conteúdo de um arquivo anterior (com
+    outro nome) e colisoes a fração que repete o nome de um arquivo
+    anterior em outra pasta. A mesma semente e os mesmos parâmetros geram
+    sempre a mesma árvore.
+    """
+    if semente is None:
+        semente = random.randrange(2**32)
+    rnd = random.Random(semente)
+    extensoes = extensoes or all_exts
+    nomes = nomes or nomes_base
+    root.mkdir(parents=True, exist_ok=True)
+    criados = []
+
+    for _ in range(num_arquivos):
+        # Escolhe pasta aleatória
+        p = root / rnd.choice(pastas)
+        for _ in range(profundidade - 1):
+            p = p / ('Sub_' + str(rnd.randint(1, ramificacao)))
+        p.mkdir(parents=True, exist_ok=True)
+
+        sorteio = rnd.random()
+        original = None
+        if criados and sorteio < duplicados:
+            # Cópia de um arquivo anterior, com outro nome
+            original = rnd.choice(criados)
+            e = "".join(original.suffixes[-1:])
+            nome = None
+        elif criados and sorteio < duplicados + colisoes:
+            # Mesmo nome de um arquivo anterior, em outra pasta
+            nome = rnd.choice(criados).name
+        else:
+            nome = None
+            e = rnd.choice(extensoes)
+        if nome is None or (p / nome).exists():
+            # Gera nome aleatório
+            e = e if nome is None else pathlib.Path(nome).suffix
+            nome = rnd.choice(nomes) + '_' + ''.join(rnd.choices(string.ascii_lowercase + string.digits, k=5)) + e
+
+        file_path = p / nome
+        if original is not None:
+            shutil.copyfile(original, file_path)
+        else:
+            file_path.write_bytes(bytes_aleatorios(rnd, sortear_tamanho(rnd, distribuicao, tamanho_max)))
+        criados.append(file_path)
+
+        # Define datas de modificação e criação aleatórias
+        ts = random_date(rnd, anos).timestamp()
+        os.utime(file_path, (ts, ts))  # (access_time, modified_time)
+
+    return semente
+
+def main(**padroes):
+    """Lê os parâmetros da linha de comando (com os padrões dados) e gera o HD."""
+    parser = argparse.ArgumentParser(description="Gera um HD simulado com arquivos aleatórios")
+    parser.add_argument("--pasta", type=pathlib.Path, default=padroes.get("pasta", "HD_SIMULADO_GRANDE"),
+                        help="Pasta raiz do HD simulado")
+    parser.add_argument("--arquivos", type=int, default=padroes.get("arquivos", 1000),
+                        help="Quantidade de arquivos")
+    parser.add_argument("--semente", type=int,
+                        help="Semente do gerador; a mesma semente gera a mesma árvore")
+    parser.add_argument("--profundidade", type=int, default=padroes.get("profundidade", 2),
+                        help="Níveis de pastas abaixo da raiz")
+    parser.add_argument("--ramificacao", type=int, default=padroes.get("ramificacao", 5),
+                        help="Subpastas por nível (Sub_1..Sub_N)")
+    parser.add_argument("--tamanho-max", type=int, default=padroes.get("tamanho_max", 10240),
+                        help="Tamanho máximo de cada arquivo em bytes")
+    parser.add_argument("--distribuicao", choices=["uniforme", "lognormal"],
+                        default=padroes.get("distribuicao", "uniforme"),
+                        help="Distribuição dos tamanhos")
+    parser.add_argument("--duplicados", type=float, default=padroes.get("duplicados", 0.0),
+                        help="Fração de arquivos com conteúdo repetido (0 a 1)")
+    parser.add_argument("--colisoes", type=float, default=padroes.get("colisoes", 0.0),
+                        help="Fração de arquivos com nome repetido (0 a 1)")
+    args = parser.parse_args()
+
+    semente = gerar(
+        args.pasta, args.arquivos, args.semente, args.profundidade, args.ramificacao,
+        args.tamanho_max, args.distribuicao, args.duplicados, args.colisoes,
+        extensoes=padroes.get("extensoes"), nomes=padroes.get("nomes")
+    )
+    print(f"{args.arquivos} arquivos criados com sucesso na pasta {args.pasta.resolve()} (semente {semente})")
+
+if __name__ == "__main__":
+    main()
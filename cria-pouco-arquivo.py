@@ -1,21 +1,19 @@
-import os
-import random
 import pathlib
+import importlib.util
 
-# Pasta raiz do HD simulado
-root = pathlib.Path('HD_SIMULADO')
+# O gerador fica em cria-muito-arquivo.py; aqui só mudam os padrões
+spec = importlib.util.spec_from_file_location(
+    "cria_muito_arquivo", pathlib.Path(__file__).resolve().parent / "cria-muito-arquivo.py"
+)
+gerador = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gerador)
 
 # Categorias e extensões
-exts = ['jpg','png','mp4','mp3','pdf','docx','xlsx','txt','zip','']
-pastas = ['Downloads','Documentos','Fotos','Videos','Musicas','Backup','Projetos','Coisas_Aleatorias']
+exts = ['.jpg','.png','.mp4','.mp3','.pdf','.docx','.xlsx','.txt','.zip','']
 nomes = ['relatorio','foto','video','arquivo','backup','nota','print','planilha']
 
-# Criar arquivos aleatórios
-for _ in range(50):  # quantidade pequena, ajustável
-    p = root / random.choice(pastas) / ('Sub_' + str(random.randint(1,3)))
-    p.mkdir(parents=True, exist_ok=True)
-    e = random.choice(exts)
-    nome = random.choice(nomes) + '_' + str(random.randint(1,50)) + (('.'+e) if e else '')
-    (p / nome).write_bytes(os.urandom(random.randint(0,1024)))
-
-print('HD simulado criado com sucesso.')
\ No newline at end of file
+# Criar arquivos aleatórios (quantidade pequena, ajustável com --arquivos)
+gerador.main(
+    pasta='HD_SIMULADO', arquivos=50, ramificacao=3, tamanho_max=1024,
+    colisoes=0.2, extensoes=exts, nomes=nomes
+)
@@ -3,7 +3,7 @@
 Minimalist and efficient File Organizer.
 """
 
-import os, shutil, csv, argparse, time
+import os, shutil, csv, gzip, json, argparse, time
 from pathlib import Path
 from tqdm import tqdm
 from datetime import datetime
@@ -13,7 +13,7 @@ from datetime import datetime
     "Videos": [".mp4", ".mov", ".avi", ".mkv", ".flv", ".wmv", ".webm", ".mpeg", ".mpg", ".3gp", ".m4v", ".vob"],
     "Music": [".mp3", ".flac", ".wav", ".aac", ".ogg", ".wma", ".m4a", ".alac", ".aiff", ".opus"],
     "Documents": [".pdf", ".docx", ".doc", ".xlsx", ".xls", ".pptx", ".ppt", ".txt", ".odt", ".ods", ".odp", ".rtf", ".tex", ".csv", ".md", ".log"],
-    "Compressed": [".zip", ".rar", ".7z", ".tar", ".gz", ".bz2", ".xz", ".iso", ".dmg", ".cab"],
+    "Compressed": [".zip", ".rar", ".7z", ".tar", ".gz", ".bz2", ".xz", ".iso", ".dmg", ".cab", ".tar.gz", ".tar.bz2", ".tar.xz"],
     "Executables": [".exe", ".msi", ".bat", ".cmd", ".sh", ".jar", ".app", ".apk"],
     "Fonts": [".ttf", ".otf", ".woff", ".woff2", ".fnt"],
     "Scripts and Code": [".py", ".js", ".ts", ".java", ".c", ".cpp", ".cs", ".rb", ".php", ".html", ".css", ".json", ".xml", ".sql", ".sh", ".pl", ".go", ".rs", ".swift", ".kt"],
@@ -22,56 +22,72 @@ from datetime import datetime
     "Others": [".bak", ".tmp", ".log", ".dat", ".cfg", ".ini"]
 }
 
+# extension -> category (the first category listing it wins: .iso, .sh, .log)
+表 = {x: c for c, d in reversed(类.items()) for x in d}
+
+# lowercase extension, preferring a known two-part one (.tar.gz)
+def 尾(a: Path) -> str:
+    b = "".join(a.suffixes[-2:]).lower()
+    return b if b in 表 else a.suffix.lower()
+
 # returns category based on extension
 def 路(a: Path) -> str:
-    b = a.suffix.lower()
-    for c, d in 类.items():
-        if b in d: return c
-    return "Others"
+    return 表.get(尾(a), "Others")
 
 # returns subfolder: year or extension
 def 子(a: Path, c: str) -> str:
     if c in ["Images","Videos"]:
         try: return str(datetime.fromtimestamp(a.stat().st_mtime).year)
         except: return "Year?"
-    return a.suffix.lower().lstrip(".")
+    return 尾(a).lstrip(".")
 
-# moves or copies file without overwriting
+# moves or copies file without overwriting (returns the error on failure)
 def 动(a: Path, b: Path, c=True):
     b.parent.mkdir(parents=True, exist_ok=True)
     d = 1; e = b
     while e.exists(): e = b.with_name(f"{b.stem}_{d}{b.suffix}"); d+=1
-    try: return shutil.move(a,b) if c else shutil.copy2(a,b)
-    except Exception as f: print(f"[ERROR] {a}: {f}"); return None
+    try: return shutil.move(a,e) if c else shutil.copy2(a,e)
+    except Exception as f: print(f"[ERROR] {a}: {f}"); return f
 
-# main function
-def 文(a: Path, b: Path, c=True, d=False, e: Path=None):
-    f=[]
+# walks the source lazily, skipping the destination
+def 扫(a: Path, b: Path):
     for g,h,i in os.walk(a):
         h[:] = [j for j in h if Path(g,j)!=b]
-        for j in i: f.append(Path(g)/j)
+        for j in i: yield Path(g)/j
 
-    k={}
-    for l in f:
-        m=路(l); k.setdefault(m,0); k[m]+=1
+# opens the report as CSV or JSON Lines (.jsonl), compressed if it ends in .gz
+def 录(e: Path, k: list):
+    f = gzip.open(e,"wt",newline="",encoding="utf-8") if e.suffix==".gz" else open(e,"w",newline="",encoding="utf-8",buffering=1<<20)
+    if ".jsonl" in e.suffixes: return f, lambda u: f.write(json.dumps(u,default=str)+"\n")
+    w=csv.DictWriter(f,fieldnames=k); w.writeheader(); return f, w.writerow
+
+# main function
+def 文(a: Path, b: Path, c=True, d=False, e: Path=None):
+    k={}; f=0; 始=time.perf_counter()
+    for l in 扫(a,b):
+        m=路(l); k[m]=k.get(m,0)+1; f+=1
 
     print("\nSummary:")
     print("\n".join(f"- {c}: {n}" for c, n in k.items()))
-    print(f"Total: {len(f)} files")
+    print(f"Total: {f} files")
     if input("\nContinue? (y/n): ").lower() != "y":
         return
 
-    p=[]
-    for l in tqdm(f,desc="Organizing",unit="file"):
+    # each row goes straight to disk instead of piling up in memory
+    p=None; w=lambda u: None
+    if e: p,w=录(e,["orig","dst","ac","sz","cat","t","err"])
+    for l in tqdm(扫(a,b),total=f,desc="Organizing",unit="file"):
         m=路(l); q=子(l,m); r=b/m/q; s=r/l.name
-        if d: p.append({"orig":l,"dst":s,"ac":"M" if c else "C"}); continue
-        t=动(l,s,c); 
-        if t: p.append({"orig":l,"dst":t,"ac":"M" if c else "C"})
-
-    if e:
-        with open(e,"w",newline="",encoding="utf-8") as f_csv:
-            w=csv.DictWriter(f_csv,fieldnames=["orig","dst","ac"]); w.writeheader()
-            [w.writerow(u) for u in p]
+        u={"orig":l,"dst":s,"ac":"M" if c else "C","sz":"","cat":m}
+        # size only for the report, read with the file still there; a vanished file gets an err row
+        try: u["sz"]=l.stat().st_size if e else ""
+        except OSError as x: print(f"[ERROR] {l}: {x}"); u["err"]=str(x); w(u); continue
+        if d: w(u); continue
+        v=time.perf_counter(); t=动(l,s,c); u["t"]=round(time.perf_counter()-v,6)
+        if isinstance(t,Exception): u["err"]=str(t)
+        else: u["dst"]=t
+        w(u)
+    if p: p.close()
 
     print(f"Total execution time: {time.perf_counter() - 始:.2f} seconds")
 
@@ -87,5 +103,4 @@ def 参():
 
 if __name__=="__main__":
     a=参()
-    始 = time.perf_counter()
     文(a.origin.resolve(), a.destination.resolve(), c=not a.copy, d=a.dry_run, e=a.report.resolve() if a.report else None)
\ No newline at end of file
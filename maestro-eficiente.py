@@ -3,7 +3,7 @@
 Organizador de Arquivos minimalista e eficiente.
 """
 
-import os, shutil, csv, argparse, time
+import os, shutil, csv, gzip, json, argparse, time
 from pathlib import Path
 from tqdm import tqdm
 from datetime import datetime
@@ -13,7 +13,7 @@ from datetime import datetime
     "Videos": [".mp4", ".mov", ".avi", ".mkv", ".flv", ".wmv", ".webm", ".mpeg", ".mpg", ".3gp", ".m4v", ".vob"],
     "Musicas": [".mp3", ".flac", ".wav", ".aac", ".ogg", ".wma", ".m4a", ".alac", ".aiff", ".opus"],
     "Documentos": [".pdf", ".docx", ".doc", ".xlsx", ".xls", ".pptx", ".ppt", ".txt", ".odt", ".ods", ".odp", ".rtf", ".tex", ".csv", ".md", ".log"],
-    "Compactados": [".zip", ".rar", ".7z", ".tar", ".gz", ".bz2", ".xz", ".iso", ".dmg", ".cab"],
+    "Compactados": [".zip", ".rar", ".7z", ".tar", ".gz", ".bz2", ".xz", ".iso", ".dmg", ".cab", ".tar.gz", ".tar.bz2", ".tar.xz"],
     "Executáveis": [".exe", ".msi", ".bat", ".cmd", ".sh", ".jar", ".app", ".apk"],
     "Fontes": [".ttf", ".otf", ".woff", ".woff2", ".fnt"],
     "Scripts e Código": [".py", ".js", ".ts", ".java", ".c", ".cpp", ".cs", ".rb", ".php", ".html", ".css", ".json", ".xml", ".sql", ".sh", ".pl", ".go", ".rs", ".swift", ".kt"],
@@ -22,56 +22,72 @@ from datetime import datetime
     "Outros": [".bak", ".tmp", ".log", ".dat", ".cfg", ".ini"]
 }
 
+# extensão -> categoria (vence a primeira categoria que lista: .iso, .sh, .log)
+表 = {x: c for c, d in reversed(类.items()) for x in d}
+
+# extensão em minúsculas, preferindo uma de duas partes conhecida (.tar.gz)
+def 尾(a: Path) -> str:
+    b = "".join(a.suffixes[-2:]).lower()
+    return b if b in 表 else a.suffix.lower()
+
 # retorna categoria baseado em extensão
 def 路(a: Path) -> str:
-    b = a.suffix.lower()
-    for c, d in 类.items():
-        if b in d: return c
-    return "Outros"
+    return 表.get(尾(a), "Outros")
 
 # retorna subpasta: ano ou extensão
 def 子(a: Path, c: str) -> str:
     if c in ["Imagens","Videos"]:
         try: return str(datetime.fromtimestamp(a.stat().st_mtime).year)
         except: return "Ano?"
-    return a.suffix.lower().lstrip(".")
+    return 尾(a).lstrip(".")
 
-# move ou copia arquivo sem sobrescrever
+# move ou copia arquivo sem sobrescrever (devolve o erro se falhar)
 def 动(a: Path, b: Path, c=True):
     b.parent.mkdir(parents=True, exist_ok=True)
     d = 1; e = b
     while e.exists(): e = b.with_name(f"{b.stem}_{d}{b.suffix}"); d+=1
-    try: return shutil.move(a,b) if c else shutil.copy2(a,b)
-    except Exception as f: print(f"[ERRO] {a}: {f}"); return None
+    try: return shutil.move(a,e) if c else shutil.copy2(a,e)
+    except Exception as f: print(f"[ERRO] {a}: {f}"); return f
 
-# função principal
-def 文(a: Path, b: Path, c=True, d=False, e: Path=None):
-    f=[]
+# percorre a origem sob demanda, ignorando o destino
+def 扫(a: Path, b: Path):
     for g,h,i in os.walk(a):
         h[:] = [j for j in h if Path(g,j)!=b]
-        for j in i: f.append(Path(g)/j)
+        for j in i: yield Path(g)/j
 
-    k={}
-    for l in f:
-        m=路(l); k.setdefault(m,0); k[m]+=1
+# abre o relatório em CSV ou JSON Lines (.jsonl), compactado se terminar em .gz
+def 录(e: Path, k: list):
+    f = gzip.open(e,"wt",newline="",encoding="utf-8") if e.suffix==".gz" else open(e,"w",newline="",encoding="utf-8",buffering=1<<20)
+    if ".jsonl" in e.suffixes: return f, lambda u: f.write(json.dumps(u,default=str)+"\n")
+    w=csv.DictWriter(f,fieldnames=k); w.writeheader(); return f, w.writerow
+
+# função principal
+def 文(a: Path, b: Path, c=True, d=False, e: Path=None):
+    k={}; f=0; 始=time.perf_counter()
+    for l in 扫(a,b):
+        m=路(l); k[m]=k.get(m,0)+1; f+=1
 
     print("\nResumo:")
     print("\n".join(f"- {c}: {n}" for c, n in k.items()))
-    print(f"Total: {len(f)} arquivos")
+    print(f"Total: {f} arquivos")
     if input("\nContinuar? (s/n): ").lower() != "s":
         return
 
-    p=[]
-    for l in tqdm(f,desc="Organizando",unit="arq"):
+    # cada linha vai direto para o disco em vez de se acumular na memória
+    p=None; w=lambda u: None
+    if e: p,w=录(e,["orig","dst","ac","sz","cat","t","err"])
+    for l in tqdm(扫(a,b),total=f,desc="Organizando",unit="arq"):
         m=路(l); q=子(l,m); r=b/m/q; s=r/l.name
-        if d: p.append({"orig":l,"dst":s,"ac":"M" if c else "C"}); continue
-        t=动(l,s,c); 
-        if t: p.append({"orig":l,"dst":t,"ac":"M" if c else "C"})
-
-    if e:
-        with open(e,"w",newline="",encoding="utf-8") as f_csv:
-            w=csv.DictWriter(f_csv,fieldnames=["orig","dst","ac"]); w.writeheader()
-            [w.writerow(u) for u in p]
+        u={"orig":l,"dst":s,"ac":"M" if c else "C","sz":"","cat":m}
+        # tamanho só para o relatório, lido com o arquivo ainda lá; arquivo sumido ganha linha com err
+        try: u["sz"]=l.stat().st_size if e else ""
+        except OSError as x: print(f"[ERRO] {l}: {x}"); u["err"]=str(x); w(u); continue
+        if d: w(u); continue
+        v=time.perf_counter(); t=动(l,s,c); u["t"]=round(time.perf_counter()-v,6)
+        if isinstance(t,Exception): u["err"]=str(t)
+        else: u["dst"]=t
+        w(u)
+    if p: p.close()
 
     print(f"Tempo total de execução: {time.perf_counter() - 始:.2f} segundos")
 
@@ -87,5 +103,4 @@ def 参():
 
 if __name__=="__main__":
     a=参()
-    始 = time.perf_counter()
     文(a.origem.resolve(), a.destino.resolve(), c=not a.copia, d=a.dry_run, e=a.report.resolve() if a.report else None)
\ No newline at end of file
@@ -7,17 +7,55 @@ and organizes them into a destination directory.
 
 Requirements:
 - Python 3.8+
-- Libraries: tqdm, os, pathlib, shutil, argparse, datetime, csv
+- Libraries: tqdm (everything else is in the standard library)
+- Optional: zstandard, for zstd-compressed pack archives
 """
 
 import os
+import hashlib
+import io
 import shutil
+import sys
 from pathlib import Path
 from tqdm import tqdm
+from array import array
 from datetime import datetime
+from decimal import Decimal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import NamedTuple
 import argparse
+import asyncio
+import cProfile
 import csv
+import ctypes
+import errno
+import fnmatch
+import gzip
+import json
+import queue
+import re
+import select
+import sqlite3
+import stat
+import string
+import struct
+import tarfile
+import threading
 import time
+import tracemalloc
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:  # only needed for zstd pack archives
+    zstandard = None
 
 # ----------------------------
 # CATEGORY CONFIGURATION
@@ -27,7 +65,7 @@ CATEGORIES = {
     "Videos": [".mp4", ".mov", ".avi", ".mkv", ".flv", ".wmv", ".webm", ".mpeg", ".mpg", ".3gp", ".m4v", ".vob"],
     "Music": [".mp3", ".flac", ".wav", ".aac", ".ogg", ".wma", ".m4a", ".alac", ".aiff", ".opus"],
     "Documents": [".pdf", ".docx", ".doc", ".xlsx", ".xls", ".pptx", ".ppt", ".txt", ".odt", ".ods", ".odp", ".rtf", ".tex", ".csv", ".md", ".log"],
-    "Archives": [".zip", ".rar", ".7z", ".tar", ".gz", ".bz2", ".xz", ".iso", ".dmg", ".cab"],
+    "Archives": [".zip", ".rar", ".7z", ".tar", ".gz", ".bz2", ".xz", ".iso", ".dmg", ".cab", ".tar.gz", ".tar.bz2", ".tar.xz"],
     "Executables": [".exe", ".msi", ".bat", ".cmd", ".sh", ".jar", ".app", ".apk"],
     "Fonts": [".ttf", ".otf", ".woff", ".woff2", ".fnt"],
     "Scripts_and_Code": [".py", ".js", ".ts", ".java", ".c", ".cpp", ".cs", ".rb", ".php", ".html", ".css", ".json", ".xml", ".sql", ".sh", ".pl", ".go", ".rs", ".swift", ".kt"],
@@ -36,147 +74,4609 @@ CATEGORIES = {
     "Others": [".bak", ".tmp", ".log", ".dat", ".cfg", ".ini"]
 }
 
+# Some extensions are listed in more than one category. They resolve to the
+# first category above that lists them:
+#   .iso -> Archives (also in Disk_Images)
+#   .sh  -> Executables (also in Scripts_and_Code)
+#   .log -> Documents (also in Others)
+# To send one elsewhere, add it here instead of reordering CATEGORIES.
+EXTENSION_OVERRIDES = {}
+
+# Categories sorted into year subfolders
+DATED_CATEGORIES = ["Images", "Videos"]
+
+# Categories sorted into extension subfolders; any other goes to UNKNOWN_FOLDER
+EXTENSION_FOLDER_CATEGORIES = [
+    "Documents", "Archives", "Executables", "Fonts", "Scripts_and_Code",
+    "Disk_Images", "3D_Models", "Others"
+]
+
+# Category of the files no rule matches
+DEFAULT_CATEGORY = "Others"
+
+# Folder names used when a template field can't be worked out
+UNKNOWN_YEAR = "UnknownYear"
+UNKNOWN_FOLDER = "Unknown"
+
+# ----------------------------
+# CLASSIFICATION RULES
+# ----------------------------
+
+# Fields a target template may use; month and day are zero-padded
+TEMPLATE_FIELDS = ("category", "ext", "year", "month", "day")
+DATE_FIELDS = {"year", "month", "day"}
+
+DEFAULT_TARGET = "{category}/{ext}"
+
+# Keys a rule may have in a rules file
+RULE_KEYS = (
+    "category", "target", "extensions", "glob", "path", "min_size", "max_size",
+    "older_than_days", "newer_than_days"
+)
+
+# Size suffixes accepted in rules files (powers of 1024)
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+def parse_size(value) -> int:
+    """Reads a size in bytes, given as a number or as text like "10M" or "1.5 GiB"."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    found = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?", str(value).strip().lower())
+    if found is None:
+        raise ValueError(f"invalid size: {value!r}")
+    return int(float(found.group(1)) * SIZE_UNITS[found.group(2)])
+
+class Rule:
+    """
+    One classification rule: which files it takes, their category and the
+    folder they go to.
+
+    A file matches when it meets every condition given: its extension is
+    one of extensions ("" for files without one), its name matches one of
+    globs (case-insensitive), its path starts with one of the folders in
+    paths (relative to the source, or absolute), its size is between
+    min_size and max_size, and its age (from the modification time) is
+    between newer_than and older_than seconds. target is a str.format
+    template of the folder inside the destination, using TEMPLATE_FIELDS.
+    """
+    __slots__ = (
+        "category", "target", "extensions", "globs", "pattern", "paths",
+        "_relative", "_absolute", "min_size", "max_size", "older_than",
+        "newer_than", "dated", "plain"
+    )
+
+    def __init__(self, category: str, target: str = DEFAULT_TARGET, extensions=None,
+                 globs=None, paths=None, min_size: int = None, max_size: int = None,
+                 older_than: float = None, newer_than: float = None):
+        fields = {field for _, field, _, _ in string.Formatter().parse(target) if field is not None}
+        unknown = fields - set(TEMPLATE_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown template fields in {target!r}: {', '.join(sorted(unknown))}")
+        self.category = category
+        self.target = target
+        self.dated = bool(fields & DATE_FIELDS)
+        self.extensions = None
+        if extensions:
+            self.extensions = frozenset(
+                "." + ext.lower().lstrip(".") if ext else "" for ext in extensions
+            )
+        self.globs = tuple(globs) if globs else None
+        self.pattern = None
+        if self.globs:
+            self.pattern = re.compile(
+                "|".join(fnmatch.translate(glob) for glob in self.globs), re.IGNORECASE
+            )
+        self.paths = tuple(paths) if paths else None
+        # Folder prefixes end with "/" so "Downloads" doesn't match "Downloads2"
+        prefixes = [path.replace(os.sep, "/").rstrip("/") + "/" for path in self.paths or ()]
+        self._relative = tuple(prefix for prefix in prefixes if not os.path.isabs(prefix))
+        self._absolute = tuple(prefix for prefix in prefixes if os.path.isabs(prefix))
+        self.min_size = min_size
+        self.max_size = max_size
+        self.older_than = older_than
+        self.newer_than = newer_than
+        # Only the extension decides, so RuleSet needn't check anything else
+        self.plain = (self.pattern is None and self.paths is None and min_size is None
+                      and max_size is None and older_than is None and newer_than is None)
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> "Rule":
+        """Builds a rule from its entry in a rules file; see RULE_KEYS."""
+        unknown = set(spec) - set(RULE_KEYS)
+        if unknown:
+            raise ValueError(f"unknown keys: {', '.join(sorted(unknown))}")
+        if not spec.get("category"):
+            raise ValueError("a category is required")
+
+        def listed(key):
+            value = spec.get(key)
+            return [value] if isinstance(value, str) else value
+
+        def seconds(key):
+            return None if spec.get(key) is None else float(spec[key]) * 86400
+
+        def size(key):
+            return None if spec.get(key) is None else parse_size(spec[key])
+
+        return cls(
+            spec["category"], spec.get("target", DEFAULT_TARGET), listed("extensions"),
+            listed("glob"), listed("path"), size("min_size"), size("max_size"),
+            seconds("older_than_days"), seconds("newer_than_days")
+        )
+
+    def __repr__(self):
+        return f"Rule({self.category!r}, {self.target!r})"
+
+    def accepts(self, name: str, size: int, mtime: float, path: str, root: str = None) -> bool:
+        """Checks every condition but the extension, which the RuleSet dispatches on."""
+        if self.pattern is not None and self.pattern.match(name) is None:
+            return False
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.older_than is not None or self.newer_than is not None:
+            if mtime is None:
+                return False
+            age = time.time() - mtime
+            if self.older_than is not None and age < self.older_than:
+                return False
+            if self.newer_than is not None and age > self.newer_than:
+                return False
+        if self.paths is not None:
+            if root is not None and path[len(os.path.join(root, "")):].replace(
+                    os.sep, "/").startswith(self._relative):
+                return True
+            return path.replace(os.sep, "/").startswith(self._absolute)
+        return True
+
+    def folder(self, ext: str, mtime: float = None) -> str:
+        """Renders target for a file with this extension and date."""
+        fields = {"category": self.category, "ext": ext.lstrip(".")}
+        if self.dated:
+            try:
+                when = datetime.fromtimestamp(mtime)
+                fields.update(year=str(when.year), month=f"{when.month:02d}", day=f"{when.day:02d}")
+            except (TypeError, ValueError, OverflowError, OSError):
+                fields.update(year=UNKNOWN_YEAR, month=UNKNOWN_FOLDER, day=UNKNOWN_FOLDER)
+        parts = self.target.format_map(fields).split("/")
+        # Empty fields (files without an extension) collapse; nothing climbs out
+        return "/".join(part for part in parts if part not in ("", ".", ".."))
+
+class GlobIndex:
+    """
+    Finds which of many numbered glob patterns a name matches first.
+
+    Globs are bucketed by their first character, or by their last one if
+    they start with a wildcard, so a name is only tried against the
+    buckets of its own first and last characters and the globs with
+    wildcards at both ends. Each bucket is one regular expression joining
+    its globs, and again one per half, quarter, ... of them: a name that
+    matches nothing costs a regex match per bucket, and a hit is narrowed
+    down by descending into the first half that matches. Named groups
+    could tell the matching glob directly, but make the regex engine save
+    every group at each branch, which is far slower with hundreds of them.
+    """
+
+    # Globs under which a bucket is searched one by one
+    LEAF_SIZE = 8
+
+    def __init__(self, globs):
+        buckets = {}
+        for index, glob in globs:
+            if glob[:1] and glob[0] not in "*?[" and glob[0].isascii():
+                key = ("first", glob[0].lower())
+            elif glob[-1:] and glob[-1] not in "*?]" and glob[-1].isascii():
+                key = ("last", glob[-1].lower())
+            else:
+                key = ("any", None)
+            buckets.setdefault(key, []).append((index, fnmatch.translate(glob)))
+        self._by_first = {}
+        self._by_last = {}
+        self._anywhere = None
+        for (kind, char), entries in buckets.items():
+            tree = self._tree(entries)
+            if kind == "first":
+                self._by_first[char] = tree
+            elif kind == "last":
+                self._by_last[char] = tree
+            else:
+                self._anywhere = tree
+
+    def _tree(self, entries):
+        # A node is (first index, last index, regex, children); a single glob has no children
+        regex = re.compile("|".join(f"(?:{pattern})" for _, pattern in entries), re.IGNORECASE)
+        if len(entries) == 1:
+            children = None
+        elif len(entries) <= self.LEAF_SIZE:
+            children = tuple(self._tree([entry]) for entry in entries)
+        else:
+            middle = len(entries) // 2
+            children = (self._tree(entries[:middle]), self._tree(entries[middle:]))
+        return entries[0][0], entries[-1][0], regex, children
+
+    def first(self, name: str, start: int = 0, limit: int = None):
+        """Returns the number of the first glob in start..limit-1 that name matches, or None."""
+        found = None
+        for tree in (self._by_first.get(name[:1].lower()), self._by_last.get(name[-1:].lower()),
+                     self._anywhere):
+            if tree is not None:
+                index = self._first(tree, name, start, limit)
+                if index is not None:
+                    found = limit = index
+        return found
+
+    def _first(self, node, name, start, limit):
+        low, high, regex, children = node
+        if high < start or (limit is not None and low >= limit) or regex.match(name) is None:
+            return None
+        if children is None:
+            return low
+        for child in children:
+            index = self._first(child, name, start, limit)
+            if index is not None:
+                return index
+        return None
+
+class RuleSet:
+    """
+    Rules compiled for matching; the first rule a file matches wins, and
+    default takes the files no rule matches.
+
+    Rules are indexed by extension, so a file is only checked against the
+    rules naming its extension. The globs of rules without extensions go
+    into a GlobIndex, and only rules with neither are checked one by one,
+    so hundreds of extension and glob rules cost about a dict lookup and
+    a few regex matches per file. extension_map gives each extension
+    named by a rule the category of the first rule naming it.
+    """
+
+    def __init__(self, rules, default: Rule = None):
+        self.rules = tuple(rules)
+        self.default = default or Rule(DEFAULT_CATEGORY)
+        by_ext = {}
+        globbed = []
+        rest = []
+        for index, rule in enumerate(self.rules):
+            if rule.extensions is not None:
+                for ext in rule.extensions:
+                    by_ext.setdefault(ext, []).append((index, rule))
+            elif rule.pattern is not None:
+                globbed.append((index, rule))
+            else:
+                rest.append((index, rule))
+        self._by_ext = {ext: tuple(found) for ext, found in by_ext.items()}
+        self._globs = None
+        if globbed:
+            self._globs = GlobIndex(
+                (index, glob) for index, rule in globbed for glob in rule.globs
+            )
+        self._rest = tuple(rest)
+        # Index of the first rule that isn't found through its extensions
+        self._first_unkeyed = min(
+            [index for index, _ in globbed + rest], default=len(self.rules)
+        )
+        self.extension_map = {}
+        for rule in self.rules:
+            for ext in sorted(rule.extensions or ()):
+                self.extension_map.setdefault(ext, rule.category)
+
+    @classmethod
+    def load(cls, path: Path) -> "RuleSet":
+        """
+        Reads a JSON rules file: {"rules": [...], "default": {...},
+        "builtin": true}. Each rule is an object with RULE_KEYS; sizes are
+        bytes or text like "10M", ages are days. The built-in rules follow
+        the file's own unless "builtin" is false.
+        """
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        rules = []
+        for number, spec in enumerate(config.get("rules", []), 1):
+            try:
+                rules.append(Rule.from_dict(spec))
+            except (ValueError, TypeError, AttributeError) as e:
+                raise ValueError(f"{path}: rule {number}: {e}") from None
+        if config.get("builtin", True):
+            rules += default_rules()
+        default = None
+        if "default" in config:
+            try:
+                default = Rule.from_dict(config["default"])
+            except (ValueError, TypeError, AttributeError) as e:
+                raise ValueError(f"{path}: default rule: {e}") from None
+            if not default.plain or default.extensions is not None:
+                raise ValueError(f"{path}: the default rule can't have conditions")
+        return cls(rules, default)
+
+    def match(self, name: str, ext: str, size: int, mtime: float, path: str,
+              root: str = None) -> Rule:
+        """Returns the first rule the file matches, or default."""
+        found = None
+        limit = len(self.rules)
+        for index, rule in self._by_ext.get(ext, ()):
+            if rule.plain or rule.accepts(name, size, mtime, path, root):
+                found, limit = rule, index
+                break
+        if self._globs is not None and self._first_unkeyed < limit:
+            index = self._globs.first(name, 0, limit)
+            while index is not None:
+                # The glob matched; the rule may still have other conditions
+                rule = self.rules[index]
+                if rule.accepts(name, size, mtime, path, root):
+                    found, limit = rule, index
+                    break
+                index = self._globs.first(name, index + 1, limit)
+        for index, rule in self._rest:
+            if index >= limit:
+                break
+            if rule.accepts(name, size, mtime, path, root):
+                found = rule
+                break
+        return found or self.default
+
+    def extension_rule(self, ext: str):
+        """
+        Returns the rule every file with this extension gets, when the
+        extension alone decides it, or None when other conditions may.
+        """
+        candidates = self._by_ext.get(ext)
+        if candidates:
+            index, rule = candidates[0]
+            return rule if rule.plain and index < self._first_unkeyed else None
+        return self.default if self._first_unkeyed == len(self.rules) else None
+
+def default_rules() -> list:
+    """
+    The built-in rules, from CATEGORIES: an extension goes to the first
+    category listing it, unless EXTENSION_OVERRIDES sends it elsewhere,
+    into year folders for DATED_CATEGORIES and extension folders for
+    EXTENSION_FOLDER_CATEGORIES.
+    """
+    def target(category):
+        if category in DATED_CATEGORIES:
+            return "{category}/{year}"
+        if category in EXTENSION_FOLDER_CATEGORIES:
+            return DEFAULT_TARGET
+        return "{category}/" + UNKNOWN_FOLDER
+
+    rules = [Rule(category, target(category), [ext]) for ext, category in EXTENSION_OVERRIDES.items()]
+    rules += [Rule(category, target(category), exts) for category, exts in CATEGORIES.items()]
+    return rules
+
+def use_rules(rules: RuleSet):
+    """
+    Makes rules the RuleSet every file is classified with from now on, and
+    the extensions it names the known ones (see split_extension()).
+    """
+    global RULES, EXTENSION_MAP, MAX_SUFFIX_PARTS
+    RULES = rules
+    EXTENSION_MAP = rules.extension_map
+    # Longest multi-part extension known (".tar.gz" has 2 parts)
+    MAX_SUFFIX_PARTS = max((ext.count(".") for ext in EXTENSION_MAP), default=1)
+
+use_rules(RuleSet(default_rules(), Rule(DEFAULT_CATEGORY, DEFAULT_TARGET)))
+
+# ----------------------------
+# HELPER FUNCTIONS
+# ----------------------------
+
+def split_extension(name: str) -> str:
+    """
+    Returns the lowercase extension of a file name, like Path.suffix, but
+    preferring a known multi-part extension (".tar.gz" rather than ".gz").
+    """
+    name = name.lower()
+    end = len(name)
+    ext = ""
+    for _ in range(MAX_SUFFIX_PARTS):
+        dot = name.rfind(".", 0, end)
+        # A leading dot marks a hidden file, not an extension
+        if dot <= 0 or dot == len(name) - 1:
+            break
+        if not ext or name[dot:] in EXTENSION_MAP:
+            ext = name[dot:]
+        end = dot
+    return ext
+
+def get_file_extension(file_path: Path) -> str:
+    """
+    Returns the file's lowercase extension, reusing the scanner's cached
+    value. Also takes a PlanOp, for the op's source file.
+    """
+    if isinstance(file_path, FileEntry):
+        return file_path.ext
+    if isinstance(file_path, PlanOp):
+        return split_extension(os.path.basename(file_path.source))
+    return split_extension(file_path.name)
+
+def get_extension_category(ext: str) -> str:
+    """
+    Returns the main category for a lowercase extension (e.g. ".jpg"): the
+    one the first rule naming it gives, whatever its other conditions.
+    """
+    return EXTENSION_MAP.get(ext, RULES.default.category)
+
+def get_file_category(file_path: Path) -> str:
+    """Returns the main category of the file based on its extension."""
+    if isinstance(file_path, (FileEntry, PlanOp)):
+        return file_path.category
+    return get_extension_category(split_extension(file_path.name))
+
+def get_target_folder(file_path: Path, mtime: float = None) -> str:
+    """
+    Returns the folder, relative to the destination, that the file's rule
+    sends it to (e.g. "Images/2021"). When the scanner already knows the
+    modification time, or a capture date, it is passed in as mtime,
+    avoiding another stat of the file; a PlanOp uses its own.
+    """
+    ext = get_file_extension(file_path)
+    if isinstance(file_path, FileEntry):
+        rule = file_path.rule
+        modified = file_path.mtime
+    else:
+        if isinstance(file_path, PlanOp):
+            path, size, modified = file_path.source, file_path.size, file_path.mtime
+        else:
+            path = str(file_path)
+            try:
+                st = file_path.stat()
+                size, modified = st.st_size, st.st_mtime
+            except OSError:
+                size, modified = 0, None
+        rule = RULES.match(os.path.basename(path), ext, size, modified, path)
+    return rule.folder(ext, modified if mtime is None else mtime)
+
+def resolve_target(dst: Path) -> Path:
+    """Returns dst, or dst renamed with a _1, _2, ... suffix if that name is taken."""
+    counter = 1
+    target = dst
+    while target.exists():
+        target = dst.with_name(f"{dst.stem}_{counter}{dst.suffix}")
+        counter += 1
+    return target
+
+# ioctl request for a copy-on-write clone (linux/fs.h)
+FICLONE = 0x40049409
+
+# Report action for each --link mode
+LINK_ACTIONS = {"hard": "HARDLINK", "reflink": "REFLINK", "symlink": "SYMLINK"}
+
+def clone_file(src, target: Path) -> bool:
+    """
+    Clones src into target sharing its data blocks (FICLONE, supported by
+    Btrfs, XFS and similar), with metadata copied like shutil.copy2.
+    Returns False if the platform or filesystem can't clone.
+    """
+    if fcntl is None:
+        return False
+    with open(src, "rb") as fsrc, open(target, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            cloned = False
+        else:
+            cloned = True
+    if not cloned:
+        os.remove(target)
+        return False
+    shutil.copystat(src, target)
+    return True
+
+def link_file(src, target: Path, link: str) -> bool:
+    """
+    Creates target as a hard link ("hard"), a copy-on-write clone
+    ("reflink") or a symbolic link ("symlink") to src. A target that
+    already exists (the empty placeholder of a NameIndex claim) is made
+    beside it and renamed over it, so the name is never free in between.
+    Returns False when that isn't possible, so the caller copies instead.
+    """
+    made = target
+    if os.path.lexists(target):
+        made = target.with_name(f".{target.name}.maestro-link")
+    try:
+        if link == "hard":
+            os.link(src, made)
+        elif link == "symlink":
+            os.symlink(os.path.abspath(src), made)
+        elif not clone_file(src, made):
+            return False
+        if made != target:
+            os.replace(made, target)
+    except OSError:
+        return False
+    return True
+
+# Userspace buffer for copies the kernel can't do by itself
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Bytes requested per copy_file_range/sendfile call
+KERNEL_COPY_CHUNK = 1024 * 1024 * 1024
+
+def _copy_in_kernel(infd: int, outfd: int) -> bool:
+    """
+    Copies from infd to outfd without passing the data through Python,
+    using os.copy_file_range (which some filesystems turn into a server-side
+    copy or a reflink) or else os.sendfile.
+    Returns False if neither is usable here, in which case nothing was copied.
+    """
+    for name in ("copy_file_range", "sendfile"):
+        if not hasattr(os, name):
+            continue
+        copied = 0
+        try:
+            while True:
+                if name == "copy_file_range":
+                    sent = os.copy_file_range(infd, outfd, KERNEL_COPY_CHUNK)
+                else:
+                    sent = os.sendfile(outfd, infd, None, KERNEL_COPY_CHUNK)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError:
+            # Unsupported for this pair of files (e.g. EXDEV, EINVAL): try
+            # the next method, unless data was already written
+            if copied:
+                raise
+            continue
+        return True
+    return False
+
+def copy_file(src, target, buffer_size: int = COPY_BUFFER_SIZE, fadvise: bool = False):
+    """
+    Copies data and metadata like shutil.copy2, but through the kernel when
+    possible (copy_file_range/sendfile), falling back to a read/write loop
+    with buffer_size. With fadvise, the source is read with a sequential
+    hint and dropped from the page cache afterwards, so copying a large
+    library doesn't evict everything else from memory.
+    """
+    with open(src, "rb") as fsrc, open(target, "wb") as fdst:
+        infd = fsrc.fileno()
+        if fadvise and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(infd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        if not _copy_in_kernel(infd, fdst.fileno()):
+            shutil.copyfileobj(fsrc, fdst, buffer_size)
+        if fadvise and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(infd, 0, 0, os.POSIX_FADV_DONTNEED)
+    shutil.copystat(src, target)
+    return target
+
+def transfer_file(src: Path, target: Path, move: bool = True, link: str = None,
+                  same_device: bool = False, buffer_size: int = COPY_BUFFER_SIZE,
+                  fadvise: bool = False):
+    """
+    Moves or copies src to exactly target, whose folder must already exist.
+
+    A move within one device is a single os.rename, skipping the extra
+    checks of shutil.move. When copying, link ("hard", "reflink" or
+    "symlink") replaces the data copy, falling back to a regular copy
+    where it isn't supported. Copies, including those made by moves across
+    devices, go through copy_file() with buffer_size and fadvise.
+    Returns target, or None on error.
+    """
+    try:
+        return _transfer(src, target, move, link, same_device, buffer_size, fadvise)
+    except Exception as e:
+        print(f"[ERROR] Could not process {src}: {e}")
+        return None
+
+def _transfer(src, target, move, link, same_device, buffer_size, fadvise):
+    """Body of transfer_file(); raises on error."""
+    def copy(source, destination):
+        return copy_file(source, destination, buffer_size=buffer_size, fadvise=fadvise)
+
+    if move:
+        if same_device:
+            try:
+                os.rename(src, target)
+                return target
+            except OSError:
+                pass
+        shutil.move(str(src), str(target), copy_function=copy)
+    elif link is None or not link_file(src, target, link):
+        copy(src, target)
+    return target
+
+def safe_move_or_copy(src: Path, dst: Path, move: bool = True):
+    """Moves or copies a file, renaming if it already exists."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    return transfer_file(src, resolve_target(dst), move=move)
+
+class DirectoryCache:
+    """
+    Maps a folder name relative to the destination (see get_target_folder())
+    to its path and creates each folder only the first time it is needed,
+    so a run issues one mkdir per distinct folder (a few hundred) instead
+    of one per file.
+    """
+
+    def __init__(self, dest_dir: Path, create: bool = True):
+        self.dest_dir = dest_dir
+        self.create = create
+        self._dirs = {}
+        self._lock = threading.Lock()
+
+    def get(self, folder: str) -> Path:
+        """Returns the destination folder, creating it on first use."""
+        directory = self._dirs.get(folder)
+        if directory is None:
+            with self._lock:
+                directory = self._dirs.get(folder)
+                if directory is None:
+                    directory = self.dest_dir / folder
+                    if self.create:
+                        directory.mkdir(parents=True, exist_ok=True)
+                    self._dirs[folder] = directory
+        return directory
+
+    def create_for_extensions(self, extensions):
+        """
+        Creates up front the folders of the extensions seen in the pre-pass
+        whose rule depends on the extension alone. Dated folders depend on
+        each file's date, and the others on more than its name, so they are
+        created on demand.
+        """
+        for ext in sorted(extensions):
+            rule = RULES.extension_rule(ext)
+            if rule is not None and not rule.dated:
+                self.get(rule.folder(ext))
+
+class NameIndex:
+    """
+    In-memory index of the file names in each destination folder.
+
+    A folder is listed once, the first time a file is sent there, and every
+    name handed out is added to the index, so picking a free name is a set
+    lookup instead of one exists() call per _1, _2, ... candidate. A counter
+    per colliding name remembers the next suffix to try. Names are chosen
+    exactly as resolve_target() would choose them.
+
+    With claim, each name is also created on disk as an empty placeholder
+    (O_CREAT | O_EXCL) when it is reserved. Several processes organizing
+    into the same destination, such as the shards of a run, then never
+    pick the same name: one that another process took since the folder
+    was listed is skipped like any taken name. Transfers overwrite the
+    placeholder.
+    """
+
+    # These filesystems treat "Foto.jpg" and "foto.jpg" as the same file
+    CASE_INSENSITIVE = sys.platform in ("win32", "darwin")
+
+    def __init__(self, claim: bool = False):
+        self.claim = claim
+        self._names = {}
+        self._next_suffix = {}
+        self._lock = threading.Lock()
+
+    def _key(self, name: str) -> str:
+        return name.lower() if self.CASE_INSENSITIVE else name
+
+    def _folder_names(self, folder: Path) -> set:
+        names = self._names.get(folder)
+        if names is None:
+            try:
+                names = {self._key(name) for name in os.listdir(folder)}
+            except FileNotFoundError:
+                names = set()
+            self._names[folder] = names
+        return names
+
+    def reserve(self, folder: Path, name: str) -> Path:
+        """Returns a free path for name inside folder and marks it as taken."""
+        with self._lock:
+            names = self._folder_names(folder)
+            while True:
+                target = self._next_free(folder, names, name)
+                if not self.claim or self._create(target):
+                    return target
+
+    def _next_free(self, folder: Path, names: set, name: str) -> Path:
+        if self._key(name) not in names:
+            names.add(self._key(name))
+            return folder / name
+        dst = folder / name
+        counter = self._next_suffix.get((folder, self._key(name)), 1)
+        candidate = f"{dst.stem}_{counter}{dst.suffix}"
+        while self._key(candidate) in names:
+            counter += 1
+            candidate = f"{dst.stem}_{counter}{dst.suffix}"
+        self._next_suffix[(folder, self._key(name))] = counter + 1
+        names.add(self._key(candidate))
+        return folder / candidate
+
+    @staticmethod
+    def _create(target: Path) -> bool:
+        """Creates the placeholder of a claimed name; False if it already exists."""
+        for _ in range(2):
+            try:
+                os.close(os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+                return True
+            except FileExistsError:
+                return False
+            except FileNotFoundError:
+                target.parent.mkdir(parents=True, exist_ok=True)
+            except OSError:
+                # Not claimable (e.g. read-only): the transfer reports the error
+                return True
+        return True
+
+    def add_folder(self, folder: Path, names):
+        """Takes a folder's listing made elsewhere, so reserve() won't list it again."""
+        with self._lock:
+            if folder not in self._names:
+                self._names[folder] = {self._key(name) for name in names}
+
+    def release(self, target: Path):
+        """Frees a reserved name whose transfer failed."""
+        with self._lock:
+            self._names.get(target.parent, set()).discard(self._key(target.name))
+        if self.claim:
+            # Drop the placeholder, unless the failed transfer wrote to it
+            try:
+                if os.lstat(target).st_size == 0:
+                    os.remove(target)
+            except OSError:
+                pass
+
+# ----------------------------
+# DUPLICATE DETECTION
+# ----------------------------
+
+class DuplicateCandidate:
+    """
+    A file taking part in duplicate detection. Hashes are computed lazily
+    and kept, so no file is read more than once per kind of hash.
+    """
+    __slots__ = ("path", "size", "target", "partial", "full")
+
+    def __init__(self, path, size: int):
+        self.path = path
+        self.size = size
+        self.target = None
+        self.partial = None
+        self.full = None
+
+class DuplicateIndex:
+    """
+    Finds files whose content was already organized during this run, or
+    before it (see add_organized()).
+
+    Files are bucketed by size and nothing is read until a second file of
+    the same size shows up. Then a cheap partial hash (first and last block)
+    is compared, and only if it matches is the full content hashed.
+
+    The files and their hashes are kept in a temporary SQLite database
+    rather than in memory, so a run of millions of files doesn't grow with
+    them; only the pending transfers of the latest ones are held.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self):
+        # An empty name gives a private database in a temporary file
+        self._conn = sqlite3.connect("")
+        self._conn.execute(
+            "CREATE TABLE files (size INTEGER, path TEXT, target TEXT, partial BLOB, full BLOB)"
+        )
+        self._conn.execute("CREATE INDEX files_by_size ON files (size)")
+        # rowid -> pending transfer of the file, oldest first
+        self._pending = {}
+
+    def _partial_hash(self, candidate: DuplicateCandidate) -> bytes:
+        if candidate.partial is None:
+            digest = hashlib.blake2b(digest_size=16)
+            with open(candidate.path, "rb") as f:
+                digest.update(f.read(self.BLOCK_SIZE))
+                if candidate.size > 2 * self.BLOCK_SIZE:
+                    f.seek(-self.BLOCK_SIZE, os.SEEK_END)
+                digest.update(f.read(self.BLOCK_SIZE))
+            candidate.partial = digest.digest()
+        return candidate.partial
+
+    def _full_hash(self, candidate: DuplicateCandidate) -> bytes:
+        if candidate.full is None:
+            if candidate.size <= 2 * self.BLOCK_SIZE:
+                # The partial hash already covered the whole file
+                candidate.full = self._partial_hash(candidate)
+            else:
+                digest = hashlib.blake2b(digest_size=16)
+                with open(candidate.path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        digest.update(chunk)
+                candidate.full = digest.digest()
+        return candidate.full
+
+    def match(self, entry: "FileEntry"):
+        """
+        Returns (candidate, original): candidate wraps entry for a later
+        add(), original is the organized file with the same content, or None.
+        """
+        candidate = DuplicateCandidate(entry.path, entry.size)
+        found = None
+        # Hashes computed here are stored, and files gone since are dropped,
+        # once the rows are read
+        hashed = []
+        dropped = []
+        rows = self._conn.execute(
+            "SELECT rowid, path, target, partial, full FROM files WHERE size = ?", (entry.size,)
+        )
+        for rowid, path, target, partial, full in rows:
+            future = self._pending.pop(rowid, None)
+            # Wait until the original has landed before reading it
+            if future is not None and future.result()[0] is None:
+                dropped.append(rowid)
+                continue
+            original = DuplicateCandidate(path, entry.size)
+            original.target = Path(target)
+            original.partial = partial
+            original.full = full
+            try:
+                same = (self._partial_hash(candidate) == self._partial_hash(original)
+                        and self._full_hash(candidate) == self._full_hash(original))
+            except OSError as e:
+                if e.filename == path:
+                    dropped.append(rowid)
+                    continue
+                print(f"[ERROR] Could not compare {entry.path}: {e}")
+                break
+            finally:
+                if (original.partial, original.full) != (partial, full):
+                    hashed.append((original.partial, original.full, rowid))
+            if same:
+                found = original
+                break
+        rows.close()
+        if hashed:
+            self._conn.executemany(
+                "UPDATE files SET partial = ?, full = ? WHERE rowid = ?", hashed
+            )
+        if dropped:
+            self._conn.executemany("DELETE FROM files WHERE rowid = ?", [(r,) for r in dropped])
+        return candidate, found
+
+    def _settle(self):
+        # Lets go of finished transfers, dropping the files whose transfer failed
+        while self._pending:
+            rowid, future = next(iter(self._pending.items()))
+            if not future.done():
+                break
+            del self._pending[rowid]
+            if future.result()[0] is None:
+                self._conn.execute("DELETE FROM files WHERE rowid = ?", (rowid,))
+
+    def add(self, candidate: DuplicateCandidate, path, target: Path, future=None):
+        """
+        Registers an organized file. path is where its content can be read,
+        target where it was organized to; future, if given, is its pending
+        transfer.
+        """
+        self._settle()
+        rowid = self._conn.execute(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+            (candidate.size, str(path), str(target), candidate.partial, candidate.full)
+        ).lastrowid
+        if future is not None:
+            self._pending[rowid] = future
+
+    def add_organized(self, files):
+        """
+        Registers files organized before this run started, given as (size,
+        destination) pairs, so the files of this run can be matched with them.
+        """
+        self._conn.executemany(
+            "INSERT INTO files (size, path, target) VALUES (?, ?, ?)",
+            ((size, path, path) for size, path in files)
+        )
+
+    def close(self):
+        """Deletes the database."""
+        self._conn.close()
+
+def link_duplicate(original: Path, target: Path, src, move: bool = True) -> bool:
+    """
+    Hardlinks target to an identical, already organized file instead of
+    copying it. In move mode the source copy is then removed.
+    Returns False if the link can't be made (e.g. across devices).
+    """
+    if not link_file(original, target, "hard"):
+        return False
+    if move:
+        try:
+            os.remove(src)
+        except OSError as e:
+            print(f"[ERROR] Could not remove {src}: {e}")
+    return True
+
+# ----------------------------
+# PARALLEL EXECUTION
+# ----------------------------
+
+class DeviceLimiter:
+    """
+    Caps how many transfers may run at once on each device (st_dev).
+    A transfer holds a slot on both its source and destination devices;
+    slots are always taken in device order so two transfers can't deadlock.
+    """
+
+    def __init__(self, limit: int = None):
+        self.limit = limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, dev: int):
+        with self._lock:
+            if dev not in self._semaphores:
+                self._semaphores[dev] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[dev]
+
+    @contextmanager
+    def hold(self, *devices):
+        if not self.limit:
+            yield
+            return
+        semaphores = [self._semaphore(dev) for dev in sorted(set(devices))]
+        for semaphore in semaphores:
+            semaphore.acquire()
+        try:
+            yield
+        finally:
+            for semaphore in reversed(semaphores):
+                semaphore.release()
+
+def timed_transfer(src, target: Path, move: bool = True, link: str = None,
+                   same_device: bool = False, buffer_size: int = COPY_BUFFER_SIZE,
+                   fadvise: bool = False):
+    """
+    Runs a transfer like transfer_file. Returns (target, seconds taken, None),
+    or (None, seconds taken, error message) on error.
+    """
+    started = time.perf_counter()
+    try:
+        _transfer(src, target, move, link, same_device, buffer_size, fadvise)
+    except Exception as e:
+        print(f"[ERROR] Could not process {src}: {e}")
+        return None, time.perf_counter() - started, str(e)
+    return target, time.perf_counter() - started, None
+
+def limited_transfer(limiter: DeviceLimiter, devices, src, target: Path, **options):
+    """Runs timed_transfer while holding the device slots for the transfer."""
+    with limiter.hold(*devices):
+        return timed_transfer(src, target, **options)
+
+# ----------------------------
+# DIRECTORY SCANNING
+# ----------------------------
+
+class FileEntry:
+    """
+    A file found by the scanner.
+
+    Carries the data read from the directory entry during the walk (size,
+    mtime, device, inode), so each file is stat'ed at most once end to end.
+    The extension, rule and category are worked out once, when the entry
+    is built; root is the source folder, for rules matching on paths.
+    """
+    __slots__ = ("path", "name", "size", "mtime", "dev", "ino", "root", "ext", "rule", "category")
+
+    def __init__(self, path: str, name: str, size: int, mtime: float, dev: int, ino: int,
+                 root: str = None):
+        self.path = path
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.dev = dev
+        self.ino = ino
+        self.root = root
+        self.ext = split_extension(name)
+        self.classify()
+
+    def classify(self):
+        """Picks the entry's rule, and so its category, from the active RuleSet."""
+        self.rule = RULES.match(self.name, self.ext, self.size, self.mtime, self.path, self.root)
+        self.category = self.rule.category
+
+    def __repr__(self):
+        return f"FileEntry({self.path!r})"
+
+def _dir_key(path: Path):
+    """Returns (device, inode) of a directory, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+# Exclude patterns read from the top of the source, one per line
+IGNORE_FILE = ".maestroignore"
+
+def read_ignore_file(path: Path) -> list:
+    """Returns the patterns of an ignore file, skipping blank lines and # comments."""
+    patterns = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("!"):
+                raise ValueError(f"{path}: line {number}: negated patterns (!) are not supported")
+            patterns.append(line)
+    return patterns
+
+class ScanFilter:
+    """
+    Which folders and files of a source the scanner takes, decided from
+    their names and paths, so nothing is stat'ed for it.
+
+    exclude and include are glob patterns, as in .gitignore: one without a
+    "/" is matched against the name of every file and folder, one with a
+    "/" against the path relative to source_dir ("*" also crosses folders,
+    a leading "**/" matches at any depth), and one ending in "/" only
+    against folders. The patterns are compiled into a few regexes once.
+    An excluded folder is pruned where it is listed, so nothing below it
+    is ever read. With include, only files matching one of its patterns
+    are taken (a folder pattern takes the files below it). Folders more
+    than max_depth levels down (0: only the files directly in the source)
+    are pruned too, and so are hidden files and folders (names starting
+    with ".") with skip_hidden.
+
+    min_size and max_size bound file sizes in bytes; they are checked
+    where the scanner stats each file anyway.
+    """
+
+    def __init__(self, source_dir: Path, exclude=(), include=(), max_depth: int = None,
+                 min_size: int = None, max_size: int = None, skip_hidden: bool = False):
+        self.source_dir = str(source_dir)
+        self._prefix = len(os.path.join(self.source_dir, ""))
+        self.exclude = tuple(exclude)
+        self.include = tuple(include)
+        self.max_depth = max_depth
+        self.min_size = min_size
+        self.max_size = max_size
+        self.skip_hidden = skip_hidden
+        self._exclude_files = self._compile(p for p in self.exclude if not p.endswith("/"))
+        self._exclude_dirs = self._compile(p.rstrip("/") for p in self.exclude)
+        self._include = None
+        if self.include:
+            patterns = []
+            for pattern in self.include:
+                if pattern.endswith("/"):
+                    # The files anywhere below the folder
+                    folder = pattern.rstrip("/")
+                    pattern = ("" if "/" in folder else "**/") + folder + "/*"
+                patterns.append(pattern)
+            self._include = self._compile(patterns)
+        self.sized = min_size is not None or max_size is not None
+
+    @classmethod
+    def for_source(cls, source_dir: Path, exclude=(), include=(), max_depth: int = None,
+                   min_size: int = None, max_size: int = None, skip_hidden: bool = False):
+        """
+        Builds the filter for source_dir, adding the patterns of the
+        IGNORE_FILE at its top if there is one. Returns None when nothing
+        would be left out, so plain walks don't check anything.
+        """
+        exclude = list(exclude)
+        ignore_file = Path(source_dir) / IGNORE_FILE
+        if ignore_file.is_file():
+            exclude += read_ignore_file(ignore_file)
+            # The ignore file itself stays in the source
+            exclude.append("/" + IGNORE_FILE)
+        if (not exclude and not include and max_depth is None and min_size is None
+                and max_size is None and not skip_hidden):
+            return None
+        return cls(source_dir, exclude, include, max_depth, min_size, max_size, skip_hidden)
+
+    @staticmethod
+    def _compile(patterns):
+        # Returns (regex for names, regex for relative paths); None where no pattern applies
+        names = []
+        paths = []
+        for pattern in patterns:
+            if pattern.startswith("**/"):
+                pattern = pattern[3:]
+                if "/" in pattern:
+                    paths.append(fnmatch.translate("*/" + pattern))
+            if "/" in pattern:
+                paths.append(fnmatch.translate(pattern.lstrip("/")))
+            elif pattern:
+                names.append(fnmatch.translate(pattern))
+        # Case-insensitive where the filesystem usually is, like fnmatch.fnmatch()
+        flags = re.IGNORECASE if os.name == "nt" else 0
+        return tuple(
+            re.compile("|".join(found), flags) if found else None for found in (names, paths)
+        )
+
+    def _matches(self, regexes, path: str, name: str) -> bool:
+        by_name, by_path = regexes
+        if by_name is not None and by_name.match(name) is not None:
+            return True
+        return by_path is not None and by_path.match(self.relative(path)) is not None
+
+    def relative(self, path: str) -> str:
+        """The path relative to the source, with "/" separators."""
+        return path[self._prefix:].replace(os.sep, "/")
+
+    def takes_dir(self, path: str, name: str) -> bool:
+        """True if the walk should go into this folder."""
+        if self.skip_hidden and name.startswith("."):
+            return False
+        if self.max_depth is not None and self.relative(path).count("/") >= self.max_depth:
+            return False
+        return not self._matches(self._exclude_dirs, path, name)
+
+    def takes_file(self, path: str, name: str) -> bool:
+        """True if the file should be organized, judging by its name and path."""
+        if self.skip_hidden and name.startswith("."):
+            return False
+        if self._matches(self._exclude_files, path, name):
+            return False
+        return self._include is None or self._matches(self._include, path, name)
+
+    def takes_size(self, size: int) -> bool:
+        """True if a file of this many bytes is within min_size and max_size."""
+        return ((self.min_size is None or size >= self.min_size)
+                and (self.max_size is None or size <= self.max_size))
+
+    def apply(self, files, subdirs):
+        """Filters a scan_dir() listing; returns the files and subfolders kept."""
+        files = [entry for entry in files if self.takes_file(entry.path, entry.name)]
+        subdirs = [path for path in subdirs if self.takes_dir(path, os.path.basename(path))]
+        return files, subdirs
+
+def scan_dir(root: str, dest_key, dest_path: str, scan_filter: ScanFilter = None):
+    """
+    Lists one folder. Returns (files, subdirs): the os.DirEntry of each
+    file and the paths of the subfolders to visit, or None if the folder
+    can't be read. With a ScanFilter, what it leaves out is dropped.
+
+    The destination folder is left out by comparing device/inode (plus its
+    path string, for destinations that are mount points), so no Path object
+    is built per subdirectory. Like os.walk, symlinks to directories are not
+    followed.
+    """
+    subdirs = []
+    files = []
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    files.append(entry)
+                    continue
+                if entry.is_symlink() or entry.path == dest_path:
+                    continue
+                # Ignore the destination folder itself
+                if (dest_key and entry.inode() == dest_key[1]
+                        and entry.stat(follow_symlinks=False).st_dev == dest_key[0]):
+                    continue
+                subdirs.append(entry.path)
+    except OSError:
+        return None
+    if scan_filter is not None:
+        return scan_filter.apply(files, subdirs)
+    return files, subdirs
+
+class ParallelScanner:
+    """
+    Walks a tree listing several folders at once, on worker threads.
+
+    Each worker keeps its own deque of folders to list. It pushes the
+    subfolders it finds and takes the newest one back (depth first, which
+    keeps the deques short); once its deque is empty it steals the oldest
+    folder of another worker, usually a large subtree near the root. The
+    files of each folder are handed to the consuming thread as one batch
+    through a bounded queue, so the walk never runs far ahead of it.
+
+    Files come out in a different order on each run. Iterating yields the
+    os.DirEntry of every file. A ScanFilter prunes folders as they are
+    listed.
+    """
+
+    def __init__(self, source_dir: Path, dest_dir: Path, threads: int = 4,
+                 queue_size: int = 256, scan_filter: ScanFilter = None):
+        self.source_dir = str(source_dir)
+        self.dest_key = _dir_key(dest_dir)
+        self.dest_path = str(dest_dir)
+        self.scan_filter = scan_filter
+        self.threads = threads
+        self._batches = queue.Queue(maxsize=queue_size)
+        self._deques = [deque() for _ in range(threads)]
+        self._wakeup = threading.Condition()
+        # Folders queued or being listed; the walk is over when it drops to 0
+        self._outstanding = 0
+        self._stop = threading.Event()
+        self._error = None
+
+    def _next_folder(self, me: int):
+        own = self._deques[me]
+        try:
+            return own.pop()
+        except IndexError:
+            pass
+        for offset in range(1, self.threads):
+            try:
+                return self._deques[(me + offset) % self.threads].popleft()
+            except IndexError:
+                continue
+        return None
+
+    def _put(self, batch):
+        while not self._stop.is_set():
+            try:
+                self._batches.put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _work(self, me: int):
+        try:
+            while not self._stop.is_set():
+                root = self._next_folder(me)
+                if root is None:
+                    with self._wakeup:
+                        if self._outstanding == 0:
+                            return
+                        self._wakeup.wait(0.05)
+                    continue
+                listing = scan_dir(root, self.dest_key, self.dest_path, self.scan_filter)
+                if listing is not None:
+                    files, subdirs = listing
+                    if subdirs:
+                        with self._wakeup:
+                            self._outstanding += len(subdirs)
+                            # Reversed so this worker continues in listing order
+                            self._deques[me].extend(reversed(subdirs))
+                            self._wakeup.notify_all()
+                    if files:
+                        self._put(files)
+                with self._wakeup:
+                    self._outstanding -= 1
+                    if self._outstanding == 0:
+                        self._wakeup.notify_all()
+        except BaseException as e:
+            self._error = e
+            self._stop.set()
+        finally:
+            # Tells the consumer this worker is done
+            self._batches.put(None)
+
+    def __iter__(self):
+        self._outstanding = 1
+        self._deques[0].append(self.source_dir)
+        workers = [
+            threading.Thread(target=self._work, args=(n,), daemon=True)
+            for n in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        running = len(workers)
+        try:
+            while running:
+                batch = self._batches.get()
+                if batch is None:
+                    running -= 1
+                    continue
+                yield from batch
+        finally:
+            # Also reached if the consumer stops early: stop the workers,
+            # emptying the queue so none stays blocked on it
+            self._stop.set()
+            for worker in workers:
+                while worker.is_alive():
+                    try:
+                        self._batches.get_nowait()
+                    except queue.Empty:
+                        worker.join(0.01)
+        if self._error is not None:
+            raise self._error
+
+def iter_dir_entries(source_dir: Path, dest_dir: Path, index=None, threads: int = 1,
+                     shard: "Shard" = None, scan_filter: ScanFilter = None):
+    """
+    Walks source_dir with os.scandir and yields the os.DirEntry of every
+    file, skipping dest_dir. Unreadable directories are silently skipped.
+    With a Shard, only the files of that shard are yielded. A ScanFilter
+    prunes folders and drops files by name as each folder is listed (file
+    sizes are left to iter_files()).
+
+    With threads > 1 a ParallelScanner lists folders concurrently; files
+    then come out in no fixed order.
+
+    With an IncrementalIndex, folders whose mtime is unchanged since they
+    were fully organized are not listed again; only their subfolders
+    (remembered in the index) are visited. The index is only used from
+    this thread, so it always walks serially. A folder the ScanFilter left
+    anything out of is not remembered as fully organized, so a later run
+    with other filters lists it again.
+    """
+    if shard is not None:
+        yield from shard.entries(source_dir, dest_dir, index, threads, scan_filter)
+        return
+    if threads > 1 and index is None:
+        yield from ParallelScanner(source_dir, dest_dir, threads, scan_filter=scan_filter)
+        return
+    dest_key = _dir_key(dest_dir)
+    dest_path = str(dest_dir)
+    stack = [str(source_dir)]
+    while stack:
+        root = stack.pop()
+        if index is not None:
+            try:
+                mtime = os.stat(root).st_mtime
+            except OSError:
+                continue
+            known_subdirs = index.unchanged_subdirs(root, mtime)
+            if known_subdirs is not None:
+                subdirs = [os.path.join(root, name) for name in known_subdirs]
+                if scan_filter is not None:
+                    subdirs = scan_filter.apply((), subdirs)[1]
+                stack.extend(reversed(subdirs))
+                continue
+        listing = scan_dir(root, dest_key, dest_path)
+        if listing is None:
+            continue
+        files, subdirs = listing
+        complete = True
+        if scan_filter is not None:
+            kept_files, kept_subdirs = scan_filter.apply(files, subdirs)
+            complete = len(kept_files) == len(files) and len(kept_subdirs) == len(subdirs)
+            files, subdirs = kept_files, kept_subdirs
+        if index is not None and complete:
+            index.remember_dir(root, mtime, subdirs)
+        yield from files
+        # Reversed so subfolders are visited in listing order, like os.walk
+        stack.extend(reversed(subdirs))
+
+def iter_files(source_dir: Path, dest_dir: Path, index=None, threads: int = 1,
+               profiler: "Profiler" = None, shard: "Shard" = None,
+               scan_filter: ScanFilter = None):
+    """
+    Yields a FileEntry for each file under source_dir, skipping dest_dir.
+    With an enabled Profiler, the time spent listing folders, stat'ing
+    files and classifying them goes to the walk, stat and classify stages.
+    The size limits of a ScanFilter are checked on the stat already made.
+    """
+    entries = iter_dir_entries(source_dir, dest_dir, index, threads, shard, scan_filter)
+    root = str(source_dir)
+    sized = scan_filter if scan_filter is not None and scan_filter.sized else None
+    if profiler is not None and profiler.enabled:
+        yield from _iter_files_profiled(entries, root, profiler, sized, index)
+        return
+    for entry in entries:
+        try:
+            st = entry.stat()
+        except OSError as e:
+            print(f"[ERROR] Could not read {entry.path}: {e}")
+            continue
+        if sized is not None and not sized.takes_size(st.st_size):
+            if index is not None:
+                # Left for a run with other size limits
+                index.mark_failed(entry)
+            continue
+        yield FileEntry(
+            entry.path, entry.name, st.st_size, st.st_mtime, st.st_dev, st.st_ino, root
+        )
+
+def _iter_files_profiled(entries, root: str, profiler: "Profiler", sized: ScanFilter = None,
+                         index=None):
+    """iter_files() with every step timed; kept apart so plain runs pay nothing."""
+    clock = time.perf_counter
+    stages = profiler.stages
+    while True:
+        started = clock()
+        entry = next(entries, None)
+        listed = clock()
+        stages["walk"] += listed - started
+        if entry is None:
+            return
+        try:
+            st = entry.stat()
+        except OSError as e:
+            print(f"[ERROR] Could not read {entry.path}: {e}")
+            continue
+        finally:
+            stated = clock()
+            stages["stat"] += stated - listed
+        if sized is not None and not sized.takes_size(st.st_size):
+            if index is not None:
+                index.mark_failed(entry)
+            continue
+        found = FileEntry(
+            entry.path, entry.name, st.st_size, st.st_mtime, st.st_dev, st.st_ino, root
+        )
+        stages["classify"] += clock() - stated
+        yield found
+
+def count_files(source_dir: Path, dest_dir: Path, index=None, threads: int = 1,
+                shard: "Shard" = None, scan_filter: ScanFilter = None):
+    """
+    Cheap pre-pass: counts files per category without keeping any paths.
+    Files are counted per extension, so each distinct extension is
+    classified only once, and only names are looked at: no file is stat'ed
+    unless the ScanFilter has size limits or a rule for its extension has
+    other conditions, in which case the file is matched against the rules
+    like in the run itself. Returns (summary, total, extensions).
+    """
+    ext_counts = {}
+    # Files whose extension alone doesn't decide their rule, per category
+    matched = {}
+    # Extension -> whether it decides the rule
+    decides = {}
+    root = str(source_dir)
+    sized = scan_filter is not None and scan_filter.sized
+    for entry in iter_dir_entries(source_dir, dest_dir, index, threads, shard, scan_filter):
+        ext = split_extension(entry.name)
+        decided = decides.get(ext)
+        if decided is None:
+            decided = decides[ext] = RULES.extension_rule(ext) is not None
+        if sized or not decided:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            if sized and not scan_filter.takes_size(st.st_size):
+                continue
+            if not decided:
+                category = RULES.match(entry.name, ext, st.st_size, st.st_mtime,
+                                       entry.path, root).category
+                matched[category] = matched.get(category, 0) + 1
+        ext_counts[ext] = ext_counts.get(ext, 0) + 1
+    return _count_summary(ext_counts, matched)
+
+def _count_summary(ext_counts: dict, matched: dict):
+    """
+    Builds the (summary, total, extensions) of a pre-pass from its files
+    per extension and, for those already matched one by one, per category.
+    """
+    summary = dict(matched)
+    for ext, count in ext_counts.items():
+        rule = RULES.extension_rule(ext)
+        if rule is not None:
+            summary[rule.category] = summary.get(rule.category, 0) + count
+    return summary, sum(ext_counts.values()), set(ext_counts)
+
+# ----------------------------
+# SHARDING
+# ----------------------------
+
+# How a source is split: each file by its path, or whole top-level folders
+SHARD_MODES = ("path", "top")
+
+class Shard:
+    """
+    One of count slices of a source, numbered from 1, so count independent
+    processes (on one machine or several) can organize it together.
+
+    A file belongs to the shard given by the CRC-32 of its path relative
+    to the source ("path", which spreads files evenly) or of the first
+    component of that path ("top", which keeps each top-level folder in
+    one shard and lets a shard skip listing the others). Both depend only
+    on the path, so every process agrees on the split without talking to
+    the others.
+
+    A sharded run claims its target names on disk (see NameIndex), keeps a
+    journal of its own and only finds duplicates among its own files;
+    merge_reports() combines the reports of the shards.
+    """
+    __slots__ = ("index", "count", "by")
+
+    def __init__(self, index: int, count: int, by: str = "path"):
+        if not 1 <= index <= count:
+            raise ValueError(f"shard {index} is not between 1 and {count}")
+        if by not in SHARD_MODES:
+            raise ValueError(f"unknown shard mode: {by}")
+        self.index = index
+        self.count = count
+        self.by = by
+
+    @classmethod
+    def parse(cls, text: str, by: str = "path") -> "Shard":
+        """Reads a shard written as "i/N", e.g. "2/4"."""
+        index, sep, count = text.partition("/")
+        if not (sep and index.isdigit() and count.isdigit()):
+            raise ValueError(f"expected i/N, got {text!r}")
+        return cls(int(index), int(count), by)
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def owns(self, relative: str) -> bool:
+        """True if the file at this path (relative to the source) belongs to this shard."""
+        relative = relative.replace(os.sep, "/")
+        if self.by == "top":
+            relative = relative.split("/", 1)[0]
+        key = relative.encode("utf-8", "surrogatepass")
+        return zlib.crc32(key) % self.count == self.index - 1
+
+    def entries(self, source_dir: Path, dest_dir: Path, index=None, threads: int = 1,
+                scan_filter: ScanFilter = None):
+        """iter_dir_entries() restricted to this shard's files."""
+        if self.by == "path":
+            prefix = len(os.path.join(str(source_dir), ""))
+            for entry in iter_dir_entries(source_dir, dest_dir, index, threads,
+                                          scan_filter=scan_filter):
+                if self.owns(entry.path[prefix:]):
+                    yield entry
+            return
+        listing = scan_dir(str(source_dir), _dir_key(dest_dir), str(dest_dir), scan_filter)
+        if listing is None:
+            return
+        files, subdirs = listing
+        yield from (entry for entry in files if self.owns(entry.name))
+        for subdir in subdirs:
+            if self.owns(os.path.basename(subdir)):
+                yield from iter_dir_entries(
+                    Path(subdir), dest_dir, index, threads, scan_filter=scan_filter
+                )
+
+# ----------------------------
+# CAPTURE DATES
+# ----------------------------
+
+DATE_SOURCES = ("exif", "container", "mtime")
+
+# Seconds from the QuickTime/MP4 epoch (1904-01-01 UTC) to the Unix epoch
+MP4_EPOCH_OFFSET = 2082844800
+
+# First box types of ISO media files (MP4, MOV, HEIC); old QuickTime files
+# may start with something other than ftyp
+ISO_BOX_TYPES = {b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot"}
+
+# Most bytes read at once from a header: a JPEG segment is at most 64 KiB
+# and a HEIC meta box a few KiB
+HEADER_READ_LIMIT = 1024 * 1024
+
+# Most bytes read from one JPEG segment (its length field is 16 bits)
+JPEG_SEGMENT_LIMIT = 64 * 1024
+
+def _tiff_date(data: bytes):
+    """
+    Returns the capture time in an EXIF (TIFF) block as a timestamp:
+    DateTimeOriginal, else DateTimeDigitized, else the IFD0 DateTime.
+    """
+    order = {b"II": "<", b"MM": ">"}.get(data[:2])
+    if order is None:
+        return None
+
+    def read_ifd(offset):
+        # {tag: (type, count, offset of the value field)}
+        (count,) = struct.unpack_from(order + "H", data, offset)
+        tags = {}
+        for pos in range(offset + 2, min(offset + 2 + 12 * count, len(data) - 11), 12):
+            tag, kind, n = struct.unpack_from(order + "HHI", data, pos)
+            tags[tag] = (kind, n, pos + 8)
+        return tags
+
+    ifd0 = read_ifd(struct.unpack_from(order + "I", data, 4)[0])
+    fields = []
+    if 0x8769 in ifd0:
+        exif = read_ifd(struct.unpack_from(order + "I", data, ifd0[0x8769][2])[0])
+        fields += [exif.get(0x9003), exif.get(0x9004)]
+    fields.append(ifd0.get(0x0132))
+    for field in fields:
+        # Dates are ASCII (type 2) "YYYY:MM:DD HH:MM:SS", stored elsewhere when over 4 bytes
+        if field is None or field[0] != 2:
+            continue
+        kind, n, pos = field
+        if n > 4:
+            (pos,) = struct.unpack_from(order + "I", data, pos)
+        text = data[pos:pos + n].split(b"\0")[0].decode("ascii", "replace")
+        try:
+            return datetime.strptime(text[:19], "%Y:%m:%d %H:%M:%S").timestamp()
+        except ValueError:
+            continue
+    return None
+
+def _jpeg_exif_date(f):
+    """Reads the JPEG marker headers up to the APP1 Exif segment, and only that segment."""
+    f.seek(2)
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return None
+        kind = marker[1]
+        (length,) = struct.unpack(">H", marker[2:])
+        if kind in (0xDA, 0xD9):
+            # Start of the image data: no metadata after this
+            return None
+        if length < 2:
+            # The length counts its own two bytes: the file is corrupt
+            return None
+        if kind == 0xE1:
+            segment = f.read(min(length - 2, JPEG_SEGMENT_LIMIT))
+            if segment[:6] == b"Exif\0\0":
+                return _tiff_date(segment[6:])
+        else:
+            f.seek(length - 2, 1)
+
+def _iso_boxes(f, start: int, end: int):
+    """
+    Yields (type, payload start, box end) for the ISO media boxes between
+    start and end, reading only their 8 or 16 byte headers.
+    """
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        payload = pos + 8
+        if size == 1:
+            (size,) = struct.unpack(">Q", f.read(8))
+            payload += 8
+        elif size == 0:
+            size = end - pos
+        if size < payload - pos:
+            return
+        yield kind, payload, pos + size
+        pos += size
+
+def _container_date(f, size: int):
+    """Returns the creation time in the movie header (moov/mvhd) of an MP4/MOV file."""
+    for kind, start, end in _iso_boxes(f, 0, size):
+        if kind != b"moov":
+            continue
+        for kind, start, end in _iso_boxes(f, start, end):
+            if kind == b"mvhd":
+                f.seek(start)
+                header = f.read(12)
+                if header[0] == 1:
+                    (created,) = struct.unpack(">Q", header[4:12])
+                else:
+                    (created,) = struct.unpack(">I", header[4:8])
+                # 0 means unset
+                return created - MP4_EPOCH_OFFSET if created > MP4_EPOCH_OFFSET else None
+        return None
+    return None
+
+def _uint(data: bytes, pos: int, size: int) -> int:
+    return int.from_bytes(data[pos:pos + size], "big")
+
+def _heif_exif_date(f, size: int):
+    """
+    Returns the EXIF capture time of a HEIC/HEIF image. The meta box is
+    read to find the Exif item (iinf) and where it is stored (iloc); then
+    only that item is read.
+    """
+    for kind, start, end in _iso_boxes(f, 0, size):
+        if kind == b"meta":
+            break
+    else:
+        return None
+    if end - start > HEADER_READ_LIMIT:
+        return None
+    f.seek(start)
+    meta = io.BytesIO(f.read(end - start))
+    # meta is a full box: 4 bytes of version and flags before its children
+    children = {kind: (start, end) for kind, start, end in _iso_boxes(meta, 4, end - start)}
+    if b"iinf" not in children or b"iloc" not in children:
+        return None
+
+    data = meta.getvalue()
+    start, end = children[b"iinf"]
+    version = data[start]
+    count_size = 2 if version == 0 else 4
+    exif_id = None
+    for kind, item, _ in _iso_boxes(meta, start + 4 + count_size, end):
+        if kind == b"infe" and data[item] >= 2:
+            id_size = 2 if data[item] == 2 else 4
+            if data[item + 4 + id_size + 2:item + 4 + id_size + 6] == b"Exif":
+                exif_id = _uint(data, item + 4, id_size)
+                break
+    if exif_id is None:
+        return None
+
+    pos, _ = children[b"iloc"]
+    version = data[pos]
+    offset_size, length_size = data[pos + 4] >> 4, data[pos + 4] & 15
+    base_size, index_size = data[pos + 5] >> 4, data[pos + 5] & 15
+    id_size = 2 if version < 2 else 4
+    count = _uint(data, pos + 6, id_size)
+    pos += 6 + id_size
+    for _ in range(count):
+        item = _uint(data, pos, id_size)
+        pos += id_size
+        method = 0
+        if version in (1, 2):
+            method = _uint(data, pos, 2) & 15
+            pos += 2
+        base = _uint(data, pos + 2, base_size)
+        extents = _uint(data, pos + 2 + base_size, 2)
+        pos += 4 + base_size
+        first = None
+        for _ in range(extents):
+            if version in (1, 2):
+                pos += index_size
+            extent = (_uint(data, pos, offset_size), _uint(data, pos + offset_size, length_size))
+            pos += offset_size + length_size
+            first = first or extent
+        if item != exif_id:
+            continue
+        if method != 0 or first is None:
+            # Stored inside the meta box (idat) or by reference: not handled
+            return None
+        f.seek(base + first[0])
+        block = f.read(min(first[1], HEADER_READ_LIMIT))
+        # The item starts with the offset of the TIFF header after these 4 bytes
+        return _tiff_date(block[4 + _uint(block, 0, 4):])
+    return None
+
+def read_capture_time(path, sources=("exif", "container")):
+    """
+    Returns when a photo or video was taken, as a timestamp, or None.
+
+    sources are tried in order: "exif" reads the EXIF date of JPEG and
+    HEIC files, "container" the creation time in the movie header of
+    MP4/MOV files, and "mtime" stops the search (the caller then uses the
+    modification time). Only header bytes are read, never the whole file.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(12)
+            if head[:2] == b"\xff\xd8":
+                readers = {"exif": lambda: _jpeg_exif_date(f)}
+            elif head[4:8] in ISO_BOX_TYPES:
+                size = os.fstat(f.fileno()).st_size
+                readers = {
+                    "exif": lambda: _heif_exif_date(f, size),
+                    "container": lambda: _container_date(f, size)
+                }
+            else:
+                return None
+            for source in sources:
+                if source == "mtime":
+                    return None
+                if source in readers:
+                    taken = readers[source]()
+                    if taken is not None:
+                        return taken
+    except (OSError, ValueError, IndexError, struct.error):
+        pass
+    return None
+
+class HeaderCache:
+    """
+    SQLite store in the destination for something read from file headers,
+    keyed by (path, size, mtime) and a key naming how it was read, so
+    re-runs don't open the files again. Files where nothing was found are
+    remembered too. With persist=False (dry runs) an existing store is
+    read but nothing is written.
+    """
+
+    FILENAME = None
+    BATCH_SIZE = 1000
+
+    def __init__(self, dest_dir: Path, key: str, persist: bool = True):
+        self.db_path = dest_dir / self.FILENAME
+        self.key = key
+        self.persist = persist
+        self._conn = None
+        self._pending = []
+        if self.db_path.exists():
+            self._connect()
+
+    def _connect(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path))
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS headers (path TEXT PRIMARY KEY, "
+                "size INTEGER, mtime REAL, key TEXT, value)"
+            )
+        return self._conn
+
+    def cached(self, entry: FileEntry):
+        """Returns (value or None,) if the file is in the store unchanged, else None."""
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT size, mtime, key, value FROM headers WHERE path = ?", (entry.path,)
+        ).fetchone()
+        if row is None or tuple(row[:3]) != (entry.size, entry.mtime, self.key):
+            return None
+        return row[3:]
+
+    def store(self, entry: FileEntry, value):
+        """Remembers what was read for a file (None for nothing); writes are batched."""
+        if not self.persist:
+            return
+        self._pending.append((entry.path, entry.size, entry.mtime, self.key, value))
+        if len(self._pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?)", self._pending)
+            self._pending = []
+
+    def close(self):
+        """Writes what is still pending and closes the database."""
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class CaptureDateCache(HeaderCache):
+    """
+    Capture dates of Images and Videos, read with read_capture_time(); the
+    key is the list of date sources.
+    """
+
+    FILENAME = ".maestro_dates.sqlite"
+
+    def __init__(self, dest_dir: Path, sources, persist: bool = True):
+        self.sources = tuple(sources)
+        super().__init__(dest_dir, ",".join(self.sources), persist)
+
+    def capture_time(self, entry: FileEntry) -> float:
+        """Returns the file's capture time, or its mtime if its headers have none."""
+        row = self.cached(entry)
+        if row is None:
+            row = (read_capture_time(entry.path, self.sources),)
+            self.store(entry, row[0])
+        return row[0] if row[0] is not None else entry.mtime
+
+# ----------------------------
+# CONTENT SNIFFING
+# ----------------------------
+
+# Bytes read from the start of a file to work out its type
+SNIFF_BYTES = 512
+
+# Threads reading file starts with sniff enabled
+SNIFF_WORKERS = 8
+
+# (offset, magic number, extension); the first match wins
+MAGIC_NUMBERS = [
+    (0, b"\xff\xd8\xff", ".jpg"),
+    (0, b"\x89PNG\r\n\x1a\n", ".png"),
+    (0, b"GIF87a", ".gif"),
+    (0, b"GIF89a", ".gif"),
+    (0, b"II*\0", ".tif"),
+    (0, b"MM\0*", ".tif"),
+    (0, b"8BPS", ".psd"),
+    (0, b"%PDF-", ".pdf"),
+    (0, b"{\\rtf", ".rtf"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", ".doc"),
+    (0, b"PK\x03\x04", ".zip"),
+    (0, b"Rar!\x1a\x07", ".rar"),
+    (0, b"7z\xbc\xaf\x27\x1c", ".7z"),
+    (0, b"\x1f\x8b", ".gz"),
+    (0, b"BZh", ".bz2"),
+    (0, b"\xfd7zXZ\0", ".xz"),
+    (0, b"MSCF", ".cab"),
+    (257, b"ustar", ".tar"),
+    (0, b"ID3", ".mp3"),
+    (0, b"fLaC", ".flac"),
+    (0, b"OggS", ".ogg"),
+    (0, b"\x1a\x45\xdf\xa3", ".mkv"),
+    (0, b"FLV\x01", ".flv"),
+    (0, b"MZ", ".exe"),
+    (0, b"#!", ".sh"),
+    (0, b"wOFF", ".woff"),
+    (0, b"wOF2", ".woff2"),
+    (0, b"OTTO", ".otf"),
+    (0, b"\0\x01\0\0\0", ".ttf"),
+]
+
+# RIFF files name their format at bytes 8-11, ISO media files their brand
+RIFF_FORMATS = {b"WAVE": ".wav", b"AVI ": ".avi", b"WEBP": ".webp"}
+ISO_BRANDS = {
+    b"heic": ".heic", b"heix": ".heic", b"mif1": ".heic", b"msf1": ".heic",
+    b"qt  ": ".mov", b"M4A ": ".m4a", b"3gp4": ".3gp", b"3gp5": ".3gp"
+}
+
+# Bump when the tables above change, so cached results are worked out again
+MAGIC_VERSION = "1"
+
+def sniff_type(path) -> str:
+    """
+    Returns the extension matching the start of a file's content (".jpg",
+    ".pdf", ...), or None. At most SNIFF_BYTES are read. Content that is
+    valid UTF-8 without control characters is taken as ".txt".
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+    except OSError:
+        return None
+    if head[:4] == b"RIFF":
+        return RIFF_FORMATS.get(head[8:12])
+    if head[4:8] == b"ftyp":
+        return ISO_BRANDS.get(head[8:12], ".mp4")
+    for offset, magic, ext in MAGIC_NUMBERS:
+        if head.startswith(magic, offset):
+            return ext
+    if not head or any(byte < 32 and byte not in b"\t\n\r\f" for byte in head):
+        return None
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Only a character cut in half by the read limit is allowed
+        if e.start < len(head) - 3:
+            return None
+    return ".txt"
+
+class FileTypeCache(HeaderCache):
+    """Types found by sniff_type(), as extensions; the key is MAGIC_VERSION."""
+
+    FILENAME = ".maestro_types.sqlite"
+
+    def __init__(self, dest_dir: Path, persist: bool = True):
+        super().__init__(dest_dir, MAGIC_VERSION, persist)
+
+def needs_sniffing(entry: FileEntry) -> bool:
+    """True for files whose extension doesn't name a known type."""
+    return entry.ext not in EXTENSION_MAP
+
+def apply_sniffed_type(entry: FileEntry, ext: str):
+    """Classifies the entry by the sniffed extension instead of its own."""
+    entry.ext = ext
+    entry.classify()
+
+def _sniff_batch(batch, cache: FileTypeCache, pool: ThreadPoolExecutor):
+    unknown = []
+    for entry in batch:
+        if not needs_sniffing(entry):
+            continue
+        row = cache.cached(entry)
+        if row is None:
+            unknown.append(entry)
+        elif row[0] is not None:
+            apply_sniffed_type(entry, row[0])
+    for entry, ext in zip(unknown, pool.map(sniff_type, [entry.path for entry in unknown])):
+        cache.store(entry, ext)
+        if ext is not None:
+            apply_sniffed_type(entry, ext)
+
+def sniff_entries(entries, cache: FileTypeCache, workers: int = SNIFF_WORKERS,
+                  batch_size: int = 256, profiler: "Profiler" = None):
+    """
+    Yields the FileEntry objects of entries in the same order, those with an
+    unknown extension reclassified by their content. Entries are taken in
+    batches whose unknown files are sniffed together on a thread pool;
+    results go to cache, so each file is read once across runs.
+    """
+    profiler = profiler or Profiler(enabled=False)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                with profiler.stage("sniff"):
+                    _sniff_batch(batch, cache, pool)
+                yield from batch
+                batch = []
+        with profiler.stage("sniff"):
+            _sniff_batch(batch, cache, pool)
+        yield from batch
+
+# ----------------------------
+# INCREMENTAL INDEX
+# ----------------------------
+
+class IncrementalIndex:
+    """
+    SQLite index kept in the destination that remembers what was organized,
+    so re-runs (nightly copies in particular) only process new or changed
+    files.
+
+    A file is unchanged when its path, size, mtime and inode all match the
+    last run. A folder is skipped without being listed when its mtime
+    matches the last run in which all of its files were organized; note
+    that rewriting a file in place does not change its folder's mtime.
+    """
+
+    FILENAME = ".maestro_index.sqlite"
+    BATCH_SIZE = 1000
+
+    def __init__(self, dest_dir: Path):
+        self.db_path = dest_dir / self.FILENAME
+        self._conn = None
+        self._pending_files = []
+        self._pending_dirs = {}
+        self._failed_dirs = set()
+        if self.db_path.exists():
+            self._connect()
+
+    def _connect(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path))
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, "
+                "size INTEGER, mtime REAL, inode INTEGER, destination TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, "
+                "mtime REAL, subdirs TEXT)"
+            )
+        return self._conn
+
+    def unchanged_subdirs(self, path: str, mtime: float):
+        """Returns the remembered subfolder names if the folder is unchanged, else None."""
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT mtime, subdirs FROM dirs WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None or row[0] != mtime:
+            return None
+        return json.loads(row[1])
+
+    def remember_dir(self, path: str, mtime: float, subdirs):
+        """Notes a listed folder; it is saved on close() unless one of its files failed."""
+        self._pending_dirs[path] = (mtime, [os.path.basename(d) for d in subdirs])
+
+    def is_unchanged(self, entry: "FileEntry") -> bool:
+        """True if the file was organized before and hasn't changed since."""
+        if self._conn is None:
+            return False
+        row = self._conn.execute(
+            "SELECT size, mtime, inode FROM files WHERE path = ?", (entry.path,)
+        ).fetchone()
+        return row is not None and tuple(row) == (entry.size, entry.mtime, entry.ino)
+
+    def organized(self):
+        """Yields (size, destination) for each file organized by earlier runs."""
+        if self._conn is not None:
+            yield from self._conn.execute("SELECT size, destination FROM files")
+
+    def record(self, entry: "FileEntry", destination):
+        """Remembers an organized file; writes are batched."""
+        self._pending_files.append(
+            (entry.path, entry.size, entry.mtime, entry.ino, str(destination))
+        )
+        if len(self._pending_files) >= self.BATCH_SIZE:
+            self.flush()
+
+    def mark_failed(self, entry: "FileEntry"):
+        """Keeps the file's folder from being marked as fully organized."""
+        self._failed_dirs.add(os.path.dirname(entry.path))
+
+    def forget(self, paths):
+        """Drops files, and the folders holding them, so they are organized again."""
+        if self._conn is None or not paths:
+            return
+        with self._conn as conn:
+            conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in paths])
+            conn.executemany(
+                "DELETE FROM dirs WHERE path = ?",
+                [(d,) for d in {os.path.dirname(p) for p in paths}]
+            )
+
+    def flush(self):
+        if self._pending_files:
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                    self._pending_files
+                )
+            self._pending_files = []
+
+    def close(self, save: bool = True):
+        """Writes what is still pending (unless save is False) and closes the database."""
+        if save:
+            self.flush()
+            dirs = [
+                (path, mtime, json.dumps(subdirs))
+                for path, (mtime, subdirs) in self._pending_dirs.items()
+                if path not in self._failed_dirs
+            ]
+            if dirs:
+                with self._connect() as conn:
+                    conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", dirs)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+def print_summary(summary: dict, total: int):
+    """Prints the number of files found per category."""
+    print("\nSummary of files found by category:")
+    for cat, count in summary.items():
+        print(f"- {cat}: {count}")
+    print(f"Total: {total} files\n")
+
+def confirm(assume_yes: bool = False) -> bool:
+    """Asks the user to go ahead; with assume_yes (--yes) it doesn't ask."""
+    if assume_yes:
+        return True
+    if input("Do you want to continue? (y/n): ").lower() == "y":
+        return True
+    print("Operation canceled by user.")
+    return False
+
+# ----------------------------
+# PROFILING
+# ----------------------------
+
+# Stages a Profiler times. report covers the report, journal and index
+# writes; transfer is the time spent moving/copying/linking files.
+PROFILE_STAGES = (
+    "count", "prompt", "walk", "stat", "sniff", "classify", "dates", "dedupe", "mkdir",
+    "collision", "transfer", "report"
+)
+
+class Profiler:
+    """
+    Records where a run spends its time: seconds per stage (PROFILE_STAGES)
+    and, per category, the files, bytes and transfer seconds behind its
+    throughput. Used as a context manager around a run, it also measures
+    the wall time and can write a cProfile dump to cpu_file and record
+    tracemalloc's peak and top allocation sites (memory=True).
+
+    Stages are recorded from the organizer's thread. Transfer times are
+    summed over every transfer, so with workers > 1 the transfer stage can
+    exceed the wall time. A disabled Profiler records nothing; the
+    organizers use one when none is passed in.
+    """
+
+    def __init__(self, enabled: bool = True, cpu_file: Path = None, memory: bool = False):
+        self.enabled = enabled
+        self.cpu_file = cpu_file
+        self.memory = memory
+        self.stages = dict.fromkeys(PROFILE_STAGES, 0.0)
+        self.categories = {}
+        self.seconds = None
+        self._started = None
+        self._cpu = None
+        self._allocations = None
+
+    def __enter__(self):
+        if self.cpu_file:
+            self._cpu = cProfile.Profile()
+            self._cpu.enable()
+        if self.memory:
+            tracemalloc.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._started
+        if self._cpu is not None:
+            self._cpu.disable()
+            self._cpu.dump_stats(self.cpu_file)
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            tracemalloc.stop()
+            self._allocations = {
+                "peak_bytes": peak,
+                "top": [
+                    {"where": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                    for stat in top
+                ]
+            }
+        return False
+
+    def stage(self, name: str):
+        """Context manager adding the time spent in its block to a stage."""
+        if not self.enabled:
+            return nullcontext()
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - started
+
+    def add(self, name: str, seconds: float):
+        """Adds seconds measured elsewhere to a stage."""
+        if self.enabled and seconds:
+            self.stages[name] += seconds
+
+    def count(self, category: str, size: int, seconds: float = None):
+        """Records one organized file and the time its transfer took."""
+        if not self.enabled:
+            return
+        stats = self.categories.setdefault(category, [0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += size
+        if seconds:
+            stats[2] += seconds
+            self.stages["transfer"] += seconds
+
+    def summary(self) -> dict:
+        """Returns the recorded timings as a JSON-serializable dict."""
+        categories = {}
+        for category, (files, size, seconds) in sorted(self.categories.items()):
+            categories[category] = {
+                "files": files,
+                "bytes": size,
+                "transfer_seconds": round(seconds, 6),
+                "files_per_s": round(files / seconds, 1) if seconds else None,
+                "mb_per_s": round(size / seconds / 1e6, 2) if seconds else None
+            }
+        files = sum(stats["files"] for stats in categories.values())
+        result = {
+            "seconds": round(self.seconds, 6) if self.seconds is not None else None,
+            "files": files,
+            "bytes": sum(stats["bytes"] for stats in categories.values()),
+            "files_per_s": round(files / self.seconds, 1) if self.seconds else None,
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "categories": categories
+        }
+        if self.cpu_file:
+            result["cpu_profile"] = str(self.cpu_file)
+        if self._allocations is not None:
+            result["memory"] = self._allocations
+        return result
+
+    def write(self, path: Path):
+        """Writes summary() to path as JSON."""
+        Path(path).write_text(json.dumps(self.summary(), indent=2), encoding="utf-8")
+
+def print_profile(profile: dict):
+    """Prints the stage times and per-category throughput of a Profiler summary."""
+    print(f"\nProfile: {profile['seconds']:.2f} seconds, {profile['files_per_s']} files/s")
+    for name, seconds in profile["stages"].items():
+        if seconds:
+            print(f"- {name}: {seconds:.3f} s")
+    for category, stats in profile["categories"].items():
+        throughput = f", {stats['mb_per_s']} MB/s" if stats["mb_per_s"] is not None else ""
+        print(f"- {category}: {stats['files']} files{throughput}")
+    if "memory" in profile:
+        print(f"Peak traced memory: {profile['memory']['peak_bytes'] / 1e6:.1f} MB")
+
+# ----------------------------
+# REPORT
+# ----------------------------
+
+REPORT_FORMATS = ("csv", "jsonl")
+
+class ReportWriter:
+    """
+    Writes the report one row at a time through a large buffer, so memory
+    doesn't grow with the number of files and a crash loses at most the
+    last buffer. report_format is "csv" or "jsonl" (JSON Lines); by default it
+    comes from the file name, and a name ending in ".gz" is compressed.
+    """
+
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, path: Path, fieldnames, report_format: str = None):
+        suffixes = [suffix.lower() for suffix in Path(path).suffixes]
+        if report_format is None:
+            report_format = "jsonl" if ".jsonl" in suffixes else "csv"
+        self.path = path
+        self.fieldnames = fieldnames
+        if suffixes[-1:] == [".gz"]:
+            self._file = gzip.open(path, "wt", newline="", encoding="utf-8")
+        else:
+            self._file = open(
+                path, "w", newline="", encoding="utf-8", buffering=self.BUFFER_SIZE
+            )
+        self._csv = None
+        if report_format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=fieldnames)
+            self._csv.writeheader()
+
+    def write(self, row: dict):
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps({key: row.get(key) for key in self.fieldnames}) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def open_report(report_file: Path, report_format: str = None, dedupe: bool = False,
+                pack: bool = False):
+    """
+    Opens the run's ReportWriter; returns None if report_file is None or
+    can't be created. dedupe adds the duplicate_of column, pack the member
+    column (a packed file's name inside its archive).
+    """
+    if not report_file:
+        return None
+    fieldnames = [
+        "source", "destination", "action", "size", "category",
+        "seconds", "mb_per_s", "error"
+    ]
+    if dedupe:
+        fieldnames.append("duplicate_of")
+    if pack:
+        fieldnames.append("member")
+    try:
+        return ReportWriter(report_file, fieldnames, report_format)
+    except Exception as e:
+        print(f"[ERROR] Could not generate report: {e}")
+        return None
+
+def read_report(path: Path):
+    """
+    Yields the rows of a report written by ReportWriter as dicts. CSV and
+    JSON Lines are told apart by the first character; ".gz" names are
+    decompressed.
+    """
+    opener = gzip.open if Path(path).suffix.lower() == ".gz" else open
+    with opener(path, "rt", newline="", encoding="utf-8") as f:
+        first = f.read(1)
+        f.seek(0)
+        if first == "{":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+def merge_reports(report_files, report_file: Path, report_format: str = None):
+    """
+    Combines the reports of several runs, such as the shards of one, into
+    report_file, one after the other. The duplicate_of and member columns
+    are kept if any of them has them. Returns the number of rows written,
+    or None if report_file can't be created.
+    """
+    dedupe = pack = False
+    for path in report_files:
+        rows = read_report(path)
+        first = next(rows, {})
+        dedupe = dedupe or "duplicate_of" in first
+        pack = pack or "member" in first
+        rows.close()
+    report = open_report(report_file, report_format, dedupe, pack)
+    if report is None:
+        return None
+    written = 0
+    try:
+        for path in report_files:
+            for row in read_report(path):
+                report.write(row)
+                written += 1
+    finally:
+        report.close()
+    return written
+
+class RunRecorder:
+    """
+    Writes the outcome of each file to the report, the journal and the
+    incremental index, whichever of them are in use, and counts it in the
+    Profiler. Shared by the organizer engines so their output is the same.
+    """
+
+    def __init__(self, names: NameIndex, report: ReportWriter = None,
+                 journal: "Journal" = None, index: "IncrementalIndex" = None,
+                 profiler: Profiler = None):
+        self.names = names
+        self.report = report
+        self.journal = journal
+        self.index = index
+        self.profiler = profiler or Profiler(enabled=False)
+
+    def _write_row(self, entry, destination, action, original=None, seconds=None,
+                   error=None, member=None):
+        if self.report is None:
+            return
+        row = {
+            "source": entry.path,
+            "destination": str(destination),
+            "action": action,
+            "size": entry.size,
+            "category": entry.category
+        }
+        if original is not None:
+            row["duplicate_of"] = str(original.target)
+        if member is not None:
+            row["member"] = member
+        if seconds is not None:
+            row["seconds"] = round(seconds, 6)
+            if seconds > 0 and error is None:
+                row["mb_per_s"] = round(entry.size / seconds / 1e6, 2)
+        if error is not None:
+            row["error"] = error
+        self.report.write(row)
+
+    def done(self, entry, destination, action: str, original=None, seconds=None,
+             member=None):
+        """
+        Records a file that was organized (or would be, in a dry run); a
+        packed file's destination is its archive, member its name in it.
+        """
+        self.profiler.count(entry.category, entry.size, seconds)
+        with self.profiler.stage("report"):
+            if self.index is not None:
+                self.index.record(entry, destination)
+            if self.journal is not None:
+                self.journal.done(entry.path, destination, action, member)
+            self._write_row(entry, destination, action, original, seconds, member=member)
+
+    def failed(self, entry, target: Path, action: str, seconds=None, error=None,
+               original=None, member=None):
+        """
+        Records a failed transfer and frees its target name. For a packed
+        file, target is the archive, which keeps its name.
+        """
+        if member is None:
+            self.names.release(target)
+        self.profiler.add("transfer", seconds)
+        with self.profiler.stage("report"):
+            if self.index is not None:
+                self.index.mark_failed(entry)
+            if self.journal is not None:
+                self.journal.abort(entry.path, target)
+            self._write_row(entry, target, action, original, seconds, error, member)
+
+    def finish(self, entry, target: Path, action: str, original, result):
+        """Records a transfer from what timed_transfer() returned for it."""
+        destination, seconds, error = result
+        if destination is None:
+            self.failed(entry, target, action, seconds, error, original)
+        else:
+            self.done(entry, destination, action, original, seconds)
+
+# ----------------------------
+# JOURNAL
+# ----------------------------
+
+class Journal:
+    """
+    Write-ahead log of a run, kept in the destination as JSON Lines.
+
+    Every transfer is written as "begin" before it starts and as "done" or
+    "abort" once it ends; a packed file's lines also name its member in
+    the archive that is its target. Each line is flushed to the OS right
+    away, so a killed process loses nothing; fsync runs every SYNC_EVERY
+    lines, so a power loss costs at most that many. A finished run ends
+    with "end"; a journal without it can be picked up by a resumed run,
+    and undo_journal() reverses the run it records.
+    """
+
+    PREFIX = ".maestro_journal_"
+    SYNC_EVERY = 100
+
+    def __init__(self, path: Path, header: dict = None):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._unsynced = 0
+        if header is not None:
+            self._write(dict(header, op="start"))
+
+    @classmethod
+    def create(cls, source_dir: Path, dest_dir: Path, move: bool, shard=None):
+        """Starts a new journal for this run (or this shard of it) in the destination."""
+        name = f"{cls.PREFIX}{datetime.now():%Y%m%d_%H%M%S_%f}"
+        if shard is not None:
+            name += "_shard" + str(shard).replace("/", "of")
+        header = {
+            "source": str(source_dir),
+            "destination": str(dest_dir),
+            "move": move,
+            "started": datetime.now().isoformat(timespec="seconds")
+        }
+        if shard is not None:
+            header["shard"] = str(shard)
+        return cls(dest_dir / f"{name}.jsonl", header)
+
+    @classmethod
+    def find_interrupted(cls, dest_dir: Path, shard=None):
+        """
+        Returns the newest journal in dest_dir whose run didn't finish, or
+        None. Only journals of the same shard (or of unsharded runs, for
+        None) are considered, so shards resume independently.
+        """
+        shard = None if shard is None else str(shard)
+        for path in sorted(dest_dir.glob(cls.PREFIX + "*.jsonl"), reverse=True):
+            header, _, _, status = read_journal(path)
+            if status == "interrupted" and header.get("shard") == shard:
+                return path
+        return None
+
+    def _write(self, record: dict):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.SYNC_EVERY:
+            self.sync()
+
+    def begin(self, source, target, action: str, member: str = None):
+        record = {"op": "begin", "source": str(source), "target": str(target), "action": action}
+        if member is not None:
+            record["member"] = member
+        self._write(record)
+
+    def done(self, source, target, action: str, member: str = None):
+        record = {"op": "done", "source": str(source), "target": str(target), "action": action}
+        if member is not None:
+            record["member"] = member
+        self._write(record)
+
+    def abort(self, source, target):
+        self._write({"op": "abort", "source": str(source), "target": str(target)})
+
+    def sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self, op: str = None):
+        """Optionally writes a final "end"/"undo" line, then syncs and closes."""
+        if op is not None:
+            self._write({"op": op})
+        self.sync()
+        self._file.close()
+
+def read_journal(path: Path):
+    """
+    Reads a journal. Returns (header, done, pending, status): done and
+    pending map each source to its last "done"/"begin" line, and status
+    is "completed", "undone" or "interrupted". A line cut short by a crash
+    is ignored.
+    """
+    header, done, pending, status = {}, {}, {}, "interrupted"
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            op = record.get("op")
+            if op == "start":
+                header = record
+            elif op == "begin":
+                pending[record["source"]] = record
+            elif op == "done":
+                pending.pop(record["source"], None)
+                done[record["source"]] = record
+            elif op == "abort":
+                pending.pop(record["source"], None)
+            elif op == "end":
+                status = "completed"
+            elif op == "undo":
+                status = "undone"
+    return header, done, pending, status
+
+def settle_pending(pending: dict, done: dict, journal: Journal = None,
+                   move: bool = False) -> dict:
+    """
+    Sorts out transfers that began but never finished. If the source is
+    still there, the target may be incomplete: it is deleted so the file
+    can be organized again. Otherwise the transfer went through. The
+    outcome is written to journal, if given. Returns the finished ones.
+
+    Packed files share their archive, so they are settled archive by
+    archive: its members are only recorded as done once it is complete, so
+    an archive with a member in done is kept, its pending members are done
+    too and, for a move, the sources still left are deleted. An archive
+    with no member in done is partial and is deleted.
+    """
+    finished = {}
+    archives = {}
+    for source, record in pending.items():
+        target = record["target"]
+        if "member" in record:
+            archives.setdefault(target, []).append((source, record))
+            continue
+        if os.path.lexists(source):
+            if os.path.lexists(target):
+                try:
+                    os.remove(target)
+                except OSError as e:
+                    print(f"[ERROR] Could not remove {target}: {e}")
+                    continue
+            if journal is not None:
+                journal.abort(source, target)
+        elif os.path.lexists(target):
+            finished[source] = record
+            if journal is not None:
+                journal.done(source, target, record["action"])
+    # Archive -> sources of its members recorded as done
+    packed = {}
+    if archives:
+        for source, record in done.items():
+            if "member" in record:
+                packed.setdefault(record["target"], []).append(source)
+    for target, records in archives.items():
+        if target not in packed:
+            if os.path.lexists(target):
+                try:
+                    os.remove(target)
+                except OSError as e:
+                    print(f"[ERROR] Could not remove {target}: {e}")
+                    continue
+            if journal is not None:
+                for source, _ in records:
+                    journal.abort(source, target)
+            continue
+        for source, record in records:
+            finished[source] = record
+            if journal is not None:
+                journal.done(source, target, record["action"], record["member"])
+        if not move:
+            continue
+        if journal is not None:
+            journal.sync()
+        # The run stopped while finishing the archive (see Packer._finish())
+        for source in packed[target] + [source for source, _ in records]:
+            if os.path.lexists(source):
+                try:
+                    os.remove(source)
+                except OSError as e:
+                    print(f"[ERROR] Packed {source}, but could not remove it: {e}")
+    return finished
+
+def open_journal(source_dir: Path, dest_dir: Path, move: bool, resume: bool = False,
+                 shard=None):
+    """
+    Returns (journal, completed) for a run: with resume, the newest
+    interrupted journal (of the same shard) is reopened and completed maps
+    the sources it already handled; otherwise a new journal is started.
+    """
+    journal_path = Journal.find_interrupted(dest_dir, shard) if resume else None
+    if journal_path is None:
+        if resume:
+            print("No interrupted run found; starting a new one.")
+        return Journal.create(source_dir, dest_dir, move, shard), {}
+    print(f"Resuming the run recorded in {journal_path}")
+    header, completed, pending, _ = read_journal(journal_path)
+    journal = Journal(journal_path)
+    completed.update(settle_pending(pending, completed, journal, header.get("move", move)))
+    return journal, completed
+
+def undo_journal(journal_path: Path, assume_yes: bool = False):
+    """
+    Reverses the run recorded in a journal, newest operation first: moved
+    files go back to their source path, copies and links are deleted, and
+    destination folders left empty are removed. Packed files are extracted
+    back to their source path (moves) and each pack archive is deleted once
+    nothing in it is left to restore. assume_yes skips the confirmation.
+    """
+    if not journal_path.is_file():
+        print(f"[ERROR] Journal not found: {journal_path}")
+        return
+    header, done, pending, status = read_journal(journal_path)
+    if status == "undone":
+        print("This run has already been undone.")
+        return
+    move = header.get("move", True)
+    done.update(settle_pending(pending, done, move=move))
+    records = [record for record in done.values() if record["action"] != "DUPLICATE"]
+    dest_dir = Path(header.get("destination", journal_path.parent))
+
+    print(f"\n{len(records)} operations will be reverted.")
+    if not confirm(assume_yes):
+        return
+
+    reverted = []
+    folders = set()
+    archives = {}
+    for record in tqdm(reversed(records), total=len(records), desc="Reverting", unit="file"):
+        source, target = record["source"], record["target"]
+        if record["action"] == "PACK":
+            # Restored archive by archive, below, so each is read only once
+            archives.setdefault(target, {})[record["member"]] = source
+            continue
+        try:
+            if move:
+                if os.path.lexists(source):
+                    print(f"[ERROR] Could not restore {target}: {source} already exists")
+                    continue
+                os.makedirs(os.path.dirname(source), exist_ok=True)
+                shutil.move(target, source)
+            else:
+                os.remove(target)
+        except OSError as e:
+            print(f"[ERROR] Could not revert {target}: {e}")
+            continue
+        reverted.append(source)
+        folders.add(Path(target).parent)
+
+    for archive, members in archives.items():
+        restored = unpack_files(Path(archive), members) if move else list(members.values())
+        reverted.extend(restored)
+        if len(restored) < len(members):
+            continue
+        try:
+            os.remove(archive)
+        except OSError as e:
+            print(f"[ERROR] Could not remove {archive}: {e}")
+            continue
+        folders.add(Path(archive).parent)
+
+    # Remove year/extension folders, then category folders, left empty
+    for folder in sorted(folders, key=lambda p: len(p.parts), reverse=True):
+        while folder != dest_dir and dest_dir in folder.parents:
+            try:
+                folder.rmdir()
+            except OSError:
+                break
+            folder = folder.parent
+
+    # The incremental index must not skip the restored files next time
+    index = IncrementalIndex(dest_dir)
+    index.forget(reverted)
+    index.close(save=False)
+
+    journal = Journal(journal_path)
+    journal.close(op="undo")
+    print(f"Reverted {len(reverted)} of {len(records)} operations.")
+
+# ----------------------------
+# SMALL-FILE PACKING
+# ----------------------------
+
+# Name suffix of a pack archive for each compression
+PACK_SUFFIXES = {"none": ".tar", "gzip": ".tar.gz", "zstd": ".tar.zst"}
+
+# Pack archives are named packed_<run start>_<n><suffix> in their target folder
+PACK_PREFIX = "packed_"
+
+class PackArchive:
+    """
+    A pack archive being written: a tar stream, compressed on the fly if
+    asked, with the files added to it so far and their total size. In a
+    dry run (write=False) nothing is written; only the size is counted.
+    broken is set once a file failed halfway through being added, which
+    leaves a partial member the stream can't take back.
+    """
+
+    def __init__(self, path: Path, compression: str = "none", write: bool = True):
+        self.path = path
+        self.files = []
+        self.size = 0
+        self.broken = False
+        self.tar = None
+        if not write:
+            return
+        self._file = open(path, "wb")
+        self._compressor = None
+        if compression == "zstd":
+            self._compressor = zstandard.ZstdCompressor().stream_writer(self._file, closefd=False)
+            self.tar = tarfile.open(fileobj=self._compressor, mode="w|")
+        else:
+            self.tar = tarfile.open(fileobj=self._file, mode="w|gz" if compression == "gzip" else "w|")
+
+    def add(self, path: str, member: str):
+        """
+        Appends a file (or symlink) as member, streaming it in buffer-sized
+        chunks. The member takes the size of the open file; if the file
+        shrinks or grows while it is copied the archive is left broken.
+        """
+        st = os.lstat(path)
+        info = tarfile.TarInfo(member)
+        info.mode = st.st_mode & 0o7777
+        # A plain tar header only holds whole seconds: the exact mtime goes
+        # in a pax header, so an undo gives the file back the one it had
+        info.mtime = int(st.st_mtime)
+        info.pax_headers = {"mtime": str(Decimal(st.st_mtime_ns).scaleb(-9))}
+        if stat.S_ISLNK(st.st_mode):
+            info.type = tarfile.SYMTYPE
+            info.linkname = os.readlink(path)
+            self.tar.addfile(info)
+            return
+        with open(path, "rb") as f:
+            info.size = os.fstat(f.fileno()).st_size
+            try:
+                # Raises OSError if the file ends before info.size bytes
+                self.tar.addfile(info, f)
+                if f.read(1):
+                    raise OSError(f"{path} grew while being packed")
+            except OSError:
+                self.broken = True
+                raise
+        self.size += info.size
+
+    def close(self):
+        """Ends the archive and syncs it to disk."""
+        if self.tar is None:
+            return
+        self.tar.close()
+        if self._compressor is not None:
+            self._compressor.close()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def discard(self):
+        """Closes and deletes an archive that won't be completed."""
+        if self.tar is None:
+            return
+        try:
+            self.tar.close()
+            if self._compressor is not None:
+                self._compressor.close()
+        except (OSError, ValueError):
+            pass
+        try:
+            self._file.close()
+            os.remove(self.path)
+        except OSError:
+            pass
+
+@contextmanager
+def read_pack(path: Path):
+    """Opens a pack archive for one pass over its members, whatever its compression."""
+    with open(path, "rb") as f:
+        if path.name.endswith(".zst"):
+            if zstandard is None:
+                raise ValueError(f"the zstandard module is needed to read {path}")
+            f = zstandard.ZstdDecompressor().stream_reader(f)
+        with tarfile.open(fileobj=f, mode="r|*") as tar:
+            yield tar
+
+def unpack_files(archive: Path, members: dict) -> list:
+    """
+    Writes members of a pack archive back to disk, given as member name ->
+    path, keeping their mode and mtime; existing files are not overwritten.
+    Returns the paths written.
+    """
+    written = []
+    try:
+        with read_pack(archive) as tar:
+            for info in tar:
+                path = members.get(info.name)
+                if path is None:
+                    continue
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if info.issym():
+                        os.symlink(info.linkname, path)
+                    else:
+                        with tar.extractfile(info) as src, open(path, "xb") as dst:
+                            shutil.copyfileobj(src, dst)
+                        os.chmod(path, info.mode)
+                        # Exact when the member has a pax mtime (see PackArchive.add())
+                        mtime = info.pax_headers.get("mtime", info.mtime)
+                        mtime_ns = int(Decimal(mtime).scaleb(9))
+                        os.utime(path, ns=(mtime_ns, mtime_ns))
+                except OSError as e:
+                    print(f"[ERROR] Could not restore {path} from {archive}: {e}")
+                    continue
+                written.append(path)
+    except (OSError, ValueError, tarfile.TarError) as e:
+        print(f"[ERROR] Could not read {archive}: {e}")
+    return written
+
+class Packer:
+    """
+    Bundles the files it is given (those a Planner marks "PACK", being
+    under its size threshold) into one tar archive per target folder
+    instead of transferring them one by one, so a tree of many tiny files
+    lands as a few large ones. Files are streamed into the folder's open
+    archive (see PackArchive) as they come; an archive is closed at
+    MAX_MEMBERS files or MAX_BYTES bytes and the next file starts another.
+
+    Files are recorded as done, under their archive and member name, only
+    once their archive is complete and synced, and only then are moved
+    files deleted from the source. If the run stops first, its open
+    archives are deleted and their files are left where they were; if it
+    stops in between, a resumed run or an undo finishes the archive (see
+    settle_pending()).
+
+    Member names are picked like target names (see NameIndex), so files
+    with the same name get the usual "_1" suffix inside an archive.
+    Packing is not combined with dedupe or link.
+    """
+
+    MAX_MEMBERS = 10000
+    MAX_BYTES = 1024 ** 3
+
+    def __init__(self, names: NameIndex, recorder: RunRecorder, compression: str = "none",
+                 move: bool = True, dry_run: bool = False):
+        self.names = names
+        self.recorder = recorder
+        self.compression = compression
+        self.move = move
+        self.dry_run = dry_run
+        self.members = NameIndex()
+        self._stamp = f"{datetime.now():%Y%m%d_%H%M%S}"
+        self._archives = {}
+        self._counts = {}
+
+    def _open(self, folder: Path) -> PackArchive:
+        count = self._counts.get(folder, 0) + 1
+        self._counts[folder] = count
+        name = f"{PACK_PREFIX}{self._stamp}_{count}{PACK_SUFFIXES[self.compression]}"
+        if self.dry_run:
+            archive = PackArchive(folder / name, write=False)
+        else:
+            archive = PackArchive(self.names.reserve(folder, name), self.compression)
+        self.members.add_folder(archive.path, ())
+        self._archives[folder] = archive
+        return archive
+
+    def add(self, entry: FileEntry, folder: Path):
+        """Packs a file into the open archive of its target folder."""
+        profiler = self.recorder.profiler
+        archive = self._archives.get(folder) or self._open(folder)
+        member = self.members.reserve(archive.path, entry.name).name
+        if self.dry_run:
+            archive.size += entry.size
+            archive.files.append(entry)
+            self.recorder.done(entry, archive.path, "PACK", member=member)
+        else:
+            if self.recorder.journal is not None:
+                with profiler.stage("report"):
+                    self.recorder.journal.begin(entry.path, archive.path, "PACK", member)
+            started = time.perf_counter()
+            try:
+                archive.add(entry.path, member)
+            except OSError as e:
+                print(f"[ERROR] Could not pack {entry.path}: {e}")
+                self.recorder.failed(entry, archive.path, "PACK",
+                                     time.perf_counter() - started, str(e), member=member)
+                if archive.broken:
+                    print(f"[ERROR] Discarded {archive.path}; its files were left unpacked")
+                    self._discard(folder, f"the archive was discarded after {entry.path} failed")
+                return
+            archive.files.append((entry, member, time.perf_counter() - started))
+        if len(archive.files) >= self.MAX_MEMBERS or archive.size >= self.MAX_BYTES:
+            self._finish(folder)
+
+    def _finish(self, folder: Path):
+        archive = self._archives.pop(folder)
+        if self.dry_run:
+            return
+        with self.recorder.profiler.stage("transfer"):
+            archive.close()
+        for entry, member, seconds in archive.files:
+            self.recorder.done(entry, archive.path, "PACK", seconds=seconds, member=member)
+        if not self.move:
+            return
+        if self.recorder.journal is not None:
+            self.recorder.journal.sync()
+        for entry, _, _ in archive.files:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                print(f"[ERROR] Packed {entry.path}, but could not remove it: {e}")
+
+    def close(self, complete: bool = True):
+        """
+        Finishes the open archives or, if complete is False (the run was
+        interrupted), deletes them and leaves their files unpacked.
+        """
+        for folder in list(self._archives):
+            if complete:
+                self._finish(folder)
+            else:
+                self._discard(folder, "run interrupted before the archive was complete")
+
+    def _discard(self, folder: Path, reason: str):
+        archive = self._archives.pop(folder)
+        if self.dry_run:
+            return
+        archive.discard()
+        for entry, member, seconds in archive.files:
+            self.recorder.failed(entry, archive.path, "PACK", seconds, reason, member=member)
+
+# ----------------------------
+# MAIN FUNCTION
+# ----------------------------
+
+def organize_files(
+    source_dir: Path,
+    dest_dir: Path,
+    move: bool = True,
+    dry_run: bool = False,
+    report_file: Path = None,
+    stream: bool = False,
+    workers: int = 1,
+    per_device: int = None,
+    dedupe: str = None,
+    incremental: bool = False,
+    link: str = None,
+    buffer_size: int = COPY_BUFFER_SIZE,
+    fadvise: bool = False,
+    resume: bool = False,
+    report_format: str = None,
+    scan_threads: int = 1,
+    date_source=None,
+    sniff: bool = False,
+    assume_yes: bool = False,
+    shard: Shard = None,
+    scan_filter: ScanFilter = None,
+    pack_under: int = None,
+    pack_compression: str = "none",
+    profiler: Profiler = None
+):
+    """
+    Organizes files from the source directory into the destination.
+
+    Files are streamed from the walk through a Planner into an Executor,
+    so memory stays bounded whatever the tree size, and each goes where
+    the first matching rule of the active RuleSet (see use_rules()) sends
+    it. Unless stream is set, a count-only pre-pass prints a summary first.
+
+    move: move files (plain renames within one device) instead of copying.
+    dry_run: only report what would be done.
+    report_file, report_format: the report, see ReportWriter.
+    stream: skip the pre-pass; the summary is printed at the end.
+    workers, per_device: transfer threads, and the cap per device.
+    dedupe: "skip", "hardlink" or "report" duplicates (see DuplicateIndex)
+        of files organized in this run, the run it resumes or, with
+        incremental, earlier runs.
+    incremental: skip files and folders unchanged since the last run (see
+        IncrementalIndex).
+    link: "hard", "reflink" or "symlink" instead of copies; only when move
+        is False.
+    buffer_size, fadvise: how data is copied, see copy_file().
+    resume: pick up the newest interrupted Journal of the destination.
+    scan_threads: list folders with a ParallelScanner (not with
+        incremental); same-named files may then get their "_1" in any order.
+    date_source: where dated categories get their year, see
+        read_capture_time(); by default the modification time.
+    sniff: classify unknown extensions by content (see sniff_entries()),
+        which the pre-pass summary doesn't do.
+    assume_yes: skip the confirmation prompt.
+    shard: organize only this Shard of the source.
+    scan_filter: the ScanFilter of the walk.
+    pack_under, pack_compression: pack smaller files into tar archives,
+        see Packer.
+    profiler: a Profiler, entered by the caller, to time the run's stages.
+    """
+    started = time.perf_counter()
+    profiler = profiler or Profiler(enabled=False)
+    total = None
+    extensions = ()
+    index = IncrementalIndex(dest_dir) if incremental else None
+
+    # 1️⃣ Count files per category (names only, no paths are kept)
+    if not stream:
+        with profiler.stage("count"):
+            summary, total, extensions = count_files(
+                source_dir, dest_dir, index, scan_threads, shard, scan_filter
+            )
+
+        # 2️⃣ Show summary to the user
+        print_summary(summary, total)
+    else:
+        print("\nStreaming mode: files will be organized as they are found.")
+    if shard is not None:
+        print(f"Shard {shard} (by {shard.by}): only this slice of the source is organized.")
+
+    # 3️⃣ Confirm execution
+    with profiler.stage("prompt"):
+        proceed = confirm(assume_yes)
+    if not proceed:
+        if index is not None:
+            index.close(save=False)
+        return
+
+    # The destination must exist before the walk so it can be recognized
+    # (and skipped) by device/inode when it lives inside the source
+    if not dry_run:
+        dest_dir.mkdir(parents=True, exist_ok=True)
+    dirs = DirectoryCache(dest_dir, create=not dry_run)
+    with profiler.stage("mkdir"):
+        dirs.create_for_extensions(extensions)
+
+    journal = None
+    completed = {}
+    if not dry_run:
+        journal, completed = open_journal(source_dir, dest_dir, move, resume, shard)
+    # Report rows are written as files are processed
+    report = open_report(report_file, report_format, dedupe=bool(dedupe), pack=bool(pack_under))
+    dates = None
+    if date_source and tuple(date_source) != ("mtime",):
+        dates = CaptureDateCache(dest_dir, date_source, persist=not dry_run)
+    types = FileTypeCache(dest_dir, persist=not dry_run) if sniff else None
+
+    # 4️⃣ Walk and process files with progress bar
+    summary = {}
+    progress = tqdm(total=total, desc="Organizing", unit="file")
+    names = NameIndex(claim=shard is not None and not dry_run)
+    duplicates = None
+    if dedupe:
+        duplicates = DuplicateIndex()
+        if index is not None:
+            # Files skipped as unchanged, whole folders of them included, can
+            # still be the originals of this run's files (archives can't)
+            duplicates.add_organized(
+                (size, destination) for size, destination in index.organized()
+                if not os.path.basename(destination).startswith(PACK_PREFIX)
+            )
+    action = "MOVE" if move else LINK_ACTIONS.get(link, "COPY")
+    planner = Planner(names, dirs, action, dates, duplicates, dedupe, pack_under, profiler)
+    recorder = RunRecorder(names, report, journal, index if not dry_run else None, profiler)
+    packer = None
+    if pack_under:
+        packer = Packer(names, recorder, pack_compression, move, dry_run)
+    executor = Executor(
+        recorder, dest_dir, move, link, workers, per_device, buffer_size, fadvise, dry_run,
+        duplicates=duplicates, packer=packer, advance=lambda: progress.update(1)
+    )
+    unchanged = 0
+    resumed = 0
+    finished = False
+
+    entries = iter_files(source_dir, dest_dir, index, scan_threads, profiler, shard, scan_filter)
+    if types is not None:
+        entries = sniff_entries(entries, types, profiler=profiler)
+
+    try:
+        for entry in entries:
+            category = entry.category
+            summary[category] = summary.get(category, 0) + 1
+            if entry.path in completed:
+                # Handled before the previous run was interrupted
+                resumed += 1
+                progress.update(1)
+                record = completed[entry.path]
+                if (duplicates is not None and record["action"] != "DUPLICATE"
+                        and "member" not in record):
+                    duplicates.add_organized([(entry.size, record["target"])])
+                continue
+            if index is not None and index.is_unchanged(entry):
+                # Already organized by a previous run
+                unchanged += 1
+                progress.update(1)
+                continue
+            op, candidate = planner.plan(entry)
+            executor.run(op, entry, candidate)
+
+        executor.drain()
+        if packer is not None:
+            packer.close()
+        finished = True
+    finally:
+        # Reached on Ctrl-C too: wait for running transfers and close the
+        # journal and report so a later --resume knows where this run stopped
+        executor.close()
+        if packer is not None and not finished:
+            packer.close(complete=False)
+        if duplicates is not None:
+            duplicates.close()
+        progress.close()
+        if dates is not None:
+            dates.close()
+        if types is not None:
+            types.close()
+        if journal is not None:
+            journal.close(op="end" if finished else None)
+        if report is not None:
+            report.close()
+    if index is not None:
+        index.close(save=not dry_run)
+        print(f"Skipped {unchanged} files unchanged since the last run.")
+    if resumed:
+        print(f"Skipped {resumed} files already handled by the interrupted run.")
+
+    if stream:
+        print_summary(summary, sum(summary.values()))
+
+    # 5️⃣ Report and journal locations
+    if report is not None:
+        print(f"Report saved to: {report_file}")
+    if journal is not None:
+        print(f"Journal saved to: {journal.path}")
+
+    print("\nOrganization completed!")
+    print(f"Total execution time: {time.perf_counter() - started:.2f} seconds")
+
+# ----------------------------
+# PLAN AND EXECUTE
+# ----------------------------
+
+PLAN_VERSION = 1
+
+class PlanOp(NamedTuple):
+    """One file of a Plan: where it goes, how, and what it was when planned."""
+    source: str
+    target: str
+    action: str
+    category: str
+    size: int
+    mtime: float
+    duplicate_of: str = None
+
+    @property
+    def path(self) -> str:
+        """The source, under the name RunRecorder reads from a FileEntry."""
+        return self.source
+
+class Planner:
+    """
+    Works out the PlanOp of each file: its target folder from the active
+    RuleSet, a free name there (reserved in names) and, with a
+    DuplicateIndex, whether its content is already planned. make_plan()
+    collects the ops into a Plan; organize_files(), watch_files() and the
+    async engine hand each one to an Executor as soon as it is planned.
+    """
+
+    def __init__(self, names: NameIndex, dirs: DirectoryCache, action: str,
+                 dates: CaptureDateCache = None, duplicates: DuplicateIndex = None,
+                 dedupe: str = None, pack_under: int = None, profiler: Profiler = None):
+        self.names = names
+        self.dirs = dirs
+        self.action = action
+        self.dates = dates
+        self.duplicates = duplicates
+        self.dedupe = dedupe
+        self.pack_under = pack_under
+        self.profiler = profiler or Profiler(enabled=False)
+
+    def target_folder(self, entry: FileEntry, mtime: float = None) -> str:
+        """
+        Returns the folder a file goes to, relative to the destination.
+        mtime is its date when already known; otherwise it is read from the
+        CaptureDateCache, if any, or taken from the file.
+        """
+        if mtime is None:
+            mtime = entry.mtime
+            if self.dates is not None and entry.rule.dated:
+                with self.profiler.stage("dates"):
+                    mtime = self.dates.capture_time(entry)
+        with self.profiler.stage("classify"):
+            return get_target_folder(entry, mtime)
+
+    def place(self, entry: FileEntry, folder: Path):
+        """
+        Plans a file bound for folder. Returns (op, candidate): candidate,
+        if not None, goes to DuplicateIndex.add() once the file is in place.
+        """
+        profiler = self.profiler
+        if self.pack_under and entry.size < self.pack_under:
+            # The Packer picks the archive and member name when it gets there
+            return PlanOp(
+                entry.path, str(folder / entry.name), "PACK", entry.category, entry.size,
+                entry.mtime
+            ), None
+        action = self.action
+        candidate = original = None
+        if self.duplicates is not None:
+            with profiler.stage("dedupe"):
+                candidate, original = self.duplicates.match(entry)
+            if original is not None:
+                candidate = None
+                if self.dedupe == "skip":
+                    # The content is already planned: leave this copy in place
+                    return PlanOp(
+                        entry.path, str(original.target), "DUPLICATE", entry.category,
+                        entry.size, entry.mtime, str(original.target)
+                    ), None
+                if self.dedupe == "hardlink":
+                    action = "HARDLINK"
+        with profiler.stage("collision"):
+            target = self.names.reserve(folder, entry.name)
+        return PlanOp(
+            entry.path, str(target), action, entry.category, entry.size, entry.mtime,
+            str(original.target) if original is not None else None
+        ), candidate
+
+    def plan(self, entry: FileEntry):
+        """Plans a file; returns (op, candidate) as place() does."""
+        folder = self.target_folder(entry)
+        with self.profiler.stage("mkdir"):
+            folder = self.dirs.get(folder)
+        return self.place(entry, folder)
+
+class Transfer(NamedTuple):
+    """A move/copy left to run by Executor.start(), and what to record it under."""
+    file: object
+    source: str
+    target: Path
+    action: str
+    original: DuplicateCandidate
+    dev: int
+
+class Executor:
+    """
+    Applies PlanOps: moves, copies or links each file (or hands it to a
+    Packer), keeps the journal and records the outcome with a RunRecorder.
+    execute_plan(), organize_files(), watch_files() and the async engine
+    all go through it, so they organize files the same way.
+
+    With recheck (the ops of a saved plan), each source is checked first:
+    one that is gone, or whose size or mtime changed since the plan was
+    made, fails instead of being organized, and a target name taken since
+    then gets the next free _1, _2, ... name. Otherwise an op is applied
+    as planned in this run, with the stat data of its FileEntry.
+
+    With workers > 1 transfers run on a thread pool, at most workers * 4
+    of them in flight, and are recorded in op order. counts holds the ops
+    "done" and "failed"; advance, if given, is called once per op.
+    """
+
+    def __init__(self, recorder: RunRecorder, dest_dir: Path, move: bool = True,
+                 link: str = None, workers: int = 1, per_device: int = None,
+                 buffer_size: int = COPY_BUFFER_SIZE, fadvise: bool = False,
+                 dry_run: bool = False, recheck: bool = False,
+                 duplicates: DuplicateIndex = None, packer: Packer = None, advance=None):
+        self.recorder = recorder
+        self.move = move
+        self.action = "MOVE" if move else LINK_ACTIONS.get(link, "COPY")
+        self.dry_run = dry_run
+        self.recheck = recheck
+        self.duplicates = duplicates
+        self.packer = packer
+        self.advance = advance
+        self.options = {
+            "move": move, "link": link, "buffer_size": buffer_size, "fadvise": fadvise
+        }
+        self.dest_dev = None if dry_run else os.stat(dest_dir).st_dev
+        self.pool = None
+        if workers > 1 and not dry_run:
+            self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.limiter = DeviceLimiter(per_device)
+        self.window = workers * 4
+        self.counts = {"done": 0, "failed": 0}
+        self._folders = set()
+        # Planned target -> actual target, for targets renamed at execution
+        self._placed = {}
+        self._pending = deque()
+
+    def _count(self, done: bool):
+        self.counts["done" if done else "failed"] += 1
+        if self.advance is not None:
+            self.advance()
+
+    def _recheck(self, op: PlanOp, item, target: Path):
+        # Returns the source's device, or None if it can't be organized
+        try:
+            st = os.stat(op.source)
+            if (st.st_size, st.st_mtime) != (op.size, op.mtime):
+                raise OSError("changed since the plan was made")
+        except OSError as e:
+            print(f"[ERROR] Could not process {op.source}: {e}")
+            self.recorder.failed(item, target, op.action, error=str(e))
+            self._count(False)
+            return None
+        if target.parent not in self._folders:
+            with self.recorder.profiler.stage("mkdir"):
+                target.parent.mkdir(parents=True, exist_ok=True)
+            self._folders.add(target.parent)
+        return st.st_dev
+
+    def start(self, op: PlanOp, entry: FileEntry = None) -> Transfer:
+        """
+        Does all an op needs but its move/copy: records duplicates, dry runs
+        and packed files, makes hard links and writes the journal entry.
+        Returns the Transfer still to run and hand to finish(), or None.
+        entry is the op's FileEntry, if it was planned in this run.
+        """
+        recorder = self.recorder
+        profiler = recorder.profiler
+        item = op if entry is None else entry
+        original = None
+        if op.duplicate_of is not None:
+            original = DuplicateCandidate(op.duplicate_of, op.size)
+            original.target = self._placed.get(op.duplicate_of, Path(op.duplicate_of))
+        if op.action == "DUPLICATE":
+            recorder.done(item, original.target, "DUPLICATE", original)
+            self._count(True)
+            return None
+        target = Path(op.target)
+        if op.action == "PACK":
+            self.packer.add(entry, target.parent)
+            if self.advance is not None:
+                self.advance()
+            return None
+        if self.dry_run:
+            # Simulation only
+            recorder.done(item, target, op.action, original)
+            self._count(True)
+            return None
+
+        dev = None if entry is None else entry.dev
+        if self.recheck:
+            with profiler.stage("collision"):
+                target = recorder.names.reserve(target.parent, target.name)
+            if target != Path(op.target):
+                self._placed[op.target] = target
+            dev = self._recheck(op, item, target)
+            if dev is None:
+                return None
+
+        action = op.action
+        if original is not None and action == "HARDLINK":
+            # The original must have landed before it can be linked to
+            self.drain()
+            with profiler.stage("report"):
+                recorder.journal.begin(op.source, target, action)
+            with profiler.stage("transfer"):
+                linked = link_duplicate(original.target, target, op.source, move=self.move)
+            if linked:
+                recorder.done(item, target, action, original)
+                self._count(True)
+                return None
+            # Could not link: fall back to a regular move/copy
+            recorder.journal.abort(op.source, target)
+            action = self.action
+        with profiler.stage("report"):
+            recorder.journal.begin(op.source, target, action)
+        return Transfer(item, op.source, target, action, original, dev)
+
+    def transfer_options(self, transfer: Transfer) -> dict:
+        """The timed_transfer() keyword arguments for a Transfer."""
+        return dict(self.options, same_device=transfer.dev == self.dest_dev)
+
+    def finish(self, transfer: Transfer, result):
+        """Records a Transfer from what timed_transfer() returned for it."""
+        self.recorder.finish(
+            transfer.file, transfer.target, transfer.action, transfer.original, result
+        )
+        self._count(result[0] is not None)
+
+    def run(self, op: PlanOp, entry: FileEntry = None, candidate: DuplicateCandidate = None):
+        """
+        Applies an op, as start() and finish() do, running its transfer
+        here or on the pool. candidate, from Planner.place(), is added to
+        the DuplicateIndex with the file's new path.
+        """
+        transfer = self.start(op, entry)
+        if transfer is None:
+            if candidate is not None and self.dry_run:
+                self.duplicates.add(candidate, op.source, Path(op.target))
+            return
+        options = self.transfer_options(transfer)
+        if self.pool is None:
+            result = timed_transfer(op.source, transfer.target, **options)
+            self.finish(transfer, result)
+            if candidate is not None and result[0] is not None:
+                self.duplicates.add(candidate, transfer.target, transfer.target)
+            return
+        future = self.pool.submit(
+            limited_transfer, self.limiter, (transfer.dev, self.dest_dev), op.source,
+            transfer.target, **options
+        )
+        if candidate is not None:
+            self.duplicates.add(candidate, transfer.target, transfer.target, future)
+        self._pending.append((transfer, future))
+        # Keep a bounded window of in-flight transfers
+        while self._pending and (
+                len(self._pending) >= self.window or self._pending[0][1].done()):
+            self._collect()
+
+    def _collect(self):
+        # Results are collected in submission order to keep the report ordered
+        transfer, future = self._pending.popleft()
+        self.finish(transfer, future.result())
+
+    def drain(self):
+        """Waits for the transfers still running and records them."""
+        while self._pending:
+            self._collect()
+
+    def close(self):
+        """Shuts the pool down, after the transfers already running."""
+        if self.pool is not None:
+            self.pool.shutdown()
+
+class PlanTable:
+    """
+    The ops of a Plan, stored by column so plans of tens of millions of
+    files fit in memory. Each folder path is stored once and ops keep its
+    id; basenames are packed as UTF-8 into one buffer; categories and
+    actions are ids into separate label lists (--rules can add thousands
+    of categories; actions are a fixed handful); sizes and mtimes live in
+    typed arrays. Target names and duplicate_of are kept only for the ops
+    that have them (a renamed target, a duplicate). Indexing and iterating
+    build PlanOp tuples on the fly. A table is filled once, from the ops
+    it is created with, and is read-only after that.
+    """
+    __slots__ = (
+        "_folders", "_folder_ids", "_category_labels", "_category_ids", "_action_labels",
+        "_action_ids", "_names", "_name_ends", "_source_dirs", "_target_dirs", "_categories",
+        "_actions", "_sizes", "_mtimes", "_renamed", "_duplicate_of"
+    )
+
+    def __init__(self, ops=()):
+        self._folders = []
+        self._folder_ids = {}
+        self._category_labels = []
+        self._category_ids = {}
+        self._action_labels = []
+        self._action_ids = {}
+        self._names = bytearray()
+        self._name_ends = array("Q")
+        self._source_dirs = array("I")
+        self._target_dirs = array("I")
+        self._categories = array("I")
+        self._actions = array("B")
+        self._sizes = array("q")
+        self._mtimes = array("d")
+        # Sparse columns: op number -> value
+        self._renamed = {}
+        self._duplicate_of = {}
+        for op in ops:
+            self._append(op)
+
+    def _folder_id(self, folder: str) -> int:
+        folder_id = self._folder_ids.get(folder)
+        if folder_id is None:
+            folder_id = self._folder_ids[folder] = len(self._folders)
+            self._folders.append(folder)
+        return folder_id
+
+    @staticmethod
+    def _label_id(labels: list, ids: dict, label: str) -> int:
+        label_id = ids.get(label)
+        if label_id is None:
+            label_id = ids[label] = len(labels)
+            labels.append(label)
+        return label_id
+
+    def _append(self, op: PlanOp):
+        source_dir, name = os.path.split(op.source)
+        target_dir, target_name = os.path.split(op.target)
+        number = len(self._sizes)
+        # surrogatepass keeps undecodable file names intact
+        self._names += name.encode("utf-8", "surrogatepass")
+        self._name_ends.append(len(self._names))
+        self._source_dirs.append(self._folder_id(source_dir))
+        self._target_dirs.append(self._folder_id(target_dir))
+        self._categories.append(
+            self._label_id(self._category_labels, self._category_ids, op.category)
+        )
+        self._actions.append(self._label_id(self._action_labels, self._action_ids, op.action))
+        self._sizes.append(op.size)
+        self._mtimes.append(op.mtime)
+        if target_name != name:
+            self._renamed[number] = target_name
+        if op.duplicate_of is not None:
+            self._duplicate_of[number] = op.duplicate_of
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def __getitem__(self, number: int) -> PlanOp:
+        if number < 0:
+            number += len(self)
+        start = self._name_ends[number - 1] if number else 0
+        name = self._names[start:self._name_ends[number]].decode("utf-8", "surrogatepass")
+        return PlanOp(
+            os.path.join(self._folders[self._source_dirs[number]], name),
+            os.path.join(
+                self._folders[self._target_dirs[number]], self._renamed.get(number, name)
+            ),
+            self._action_labels[self._actions[number]],
+            self._category_labels[self._categories[number]],
+            self._sizes[number],
+            self._mtimes[number],
+            self._duplicate_of.get(number)
+        )
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self[number]
+
+    def __eq__(self, other):
+        if not isinstance(other, PlanTable):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def has_duplicates(self) -> bool:
+        return bool(self._duplicate_of)
+
+    def summary(self) -> dict:
+        """Returns the number of ops per category, in order of first appearance."""
+        counts = [0] * len(self._category_labels)
+        for label_id in self._categories:
+            counts[label_id] += 1
+        return {label: count for label, count in zip(self._category_labels, counts) if count}
+
+class Plan(NamedTuple):
+    """
+    What a run would do, computed by make_plan() and applied by
+    execute_plan(). It is immutable, ops being a read-only PlanTable. save()
+    writes it as JSON Lines (a header line, then one op per line in walk
+    order; gzip-compressed for ".gz" names) and load() reads it back, so a
+    plan can be reviewed, diffed and executed later or on another machine.
+    shard is the "i/N" of the Shard it covers, or None for the whole source.
+    """
+    source_dir: str
+    dest_dir: str
+    move: bool
+    link: str
+    created: str
+    ops: PlanTable
+    shard: str = None
+
+    def save(self, path: Path):
+        opener = gzip.open if str(path).endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8") as f:
+            header = {
+                "plan": PLAN_VERSION, "source": self.source_dir, "destination": self.dest_dir,
+                "move": self.move, "link": self.link, "created": self.created
+            }
+            if self.shard is not None:
+                header["shard"] = self.shard
+            f.write(json.dumps(header) + "\n")
+            for op in self.ops:
+                f.write(json.dumps(op._asdict()) + "\n")
+
+    @classmethod
+    def load(cls, path: Path) -> "Plan":
+        opener = gzip.open if str(path).endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("plan") != PLAN_VERSION:
+                raise ValueError(f"{path} is not a plan this version can read")
+            ops = PlanTable(PlanOp(**json.loads(line)) for line in f if line.strip())
+        return cls(
+            header["source"], header["destination"], header["move"], header["link"],
+            header["created"], ops, header.get("shard")
+        )
+
+    def summary(self) -> dict:
+        """Returns the number of files per category."""
+        return self.ops.summary()
+
+    def diff(self, other: "Plan"):
+        """
+        Compares two plans by source file. Returns (added, removed, changed):
+        the ops only in other, the ops only in this plan, and (old, new)
+        pairs for sources planned differently.
+        """
+        mine = {op.source: op for op in self.ops}
+        theirs = {op.source: op for op in other.ops}
+        added = [op for source, op in theirs.items() if source not in mine]
+        removed = [op for source, op in mine.items() if source not in theirs]
+        changed = [
+            (op, theirs[source]) for source, op in mine.items()
+            if source in theirs and theirs[source] != op
+        ]
+        return added, removed, changed
+
+def make_plan(
+    source_dir: Path,
+    dest_dir: Path,
+    move: bool = True,
+    link: str = None,
+    dedupe: str = None,
+    scan_threads: int = 1,
+    date_source=None,
+    sniff: bool = False,
+    shard: Shard = None,
+    scan_filter: ScanFilter = None,
+    profiler: Profiler = None
+) -> Plan:
+    """
+    Works out what organize_files() would do, without changing any file or
+    asking anything, and returns it as a Plan. Options mean the same as in
+    organize_files(). Target names are chosen against the destination as
+    it is now. The date and type caches in the destination are read but
+    not written.
+    """
+    profiler = profiler or Profiler(enabled=False)
+    duplicates = DuplicateIndex() if dedupe else None
+    dates = None
+    if date_source and tuple(date_source) != ("mtime",):
+        dates = CaptureDateCache(dest_dir, date_source, persist=False)
+    types = FileTypeCache(dest_dir, persist=False) if sniff else None
+    action = "MOVE" if move else LINK_ACTIONS.get(link, "COPY")
+    planner = Planner(
+        NameIndex(), DirectoryCache(dest_dir, create=False), action, dates, duplicates, dedupe,
+        profiler=profiler
+    )
+
+    entries = iter_files(source_dir, dest_dir, None, scan_threads, profiler, shard, scan_filter)
+    if types is not None:
+        entries = sniff_entries(entries, types, profiler=profiler)
+
+    def planned():
+        for entry in entries:
+            op, candidate = planner.plan(entry)
+            if candidate is not None:
+                duplicates.add(candidate, entry.path, Path(op.target))
+            yield op
+
+    try:
+        ops = PlanTable(planned())
+    finally:
+        if duplicates is not None:
+            duplicates.close()
+        if dates is not None:
+            dates.close()
+        if types is not None:
+            types.close()
+    return Plan(
+        str(source_dir), str(dest_dir), move, link,
+        datetime.now().isoformat(timespec="seconds"), ops,
+        None if shard is None else str(shard)
+    )
+
+def execute_plan(
+    plan: Plan,
+    workers: int = 1,
+    per_device: int = None,
+    report_file: Path = None,
+    report_format: str = None,
+    buffer_size: int = COPY_BUFFER_SIZE,
+    fadvise: bool = False,
+    resume: bool = False,
+    progress: bool = False,
+    profiler: Profiler = None
+) -> dict:
+    """
+    Applies a Plan, without asking anything. Each source is checked first:
+    one that is gone, or whose size or mtime changed since the plan was
+    made, fails (with a report row) instead of being organized. A target
+    name taken since then gets the next free _1, _2, ... name. Transfers,
+    the journal, the report and resume work as in organize_files();
+    progress shows a progress bar. The plan of a shard claims its target
+    names on disk, so the plans of all shards can be executed at once.
+
+    Returns counts of the plan's ops ("done", "failed", "skipped" because
+    a resumed run already handled them) and the journal path ("journal").
+    """
+    profiler = profiler or Profiler(enabled=False)
+    dest_dir = Path(plan.dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    journal, completed = open_journal(
+        Path(plan.source_dir), dest_dir, plan.move, resume, plan.shard
+    )
+    report = open_report(
+        report_file, report_format, dedupe=plan.ops.has_duplicates()
+    )
+    recorder = RunRecorder(NameIndex(claim=plan.shard is not None), report, journal,
+                           profiler=profiler)
+    bar = tqdm(total=len(plan.ops), desc="Organizing", unit="file", disable=not progress)
+    executor = Executor(
+        recorder, dest_dir, plan.move, plan.link, workers, per_device, buffer_size, fadvise,
+        recheck=True, advance=lambda: bar.update(1)
+    )
+    skipped = 0
+    finished = False
+    try:
+        for op in plan.ops:
+            if op.source in completed:
+                # Handled before the previous run was interrupted
+                skipped += 1
+                bar.update(1)
+                continue
+            executor.run(op)
+        executor.drain()
+        finished = True
+    finally:
+        executor.close()
+        bar.close()
+        journal.close(op="end" if finished else None)
+        if report is not None:
+            report.close()
+    return dict(executor.counts, skipped=skipped, journal=str(journal.path))
+
 # ----------------------------
-# HELPER FUNCTIONS
+# WATCH MODE
 # ----------------------------
 
-def get_file_category(file_path: Path) -> str:
-    """Returns the main category of the file based on its extension."""
-    ext = file_path.suffix.lower()
-    for category, extensions in CATEGORIES.items():
-        if ext in extensions:
-            return category
-    return "Others"
-
-def get_subfolder_name(file_path: Path, category: str) -> str:
-    """Returns the subfolder based on year or extension."""
-    if category in ["Images", "Videos"]:
-        try:
-            timestamp = file_path.stat().st_mtime
-            year = datetime.fromtimestamp(timestamp).year
-            return f"{year}"
-        except Exception:
-            return "UnknownYear"
-    elif category in ["Documents","Archives","Executables","Fonts","Scripts_and_Code","Disk_Images","3D_Models","Others"]:
-        return file_path.suffix.lower().lstrip(".")
-    else:
-        return "Unknown"
+# Seconds a file must go unchanged before it is organized
+WATCH_SETTLE = 2.0
 
-def safe_move_or_copy(src: Path, dst: Path, move: bool = True):
-    """Moves or copies a file, renaming if it already exists."""
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    counter = 1
-    target = dst
-    while target.exists():
-        target = dst.with_name(f"{dst.stem}_{counter}{dst.suffix}")
-        counter += 1
+# Seconds between polls when inotify is not available
+WATCH_POLL_INTERVAL = 5.0
+
+# Most files organized in one batch
+WATCH_BATCH_SIZE = 256
+
+# Longest wait for changes, so a stop request is noticed
+WATCH_TICK = 1.0
+
+class InotifyWatcher:
+    """
+    Reports files written under a folder tree, through Linux inotify
+    (called with ctypes, so no package is needed). Every folder gets a
+    watch and folders created later are added as they show up, so nothing
+    is walked while the tree is quiet. The number of folders is limited by
+    the fs.inotify.max_user_watches sysctl. Folders a ScanFilter prunes are
+    not watched, and the files it leaves out are not reported.
+    """
+
+    KIND = "inotify"
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    # struct inotify_event: wd, mask, cookie, len, then len bytes of name
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, source_dir: Path, dest_dir: Path, scan_filter: ScanFilter = None):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.source_dir = source_dir
+        self.dest_dir = dest_dir
+        self.scan_filter = scan_filter
+        self._dest_key = _dir_key(dest_dir)
+        self._dest_path = str(dest_dir)
+        # Watch descriptor -> folder
+        self._folders = {}
+        try:
+            self._watch_tree(str(source_dir))
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _watch_tree(self, root: str) -> list:
+        """Watches root and every folder below it; returns the files already in them."""
+        paths = []
+        stack = [root]
+        while stack:
+            folder = stack.pop()
+            # Watched before it is listed, so no file created meanwhile is missed
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), self.MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code in (errno.ENOSPC, errno.ENOMEM):
+                    raise OSError(code, "too many folders to watch (see fs.inotify.max_user_watches)")
+                # Unreadable or already gone: skipped, like in the walk
+                continue
+            self._folders[wd] = folder
+            listing = scan_dir(folder, self._dest_key, self._dest_path, self.scan_filter)
+            if listing is None:
+                continue
+            files, subdirs = listing
+            paths.extend(entry.path for entry in files)
+            stack.extend(reversed(subdirs))
+        return paths
+
+    def changes(self, timeout: float) -> list:
+        """Waits up to timeout seconds; returns the paths of files created or written."""
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+        paths = []
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = self.EVENT.unpack_from(data, pos)
+                pos += self.EVENT.size
+                name = data[pos:pos + length].rstrip(b"\0")
+                pos += length
+                if mask & self.IN_Q_OVERFLOW:
+                    # Events were lost: look at the whole tree again
+                    paths.extend(
+                        entry.path for entry in iter_dir_entries(
+                            self.source_dir, self.dest_dir, scan_filter=self.scan_filter
+                        )
+                    )
+                    continue
+                if mask & self.IN_IGNORED:
+                    self._folders.pop(wd, None)
+                    continue
+                folder = self._folders.get(wd)
+                if folder is None or not name:
+                    continue
+                name = os.fsdecode(name)
+                path = os.path.join(folder, name)
+                if not mask & self.IN_ISDIR:
+                    if self.scan_filter is None or self.scan_filter.takes_file(path, name):
+                        paths.append(path)
+                elif (mask & (self.IN_CREATE | self.IN_MOVED_TO) and path != self._dest_path
+                      and (self.scan_filter is None or self.scan_filter.takes_dir(path, name))):
+                    try:
+                        paths.extend(self._watch_tree(path))
+                    except OSError as e:
+                        print(f"[ERROR] Could not watch {path}: {e}")
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+class PollingWatcher:
+    """
+    Fallback for systems without inotify. Every interval seconds it stats
+    each known folder and lists only those whose mtime changed (a file was
+    added, removed or renamed in them), so a quiet poll costs one stat per
+    folder. Only new files are noticed: rewriting a file in place doesn't
+    change its folder's mtime. A ScanFilter works as in InotifyWatcher.
+    """
+
+    KIND = "polling"
+
+    def __init__(self, source_dir: Path, dest_dir: Path, interval: float = WATCH_POLL_INTERVAL,
+                 scan_filter: ScanFilter = None):
+        self.interval = interval
+        self.scan_filter = scan_filter
+        self._dest_key = _dir_key(dest_dir)
+        self._dest_path = str(dest_dir)
+        # Folder -> (mtime, names of its files)
+        self._folders = {}
+        self._list(str(source_dir))
+        self._next_poll = time.monotonic() + interval
+
+    def _list(self, root: str, known=frozenset()) -> list:
+        """Lists root and its new subfolders; returns the files not in known."""
+        paths = []
+        stack = [(root, known)]
+        while stack:
+            folder, known = stack.pop()
+            try:
+                # Read before listing, so a change made meanwhile shows up next poll
+                mtime = os.stat(folder).st_mtime
+            except OSError:
+                self._folders.pop(folder, None)
+                continue
+            listing = scan_dir(folder, self._dest_key, self._dest_path, self.scan_filter)
+            if listing is None:
+                self._folders.pop(folder, None)
+                continue
+            files, subdirs = listing
+            self._folders[folder] = (mtime, {entry.name for entry in files})
+            paths.extend(entry.path for entry in files if entry.name not in known)
+            stack.extend(
+                (subdir, frozenset()) for subdir in subdirs if subdir not in self._folders
+            )
+        return paths
+
+    def changes(self, timeout: float) -> list:
+        """Waits up to timeout seconds; returns the paths of files added since the last poll."""
+        wait = self._next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+        self._next_poll = time.monotonic() + self.interval
+        paths = []
+        for folder, (mtime, names) in list(self._folders.items()):
+            try:
+                changed = os.stat(folder).st_mtime != mtime
+            except OSError:
+                self._folders.pop(folder, None)
+                continue
+            if changed:
+                paths.extend(self._list(folder, names))
+        return paths
+
+    def close(self):
+        pass
+
+def open_watcher(source_dir: Path, dest_dir: Path, poll_interval: float = None,
+                 scan_filter: ScanFilter = None):
+    """
+    Returns an InotifyWatcher, or a PollingWatcher when poll_interval is
+    given or inotify can't be used.
+    """
+    if poll_interval is None:
+        try:
+            return InotifyWatcher(source_dir, dest_dir, scan_filter)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}); polling every {WATCH_POLL_INTERVAL:g} seconds instead.")
+    return PollingWatcher(source_dir, dest_dir, poll_interval or WATCH_POLL_INTERVAL, scan_filter)
+
+class SettlingFiles:
+    """
+    Files seen changing, held until they are done being written: a file is
+    ready once its size and mtime stayed the same for settle seconds since
+    its last change event. root is the watched source, for the FileEntry
+    of each ready file.
+    """
+
+    def __init__(self, settle: float = WATCH_SETTLE, root: str = None):
+        self.settle = settle
+        self.root = root
+        # Path -> (size, mtime, time of the last change seen)
+        self._files = {}
+
+    def __len__(self):
+        return len(self._files)
+
+    def add(self, path: str, now: float):
+        if path in self._files:
+            # Changed again: restart its wait
+            size, mtime, _ = self._files[path]
+            self._files[path] = (size, mtime, now)
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        self._files[path] = (st.st_size, st.st_mtime, now)
+
+    def wait(self, now: float) -> float:
+        """Seconds until the next file could be ready (WATCH_TICK at most)."""
+        if not self._files:
+            return WATCH_TICK
+        due = min(since for _, _, since in self._files.values()) + self.settle
+        return min(max(due - now, 0), WATCH_TICK)
+
+    def ready(self, now: float) -> list:
+        """Returns a FileEntry for each file that stopped changing, and forgets them."""
+        entries = []
+        for path, (size, mtime, since) in list(self._files.items()):
+            if now - since < self.settle:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Deleted or moved away meanwhile
+                del self._files[path]
+                continue
+            if (st.st_size, st.st_mtime) != (size, mtime):
+                self._files[path] = (st.st_size, st.st_mtime, now)
+                continue
+            del self._files[path]
+            entries.append(FileEntry(
+                path, os.path.basename(path), st.st_size, st.st_mtime, st.st_dev, st.st_ino,
+                self.root
+            ))
+        return entries
+
+def watch_files(
+    source_dir: Path,
+    dest_dir: Path,
+    move: bool = True,
+    link: str = None,
+    incremental: bool = False,
+    report_file: Path = None,
+    report_format: str = None,
+    buffer_size: int = COPY_BUFFER_SIZE,
+    fadvise: bool = False,
+    date_source=None,
+    sniff: bool = False,
+    settle: float = WATCH_SETTLE,
+    batch_size: int = WATCH_BATCH_SIZE,
+    poll_interval: float = None,
+    stop: threading.Event = None,
+    scan_filter: ScanFilter = None,
+    profiler: Profiler = None
+) -> dict:
+    """
+    Keeps organizing files as they appear in source_dir, until stop is set
+    or Ctrl-C is pressed. Files already there are organized first. New
+    files are then found through inotify, or by polling every
+    poll_interval seconds when that is given or inotify is unavailable (see
+    InotifyWatcher and PollingWatcher), so a quiet tree costs next to
+    nothing however big it is.
+
+    A file is organized once it has gone settle seconds without changing,
+    so downloads still being written are left alone. Ready files are
+    classified and transferred in batches of up to batch_size as
+    organize_files() would; the other options mean the same as there. One
+    journal covers the whole session. Files a ScanFilter leaves out are
+    neither watched nor organized.
+
+    Returns the number of files organized ("done") and failed ("failed"),
+    and the journal path ("journal").
+    """
+    profiler = profiler or Profiler(enabled=False)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    index = IncrementalIndex(dest_dir) if incremental else None
+    journal, _ = open_journal(source_dir, dest_dir, move)
+    report = open_report(report_file, report_format)
+    dates = None
+    if date_source and tuple(date_source) != ("mtime",):
+        dates = CaptureDateCache(dest_dir, date_source)
+    types = FileTypeCache(dest_dir) if sniff else None
+    action = "MOVE" if move else LINK_ACTIONS.get(link, "COPY")
+    counts = {"done": 0, "failed": 0}
+
+    def organize(batch):
+        # Fresh per batch: other programs may change the destination in between
+        recorder = RunRecorder(NameIndex(), report, journal, index, profiler)
+        planner = Planner(recorder.names, DirectoryCache(dest_dir), action, dates,
+                          profiler=profiler)
+        executor = Executor(recorder, dest_dir, move, link, buffer_size=buffer_size,
+                            fadvise=fadvise)
+        if types is not None:
+            batch = list(sniff_entries(batch, types, profiler=profiler))
+        for entry in batch:
+            if index is not None and index.is_unchanged(entry):
+                continue
+            if scan_filter is not None and not scan_filter.takes_size(entry.size):
+                continue
+            op, _ = planner.plan(entry)
+            executor.run(op, entry)
+        organized = executor.counts["done"]
+        failed = executor.counts["failed"]
+        # Written out now rather than when the session ends
+        for store in (index, dates, types, report):
+            if store is not None:
+                store.flush()
+        counts["done"] += organized
+        counts["failed"] += failed
+        if organized or failed:
+            print(f"[{datetime.now():%H:%M:%S}] Organized {organized} files ({failed} failed)")
+
+    pending = SettlingFiles(settle, str(source_dir))
+    # Opened before the first walk, so nothing created during it is missed
+    watcher = open_watcher(source_dir, dest_dir, poll_interval, scan_filter)
+    busy = False
+    finished = False
     try:
-        if move:
-            shutil.move(str(src), str(target))
-        else:
-            shutil.copy2(str(src), str(target))
-        return target
-    except Exception as e:
-        print(f"[ERROR] Could not process {src}: {e}")
-        return None
+        now = time.monotonic()
+        for entry in iter_files(source_dir, dest_dir, index, profiler=profiler,
+                                scan_filter=scan_filter):
+            pending.add(entry.path, now)
+        print(f"Watching {source_dir} ({watcher.KIND}); press Ctrl-C to stop.")
+        while stop is None or not stop.is_set():
+            for path in watcher.changes(pending.wait(time.monotonic())):
+                pending.add(path, time.monotonic())
+            ready = pending.ready(time.monotonic())
+            for start in range(0, len(ready), batch_size):
+                busy = True
+                organize(ready[start:start + batch_size])
+                busy = False
+        finished = True
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+        # Interrupted between batches, nothing is left half done
+        finished = not busy
+    finally:
+        watcher.close()
+        if dates is not None:
+            dates.close()
+        if types is not None:
+            types.close()
+        journal.close(op="end" if finished else None)
+        if report is not None:
+            report.close()
+        if index is not None:
+            index.close()
+    counts["journal"] = str(journal.path)
+    return counts
 
 # ----------------------------
-# MAIN FUNCTION
+# ASYNC ENGINE
 # ----------------------------
 
-def organize_files(
+class LocalFS:
+    """
+    The blocking filesystem calls made by the async engine. Each one runs
+    in a worker thread, so on network mounts many round trips can be in
+    flight at once.
+    """
+
+    def scan_dir(self, root: str, dest_key, dest_path: str, scan_filter: ScanFilter = None):
+        return scan_dir(root, dest_key, dest_path, scan_filter)
+
+    def stat(self, entry: os.DirEntry):
+        return entry.stat()
+
+    def dir_key(self, path: Path):
+        return _dir_key(path)
+
+    def makedirs(self, folder: Path):
+        folder.mkdir(parents=True, exist_ok=True)
+
+    def listdir(self, folder: Path) -> list:
+        try:
+            return os.listdir(folder)
+        except FileNotFoundError:
+            return []
+
+    def capture_time(self, path: str, sources) -> float:
+        return read_capture_time(path, sources)
+
+    def sniff_type(self, path: str) -> str:
+        return sniff_type(path)
+
+    def transfer(self, src, target: Path, options: dict):
+        return timed_transfer(src, target, **options)
+
+class LatencyFS(LocalFS):
+    """
+    LocalFS with a fixed delay added to every call, to try the async engine
+    locally as if the files were on a network mount. latency is in seconds.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def scan_dir(self, root, dest_key, dest_path, scan_filter=None):
+        time.sleep(self.latency)
+        return super().scan_dir(root, dest_key, dest_path, scan_filter)
+
+    def stat(self, entry):
+        time.sleep(self.latency)
+        return super().stat(entry)
+
+    def dir_key(self, path):
+        time.sleep(self.latency)
+        return super().dir_key(path)
+
+    def makedirs(self, folder):
+        time.sleep(self.latency)
+        super().makedirs(folder)
+
+    def listdir(self, folder):
+        time.sleep(self.latency)
+        return super().listdir(folder)
+
+    def capture_time(self, path, sources):
+        time.sleep(self.latency)
+        return super().capture_time(path, sources)
+
+    def sniff_type(self, path):
+        time.sleep(self.latency)
+        return super().sniff_type(path)
+
+    def transfer(self, src, target, options):
+        time.sleep(self.latency)
+        return super().transfer(src, target, options)
+
+async def iter_files_async(source_dir: Path, dest_dir: Path, fs: LocalFS, run,
+                           stat: bool = True, lookahead: int = 32,
+                           scan_filter: ScanFilter = None):
+    """
+    Async counterpart of iter_files(): yields the files of each folder as
+    a list, in the same order. Folders are listed by scan_dir(), through
+    fs; the next lookahead on the walk stack are listed ahead of time, and
+    the files of a folder are stat'ed concurrently. With stat=False the
+    os.DirEntry objects are yielded as they are, which is all
+    count_files_async() needs. A ScanFilter applies as in iter_files();
+    its size limits only with stat. run(func, *args) runs a blocking call
+    in the engine's thread pool.
+    """
+    dest_key = await run(fs.dir_key, dest_dir)
+    dest_path = str(dest_dir)
+
+    async def list_dir(root):
+        listing = await run(fs.scan_dir, root, dest_key, dest_path, scan_filter)
+        if listing is None:
+            return [], []
+        files, subdirs = listing
+        if not stat:
+            return files, subdirs
+        results = await asyncio.gather(
+            *(run(fs.stat, entry) for entry in files), return_exceptions=True
+        )
+        found = []
+        for entry, st in zip(files, results):
+            if isinstance(st, OSError):
+                print(f"[ERROR] Could not read {entry.path}: {st}")
+            elif isinstance(st, BaseException):
+                raise st
+            elif scan_filter is None or scan_filter.takes_size(st.st_size):
+                found.append(FileEntry(
+                    entry.path, entry.name, st.st_size, st.st_mtime, st.st_dev, st.st_ino,
+                    str(source_dir)
+                ))
+        return found, subdirs
+
+    stack = [[str(source_dir), None]]
+    while stack:
+        # Start listing the folders that will be visited next
+        for item in stack[-lookahead:]:
+            if item[1] is None:
+                item[1] = asyncio.ensure_future(list_dir(item[0]))
+        files, subdirs = await stack.pop()[1]
+        yield files
+        # Reversed so subfolders are visited in listing order, like os.walk
+        stack.extend([path, None] for path in reversed(subdirs))
+
+@asynccontextmanager
+async def thread_runner(in_flight: int):
+    """
+    Yields run(func, *args), which awaits func in a thread pool with at most
+    in_flight calls at once. On exit (an error, say) tasks still waiting are
+    cancelled before the pool shuts down.
+    """
+    pool = ThreadPoolExecutor(max_workers=in_flight)
+    limit = asyncio.Semaphore(in_flight)
+    loop = asyncio.get_running_loop()
+
+    async def run(func, *args):
+        async with limit:
+            return await loop.run_in_executor(pool, func, *args)
+
+    try:
+        yield run
+    finally:
+        others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in others:
+            task.cancel()
+        await asyncio.gather(*others, return_exceptions=True)
+        pool.shutdown()
+
+async def count_files_async(source_dir: Path, dest_dir: Path, fs: LocalFS = None,
+                            in_flight: int = 32, scan_filter: ScanFilter = None):
+    """Async counterpart of count_files(); returns (summary, total, extensions)."""
+    fs = fs or LocalFS()
+    ext_counts = {}
+    matched = {}
+    decides = {}
+    root = str(source_dir)
+    # Files are stat'ed to check the size limits; otherwise only those whose
+    # extension doesn't decide their rule are, to be matched like in the run
+    stat = scan_filter is not None and scan_filter.sized
+    async with thread_runner(in_flight) as run:
+        async for files in iter_files_async(source_dir, dest_dir, fs, run, stat=stat,
+                                            lookahead=in_flight, scan_filter=scan_filter):
+            undecided = []
+            for entry in files:
+                ext = split_extension(entry.name)
+                decided = decides.get(ext)
+                if decided is None:
+                    decided = decides[ext] = RULES.extension_rule(ext) is not None
+                if decided:
+                    ext_counts[ext] = ext_counts.get(ext, 0) + 1
+                elif stat:
+                    # A FileEntry, already classified with its stat data
+                    ext_counts[ext] = ext_counts.get(ext, 0) + 1
+                    matched[entry.category] = matched.get(entry.category, 0) + 1
+                else:
+                    undecided.append((entry, ext))
+            if not undecided:
+                continue
+            results = await asyncio.gather(
+                *(run(fs.stat, entry) for entry, _ in undecided), return_exceptions=True
+            )
+            for (entry, ext), st in zip(undecided, results):
+                if isinstance(st, OSError):
+                    continue
+                if isinstance(st, BaseException):
+                    raise st
+                rule = RULES.match(entry.name, ext, st.st_size, st.st_mtime, entry.path, root)
+                ext_counts[ext] = ext_counts.get(ext, 0) + 1
+                matched[rule.category] = matched.get(rule.category, 0) + 1
+    return _count_summary(ext_counts, matched)
+
+async def _organize_async(source_dir, dest_dir, fs, in_flight, executor, extensions,
+                          completed, dates=None, types=None, scan_filter=None):
+    """
+    The walk and transfer loop of organize_files_async(). Folder creation
+    and listing start as soon as a file bound for the folder is found;
+    files are planned by a Planner and applied by the Executor in walk
+    order, as organize_files() does, with the transfers run through fs.
+    Returns (summary of files found per category, files skipped
+    because the resumed run already handled them).
+
+    The walk stage is the time spent waiting for each folder's files, stat
+    included, and mkdir the time spent waiting for a folder to be ready.
+    With a CaptureDateCache, the headers of a folder's photos and videos
+    missing from it are read concurrently, and likewise with a
+    FileTypeCache for the files that need sniffing.
+    """
+    recorder = executor.recorder
+    names = recorder.names
+    profiler = recorder.profiler
+    planner = Planner(names, None, executor.action, profiler=profiler)
+    summary = {}
+    folders = {}
+    pending = deque()
+    resumed = 0
+
+    async with thread_runner(in_flight) as run:
+
+        async def prepare(folder):
+            if not executor.dry_run:
+                await run(fs.makedirs, folder)
+            names.add_folder(folder, await run(fs.listdir, folder))
+
+        def folder_for(name):
+            # Returns the folder and the task that readies it, started once
+            if name not in folders:
+                folder = dest_dir / name
+                folders[name] = (folder, asyncio.ensure_future(prepare(folder)))
+            return folders[name]
+
+        async def capture_times(entries):
+            # Headers of files missing from the date cache are read concurrently
+            times = [entry.mtime for entry in entries]
+            if dates is None:
+                return times
+            reads = []
+            for n, entry in enumerate(entries):
+                if not entry.rule.dated:
+                    continue
+                row = dates.cached(entry)
+                if row is None:
+                    reads.append(n)
+                elif row[0] is not None:
+                    times[n] = row[0]
+            found = await asyncio.gather(
+                *(run(fs.capture_time, entries[n].path, dates.sources) for n in reads)
+            )
+            for n, taken in zip(reads, found):
+                dates.store(entries[n], taken)
+                if taken is not None:
+                    times[n] = taken
+            return times
+
+        async def sniff(entries):
+            # Files missing from the type cache are sniffed concurrently
+            unknown = []
+            for entry in entries:
+                if not needs_sniffing(entry):
+                    continue
+                row = types.cached(entry)
+                if row is None:
+                    unknown.append(entry)
+                elif row[0] is not None:
+                    apply_sniffed_type(entry, row[0])
+            found = await asyncio.gather(*(run(fs.sniff_type, entry.path) for entry in unknown))
+            for entry, ext in zip(unknown, found):
+                types.store(entry, ext)
+                if ext is not None:
+                    apply_sniffed_type(entry, ext)
+
+        async def collect():
+            # Results are collected in submission order to keep the report ordered
+            transfer, task = pending.popleft()
+            executor.finish(transfer, await task)
+
+        for ext in sorted(extensions):
+            rule = RULES.extension_rule(ext)
+            if rule is not None and not rule.dated:
+                folder_for(rule.folder(ext))
+
+        waited = time.perf_counter()
+        async for files in iter_files_async(source_dir, dest_dir, fs, run,
+                                            lookahead=in_flight, scan_filter=scan_filter):
+            profiler.add("walk", time.perf_counter() - waited)
+            if types is not None:
+                with profiler.stage("sniff"):
+                    await sniff(files)
+            todo = []
+            for entry in files:
+                category = entry.category
+                summary[category] = summary.get(category, 0) + 1
+                if entry.path in completed:
+                    # Handled before the previous run was interrupted
+                    resumed += 1
+                    executor.advance()
+                    continue
+                todo.append(entry)
+            with profiler.stage("dates"):
+                times = await capture_times(todo)
+            batch = []
+            for entry, mtime in zip(todo, times):
+                batch.append((entry, folder_for(planner.target_folder(entry, mtime))))
+
+            for entry, (folder, ready) in batch:
+                with profiler.stage("mkdir"):
+                    await ready
+                op, _ = planner.place(entry, folder)
+                transfer = executor.start(op, entry)
+                if transfer is None:
+                    continue
+                pending.append((transfer, asyncio.ensure_future(run(
+                    fs.transfer, op.source, transfer.target, executor.transfer_options(transfer)
+                ))))
+                # As in Executor.run(), but awaited: at most in_flight * 4 pending
+                while pending and (len(pending) >= in_flight * 4 or pending[0][1].done()):
+                    await collect()
+            waited = time.perf_counter()
+
+        while pending:
+            await collect()
+        # Folders created up front may not have received any file
+        await asyncio.gather(*(task for _, task in folders.values()))
+    return summary, resumed
+
+def organize_files_async(
     source_dir: Path,
     dest_dir: Path,
     move: bool = True,
     dry_run: bool = False,
-    report_file: Path = None
+    report_file: Path = None,
+    stream: bool = False,
+    link: str = None,
+    buffer_size: int = COPY_BUFFER_SIZE,
+    fadvise: bool = False,
+    resume: bool = False,
+    report_format: str = None,
+    in_flight: int = 32,
+    fs: LocalFS = None,
+    date_source=None,
+    sniff: bool = False,
+    assume_yes: bool = False,
+    scan_filter: ScanFilter = None,
+    profiler: Profiler = None
 ):
     """
-    Organizes files from the source directory into the destination.
-    """
-    files_to_process = []
+    Alternative entry point to organize_files() for high-latency network
+    filesystems, built on asyncio.
 
-    # 1️⃣ Recursively walk through source directory
-    for root, dirs, files in os.walk(source_dir):
-        # Ignore the destination folder itself
-        dirs[:] = [d for d in dirs if Path(root, d) != dest_dir]
-        for file in files:
-            files_to_process.append(Path(root) / file)
+    Every blocking call (listing, stat, mkdir, move/copy) goes through fs
+    and runs in a thread pool, with up to in_flight of them at once, so
+    their round trips overlap instead of adding up. The output is the same
+    as organize_files(): same destinations and collision names, same
+    journal, and the same report, row for row. dedupe and incremental are
+    only available in organize_files(). Pass a LatencyFS as fs to try it
+    against simulated network delays, and a Profiler to time the run's
+    stages as organize_files() does. date_source, sniff, assume_yes and
+    scan_filter work as in organize_files().
+    """
+    started = time.perf_counter()
+    fs = fs or LocalFS()
+    profiler = profiler or Profiler(enabled=False)
+    total = None
+    extensions = ()
 
-    # 2️⃣ Prepare summary counts
-    summary = {}
-    for file_path in files_to_process:
-        category = get_file_category(file_path)
-        summary.setdefault(category, 0)
-        summary[category] += 1
+    # 1️⃣ Count files per category
+    if not stream:
+        with profiler.stage("count"):
+            summary, total, extensions = asyncio.run(
+                count_files_async(source_dir, dest_dir, fs, in_flight, scan_filter)
+            )
 
-    # 3️⃣ Show summary to the user
-    print("\nSummary of files found by category:")
-    for cat, count in summary.items():
-        print(f"- {cat}: {count}")
-    print(f"Total: {len(files_to_process)} files\n")
+        # 2️⃣ Show summary to the user
+        print_summary(summary, total)
+    else:
+        print("\nStreaming mode: files will be organized as they are found.")
 
-    # 4️⃣ Confirm execution
-    proceed = input("Do you want to continue? (y/n): ").lower()
-    if proceed != "y":
-        print("Operation canceled by user.")
+    # 3️⃣ Confirm execution
+    with profiler.stage("prompt"):
+        proceed = confirm(assume_yes)
+    if not proceed:
         return
 
-    # 5️⃣ Process files with progress bar
-    processed_files = []
-    for file_path in tqdm(files_to_process, desc="Organizing", unit="file"):
-        category = get_file_category(file_path)
-        subfolder = get_subfolder_name(file_path, category)
-        target_dir = dest_dir / category / subfolder
-        target_path = target_dir / file_path.name
+    journal = None
+    completed = {}
+    if not dry_run:
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        journal, completed = open_journal(source_dir, dest_dir, move, resume)
+    report = open_report(report_file, report_format)
+    dates = None
+    if date_source and tuple(date_source) != ("mtime",):
+        dates = CaptureDateCache(dest_dir, date_source, persist=not dry_run)
+    types = FileTypeCache(dest_dir, persist=not dry_run) if sniff else None
 
-        if dry_run:
-            # Simulation only
-            processed_files.append({
-                "source": str(file_path),
-                "destination": str(target_path),
-                "action": "MOVE" if move else "COPY"
-            })
-            continue
-
-        result = safe_move_or_copy(file_path, target_path, move=move)
-        if result:
-            processed_files.append({
-                "source": str(file_path),
-                "destination": str(result),
-                "action": "MOVE" if move else "COPY"
-            })
-
-    # 6️⃣ Optional report generation
-    if report_file:
-        try:
-            with open(report_file, "w", newline="", encoding="utf-8") as csvfile:
-                fieldnames = ["source", "destination", "action"]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                for row in processed_files:
-                    writer.writerow(row)
-            print(f"Report saved to: {report_file}")
-        except Exception as e:
-            print(f"[ERROR] Could not generate report: {e}")
+    # 4️⃣ Walk and process files with progress bar
+    progress = tqdm(total=total, desc="Organizing", unit="file")
+    recorder = RunRecorder(NameIndex(), report, journal, profiler=profiler)
+    executor = Executor(
+        recorder, dest_dir, move, link, buffer_size=buffer_size, fadvise=fadvise,
+        dry_run=dry_run, advance=lambda: progress.update(1)
+    )
+    finished = False
+    try:
+        summary, resumed = asyncio.run(_organize_async(
+            source_dir, dest_dir, fs, in_flight, executor, extensions, completed, dates,
+            types, scan_filter
+        ))
+        finished = True
+    finally:
+        progress.close()
+        if dates is not None:
+            dates.close()
+        if types is not None:
+            types.close()
+        if journal is not None:
+            journal.close(op="end" if finished else None)
+        if report is not None:
+            report.close()
+    if resumed:
+        print(f"Skipped {resumed} files already handled by the interrupted run.")
+
+    if stream:
+        print_summary(summary, sum(summary.values()))
+
+    # 5️⃣ Report and journal locations
+    if report is not None:
+        print(f"Report saved to: {report_file}")
+    if journal is not None:
+        print(f"Journal saved to: {journal.path}")
 
     print("\nOrganization completed!")
-    print(f"Total execution time: {time.perf_counter() - start_time:.2f} seconds")
+    print(f"Total execution time: {time.perf_counter() - started:.2f} seconds")
 
 # ----------------------------
 # ARGPARSE EXECUTION
 # ----------------------------
 
+def positive_int(text: str) -> int:
+    """argparse type for thread, call and buffer counts: an integer of at least 1."""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid integer: {text!r}")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Automatic File Organizer"
     )
     parser.add_argument(
-        "-o", "--source", required=True, type=Path,
+        "-o", "--source", type=Path,
         help="Root source directory"
     )
     parser.add_argument(
-        "-d", "--destination", required=True, type=Path,
+        "-d", "--destination", type=Path,
         help="Destination directory"
     )
     parser.add_argument(
@@ -189,9 +4689,264 @@ def parse_args():
     )
     parser.add_argument(
         "-r", "--report", type=Path,
-        help="Generate CSV report after execution"
+        help="Write a report of every file as it is processed (JSON Lines if "
+             "the name ends in .jsonl, CSV otherwise; add .gz to compress)"
+    )
+    parser.add_argument(
+        "--report-format", choices=REPORT_FORMATS,
+        help="Report format, overriding the one implied by the file name"
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Organize files as they are found, skipping the counting pre-pass"
+    )
+    parser.add_argument(
+        "--workers", type=positive_int, default=1,
+        help="Number of threads moving/copying files in parallel"
+    )
+    parser.add_argument(
+        "--per-device", type=positive_int,
+        help="Maximum concurrent transfers per source/destination device"
+    )
+    parser.add_argument(
+        "--dedupe", choices=["skip", "hardlink", "report"],
+        help="Detect files with identical content: skip them, hardlink them "
+             "to the first copy, or just flag them in the report"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Keep an index in the destination so re-runs skip files "
+             "already organized"
+    )
+    parser.add_argument(
+        "--link", choices=["hard", "reflink", "symlink"],
+        help="Instead of copying, create hard links, copy-on-write clones or "
+             "symbolic links (falls back to a copy where unsupported)"
+    )
+    parser.add_argument(
+        "--buffer-size", type=positive_int, default=COPY_BUFFER_SIZE // 1024,
+        help="Copy buffer in KiB, used when the kernel can't copy by itself"
+    )
+    parser.add_argument(
+        "--fadvise", action="store_true",
+        help="Hint sequential reads and drop copied files from the page cache"
+    )
+    parser.add_argument(
+        "--scan-threads", type=positive_int, default=1,
+        help="Threads listing source folders in parallel (files are then "
+             "processed in no fixed order)"
+    )
+    parser.add_argument(
+        "--date-source", nargs="+", choices=DATE_SOURCES, default=["mtime"],
+        help="Where Images and Videos get their year from, tried in order: "
+             "exif (JPEG/HEIC), container (MP4/MOV header) or mtime, which is "
+             "also the last resort; header dates are cached in the destination"
+    )
+    parser.add_argument(
+        "--sniff", action="store_true",
+        help="Classify files with an unknown or no extension by the magic "
+             "number at the start of their content (results are cached in "
+             "the destination)"
+    )
+    parser.add_argument(
+        "--rules", type=Path, metavar="JSON",
+        help="Classify files with the rules in this file, matching on "
+             "extension, name glob, path, size and age, with target folders "
+             "like {category}/{year}/{month}; the built-in rules follow them"
+    )
+    parser.add_argument(
+        "--exclude", action="append", default=[], metavar="PATTERN",
+        help=f"Leave out files and folders matching this glob: a name, a path "
+             f"relative to the source if it has a /, a folder only if it ends "
+             f"in /. Excluded folders are never listed. Repeatable; the "
+             f"patterns in {IGNORE_FILE} at the top of the source are added"
+    )
+    parser.add_argument(
+        "--include", action="append", default=[], metavar="PATTERN",
+        help="Only organize files matching one of these globs (repeatable)"
+    )
+    parser.add_argument(
+        "--max-depth", type=int, metavar="N",
+        help="Don't go more than N folders below the source (0: only the "
+             "files directly in it)"
+    )
+    parser.add_argument(
+        "--min-size", metavar="SIZE",
+        help="Skip files smaller than this, in bytes or like 10K, 5M, 1G"
+    )
+    parser.add_argument(
+        "--max-size", metavar="SIZE",
+        help="Skip files larger than this, in bytes or like 10K, 5M, 1G"
+    )
+    parser.add_argument(
+        "--skip-hidden", action="store_true",
+        help="Skip hidden files and folders (names starting with a dot)"
+    )
+    parser.add_argument(
+        "--pack-under", metavar="SIZE",
+        help="Pack files smaller than SIZE (bytes, or like 64K, 1M) into one "
+             "tar archive per target folder instead of moving/copying them "
+             "one by one; the report gives each file's archive and member"
+    )
+    parser.add_argument(
+        "--pack-compression", choices=list(PACK_SUFFIXES), default="none",
+        help="Compression of the --pack-under archives (zstd needs the "
+             "zstandard module)"
+    )
+    parser.add_argument(
+        "--engine", choices=["threads", "async"], default="threads",
+        help="Organizer engine: threads, or async to overlap many filesystem "
+             "calls at once (for high-latency network mounts)"
+    )
+    parser.add_argument(
+        "--in-flight", type=positive_int, default=32,
+        help="Maximum filesystem calls in flight at once with --engine async"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0,
+        help="Add a simulated delay in milliseconds to every filesystem call "
+             "of --engine async, to test it as if on a network mount"
+    )
+    parser.add_argument(
+        "--profile", type=Path, metavar="JSON",
+        help="Time each stage of the run and the throughput per category, "
+             "and save the summary to this JSON file"
+    )
+    parser.add_argument(
+        "--profile-cpu", type=Path, metavar="FILE",
+        help="Save a cProfile dump of the run (read it with python -m pstats)"
+    )
+    parser.add_argument(
+        "--profile-memory", action="store_true",
+        help="Add tracemalloc's peak and top allocation sites to --profile"
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="Keep running and organize new files as they appear (inotify on "
+             "Linux, polling elsewhere); Ctrl-C stops"
+    )
+    parser.add_argument(
+        "--watch-poll", type=float, metavar="SECONDS",
+        help="With --watch, poll every SECONDS seconds instead of using inotify"
+    )
+    parser.add_argument(
+        "--settle", type=float, default=WATCH_SETTLE, metavar="SECONDS",
+        help=f"With --watch, how long a file must go unchanged before it is "
+             f"organized (default: {WATCH_SETTLE:g})"
+    )
+    parser.add_argument(
+        "-y", "--yes", action="store_true",
+        help="Don't ask for confirmation (for unattended runs)"
+    )
+    parser.add_argument(
+        "--save-plan", type=Path, metavar="PLAN",
+        help="Only work out what would be done and save it as a plan file "
+             "(JSON Lines, .gz to compress); no file is touched"
+    )
+    parser.add_argument(
+        "--execute-plan", type=Path, metavar="PLAN",
+        help="Apply a plan saved with --save-plan"
+    )
+    parser.add_argument(
+        "--shard", metavar="I/N",
+        help="Organize only slice I of N of the source, so N processes can "
+             "share it; target names are claimed on disk so shards never clash"
+    )
+    parser.add_argument(
+        "--shard-by", choices=SHARD_MODES, default="path",
+        help="Split the source by file path (even slices) or by top-level "
+             "folder (each shard only lists its own folders)"
+    )
+    parser.add_argument(
+        "--merge-reports", type=Path, nargs="+", metavar="REPORT",
+        help="Combine these reports (e.g. one per shard) into the -r/--report "
+             "file and exit"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Continue the interrupted run journaled in the destination"
+    )
+    parser.add_argument(
+        "--undo", type=Path, metavar="JOURNAL",
+        help="Reverse the run recorded in a journal file and exit"
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.merge_reports:
+        if args.report is None:
+            parser.error("--merge-reports requires -r/--report")
+        missing = [str(path) for path in args.merge_reports if not path.is_file()]
+        if missing:
+            parser.error(f"report not found: {', '.join(missing)}")
+        return args
+    if args.rules is not None:
+        try:
+            args.rules = RuleSet.load(args.rules)
+        except (OSError, ValueError) as e:
+            parser.error(f"--rules: {e}")
+    if (args.undo is None and args.execute_plan is None
+            and (args.source is None or args.destination is None)):
+        parser.error("the following arguments are required: -o/--source, -d/--destination")
+    filters = (args.exclude or args.include or args.max_depth is not None
+               or args.min_size is not None or args.max_size is not None or args.skip_hidden)
+    args.scan_filter = None
+    if args.undo is not None or args.execute_plan is not None:
+        if filters:
+            parser.error("--exclude, --include, --max-depth, --min-size, --max-size and "
+                         "--skip-hidden don't apply to --execute-plan or --undo")
+    else:
+        if args.max_depth is not None and args.max_depth < 0:
+            parser.error("--max-depth can't be negative")
+        try:
+            min_size = None if args.min_size is None else parse_size(args.min_size)
+            max_size = None if args.max_size is None else parse_size(args.max_size)
+        except ValueError as e:
+            parser.error(f"--min-size/--max-size: {e}")
+        try:
+            args.scan_filter = ScanFilter.for_source(
+                args.source.resolve(), args.exclude, args.include, args.max_depth,
+                min_size, max_size, args.skip_hidden
+            )
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    if args.shard is not None:
+        try:
+            args.shard = Shard.parse(args.shard, args.shard_by)
+        except ValueError as e:
+            parser.error(f"--shard: {e}")
+        if args.engine == "async" or args.watch or args.execute_plan or args.undo:
+            parser.error("--shard can't be combined with --engine async, --watch, "
+                         "--execute-plan or --undo")
+        if args.incremental and args.shard.by != "top":
+            parser.error("--incremental with --shard requires --shard-by top")
+    if args.save_plan is not None and args.execute_plan is not None:
+        parser.error("--save-plan and --execute-plan can't be used together")
+    if (args.save_plan or args.execute_plan) and (args.engine == "async" or args.incremental):
+        parser.error("plans are not available with --engine async or --incremental")
+    if args.watch and (args.dry_run or args.dedupe or args.resume or args.engine == "async"
+                       or args.save_plan or args.execute_plan or args.undo):
+        parser.error("--watch can't be combined with --dry-run, --dedupe, --resume, "
+                     "--engine async, plans or --undo")
+    if args.engine == "async" and (args.dedupe or args.incremental):
+        parser.error("--dedupe and --incremental are not available with --engine async")
+    if args.profile_memory and args.profile is None:
+        parser.error("--profile-memory requires --profile")
+    if args.pack_under is not None:
+        try:
+            args.pack_under = parse_size(args.pack_under)
+        except ValueError as e:
+            parser.error(f"--pack-under: {e}")
+        if args.pack_under > Packer.MAX_BYTES:
+            # Larger files would each fill an archive of their own
+            parser.error(f"--pack-under can't be over {Packer.MAX_BYTES} bytes (1G)")
+        if (args.engine == "async" or args.watch or args.save_plan or args.execute_plan
+                or args.undo or args.dedupe or args.link):
+            parser.error("--pack-under can't be combined with --engine async, --watch, "
+                         "plans, --undo, --dedupe or --link")
+        if args.pack_compression == "zstd" and zstandard is None:
+            parser.error("--pack-compression zstd requires the zstandard module")
+    elif args.pack_compression != "none":
+        parser.error("--pack-compression requires --pack-under")
+    return args
 
 # ----------------------------
 # ENTRY POINT
@@ -199,11 +4954,139 @@ def parse_args():
 
 if __name__ == "__main__":
     args = parse_args()
-    start_time = time.perf_counter()
-    organize_files(
-        source_dir=args.source.resolve(),
-        dest_dir=args.destination.resolve(),
-        move=not args.copy,
-        dry_run=args.dry_run,
-        report_file=args.report.resolve() if args.report else None
-    )
\ No newline at end of file
+    if args.rules is not None:
+        use_rules(args.rules)
+    profiler = None
+    if args.profile or args.profile_cpu:
+        profiler = Profiler(cpu_file=args.profile_cpu, memory=args.profile_memory)
+    with profiler or nullcontext():
+        if args.merge_reports:
+            rows = merge_reports(
+                [path.resolve() for path in args.merge_reports],
+                args.report.resolve(), args.report_format
+            )
+            if rows is not None:
+                print(f"Merged {rows} rows from {len(args.merge_reports)} reports "
+                      f"into {args.report.resolve()}")
+        elif args.undo is not None:
+            undo_journal(args.undo.resolve(), assume_yes=args.yes)
+        elif args.execute_plan is not None:
+            plan = Plan.load(args.execute_plan.resolve())
+            print(f"\nPlan from {plan.created}: {plan.source_dir} -> {plan.dest_dir}")
+            print_summary(plan.summary(), len(plan.ops))
+            if confirm(args.yes):
+                result = execute_plan(
+                    plan,
+                    workers=args.workers,
+                    per_device=args.per_device,
+                    report_file=args.report.resolve() if args.report else None,
+                    report_format=args.report_format,
+                    buffer_size=args.buffer_size * 1024,
+                    fadvise=args.fadvise,
+                    resume=args.resume,
+                    progress=True,
+                    profiler=profiler
+                )
+                print(f"Organized {result['done']} files, {result['failed']} failed, "
+                      f"{result['skipped']} skipped.")
+                if args.report:
+                    print(f"Report saved to: {args.report.resolve()}")
+                print(f"Journal saved to: {result['journal']}")
+        elif args.save_plan is not None:
+            plan = make_plan(
+                source_dir=args.source.resolve(),
+                dest_dir=args.destination.resolve(),
+                move=not (args.copy or args.link),
+                link=args.link,
+                dedupe=args.dedupe,
+                scan_threads=args.scan_threads,
+                date_source=args.date_source,
+                sniff=args.sniff,
+                shard=args.shard,
+                scan_filter=args.scan_filter,
+                profiler=profiler
+            )
+            plan.save(args.save_plan)
+            print_summary(plan.summary(), len(plan.ops))
+            print(f"Plan saved to: {args.save_plan}")
+        elif args.watch:
+            print(f"\nFiles in {args.source.resolve()} will be organized into "
+                  f"{args.destination.resolve()} as they appear.")
+            if confirm(args.yes):
+                result = watch_files(
+                    source_dir=args.source.resolve(),
+                    dest_dir=args.destination.resolve(),
+                    move=not (args.copy or args.link),
+                    link=args.link,
+                    incremental=args.incremental,
+                    report_file=args.report.resolve() if args.report else None,
+                    report_format=args.report_format,
+                    buffer_size=args.buffer_size * 1024,
+                    fadvise=args.fadvise,
+                    date_source=args.date_source,
+                    sniff=args.sniff,
+                    settle=args.settle,
+                    poll_interval=args.watch_poll,
+                    scan_filter=args.scan_filter,
+                    profiler=profiler
+                )
+                print(f"Organized {result['done']} files, {result['failed']} failed.")
+                if args.report:
+                    print(f"Report saved to: {args.report.resolve()}")
+                print(f"Journal saved to: {result['journal']}")
+        elif args.engine == "async":
+            organize_files_async(
+                source_dir=args.source.resolve(),
+                dest_dir=args.destination.resolve(),
+                move=not (args.copy or args.link),
+                dry_run=args.dry_run,
+                report_file=args.report.resolve() if args.report else None,
+                stream=args.stream,
+                link=args.link,
+                buffer_size=args.buffer_size * 1024,
+                fadvise=args.fadvise,
+                resume=args.resume,
+                report_format=args.report_format,
+                in_flight=args.in_flight,
+                fs=LatencyFS(args.latency / 1000) if args.latency else None,
+                date_source=args.date_source,
+                sniff=args.sniff,
+                assume_yes=args.yes,
+                scan_filter=args.scan_filter,
+                profiler=profiler
+            )
+        else:
+            organize_files(
+                source_dir=args.source.resolve(),
+                dest_dir=args.destination.resolve(),
+                move=not (args.copy or args.link),
+                dry_run=args.dry_run,
+                report_file=args.report.resolve() if args.report else None,
+                stream=args.stream,
+                workers=args.workers,
+                per_device=args.per_device,
+                dedupe=args.dedupe,
+                incremental=args.incremental,
+                link=args.link,
+                buffer_size=args.buffer_size * 1024,
+                fadvise=args.fadvise,
+                resume=args.resume,
+                report_format=args.report_format,
+                scan_threads=args.scan_threads,
+                date_source=args.date_source,
+                sniff=args.sniff,
+                assume_yes=args.yes,
+                shard=args.shard,
+                scan_filter=args.scan_filter,
+                pack_under=args.pack_under,
+                pack_compression=args.pack_compression,
+                profiler=profiler
+            )
+    if profiler is not None:
+        profile = profiler.summary()
+        print_profile(profile)
+        if args.profile:
+            profiler.write(args.profile)
+            print(f"Profile saved to: {args.profile}")
+        if args.profile_cpu:
+            print(f"CPU profile saved to: {args.profile_cpu}")
@@ -7,17 +7,55 @@ e organiza em um diretório de destino.
 
 Requisitos:
 - Python 3.8+
-- Bibliotecas: tqdm, os, pathlib, shutil, argparse, datetime, csv
+- Bibliotecas: tqdm (o resto é da biblioteca padrão)
+- Opcional: zstandard, para pacotes compactados com zstd
 """
 
 import os
+import hashlib
+import io
 import shutil
+import sys
 from pathlib import Path
 from tqdm import tqdm
+from array import array
 from datetime import datetime
+from decimal import Decimal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import NamedTuple
 import argparse
+import asyncio
+import cProfile
 import csv
+import ctypes
+import errno
+import fnmatch
+import gzip
+import json
+import queue
+import re
+import select
+import sqlite3
+import stat
+import string
+import struct
+import tarfile
+import threading
 import time
+import tracemalloc
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:  # só é preciso para pacotes zstd
+    zstandard = None
 
 # ----------------------------
 # CONFIGURAÇÃO DE CATEGORIAS
@@ -27,7 +65,7 @@ CATEGORIES = {
     "Videos": [".mp4", ".mov", ".avi", ".mkv", ".flv", ".wmv", ".webm", ".mpeg", ".mpg", ".3gp", ".m4v", ".vob"],
     "Musicas": [".mp3", ".flac", ".wav", ".aac", ".ogg", ".wma", ".m4a", ".alac", ".aiff", ".opus"],
     "Documentos": [".pdf", ".docx", ".doc", ".xlsx", ".xls", ".pptx", ".ppt", ".txt", ".odt", ".ods", ".odp", ".rtf", ".tex", ".csv", ".md", ".log"],
-    "Compactados": [".zip", ".rar", ".7z", ".tar", ".gz", ".bz2", ".xz", ".iso", ".dmg", ".cab"],
+    "Compactados": [".zip", ".rar", ".7z", ".tar", ".gz", ".bz2", ".xz", ".iso", ".dmg", ".cab", ".tar.gz", ".tar.bz2", ".tar.xz"],
     "Executáveis": [".exe", ".msi", ".bat", ".cmd", ".sh", ".jar", ".app", ".apk"],
     "Fontes": [".ttf", ".otf", ".woff", ".woff2", ".fnt"],
     "Scripts e Código": [".py", ".js", ".ts", ".java", ".c", ".cpp", ".cs", ".rb", ".php", ".html", ".css", ".json", ".xml", ".sql", ".sh", ".pl", ".go", ".rs", ".swift", ".kt"],
@@ -36,147 +74,4609 @@ CATEGORIES = {
     "Outros": [".bak", ".tmp", ".log", ".dat", ".cfg", ".ini"]
 }
 
+# Algumas extensões aparecem em mais de uma categoria. Elas ficam com a
+# primeira categoria acima que as lista:
+#   .iso -> Compactados (também em Imagens de Disco)
+#   .sh  -> Executáveis (também em Scripts e Código)
+#   .log -> Documentos (também em Outros)
+# Para mandar uma para outro lugar, adicione aqui em vez de reordenar CATEGORIES.
+EXTENSION_OVERRIDES = {}
+
+# Categorias separadas em subpastas por ano
+DATED_CATEGORIES = ["Imagens", "Videos"]
+
+# Categorias separadas em subpastas por extensão; as demais vão para UNKNOWN_FOLDER
+EXTENSION_FOLDER_CATEGORIES = [
+    "Documentos", "Compactados", "Executáveis", "Fontes", "Scripts e Código",
+    "Imagens de Disco", "Modelos 3D", "Outros"
+]
+
+# Categoria dos arquivos que nenhuma regra pega
+DEFAULT_CATEGORY = "Outros"
+
+# Nomes de pasta usados quando um campo do modelo não pode ser calculado
+UNKNOWN_YEAR = "AnoDesconhecido"
+UNKNOWN_FOLDER = "Desconhecido"
+
+# ----------------------------
+# REGRAS DE CLASSIFICAÇÃO
+# ----------------------------
+
+# Campos que um modelo de destino pode usar; mês e dia têm zero à esquerda
+TEMPLATE_FIELDS = ("category", "ext", "year", "month", "day")
+DATE_FIELDS = {"year", "month", "day"}
+
+DEFAULT_TARGET = "{category}/{ext}"
+
+# Chaves que uma regra pode ter num arquivo de regras
+RULE_KEYS = (
+    "category", "target", "extensions", "glob", "path", "min_size", "max_size",
+    "older_than_days", "newer_than_days"
+)
+
+# Sufixos de tamanho aceitos nos arquivos de regras (potências de 1024)
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+def parse_size(value) -> int:
+    """Lê um tamanho em bytes, dado como número ou como texto tipo "10M" ou "1.5 GiB"."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    found = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?", str(value).strip().lower())
+    if found is None:
+        raise ValueError(f"tamanho inválido: {value!r}")
+    return int(float(found.group(1)) * SIZE_UNITS[found.group(2)])
+
+class Rule:
+    """
+    Uma regra de classificação: quais arquivos ela pega, a categoria deles e
+    a pasta para onde vão.
+
+    Um arquivo casa quando cumpre todas as condições dadas: sua extensão é
+    uma de extensions ("" para arquivos sem extensão), seu nome casa com um
+    dos globs (sem diferenciar maiúsculas), seu caminho começa com uma das
+    pastas de paths (relativas à origem, ou absolutas), seu tamanho fica
+    entre min_size e max_size, e sua idade (pela data de modificação) fica
+    entre newer_than e older_than segundos. target é um modelo str.format
+    da pasta dentro do destino, usando TEMPLATE_FIELDS.
+    """
+    __slots__ = (
+        "category", "target", "extensions", "globs", "pattern", "paths",
+        "_relative", "_absolute", "min_size", "max_size", "older_than",
+        "newer_than", "dated", "plain"
+    )
+
+    def __init__(self, category: str, target: str = DEFAULT_TARGET, extensions=None,
+                 globs=None, paths=None, min_size: int = None, max_size: int = None,
+                 older_than: float = None, newer_than: float = None):
+        fields = {field for _, field, _, _ in string.Formatter().parse(target) if field is not None}
+        unknown = fields - set(TEMPLATE_FIELDS)
+        if unknown:
+            raise ValueError(f"campos desconhecidos no modelo {target!r}: {', '.join(sorted(unknown))}")
+        self.category = category
+        self.target = target
+        self.dated = bool(fields & DATE_FIELDS)
+        self.extensions = None
+        if extensions:
+            self.extensions = frozenset(
+                "." + ext.lower().lstrip(".") if ext else "" for ext in extensions
+            )
+        self.globs = tuple(globs) if globs else None
+        self.pattern = None
+        if self.globs:
+            self.pattern = re.compile(
+                "|".join(fnmatch.translate(glob) for glob in self.globs), re.IGNORECASE
+            )
+        self.paths = tuple(paths) if paths else None
+        # Os prefixos de pasta terminam em "/" para "Downloads" não casar com "Downloads2"
+        prefixes = [path.replace(os.sep, "/").rstrip("/") + "/" for path in self.paths or ()]
+        self._relative = tuple(prefix for prefix in prefixes if not os.path.isabs(prefix))
+        self._absolute = tuple(prefix for prefix in prefixes if os.path.isabs(prefix))
+        self.min_size = min_size
+        self.max_size = max_size
+        self.older_than = older_than
+        self.newer_than = newer_than
+        # Só a extensão decide, então o RuleSet não precisa checar mais nada
+        self.plain = (self.pattern is None and self.paths is None and min_size is None
+                      and max_size is None and older_than is None and newer_than is None)
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> "Rule":
+        """Monta uma regra a partir da sua entrada num arquivo de regras; veja RULE_KEYS."""
+        unknown = set(spec) - set(RULE_KEYS)
+        if unknown:
+            raise ValueError(f"chaves desconhecidas: {', '.join(sorted(unknown))}")
+        if not spec.get("category"):
+            raise ValueError("a categoria é obrigatória")
+
+        def listed(key):
+            value = spec.get(key)
+            return [value] if isinstance(value, str) else value
+
+        def seconds(key):
+            return None if spec.get(key) is None else float(spec[key]) * 86400
+
+        def size(key):
+            return None if spec.get(key) is None else parse_size(spec[key])
+
+        return cls(
+            spec["category"], spec.get("target", DEFAULT_TARGET), listed("extensions"),
+            listed("glob"), listed("path"), size("min_size"), size("max_size"),
+            seconds("older_than_days"), seconds("newer_than_days")
+        )
+
+    def __repr__(self):
+        return f"Rule({self.category!r}, {self.target!r})"
+
+    def accepts(self, name: str, size: int, mtime: float, path: str, root: str = None) -> bool:
+        """Checa todas as condições menos a extensão, pela qual o RuleSet já separa as regras."""
+        if self.pattern is not None and self.pattern.match(name) is None:
+            return False
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.older_than is not None or self.newer_than is not None:
+            if mtime is None:
+                return False
+            age = time.time() - mtime
+            if self.older_than is not None and age < self.older_than:
+                return False
+            if self.newer_than is not None and age > self.newer_than:
+                return False
+        if self.paths is not None:
+            if root is not None and path[len(os.path.join(root, "")):].replace(
+                    os.sep, "/").startswith(self._relative):
+                return True
+            return path.replace(os.sep, "/").startswith(self._absolute)
+        return True
+
+    def folder(self, ext: str, mtime: float = None) -> str:
+        """Preenche target para um arquivo com esta extensão e data."""
+        fields = {"category": self.category, "ext": ext.lstrip(".")}
+        if self.dated:
+            try:
+                when = datetime.fromtimestamp(mtime)
+                fields.update(year=str(when.year), month=f"{when.month:02d}", day=f"{when.day:02d}")
+            except (TypeError, ValueError, OverflowError, OSError):
+                fields.update(year=UNKNOWN_YEAR, month=UNKNOWN_FOLDER, day=UNKNOWN_FOLDER)
+        parts = self.target.format_map(fields).split("/")
+        # Campos vazios (arquivos sem extensão) somem; nada sobe para fora do destino
+        return "/".join(part for part in parts if part not in ("", ".", ".."))
+
+class GlobIndex:
+    """
+    Descobre com qual de muitos padrões glob numerados um nome casa primeiro.
+
+    Os globs são agrupados pelo primeiro caractere, ou pelo último se
+    começam com um curinga, então um nome só é testado contra os grupos
+    do seu próprio primeiro e último caractere e os globs com curingas
+    nas duas pontas. Cada grupo é uma expressão regular que junta seus
+    globs, e de novo uma por metade, quarto, ... deles: um nome que não
+    casa com nada custa um regex por grupo, e um acerto é afunilado
+    descendo pela primeira metade que casa. Grupos nomeados diriam
+    direto qual glob casou, mas fazem o motor de regex guardar cada grupo
+    a cada alternativa, o que fica muito mais lento com centenas deles.
+    """
+
+    # Abaixo de quantos globs um grupo é testado um a um
+    LEAF_SIZE = 8
+
+    def __init__(self, globs):
+        buckets = {}
+        for index, glob in globs:
+            if glob[:1] and glob[0] not in "*?[" and glob[0].isascii():
+                key = ("first", glob[0].lower())
+            elif glob[-1:] and glob[-1] not in "*?]" and glob[-1].isascii():
+                key = ("last", glob[-1].lower())
+            else:
+                key = ("any", None)
+            buckets.setdefault(key, []).append((index, fnmatch.translate(glob)))
+        self._by_first = {}
+        self._by_last = {}
+        self._anywhere = None
+        for (kind, char), entries in buckets.items():
+            tree = self._tree(entries)
+            if kind == "first":
+                self._by_first[char] = tree
+            elif kind == "last":
+                self._by_last[char] = tree
+            else:
+                self._anywhere = tree
+
+    def _tree(self, entries):
+        # Um nó é (primeiro índice, último índice, regex, filhos); um glob sozinho não tem filhos
+        regex = re.compile("|".join(f"(?:{pattern})" for _, pattern in entries), re.IGNORECASE)
+        if len(entries) == 1:
+            children = None
+        elif len(entries) <= self.LEAF_SIZE:
+            children = tuple(self._tree([entry]) for entry in entries)
+        else:
+            middle = len(entries) // 2
+            children = (self._tree(entries[:middle]), self._tree(entries[middle:]))
+        return entries[0][0], entries[-1][0], regex, children
+
+    def first(self, name: str, start: int = 0, limit: int = None):
+        """Retorna o número do primeiro glob em start..limit-1 com que name casa, ou None."""
+        found = None
+        for tree in (self._by_first.get(name[:1].lower()), self._by_last.get(name[-1:].lower()),
+                     self._anywhere):
+            if tree is not None:
+                index = self._first(tree, name, start, limit)
+                if index is not None:
+                    found = limit = index
+        return found
+
+    def _first(self, node, name, start, limit):
+        low, high, regex, children = node
+        if high < start or (limit is not None and low >= limit) or regex.match(name) is None:
+            return None
+        if children is None:
+            return low
+        for child in children:
+            index = self._first(child, name, start, limit)
+            if index is not None:
+                return index
+        return None
+
+class RuleSet:
+    """
+    Regras compiladas para a classificação; vale a primeira regra que o
+    arquivo cumpre, e default pega os arquivos que nenhuma regra pega.
+
+    As regras são indexadas por extensão, então um arquivo só é testado
+    contra as regras que citam sua extensão. Os globs das regras sem
+    extensão vão para um GlobIndex, e só as regras sem nenhum dos dois são
+    testadas uma a uma, então centenas de regras custam cerca de uma consulta
+    a dict e alguns regex por arquivo. extension_map dá a cada extensão
+    citada por uma regra a categoria da primeira regra que a cita.
+    """
+
+    def __init__(self, rules, default: Rule = None):
+        self.rules = tuple(rules)
+        self.default = default or Rule(DEFAULT_CATEGORY)
+        by_ext = {}
+        globbed = []
+        rest = []
+        for index, rule in enumerate(self.rules):
+            if rule.extensions is not None:
+                for ext in rule.extensions:
+                    by_ext.setdefault(ext, []).append((index, rule))
+            elif rule.pattern is not None:
+                globbed.append((index, rule))
+            else:
+                rest.append((index, rule))
+        self._by_ext = {ext: tuple(found) for ext, found in by_ext.items()}
+        self._globs = None
+        if globbed:
+            self._globs = GlobIndex(
+                (index, glob) for index, rule in globbed for glob in rule.globs
+            )
+        self._rest = tuple(rest)
+        # Índice da primeira regra que não é achada pelas extensões
+        self._first_unkeyed = min(
+            [index for index, _ in globbed + rest], default=len(self.rules)
+        )
+        self.extension_map = {}
+        for rule in self.rules:
+            for ext in sorted(rule.extensions or ()):
+                self.extension_map.setdefault(ext, rule.category)
+
+    @classmethod
+    def load(cls, path: Path) -> "RuleSet":
+        """
+        Lê um arquivo de regras JSON: {"rules": [...], "default": {...},
+        "builtin": true}. Cada regra é um objeto com RULE_KEYS; tamanhos são
+        bytes ou texto tipo "10M", idades são dias. As regras embutidas vêm
+        depois das do arquivo, a menos que "builtin" seja false.
+        """
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        rules = []
+        for number, spec in enumerate(config.get("rules", []), 1):
+            try:
+                rules.append(Rule.from_dict(spec))
+            except (ValueError, TypeError, AttributeError) as e:
+                raise ValueError(f"{path}: regra {number}: {e}") from None
+        if config.get("builtin", True):
+            rules += default_rules()
+        default = None
+        if "default" in config:
+            try:
+                default = Rule.from_dict(config["default"])
+            except (ValueError, TypeError, AttributeError) as e:
+                raise ValueError(f"{path}: regra padrão: {e}") from None
+            if not default.plain or default.extensions is not None:
+                raise ValueError(f"{path}: a regra padrão não pode ter condições")
+        return cls(rules, default)
+
+    def match(self, name: str, ext: str, size: int, mtime: float, path: str,
+              root: str = None) -> Rule:
+        """Retorna a primeira regra que o arquivo cumpre, ou default."""
+        found = None
+        limit = len(self.rules)
+        for index, rule in self._by_ext.get(ext, ()):
+            if rule.plain or rule.accepts(name, size, mtime, path, root):
+                found, limit = rule, index
+                break
+        if self._globs is not None and self._first_unkeyed < limit:
+            index = self._globs.first(name, 0, limit)
+            while index is not None:
+                # O glob casou; a regra ainda pode ter outras condições
+                rule = self.rules[index]
+                if rule.accepts(name, size, mtime, path, root):
+                    found, limit = rule, index
+                    break
+                index = self._globs.first(name, index + 1, limit)
+        for index, rule in self._rest:
+            if index >= limit:
+                break
+            if rule.accepts(name, size, mtime, path, root):
+                found = rule
+                break
+        return found or self.default
+
+    def extension_rule(self, ext: str):
+        """
+        Retorna a regra que todo arquivo com esta extensão recebe, quando só
+        a extensão decide, ou None quando outras condições podem decidir.
+        """
+        candidates = self._by_ext.get(ext)
+        if candidates:
+            index, rule = candidates[0]
+            return rule if rule.plain and index < self._first_unkeyed else None
+        return self.default if self._first_unkeyed == len(self.rules) else None
+
+def default_rules() -> list:
+    """
+    As regras embutidas, a partir de CATEGORIES: uma extensão vai para a
+    primeira categoria que a lista, a menos que EXTENSION_OVERRIDES a mande
+    para outra, em pastas de ano para DATED_CATEGORIES e de extensão para
+    EXTENSION_FOLDER_CATEGORIES.
+    """
+    def target(category):
+        if category in DATED_CATEGORIES:
+            return "{category}/{year}"
+        if category in EXTENSION_FOLDER_CATEGORIES:
+            return DEFAULT_TARGET
+        return "{category}/" + UNKNOWN_FOLDER
+
+    rules = [Rule(category, target(category), [ext]) for ext, category in EXTENSION_OVERRIDES.items()]
+    rules += [Rule(category, target(category), exts) for category, exts in CATEGORIES.items()]
+    return rules
+
+def use_rules(rules: RuleSet):
+    """
+    Faz de rules o RuleSet com que todo arquivo é classificado daqui em
+    diante, e das extensões que ele cita as conhecidas (veja split_extension()).
+    """
+    global RULES, EXTENSION_MAP, MAX_SUFFIX_PARTS
+    RULES = rules
+    EXTENSION_MAP = rules.extension_map
+    # Maior extensão composta conhecida (".tar.gz" tem 2 partes)
+    MAX_SUFFIX_PARTS = max((ext.count(".") for ext in EXTENSION_MAP), default=1)
+
+use_rules(RuleSet(default_rules(), Rule(DEFAULT_CATEGORY, DEFAULT_TARGET)))
+
+# ----------------------------
+# FUNÇÕES AUXILIARES
+# ----------------------------
+
+def split_extension(name: str) -> str:
+    """
+    Retorna a extensão minúscula de um nome de arquivo, como Path.suffix, mas
+    preferindo uma extensão composta conhecida (".tar.gz" em vez de ".gz").
+    """
+    name = name.lower()
+    end = len(name)
+    ext = ""
+    for _ in range(MAX_SUFFIX_PARTS):
+        dot = name.rfind(".", 0, end)
+        # Um ponto no início indica arquivo oculto, não extensão
+        if dot <= 0 or dot == len(name) - 1:
+            break
+        if not ext or name[dot:] in EXTENSION_MAP:
+            ext = name[dot:]
+        end = dot
+    return ext
+
+def get_file_extension(file_path: Path) -> str:
+    """
+    Retorna a extensão minúscula do arquivo, reaproveitando o valor da
+    varredura. Também aceita um PlanOp, para o arquivo de origem da op.
+    """
+    if isinstance(file_path, FileEntry):
+        return file_path.ext
+    if isinstance(file_path, PlanOp):
+        return split_extension(os.path.basename(file_path.source))
+    return split_extension(file_path.name)
+
+def get_extension_category(ext: str) -> str:
+    """
+    Retorna a categoria principal para uma extensão minúscula (ex.: ".jpg"):
+    a que a primeira regra que a cita dá, quaisquer que sejam suas outras condições.
+    """
+    return EXTENSION_MAP.get(ext, RULES.default.category)
+
+def get_file_category(file_path: Path) -> str:
+    """Retorna a categoria principal do arquivo baseado na extensão."""
+    if isinstance(file_path, (FileEntry, PlanOp)):
+        return file_path.category
+    return get_extension_category(split_extension(file_path.name))
+
+def get_target_folder(file_path: Path, mtime: float = None) -> str:
+    """
+    Retorna a pasta, relativa ao destino, para onde a regra do arquivo o
+    manda (ex.: "Imagens/2021"). Quando a varredura já conhece a data de
+    modificação, ou uma data de captura, ela é passada em mtime,
+    evitando outro stat do arquivo; um PlanOp usa a sua.
+    """
+    ext = get_file_extension(file_path)
+    if isinstance(file_path, FileEntry):
+        rule = file_path.rule
+        modified = file_path.mtime
+    else:
+        if isinstance(file_path, PlanOp):
+            path, size, modified = file_path.source, file_path.size, file_path.mtime
+        else:
+            path = str(file_path)
+            try:
+                st = file_path.stat()
+                size, modified = st.st_size, st.st_mtime
+            except OSError:
+                size, modified = 0, None
+        rule = RULES.match(os.path.basename(path), ext, size, modified, path)
+    return rule.folder(ext, modified if mtime is None else mtime)
+
+def resolve_target(dst: Path) -> Path:
+    """Retorna dst, ou dst renomeado com sufixo _1, _2, ... se o nome estiver ocupado."""
+    counter = 1
+    target = dst
+    while target.exists():
+        target = dst.with_name(f"{dst.stem}_{counter}{dst.suffix}")
+        counter += 1
+    return target
+
+# requisição ioctl para um clone copy-on-write (linux/fs.h)
+FICLONE = 0x40049409
+
+# Ação no relatório para cada modo de --link
+LINK_ACTIONS = {"hard": "HARDLINK", "reflink": "REFLINK", "symlink": "SYMLINK"}
+
+def clone_file(src, target: Path) -> bool:
+    """
+    Clona src em target compartilhando os blocos de dados (FICLONE, suportado
+    por Btrfs, XFS e similares), com metadados copiados como no shutil.copy2.
+    Retorna False se a plataforma ou o sistema de arquivos não puder clonar.
+    """
+    if fcntl is None:
+        return False
+    with open(src, "rb") as fsrc, open(target, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            cloned = False
+        else:
+            cloned = True
+    if not cloned:
+        os.remove(target)
+        return False
+    shutil.copystat(src, target)
+    return True
+
+def link_file(src, target: Path, link: str) -> bool:
+    """
+    Cria target como hard link ("hard"), clone copy-on-write
+    ("reflink") ou um link simbólico ("symlink") para src. Um target que
+    já existe (o arquivo vazio reservado por um NameIndex com claim) é criado
+    ao lado e renomeado por cima, então o nome nunca fica livre no meio.
+    Retorna False quando isso não é possível, para que quem chamou copie.
+    """
+    made = target
+    if os.path.lexists(target):
+        made = target.with_name(f".{target.name}.maestro-link")
+    try:
+        if link == "hard":
+            os.link(src, made)
+        elif link == "symlink":
+            os.symlink(os.path.abspath(src), made)
+        elif not clone_file(src, made):
+            return False
+        if made != target:
+            os.replace(made, target)
+    except OSError:
+        return False
+    return True
+
+# Buffer em espaço de usuário para cópias que o kernel não faz sozinho
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Bytes pedidos por chamada de copy_file_range/sendfile
+KERNEL_COPY_CHUNK = 1024 * 1024 * 1024
+
+def _copy_in_kernel(infd: int, outfd: int) -> bool:
+    """
+    Copia de infd para outfd sem passar os dados pelo Python,
+    usando os.copy_file_range (que alguns sistemas de arquivos transformam em cópia
+    no servidor ou reflink) ou então os.sendfile.
+    Retorna False se nenhum dos dois estiver disponível, e nesse caso nada foi copiado.
+    """
+    for name in ("copy_file_range", "sendfile"):
+        if not hasattr(os, name):
+            continue
+        copied = 0
+        try:
+            while True:
+                if name == "copy_file_range":
+                    sent = os.copy_file_range(infd, outfd, KERNEL_COPY_CHUNK)
+                else:
+                    sent = os.sendfile(outfd, infd, None, KERNEL_COPY_CHUNK)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError:
+            # Não suportado para este par de arquivos (ex.: EXDEV, EINVAL): tenta
+            # o próximo método, a menos que dados já tenham sido escritos
+            if copied:
+                raise
+            continue
+        return True
+    return False
+
+def copy_file(src, target, buffer_size: int = COPY_BUFFER_SIZE, fadvise: bool = False):
+    """
+    Copia dados e metadados como shutil.copy2, mas pelo kernel quando
+    possível (copy_file_range/sendfile), recorrendo a um laço de leitura/escrita
+    com buffer_size. Com fadvise, a origem é lida com uma dica sequencial
+    e descartada do cache de páginas depois, para que copiar uma biblioteca
+    grande não expulse todo o resto da memória.
+    """
+    with open(src, "rb") as fsrc, open(target, "wb") as fdst:
+        infd = fsrc.fileno()
+        if fadvise and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(infd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        if not _copy_in_kernel(infd, fdst.fileno()):
+            shutil.copyfileobj(fsrc, fdst, buffer_size)
+        if fadvise and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(infd, 0, 0, os.POSIX_FADV_DONTNEED)
+    shutil.copystat(src, target)
+    return target
+
+def transfer_file(src: Path, target: Path, move: bool = True, link: str = None,
+                  same_device: bool = False, buffer_size: int = COPY_BUFFER_SIZE,
+                  fadvise: bool = False):
+    """
+    Move ou copia src exatamente para target, cuja pasta já deve existir.
+
+    Um move dentro do mesmo dispositivo é um único os.rename, sem as
+    verificações extras do shutil.move. Ao copiar, link ("hard", "reflink" ou
+    "symlink") substitui a cópia dos dados, voltando à cópia normal
+    onde não for suportado. Cópias, incluindo as feitas por movimentações entre
+    dispositivos, passam por copy_file() com buffer_size e fadvise.
+    Retorna target, ou None se falhar.
+    """
+    try:
+        return _transfer(src, target, move, link, same_device, buffer_size, fadvise)
+    except Exception as e:
+        print(f"[ERRO] Não foi possível processar {src}: {e}")
+        return None
+
+def _transfer(src, target, move, link, same_device, buffer_size, fadvise):
+    """Corpo de transfer_file(); lança exceção em caso de erro."""
+    def copy(source, destination):
+        return copy_file(source, destination, buffer_size=buffer_size, fadvise=fadvise)
+
+    if move:
+        if same_device:
+            try:
+                os.rename(src, target)
+                return target
+            except OSError:
+                pass
+        shutil.move(str(src), str(target), copy_function=copy)
+    elif link is None or not link_file(src, target, link):
+        copy(src, target)
+    return target
+
+def safe_move_or_copy(src: Path, dst: Path, move: bool = True):
+    """Move ou copia arquivo, renomeando se já existir."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    return transfer_file(src, resolve_target(dst), move=move)
+
+class DirectoryCache:
+    """
+    Mapeia um nome de pasta relativo ao destino (veja get_target_folder())
+    para seu caminho e cria cada pasta só na primeira vez em que é usada,
+    então uma execução faz um mkdir por pasta distinta (algumas centenas)
+    em vez de um por arquivo.
+    """
+
+    def __init__(self, dest_dir: Path, create: bool = True):
+        self.dest_dir = dest_dir
+        self.create = create
+        self._dirs = {}
+        self._lock = threading.Lock()
+
+    def get(self, folder: str) -> Path:
+        """Retorna a pasta de destino, criando-a no primeiro uso."""
+        directory = self._dirs.get(folder)
+        if directory is None:
+            with self._lock:
+                directory = self._dirs.get(folder)
+                if directory is None:
+                    directory = self.dest_dir / folder
+                    if self.create:
+                        directory.mkdir(parents=True, exist_ok=True)
+                    self._dirs[folder] = directory
+        return directory
+
+    def create_for_extensions(self, extensions):
+        """
+        Cria de antemão as pastas das extensões vistas na pré-passagem cuja
+        regra depende só da extensão. As pastas de data dependem da data de
+        cada arquivo, e as outras de mais que o nome, então elas são
+        criadas sob demanda.
+        """
+        for ext in sorted(extensions):
+            rule = RULES.extension_rule(ext)
+            if rule is not None and not rule.dated:
+                self.get(rule.folder(ext))
+
+class NameIndex:
+    """
+    Índice em memória dos nomes de arquivo em cada pasta de destino.
+
+    Uma pasta é listada uma vez, na primeira vez que um arquivo vai para ela,
+    e todo nome entregue entra no índice, então escolher um nome livre é uma
+    consulta a um set em vez de um exists() por candidato _1, _2, ... Um
+    contador por nome em colisão guarda o próximo sufixo a testar. Os nomes
+    são escolhidos exatamente como resolve_target() os escolheria.
+
+    Com claim, cada nome também é criado no disco como um arquivo vazio
+    (O_CREAT | O_EXCL) ao ser reservado. Vários processos organizando para
+    o mesmo destino, como as fatias (shards) de uma execução, nunca escolhem
+    o mesmo nome: um que outro processo pegou depois que a pasta foi listada
+    é pulado como qualquer nome ocupado. As transferências sobrescrevem o
+    arquivo vazio.
+    """
+
+    # Estes sistemas de arquivos tratam "Foto.jpg" e "foto.jpg" como o mesmo arquivo
+    CASE_INSENSITIVE = sys.platform in ("win32", "darwin")
+
+    def __init__(self, claim: bool = False):
+        self.claim = claim
+        self._names = {}
+        self._next_suffix = {}
+        self._lock = threading.Lock()
+
+    def _key(self, name: str) -> str:
+        return name.lower() if self.CASE_INSENSITIVE else name
+
+    def _folder_names(self, folder: Path) -> set:
+        names = self._names.get(folder)
+        if names is None:
+            try:
+                names = {self._key(name) for name in os.listdir(folder)}
+            except FileNotFoundError:
+                names = set()
+            self._names[folder] = names
+        return names
+
+    def reserve(self, folder: Path, name: str) -> Path:
+        """Retorna um caminho livre para name dentro de folder e o marca como ocupado."""
+        with self._lock:
+            names = self._folder_names(folder)
+            while True:
+                target = self._next_free(folder, names, name)
+                if not self.claim or self._create(target):
+                    return target
+
+    def _next_free(self, folder: Path, names: set, name: str) -> Path:
+        if self._key(name) not in names:
+            names.add(self._key(name))
+            return folder / name
+        dst = folder / name
+        counter = self._next_suffix.get((folder, self._key(name)), 1)
+        candidate = f"{dst.stem}_{counter}{dst.suffix}"
+        while self._key(candidate) in names:
+            counter += 1
+            candidate = f"{dst.stem}_{counter}{dst.suffix}"
+        self._next_suffix[(folder, self._key(name))] = counter + 1
+        names.add(self._key(candidate))
+        return folder / candidate
+
+    @staticmethod
+    def _create(target: Path) -> bool:
+        """Cria o arquivo vazio de um nome reservado; False se ele já existe."""
+        for _ in range(2):
+            try:
+                os.close(os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+                return True
+            except FileExistsError:
+                return False
+            except FileNotFoundError:
+                target.parent.mkdir(parents=True, exist_ok=True)
+            except OSError:
+                # Não dá para reservar (ex.: somente leitura): a transferência informa o erro
+                return True
+        return True
+
+    def add_folder(self, folder: Path, names):
+        """Recebe a listagem de uma pasta feita em outro lugar, para que reserve() não a liste de novo."""
+        with self._lock:
+            if folder not in self._names:
+                self._names[folder] = {self._key(name) for name in names}
+
+    def release(self, target: Path):
+        """Libera um nome reservado cuja transferência falhou."""
+        with self._lock:
+            self._names.get(target.parent, set()).discard(self._key(target.name))
+        if self.claim:
+            # Apaga o arquivo vazio, a não ser que a transferência que falhou tenha escrito nele
+            try:
+                if os.lstat(target).st_size == 0:
+                    os.remove(target)
+            except OSError:
+                pass
+
+# ----------------------------
+# DETECÇÃO DE DUPLICADOS
+# ----------------------------
+
+class DuplicateCandidate:
+    """
+    Um arquivo participando da detecção de duplicados. Os hashes são calculados
+    sob demanda e guardados, então nenhum arquivo é lido mais de uma vez por tipo de hash.
+    """
+    __slots__ = ("path", "size", "target", "partial", "full")
+
+    def __init__(self, path, size: int):
+        self.path = path
+        self.size = size
+        self.target = None
+        self.partial = None
+        self.full = None
+
+class DuplicateIndex:
+    """
+    Encontra arquivos cujo conteúdo já foi organizado nesta execução, ou
+    antes dela (veja add_organized()).
+
+    Os arquivos são agrupados por tamanho e nada é lido até aparecer um segundo
+    arquivo do mesmo tamanho. Então um hash parcial barato (primeiro e último bloco)
+    é comparado, e só se ele bater o conteúdo inteiro recebe hash.
+
+    Os arquivos e seus hashes ficam num banco SQLite temporário em vez de
+    na memória, então uma execução de milhões de arquivos não cresce junto;
+    só as transferências pendentes dos mais recentes são guardadas.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self):
+        # Um nome vazio dá um banco privado num arquivo temporário
+        self._conn = sqlite3.connect("")
+        self._conn.execute(
+            "CREATE TABLE files (size INTEGER, path TEXT, target TEXT, partial BLOB, full BLOB)"
+        )
+        self._conn.execute("CREATE INDEX files_by_size ON files (size)")
+        # rowid -> transferência pendente do arquivo, a mais antiga primeiro
+        self._pending = {}
+
+    def _partial_hash(self, candidate: DuplicateCandidate) -> bytes:
+        if candidate.partial is None:
+            digest = hashlib.blake2b(digest_size=16)
+            with open(candidate.path, "rb") as f:
+                digest.update(f.read(self.BLOCK_SIZE))
+                if candidate.size > 2 * self.BLOCK_SIZE:
+                    f.seek(-self.BLOCK_SIZE, os.SEEK_END)
+                digest.update(f.read(self.BLOCK_SIZE))
+            candidate.partial = digest.digest()
+        return candidate.partial
+
+    def _full_hash(self, candidate: DuplicateCandidate) -> bytes:
+        if candidate.full is None:
+            if candidate.size <= 2 * self.BLOCK_SIZE:
+                # O hash parcial já cobriu o arquivo inteiro
+                candidate.full = self._partial_hash(candidate)
+            else:
+                digest = hashlib.blake2b(digest_size=16)
+                with open(candidate.path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        digest.update(chunk)
+                candidate.full = digest.digest()
+        return candidate.full
+
+    def match(self, entry: "FileEntry"):
+        """
+        Retorna (candidate, original): candidate embrulha entry para um add()
+        posterior, original é o arquivo organizado com o mesmo conteúdo, ou None.
+        """
+        candidate = DuplicateCandidate(entry.path, entry.size)
+        found = None
+        # Os hashes calculados aqui são guardados, e arquivos que sumiram são
+        # descartados, depois de lidas as linhas
+        hashed = []
+        dropped = []
+        rows = self._conn.execute(
+            "SELECT rowid, path, target, partial, full FROM files WHERE size = ?", (entry.size,)
+        )
+        for rowid, path, target, partial, full in rows:
+            future = self._pending.pop(rowid, None)
+            # Esperar o original chegar ao destino antes de lê-lo
+            if future is not None and future.result()[0] is None:
+                dropped.append(rowid)
+                continue
+            original = DuplicateCandidate(path, entry.size)
+            original.target = Path(target)
+            original.partial = partial
+            original.full = full
+            try:
+                same = (self._partial_hash(candidate) == self._partial_hash(original)
+                        and self._full_hash(candidate) == self._full_hash(original))
+            except OSError as e:
+                if e.filename == path:
+                    dropped.append(rowid)
+                    continue
+                print(f"[ERRO] Não foi possível comparar {entry.path}: {e}")
+                break
+            finally:
+                if (original.partial, original.full) != (partial, full):
+                    hashed.append((original.partial, original.full, rowid))
+            if same:
+                found = original
+                break
+        rows.close()
+        if hashed:
+            self._conn.executemany(
+                "UPDATE files SET partial = ?, full = ? WHERE rowid = ?", hashed
+            )
+        if dropped:
+            self._conn.executemany("DELETE FROM files WHERE rowid = ?", [(r,) for r in dropped])
+        return candidate, found
+
+    def _settle(self):
+        # Solta as transferências terminadas, descartando arquivos cuja transferência falhou
+        while self._pending:
+            rowid, future = next(iter(self._pending.items()))
+            if not future.done():
+                break
+            del self._pending[rowid]
+            if future.result()[0] is None:
+                self._conn.execute("DELETE FROM files WHERE rowid = ?", (rowid,))
+
+    def add(self, candidate: DuplicateCandidate, path, target: Path, future=None):
+        """
+        Registra um arquivo organizado. path é onde seu conteúdo pode ser lido,
+        target é para onde foi organizado; future, se informado, é sua
+        transferência pendente.
+        """
+        self._settle()
+        rowid = self._conn.execute(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+            (candidate.size, str(path), str(target), candidate.partial, candidate.full)
+        ).lastrowid
+        if future is not None:
+            self._pending[rowid] = future
+
+    def add_organized(self, files):
+        """
+        Registra arquivos organizados antes do início desta execução, dados como
+        pares (tamanho, destino), para que os arquivos desta execução sejam comparados com eles.
+        """
+        self._conn.executemany(
+            "INSERT INTO files (size, path, target) VALUES (?, ?, ?)",
+            ((size, path, path) for size, path in files)
+        )
+
+    def close(self):
+        """Apaga o banco."""
+        self._conn.close()
+
+def link_duplicate(original: Path, target: Path, src, move: bool = True) -> bool:
+    """
+    Cria target como hardlink de um arquivo idêntico já organizado em vez de
+    copiá-lo. No modo mover a cópia de origem é então removida.
+    Retorna False se o link não puder ser feito (ex.: entre dispositivos).
+    """
+    if not link_file(original, target, "hard"):
+        return False
+    if move:
+        try:
+            os.remove(src)
+        except OSError as e:
+            print(f"[ERRO] Não foi possível remover {src}: {e}")
+    return True
+
+# ----------------------------
+# EXECUÇÃO PARALELA
+# ----------------------------
+
+class DeviceLimiter:
+    """
+    Limita quantas transferências podem rodar ao mesmo tempo em cada dispositivo
+    (st_dev). Uma transferência ocupa uma vaga no dispositivo de origem e no de
+    destino; as vagas são pegas sempre em ordem de dispositivo, evitando deadlock.
+    """
+
+    def __init__(self, limit: int = None):
+        self.limit = limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, dev: int):
+        with self._lock:
+            if dev not in self._semaphores:
+                self._semaphores[dev] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[dev]
+
+    @contextmanager
+    def hold(self, *devices):
+        if not self.limit:
+            yield
+            return
+        semaphores = [self._semaphore(dev) for dev in sorted(set(devices))]
+        for semaphore in semaphores:
+            semaphore.acquire()
+        try:
+            yield
+        finally:
+            for semaphore in reversed(semaphores):
+                semaphore.release()
+
+def timed_transfer(src, target: Path, move: bool = True, link: str = None,
+                   same_device: bool = False, buffer_size: int = COPY_BUFFER_SIZE,
+                   fadvise: bool = False):
+    """
+    Executa uma transferência como transfer_file. Retorna (destino, segundos gastos, None),
+    ou (None, segundos gastos, mensagem de erro) em caso de erro.
+    """
+    started = time.perf_counter()
+    try:
+        _transfer(src, target, move, link, same_device, buffer_size, fadvise)
+    except Exception as e:
+        print(f"[ERRO] Não foi possível processar {src}: {e}")
+        return None, time.perf_counter() - started, str(e)
+    return target, time.perf_counter() - started, None
+
+def limited_transfer(limiter: DeviceLimiter, devices, src, target: Path, **options):
+    """Executa timed_transfer segurando as vagas de dispositivo da transferência."""
+    with limiter.hold(*devices):
+        return timed_transfer(src, target, **options)
+
+# ----------------------------
+# VARREDURA DE DIRETÓRIOS
+# ----------------------------
+
+class FileEntry:
+    """
+    Um arquivo encontrado pela varredura.
+
+    Carrega os dados lidos da entrada de diretório durante a varredura
+    (tamanho, mtime, dispositivo, inode), então cada arquivo tem no máximo um stat.
+    A extensão, a regra e a categoria são calculadas uma única vez, ao criar
+    a entrada; root é a pasta de origem, para regras que olham o caminho.
+    """
+    __slots__ = ("path", "name", "size", "mtime", "dev", "ino", "root", "ext", "rule", "category")
+
+    def __init__(self, path: str, name: str, size: int, mtime: float, dev: int, ino: int,
+                 root: str = None):
+        self.path = path
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.dev = dev
+        self.ino = ino
+        self.root = root
+        self.ext = split_extension(name)
+        self.classify()
+
+    def classify(self):
+        """Escolhe a regra da entrada, e com ela a categoria, no RuleSet ativo."""
+        self.rule = RULES.match(self.name, self.ext, self.size, self.mtime, self.path, self.root)
+        self.category = self.rule.category
+
+    def __repr__(self):
+        return f"FileEntry({self.path!r})"
+
+def _dir_key(path: Path):
+    """Retorna (dispositivo, inode) de um diretório, ou None se não existir."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+# Padrões de exclusão lidos do topo da origem, um por linha
+IGNORE_FILE = ".maestroignore"
+
+def read_ignore_file(path: Path) -> list:
+    """Retorna os padrões de um arquivo de exclusão, pulando linhas vazias e comentários #."""
+    patterns = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("!"):
+                raise ValueError(f"{path}: linha {number}: padrões negados (!) não são suportados")
+            patterns.append(line)
+    return patterns
+
+class ScanFilter:
+    """
+    Quais pastas e arquivos de uma origem a varredura pega, decidido pelos
+    nomes e caminhos, então nada recebe stat por causa disso.
+
+    exclude e include são padrões glob, como no .gitignore: um sem "/" é
+    comparado com o nome de cada arquivo e pasta, um com "/" com o
+    caminho relativo a source_dir ("*" também atravessa pastas, e um "**/"
+    no início casa em qualquer profundidade), e um terminado em "/" só
+    com pastas. Os padrões são compilados em poucos regex uma única vez.
+    Uma pasta excluída é podada onde é listada, então nada abaixo dela
+    chega a ser lido. Com include, só os arquivos que casam com um dos seus
+    padrões são pegos (um padrão de pasta pega os arquivos abaixo dela). Pastas
+    mais de max_depth níveis abaixo (0: só os arquivos direto na origem)
+    também são podadas, assim como arquivos e pastas ocultos (nomes
+    começando com ".") com skip_hidden.
+
+    min_size e max_size limitam o tamanho dos arquivos em bytes; eles são
+    checados onde a varredura já faz o stat de cada arquivo.
+    """
+
+    def __init__(self, source_dir: Path, exclude=(), include=(), max_depth: int = None,
+                 min_size: int = None, max_size: int = None, skip_hidden: bool = False):
+        self.source_dir = str(source_dir)
+        self._prefix = len(os.path.join(self.source_dir, ""))
+        self.exclude = tuple(exclude)
+        self.include = tuple(include)
+        self.max_depth = max_depth
+        self.min_size = min_size
+        self.max_size = max_size
+        self.skip_hidden = skip_hidden
+        self._exclude_files = self._compile(p for p in self.exclude if not p.endswith("/"))
+        self._exclude_dirs = self._compile(p.rstrip("/") for p in self.exclude)
+        self._include = None
+        if self.include:
+            patterns = []
+            for pattern in self.include:
+                if pattern.endswith("/"):
+                    # Os arquivos em qualquer lugar abaixo da pasta
+                    folder = pattern.rstrip("/")
+                    pattern = ("" if "/" in folder else "**/") + folder + "/*"
+                patterns.append(pattern)
+            self._include = self._compile(patterns)
+        self.sized = min_size is not None or max_size is not None
+
+    @classmethod
+    def for_source(cls, source_dir: Path, exclude=(), include=(), max_depth: int = None,
+                   min_size: int = None, max_size: int = None, skip_hidden: bool = False):
+        """
+        Monta o filtro de source_dir, somando os padrões do IGNORE_FILE
+        no seu topo, se houver um. Retorna None quando nada ficaria de
+        fora, então varreduras simples não checam nada.
+        """
+        exclude = list(exclude)
+        ignore_file = Path(source_dir) / IGNORE_FILE
+        if ignore_file.is_file():
+            exclude += read_ignore_file(ignore_file)
+            # O próprio arquivo de exclusão fica na origem
+            exclude.append("/" + IGNORE_FILE)
+        if (not exclude and not include and max_depth is None and min_size is None
+                and max_size is None and not skip_hidden):
+            return None
+        return cls(source_dir, exclude, include, max_depth, min_size, max_size, skip_hidden)
+
+    @staticmethod
+    def _compile(patterns):
+        # Retorna (regex para nomes, regex para caminhos relativos); None onde nenhum padrão se aplica
+        names = []
+        paths = []
+        for pattern in patterns:
+            if pattern.startswith("**/"):
+                pattern = pattern[3:]
+                if "/" in pattern:
+                    paths.append(fnmatch.translate("*/" + pattern))
+            if "/" in pattern:
+                paths.append(fnmatch.translate(pattern.lstrip("/")))
+            elif pattern:
+                names.append(fnmatch.translate(pattern))
+        # Sem diferenciar maiúsculas onde o sistema de arquivos costuma não diferenciar, como fnmatch.fnmatch()
+        flags = re.IGNORECASE if os.name == "nt" else 0
+        return tuple(
+            re.compile("|".join(found), flags) if found else None for found in (names, paths)
+        )
+
+    def _matches(self, regexes, path: str, name: str) -> bool:
+        by_name, by_path = regexes
+        if by_name is not None and by_name.match(name) is not None:
+            return True
+        return by_path is not None and by_path.match(self.relative(path)) is not None
+
+    def relative(self, path: str) -> str:
+        """O caminho relativo à origem, com separadores "/"."""
+        return path[self._prefix:].replace(os.sep, "/")
+
+    def takes_dir(self, path: str, name: str) -> bool:
+        """True se a varredura deve entrar nesta pasta."""
+        if self.skip_hidden and name.startswith("."):
+            return False
+        if self.max_depth is not None and self.relative(path).count("/") >= self.max_depth:
+            return False
+        return not self._matches(self._exclude_dirs, path, name)
+
+    def takes_file(self, path: str, name: str) -> bool:
+        """True se o arquivo deve ser organizado, a julgar pelo nome e caminho."""
+        if self.skip_hidden and name.startswith("."):
+            return False
+        if self._matches(self._exclude_files, path, name):
+            return False
+        return self._include is None or self._matches(self._include, path, name)
+
+    def takes_size(self, size: int) -> bool:
+        """True se um arquivo com esse número de bytes fica entre min_size e max_size."""
+        return ((self.min_size is None or size >= self.min_size)
+                and (self.max_size is None or size <= self.max_size))
+
+    def apply(self, files, subdirs):
+        """Filtra uma listagem de scan_dir(); retorna os arquivos e subpastas mantidos."""
+        files = [entry for entry in files if self.takes_file(entry.path, entry.name)]
+        subdirs = [path for path in subdirs if self.takes_dir(path, os.path.basename(path))]
+        return files, subdirs
+
+def scan_dir(root: str, dest_key, dest_path: str, scan_filter: ScanFilter = None):
+    """
+    Lista uma pasta. Retorna (files, subdirs): o os.DirEntry de cada
+    arquivo e os caminhos das subpastas a visitar, ou None se a pasta
+    não puder ser lida. Com um ScanFilter, o que ele deixa de fora é descartado.
+
+    A pasta de destino fica de fora comparando dispositivo/inode (e também o
+    caminho em texto, para destinos que são pontos de montagem), então nenhum
+    Path é criado por subdiretório. Como no os.walk, links simbólicos para
+    diretórios não são seguidos.
+    """
+    subdirs = []
+    files = []
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    files.append(entry)
+                    continue
+                if entry.is_symlink() or entry.path == dest_path:
+                    continue
+                # Ignorar a própria pasta de destino
+                if (dest_key and entry.inode() == dest_key[1]
+                        and entry.stat(follow_symlinks=False).st_dev == dest_key[0]):
+                    continue
+                subdirs.append(entry.path)
+    except OSError:
+        return None
+    if scan_filter is not None:
+        return scan_filter.apply(files, subdirs)
+    return files, subdirs
+
+class ParallelScanner:
+    """
+    Percorre uma árvore listando várias pastas ao mesmo tempo, em threads de trabalho.
+
+    Cada thread mantém seu próprio deque de pastas a listar. Ela empilha as
+    subpastas que encontra e retoma a mais recente (em profundidade, o que
+    mantém os deques curtos); quando seu deque esvazia ela rouba a pasta mais
+    antiga de outra thread, em geral uma subárvore grande perto da raiz. Os
+    arquivos de cada pasta são entregues à thread consumidora em um lote
+    por uma fila limitada, então o percurso nunca se adianta muito a ela.
+
+    Os arquivos saem em uma ordem diferente a cada execução. Iterar produz o
+    os.DirEntry de cada arquivo. Um ScanFilter poda as pastas conforme são
+    listadas.
+    """
+
+    def __init__(self, source_dir: Path, dest_dir: Path, threads: int = 4,
+                 queue_size: int = 256, scan_filter: ScanFilter = None):
+        self.source_dir = str(source_dir)
+        self.dest_key = _dir_key(dest_dir)
+        self.dest_path = str(dest_dir)
+        self.scan_filter = scan_filter
+        self.threads = threads
+        self._batches = queue.Queue(maxsize=queue_size)
+        self._deques = [deque() for _ in range(threads)]
+        self._wakeup = threading.Condition()
+        # Pastas na fila ou sendo listadas; o percurso termina quando chega a 0
+        self._outstanding = 0
+        self._stop = threading.Event()
+        self._error = None
+
+    def _next_folder(self, me: int):
+        own = self._deques[me]
+        try:
+            return own.pop()
+        except IndexError:
+            pass
+        for offset in range(1, self.threads):
+            try:
+                return self._deques[(me + offset) % self.threads].popleft()
+            except IndexError:
+                continue
+        return None
+
+    def _put(self, batch):
+        while not self._stop.is_set():
+            try:
+                self._batches.put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _work(self, me: int):
+        try:
+            while not self._stop.is_set():
+                root = self._next_folder(me)
+                if root is None:
+                    with self._wakeup:
+                        if self._outstanding == 0:
+                            return
+                        self._wakeup.wait(0.05)
+                    continue
+                listing = scan_dir(root, self.dest_key, self.dest_path, self.scan_filter)
+                if listing is not None:
+                    files, subdirs = listing
+                    if subdirs:
+                        with self._wakeup:
+                            self._outstanding += len(subdirs)
+                            # Invertido para que esta thread continue na ordem da listagem
+                            self._deques[me].extend(reversed(subdirs))
+                            self._wakeup.notify_all()
+                    if files:
+                        self._put(files)
+                with self._wakeup:
+                    self._outstanding -= 1
+                    if self._outstanding == 0:
+                        self._wakeup.notify_all()
+        except BaseException as e:
+            self._error = e
+            self._stop.set()
+        finally:
+            # Avisa o consumidor que esta thread terminou
+            self._batches.put(None)
+
+    def __iter__(self):
+        self._outstanding = 1
+        self._deques[0].append(self.source_dir)
+        workers = [
+            threading.Thread(target=self._work, args=(n,), daemon=True)
+            for n in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        running = len(workers)
+        try:
+            while running:
+                batch = self._batches.get()
+                if batch is None:
+                    running -= 1
+                    continue
+                yield from batch
+        finally:
+            # Também alcançado se o consumidor parar antes: para as threads,
+            # esvaziando a fila para que nenhuma fique bloqueada nela
+            self._stop.set()
+            for worker in workers:
+                while worker.is_alive():
+                    try:
+                        self._batches.get_nowait()
+                    except queue.Empty:
+                        worker.join(0.01)
+        if self._error is not None:
+            raise self._error
+
+def iter_dir_entries(source_dir: Path, dest_dir: Path, index=None, threads: int = 1,
+                     shard: "Shard" = None, scan_filter: ScanFilter = None):
+    """
+    Percorre source_dir com os.scandir e gera o os.DirEntry de cada
+    arquivo, ignorando dest_dir. Diretórios ilegíveis são ignorados.
+    Com um Shard, só os arquivos dessa fatia são devolvidos. Um ScanFilter
+    poda pastas e descarta arquivos pelo nome conforme cada pasta é listada
+    (os tamanhos ficam para iter_files()).
+
+    Com threads > 1 um ParallelScanner lista pastas em paralelo; os arquivos
+    então saem sem ordem fixa.
+
+    Com um IncrementalIndex, pastas cujo mtime não mudou desde que foram
+    totalmente organizadas não são listadas de novo; só as suas subpastas
+    (guardadas no índice) são visitadas. O índice só é usado a partir
+    desta thread, então com ele o percurso é sempre serial. Uma pasta da qual
+    o ScanFilter deixou algo de fora não é guardada como totalmente
+    organizada, então uma execução seguinte com outros filtros a lista de novo.
+    """
+    if shard is not None:
+        yield from shard.entries(source_dir, dest_dir, index, threads, scan_filter)
+        return
+    if threads > 1 and index is None:
+        yield from ParallelScanner(source_dir, dest_dir, threads, scan_filter=scan_filter)
+        return
+    dest_key = _dir_key(dest_dir)
+    dest_path = str(dest_dir)
+    stack = [str(source_dir)]
+    while stack:
+        root = stack.pop()
+        if index is not None:
+            try:
+                mtime = os.stat(root).st_mtime
+            except OSError:
+                continue
+            known_subdirs = index.unchanged_subdirs(root, mtime)
+            if known_subdirs is not None:
+                subdirs = [os.path.join(root, name) for name in known_subdirs]
+                if scan_filter is not None:
+                    subdirs = scan_filter.apply((), subdirs)[1]
+                stack.extend(reversed(subdirs))
+                continue
+        listing = scan_dir(root, dest_key, dest_path)
+        if listing is None:
+            continue
+        files, subdirs = listing
+        complete = True
+        if scan_filter is not None:
+            kept_files, kept_subdirs = scan_filter.apply(files, subdirs)
+            complete = len(kept_files) == len(files) and len(kept_subdirs) == len(subdirs)
+            files, subdirs = kept_files, kept_subdirs
+        if index is not None and complete:
+            index.remember_dir(root, mtime, subdirs)
+        yield from files
+        # Invertido para visitar as subpastas na ordem da listagem, como o os.walk
+        stack.extend(reversed(subdirs))
+
+def iter_files(source_dir: Path, dest_dir: Path, index=None, threads: int = 1,
+               profiler: "Profiler" = None, shard: "Shard" = None,
+               scan_filter: ScanFilter = None):
+    """
+    Gera um FileEntry para cada arquivo de source_dir, ignorando dest_dir.
+    Com um Profiler ativo, o tempo gasto listando pastas, fazendo stat dos
+    arquivos e classificando-os vai para as etapas walk, stat e classify.
+    Os limites de tamanho de um ScanFilter são checados no stat já feito.
+    """
+    entries = iter_dir_entries(source_dir, dest_dir, index, threads, shard, scan_filter)
+    root = str(source_dir)
+    sized = scan_filter if scan_filter is not None and scan_filter.sized else None
+    if profiler is not None and profiler.enabled:
+        yield from _iter_files_profiled(entries, root, profiler, sized, index)
+        return
+    for entry in entries:
+        try:
+            st = entry.stat()
+        except OSError as e:
+            print(f"[ERRO] Não foi possível ler {entry.path}: {e}")
+            continue
+        if sized is not None and not sized.takes_size(st.st_size):
+            if index is not None:
+                # Fica para uma execução com outros limites de tamanho
+                index.mark_failed(entry)
+            continue
+        yield FileEntry(
+            entry.path, entry.name, st.st_size, st.st_mtime, st.st_dev, st.st_ino, root
+        )
+
+def _iter_files_profiled(entries, root: str, profiler: "Profiler", sized: ScanFilter = None,
+                         index=None):
+    """iter_files() com cada passo cronometrado; separado para que execuções normais não paguem nada."""
+    clock = time.perf_counter
+    stages = profiler.stages
+    while True:
+        started = clock()
+        entry = next(entries, None)
+        listed = clock()
+        stages["walk"] += listed - started
+        if entry is None:
+            return
+        try:
+            st = entry.stat()
+        except OSError as e:
+            print(f"[ERRO] Não foi possível ler {entry.path}: {e}")
+            continue
+        finally:
+            stated = clock()
+            stages["stat"] += stated - listed
+        if sized is not None and not sized.takes_size(st.st_size):
+            if index is not None:
+                index.mark_failed(entry)
+            continue
+        found = FileEntry(
+            entry.path, entry.name, st.st_size, st.st_mtime, st.st_dev, st.st_ino, root
+        )
+        stages["classify"] += clock() - stated
+        yield found
+
+def count_files(source_dir: Path, dest_dir: Path, index=None, threads: int = 1,
+                shard: "Shard" = None, scan_filter: ScanFilter = None):
+    """
+    Pré-passagem barata: conta arquivos por categoria sem guardar caminhos.
+    A contagem é feita por extensão, então cada extensão distinta é
+    classificada uma vez só, e só os nomes são olhados: nenhum arquivo recebe
+    stat a menos que o ScanFilter tenha limites de tamanho ou uma regra da sua
+    extensão tenha outras condições, e nesse caso o arquivo é comparado com as
+    regras como na própria execução. Retorna (summary, total, extensions).
+    """
+    ext_counts = {}
+    # Arquivos cuja extensão sozinha não decide a regra, por categoria
+    matched = {}
+    # Extensão -> se ela decide a regra
+    decides = {}
+    root = str(source_dir)
+    sized = scan_filter is not None and scan_filter.sized
+    for entry in iter_dir_entries(source_dir, dest_dir, index, threads, shard, scan_filter):
+        ext = split_extension(entry.name)
+        decided = decides.get(ext)
+        if decided is None:
+            decided = decides[ext] = RULES.extension_rule(ext) is not None
+        if sized or not decided:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            if sized and not scan_filter.takes_size(st.st_size):
+                continue
+            if not decided:
+                category = RULES.match(entry.name, ext, st.st_size, st.st_mtime,
+                                       entry.path, root).category
+                matched[category] = matched.get(category, 0) + 1
+        ext_counts[ext] = ext_counts.get(ext, 0) + 1
+    return _count_summary(ext_counts, matched)
+
+def _count_summary(ext_counts: dict, matched: dict):
+    """
+    Monta o (summary, total, extensions) de uma pré-passagem a partir dos seus
+    arquivos por extensão e, para os já comparados um a um, por categoria.
+    """
+    summary = dict(matched)
+    for ext, count in ext_counts.items():
+        rule = RULES.extension_rule(ext)
+        if rule is not None:
+            summary[rule.category] = summary.get(rule.category, 0) + count
+    return summary, sum(ext_counts.values()), set(ext_counts)
+
+# ----------------------------
+# FATIAS (SHARDING)
+# ----------------------------
+
+# Como a origem é dividida: cada arquivo pelo caminho, ou pastas de primeiro nível inteiras
+SHARD_MODES = ("path", "top")
+
+class Shard:
+    """
+    Uma de count fatias de uma origem, numeradas a partir de 1, para que count
+    processos independentes (numa máquina ou em várias) a organizem juntos.
+
+    Um arquivo pertence à fatia dada pelo CRC-32 do seu caminho relativo
+    à origem ("path", que distribui os arquivos por igual) ou do primeiro
+    componente desse caminho ("top", que mantém cada pasta de primeiro nível
+    numa fatia e deixa cada fatia sem listar as outras). Os dois dependem só
+    do caminho, então todos os processos concordam na divisão sem conversar
+    entre si.
+
+    Uma execução fatiada reserva seus nomes de destino no disco (veja NameIndex),
+    tem diário próprio e só encontra duplicados entre os seus arquivos;
+    merge_reports() junta os relatórios das fatias.
+    """
+    __slots__ = ("index", "count", "by")
+
+    def __init__(self, index: int, count: int, by: str = "path"):
+        if not 1 <= index <= count:
+            raise ValueError(f"a fatia {index} não está entre 1 e {count}")
+        if by not in SHARD_MODES:
+            raise ValueError(f"modo de fatia desconhecido: {by}")
+        self.index = index
+        self.count = count
+        self.by = by
+
+    @classmethod
+    def parse(cls, text: str, by: str = "path") -> "Shard":
+        """Lê uma fatia escrita como "i/N", ex.: "2/4"."""
+        index, sep, count = text.partition("/")
+        if not (sep and index.isdigit() and count.isdigit()):
+            raise ValueError(f"esperado i/N, recebido {text!r}")
+        return cls(int(index), int(count), by)
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def owns(self, relative: str) -> bool:
+        """True se o arquivo neste caminho (relativo à origem) pertence a esta fatia."""
+        relative = relative.replace(os.sep, "/")
+        if self.by == "top":
+            relative = relative.split("/", 1)[0]
+        key = relative.encode("utf-8", "surrogatepass")
+        return zlib.crc32(key) % self.count == self.index - 1
+
+    def entries(self, source_dir: Path, dest_dir: Path, index=None, threads: int = 1,
+                scan_filter: ScanFilter = None):
+        """iter_dir_entries() restrito aos arquivos desta fatia."""
+        if self.by == "path":
+            prefix = len(os.path.join(str(source_dir), ""))
+            for entry in iter_dir_entries(source_dir, dest_dir, index, threads,
+                                          scan_filter=scan_filter):
+                if self.owns(entry.path[prefix:]):
+                    yield entry
+            return
+        listing = scan_dir(str(source_dir), _dir_key(dest_dir), str(dest_dir), scan_filter)
+        if listing is None:
+            return
+        files, subdirs = listing
+        yield from (entry for entry in files if self.owns(entry.name))
+        for subdir in subdirs:
+            if self.owns(os.path.basename(subdir)):
+                yield from iter_dir_entries(
+                    Path(subdir), dest_dir, index, threads, scan_filter=scan_filter
+                )
+
+# ----------------------------
+# DATAS DE CAPTURA
+# ----------------------------
+
+DATE_SOURCES = ("exif", "container", "mtime")
+
+# Segundos da época do QuickTime/MP4 (1904-01-01 UTC) até a época Unix
+MP4_EPOCH_OFFSET = 2082844800
+
+# Tipos da primeira caixa de arquivos de mídia ISO (MP4, MOV, HEIC); arquivos
+# antigos do QuickTime podem começar com algo diferente de ftyp
+ISO_BOX_TYPES = {b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot"}
+
+# Máximo de bytes lidos de uma vez de um cabeçalho: um segmento JPEG tem no máximo 64 KiB
+# e uma caixa meta de HEIC alguns KiB
+HEADER_READ_LIMIT = 1024 * 1024
+
+# Máximo de bytes lidos de um segmento JPEG (o campo de tamanho tem 16 bits)
+JPEG_SEGMENT_LIMIT = 64 * 1024
+
+def _tiff_date(data: bytes):
+    """
+    Retorna a data de captura de um bloco EXIF (TIFF) como timestamp:
+    DateTimeOriginal, senão DateTimeDigitized, senão o DateTime do IFD0.
+    """
+    order = {b"II": "<", b"MM": ">"}.get(data[:2])
+    if order is None:
+        return None
+
+    def read_ifd(offset):
+        # {tag: (tipo, quantidade, posição do campo de valor)}
+        (count,) = struct.unpack_from(order + "H", data, offset)
+        tags = {}
+        for pos in range(offset + 2, min(offset + 2 + 12 * count, len(data) - 11), 12):
+            tag, kind, n = struct.unpack_from(order + "HHI", data, pos)
+            tags[tag] = (kind, n, pos + 8)
+        return tags
+
+    ifd0 = read_ifd(struct.unpack_from(order + "I", data, 4)[0])
+    fields = []
+    if 0x8769 in ifd0:
+        exif = read_ifd(struct.unpack_from(order + "I", data, ifd0[0x8769][2])[0])
+        fields += [exif.get(0x9003), exif.get(0x9004)]
+    fields.append(ifd0.get(0x0132))
+    for field in fields:
+        # Datas são ASCII (tipo 2) "AAAA:MM:DD HH:MM:SS", guardadas em outro lugar quando passam de 4 bytes
+        if field is None or field[0] != 2:
+            continue
+        kind, n, pos = field
+        if n > 4:
+            (pos,) = struct.unpack_from(order + "I", data, pos)
+        text = data[pos:pos + n].split(b"\0")[0].decode("ascii", "replace")
+        try:
+            return datetime.strptime(text[:19], "%Y:%m:%d %H:%M:%S").timestamp()
+        except ValueError:
+            continue
+    return None
+
+def _jpeg_exif_date(f):
+    """Lê os cabeçalhos dos marcadores do JPEG até o segmento APP1 Exif, e só esse segmento."""
+    f.seek(2)
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return None
+        kind = marker[1]
+        (length,) = struct.unpack(">H", marker[2:])
+        if kind in (0xDA, 0xD9):
+            # Início dos dados da imagem: não há metadados depois disso
+            return None
+        if length < 2:
+            # O tamanho conta os próprios dois bytes: o arquivo está corrompido
+            return None
+        if kind == 0xE1:
+            segment = f.read(min(length - 2, JPEG_SEGMENT_LIMIT))
+            if segment[:6] == b"Exif\0\0":
+                return _tiff_date(segment[6:])
+        else:
+            f.seek(length - 2, 1)
+
+def _iso_boxes(f, start: int, end: int):
+    """
+    Gera (tipo, início do conteúdo, fim da caixa) para as caixas de mídia ISO entre
+    start e end, lendo só seus cabeçalhos de 8 ou 16 bytes.
+    """
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        payload = pos + 8
+        if size == 1:
+            (size,) = struct.unpack(">Q", f.read(8))
+            payload += 8
+        elif size == 0:
+            size = end - pos
+        if size < payload - pos:
+            return
+        yield kind, payload, pos + size
+        pos += size
+
+def _container_date(f, size: int):
+    """Retorna a data de criação no cabeçalho do filme (moov/mvhd) de um arquivo MP4/MOV."""
+    for kind, start, end in _iso_boxes(f, 0, size):
+        if kind != b"moov":
+            continue
+        for kind, start, end in _iso_boxes(f, start, end):
+            if kind == b"mvhd":
+                f.seek(start)
+                header = f.read(12)
+                if header[0] == 1:
+                    (created,) = struct.unpack(">Q", header[4:12])
+                else:
+                    (created,) = struct.unpack(">I", header[4:8])
+                # 0 significa não definida
+                return created - MP4_EPOCH_OFFSET if created > MP4_EPOCH_OFFSET else None
+        return None
+    return None
+
+def _uint(data: bytes, pos: int, size: int) -> int:
+    return int.from_bytes(data[pos:pos + size], "big")
+
+def _heif_exif_date(f, size: int):
+    """
+    Retorna a data de captura EXIF de uma imagem HEIC/HEIF. A caixa meta é
+    lida para achar o item Exif (iinf) e onde ele está guardado (iloc); depois
+    só esse item é lido.
+    """
+    for kind, start, end in _iso_boxes(f, 0, size):
+        if kind == b"meta":
+            break
+    else:
+        return None
+    if end - start > HEADER_READ_LIMIT:
+        return None
+    f.seek(start)
+    meta = io.BytesIO(f.read(end - start))
+    # meta é uma full box: 4 bytes de versão e flags antes das caixas filhas
+    children = {kind: (start, end) for kind, start, end in _iso_boxes(meta, 4, end - start)}
+    if b"iinf" not in children or b"iloc" not in children:
+        return None
+
+    data = meta.getvalue()
+    start, end = children[b"iinf"]
+    version = data[start]
+    count_size = 2 if version == 0 else 4
+    exif_id = None
+    for kind, item, _ in _iso_boxes(meta, start + 4 + count_size, end):
+        if kind == b"infe" and data[item] >= 2:
+            id_size = 2 if data[item] == 2 else 4
+            if data[item + 4 + id_size + 2:item + 4 + id_size + 6] == b"Exif":
+                exif_id = _uint(data, item + 4, id_size)
+                break
+    if exif_id is None:
+        return None
+
+    pos, _ = children[b"iloc"]
+    version = data[pos]
+    offset_size, length_size = data[pos + 4] >> 4, data[pos + 4] & 15
+    base_size, index_size = data[pos + 5] >> 4, data[pos + 5] & 15
+    id_size = 2 if version < 2 else 4
+    count = _uint(data, pos + 6, id_size)
+    pos += 6 + id_size
+    for _ in range(count):
+        item = _uint(data, pos, id_size)
+        pos += id_size
+        method = 0
+        if version in (1, 2):
+            method = _uint(data, pos, 2) & 15
+            pos += 2
+        base = _uint(data, pos + 2, base_size)
+        extents = _uint(data, pos + 2 + base_size, 2)
+        pos += 4 + base_size
+        first = None
+        for _ in range(extents):
+            if version in (1, 2):
+                pos += index_size
+            extent = (_uint(data, pos, offset_size), _uint(data, pos + offset_size, length_size))
+            pos += offset_size + length_size
+            first = first or extent
+        if item != exif_id:
+            continue
+        if method != 0 or first is None:
+            # Guardado dentro da caixa meta (idat) ou por referência: não tratado
+            return None
+        f.seek(base + first[0])
+        block = f.read(min(first[1], HEADER_READ_LIMIT))
+        # O item começa com a posição do cabeçalho TIFF depois destes 4 bytes
+        return _tiff_date(block[4 + _uint(block, 0, 4):])
+    return None
+
+def read_capture_time(path, sources=("exif", "container")):
+    """
+    Retorna quando uma foto ou vídeo foi feito, como timestamp, ou None.
+
+    sources são tentadas em ordem: "exif" lê a data EXIF de arquivos JPEG e
+    HEIC, "container" a data de criação no cabeçalho do filme de arquivos
+    MP4/MOV, e "mtime" encerra a busca (quem chamou usa então a
+    data de modificação). Só bytes de cabeçalho são lidos, nunca o arquivo inteiro.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(12)
+            if head[:2] == b"\xff\xd8":
+                readers = {"exif": lambda: _jpeg_exif_date(f)}
+            elif head[4:8] in ISO_BOX_TYPES:
+                size = os.fstat(f.fileno()).st_size
+                readers = {
+                    "exif": lambda: _heif_exif_date(f, size),
+                    "container": lambda: _container_date(f, size)
+                }
+            else:
+                return None
+            for source in sources:
+                if source == "mtime":
+                    return None
+                if source in readers:
+                    taken = readers[source]()
+                    if taken is not None:
+                        return taken
+    except (OSError, ValueError, IndexError, struct.error):
+        pass
+    return None
+
+class HeaderCache:
+    """
+    Banco SQLite no destino para algo lido dos cabeçalhos dos arquivos,
+    com chave (path, size, mtime) e uma chave que diz como foi lido, para que
+    novas execuções não abram os arquivos de novo. Arquivos em que nada foi achado
+    também são lembrados. Com persist=False (simulações) um banco existente é
+    lido, mas nada é gravado.
+    """
+
+    FILENAME = None
+    BATCH_SIZE = 1000
+
+    def __init__(self, dest_dir: Path, key: str, persist: bool = True):
+        self.db_path = dest_dir / self.FILENAME
+        self.key = key
+        self.persist = persist
+        self._conn = None
+        self._pending = []
+        if self.db_path.exists():
+            self._connect()
+
+    def _connect(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path))
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS headers (path TEXT PRIMARY KEY, "
+                "size INTEGER, mtime REAL, key TEXT, value)"
+            )
+        return self._conn
+
+    def cached(self, entry: FileEntry):
+        """Retorna (valor ou None,) se o arquivo está no banco sem mudanças, senão None."""
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT size, mtime, key, value FROM headers WHERE path = ?", (entry.path,)
+        ).fetchone()
+        if row is None or tuple(row[:3]) != (entry.size, entry.mtime, self.key):
+            return None
+        return row[3:]
+
+    def store(self, entry: FileEntry, value):
+        """Lembra o que foi lido de um arquivo (None se nada); gravações são em lote."""
+        if not self.persist:
+            return
+        self._pending.append((entry.path, entry.size, entry.mtime, self.key, value))
+        if len(self._pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?)", self._pending)
+            self._pending = []
+
+    def close(self):
+        """Grava o que ainda está pendente e fecha o banco de dados."""
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class CaptureDateCache(HeaderCache):
+    """
+    Datas de captura de Imagens e Videos, lidas com read_capture_time(); a
+    chave é a lista de fontes de data.
+    """
+
+    FILENAME = ".maestro_dates.sqlite"
+
+    def __init__(self, dest_dir: Path, sources, persist: bool = True):
+        self.sources = tuple(sources)
+        super().__init__(dest_dir, ",".join(self.sources), persist)
+
+    def capture_time(self, entry: FileEntry) -> float:
+        """Retorna a data de captura do arquivo, ou seu mtime se os cabeçalhos não tiverem."""
+        row = self.cached(entry)
+        if row is None:
+            row = (read_capture_time(entry.path, self.sources),)
+            self.store(entry, row[0])
+        return row[0] if row[0] is not None else entry.mtime
+
+# ----------------------------
+# DETECÇÃO PELO CONTEÚDO
+# ----------------------------
+
+# Bytes lidos do início de um arquivo para descobrir seu tipo
+SNIFF_BYTES = 512
+
+# Threads lendo o início dos arquivos com sniff ativado
+SNIFF_WORKERS = 8
+
+# (posição, número mágico, extensão); vale a primeira que bater
+MAGIC_NUMBERS = [
+    (0, b"\xff\xd8\xff", ".jpg"),
+    (0, b"\x89PNG\r\n\x1a\n", ".png"),
+    (0, b"GIF87a", ".gif"),
+    (0, b"GIF89a", ".gif"),
+    (0, b"II*\0", ".tif"),
+    (0, b"MM\0*", ".tif"),
+    (0, b"8BPS", ".psd"),
+    (0, b"%PDF-", ".pdf"),
+    (0, b"{\\rtf", ".rtf"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", ".doc"),
+    (0, b"PK\x03\x04", ".zip"),
+    (0, b"Rar!\x1a\x07", ".rar"),
+    (0, b"7z\xbc\xaf\x27\x1c", ".7z"),
+    (0, b"\x1f\x8b", ".gz"),
+    (0, b"BZh", ".bz2"),
+    (0, b"\xfd7zXZ\0", ".xz"),
+    (0, b"MSCF", ".cab"),
+    (257, b"ustar", ".tar"),
+    (0, b"ID3", ".mp3"),
+    (0, b"fLaC", ".flac"),
+    (0, b"OggS", ".ogg"),
+    (0, b"\x1a\x45\xdf\xa3", ".mkv"),
+    (0, b"FLV\x01", ".flv"),
+    (0, b"MZ", ".exe"),
+    (0, b"#!", ".sh"),
+    (0, b"wOFF", ".woff"),
+    (0, b"wOF2", ".woff2"),
+    (0, b"OTTO", ".otf"),
+    (0, b"\0\x01\0\0\0", ".ttf"),
+]
+
+# Arquivos RIFF dizem seu formato nos bytes 8-11, arquivos de mídia ISO sua marca
+RIFF_FORMATS = {b"WAVE": ".wav", b"AVI ": ".avi", b"WEBP": ".webp"}
+ISO_BRANDS = {
+    b"heic": ".heic", b"heix": ".heic", b"mif1": ".heic", b"msf1": ".heic",
+    b"qt  ": ".mov", b"M4A ": ".m4a", b"3gp4": ".3gp", b"3gp5": ".3gp"
+}
+
+# Incremente quando as tabelas acima mudarem, para que resultados em cache sejam refeitos
+MAGIC_VERSION = "1"
+
+def sniff_type(path) -> str:
+    """
+    Retorna a extensão que corresponde ao início do conteúdo do arquivo (".jpg",
+    ".pdf", ...), ou None. No máximo SNIFF_BYTES são lidos. Conteúdo que é
+    UTF-8 válido sem caracteres de controle é tomado como ".txt".
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+    except OSError:
+        return None
+    if head[:4] == b"RIFF":
+        return RIFF_FORMATS.get(head[8:12])
+    if head[4:8] == b"ftyp":
+        return ISO_BRANDS.get(head[8:12], ".mp4")
+    for offset, magic, ext in MAGIC_NUMBERS:
+        if head.startswith(magic, offset):
+            return ext
+    if not head or any(byte < 32 and byte not in b"\t\n\r\f" for byte in head):
+        return None
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Só é aceito um caractere cortado ao meio pelo limite de leitura
+        if e.start < len(head) - 3:
+            return None
+    return ".txt"
+
+class FileTypeCache(HeaderCache):
+    """Tipos achados por sniff_type(), como extensões; a chave é MAGIC_VERSION."""
+
+    FILENAME = ".maestro_types.sqlite"
+
+    def __init__(self, dest_dir: Path, persist: bool = True):
+        super().__init__(dest_dir, MAGIC_VERSION, persist)
+
+def needs_sniffing(entry: FileEntry) -> bool:
+    """True para arquivos cuja extensão não indica um tipo conhecido."""
+    return entry.ext not in EXTENSION_MAP
+
+def apply_sniffed_type(entry: FileEntry, ext: str):
+    """Classifica a entrada pela extensão detectada em vez da sua própria."""
+    entry.ext = ext
+    entry.classify()
+
+def _sniff_batch(batch, cache: FileTypeCache, pool: ThreadPoolExecutor):
+    unknown = []
+    for entry in batch:
+        if not needs_sniffing(entry):
+            continue
+        row = cache.cached(entry)
+        if row is None:
+            unknown.append(entry)
+        elif row[0] is not None:
+            apply_sniffed_type(entry, row[0])
+    for entry, ext in zip(unknown, pool.map(sniff_type, [entry.path for entry in unknown])):
+        cache.store(entry, ext)
+        if ext is not None:
+            apply_sniffed_type(entry, ext)
+
+def sniff_entries(entries, cache: FileTypeCache, workers: int = SNIFF_WORKERS,
+                  batch_size: int = 256, profiler: "Profiler" = None):
+    """
+    Gera os FileEntry de entries na mesma ordem, os de extensão
+    desconhecida reclassificados pelo conteúdo. As entradas são tomadas em
+    lotes cujos arquivos desconhecidos são examinados juntos num pool de threads;
+    os resultados vão para cache, então cada arquivo é lido uma vez entre execuções.
+    """
+    profiler = profiler or Profiler(enabled=False)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                with profiler.stage("sniff"):
+                    _sniff_batch(batch, cache, pool)
+                yield from batch
+                batch = []
+        with profiler.stage("sniff"):
+            _sniff_batch(batch, cache, pool)
+        yield from batch
+
+# ----------------------------
+# ÍNDICE INCREMENTAL
+# ----------------------------
+
+class IncrementalIndex:
+    """
+    Índice SQLite mantido no destino que lembra o que já foi organizado,
+    então novas execuções (cópias noturnas em especial) só processam arquivos
+    novos ou alterados.
+
+    Um arquivo está inalterado quando caminho, tamanho, mtime e inode batem com
+    a última execução. Uma pasta é pulada sem ser listada quando seu mtime
+    bate com a última execução em que todos os seus arquivos foram organizados;
+    note que reescrever um arquivo no lugar não muda o mtime da pasta.
+    """
+
+    FILENAME = ".maestro_index.sqlite"
+    BATCH_SIZE = 1000
+
+    def __init__(self, dest_dir: Path):
+        self.db_path = dest_dir / self.FILENAME
+        self._conn = None
+        self._pending_files = []
+        self._pending_dirs = {}
+        self._failed_dirs = set()
+        if self.db_path.exists():
+            self._connect()
+
+    def _connect(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path))
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, "
+                "size INTEGER, mtime REAL, inode INTEGER, destination TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, "
+                "mtime REAL, subdirs TEXT)"
+            )
+        return self._conn
+
+    def unchanged_subdirs(self, path: str, mtime: float):
+        """Retorna os nomes de subpastas guardados se a pasta não mudou, senão None."""
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT mtime, subdirs FROM dirs WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None or row[0] != mtime:
+            return None
+        return json.loads(row[1])
+
+    def remember_dir(self, path: str, mtime: float, subdirs):
+        """Anota uma pasta listada; ela é salva no close() a menos que um arquivo dela falhe."""
+        self._pending_dirs[path] = (mtime, [os.path.basename(d) for d in subdirs])
+
+    def is_unchanged(self, entry: "FileEntry") -> bool:
+        """True se o arquivo já foi organizado antes e não mudou desde então."""
+        if self._conn is None:
+            return False
+        row = self._conn.execute(
+            "SELECT size, mtime, inode FROM files WHERE path = ?", (entry.path,)
+        ).fetchone()
+        return row is not None and tuple(row) == (entry.size, entry.mtime, entry.ino)
+
+    def organized(self):
+        """Gera (tamanho, destino) de cada arquivo organizado por execuções anteriores."""
+        if self._conn is not None:
+            yield from self._conn.execute("SELECT size, destination FROM files")
+
+    def record(self, entry: "FileEntry", destination):
+        """Guarda um arquivo organizado; as gravações são feitas em lotes."""
+        self._pending_files.append(
+            (entry.path, entry.size, entry.mtime, entry.ino, str(destination))
+        )
+        if len(self._pending_files) >= self.BATCH_SIZE:
+            self.flush()
+
+    def mark_failed(self, entry: "FileEntry"):
+        """Impede que a pasta do arquivo seja marcada como totalmente organizada."""
+        self._failed_dirs.add(os.path.dirname(entry.path))
+
+    def forget(self, paths):
+        """Remove arquivos, e as pastas que os contêm, para que sejam organizados de novo."""
+        if self._conn is None or not paths:
+            return
+        with self._conn as conn:
+            conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in paths])
+            conn.executemany(
+                "DELETE FROM dirs WHERE path = ?",
+                [(d,) for d in {os.path.dirname(p) for p in paths}]
+            )
+
+    def flush(self):
+        if self._pending_files:
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                    self._pending_files
+                )
+            self._pending_files = []
+
+    def close(self, save: bool = True):
+        """Grava o que ainda está pendente (a menos que save seja False) e fecha o banco."""
+        if save:
+            self.flush()
+            dirs = [
+                (path, mtime, json.dumps(subdirs))
+                for path, (mtime, subdirs) in self._pending_dirs.items()
+                if path not in self._failed_dirs
+            ]
+            if dirs:
+                with self._connect() as conn:
+                    conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", dirs)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+def print_summary(summary: dict, total: int):
+    """Mostra a quantidade de arquivos encontrados por categoria."""
+    print("\nResumo de arquivos encontrados por categoria:")
+    for cat, count in summary.items():
+        print(f"- {cat}: {count}")
+    print(f"Total: {total} arquivos\n")
+
+def confirm(assume_yes: bool = False) -> bool:
+    """Pede ao usuário para seguir em frente; com assume_yes (--yes) não pergunta."""
+    if assume_yes:
+        return True
+    if input("Deseja continuar? (s/n): ").lower() == "s":
+        return True
+    print("Operação cancelada pelo usuário.")
+    return False
+
+# ----------------------------
+# PERFILAMENTO
+# ----------------------------
+
+# Etapas cronometradas por um Profiler. report cobre as escritas no relatório,
+# no diário e no índice; transfer é o tempo gasto movendo/copiando/ligando arquivos.
+PROFILE_STAGES = (
+    "count", "prompt", "walk", "stat", "sniff", "classify", "dates", "dedupe", "mkdir",
+    "collision", "transfer", "report"
+)
+
+class Profiler:
+    """
+    Registra onde uma execução gasta seu tempo: segundos por etapa (PROFILE_STAGES)
+    e, por categoria, os arquivos, bytes e segundos de transferência por trás da
+    sua vazão. Usado como gerenciador de contexto em volta de uma execução, também mede
+    o tempo total e pode gravar um dump do cProfile em cpu_file e registrar
+    o pico e os maiores pontos de alocação do tracemalloc (memory=True).
+
+    As etapas são registradas pela thread do organizador. Os tempos de transferência
+    são somados sobre todas as transferências, então com workers > 1 a etapa transfer
+    pode passar do tempo total. Um Profiler desativado não registra nada; os
+    organizadores usam um quando nenhum é passado.
+    """
+
+    def __init__(self, enabled: bool = True, cpu_file: Path = None, memory: bool = False):
+        self.enabled = enabled
+        self.cpu_file = cpu_file
+        self.memory = memory
+        self.stages = dict.fromkeys(PROFILE_STAGES, 0.0)
+        self.categories = {}
+        self.seconds = None
+        self._started = None
+        self._cpu = None
+        self._allocations = None
+
+    def __enter__(self):
+        if self.cpu_file:
+            self._cpu = cProfile.Profile()
+            self._cpu.enable()
+        if self.memory:
+            tracemalloc.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._started
+        if self._cpu is not None:
+            self._cpu.disable()
+            self._cpu.dump_stats(self.cpu_file)
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            tracemalloc.stop()
+            self._allocations = {
+                "peak_bytes": peak,
+                "top": [
+                    {"where": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                    for stat in top
+                ]
+            }
+        return False
+
+    def stage(self, name: str):
+        """Gerenciador de contexto que soma a uma etapa o tempo gasto em seu bloco."""
+        if not self.enabled:
+            return nullcontext()
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - started
+
+    def add(self, name: str, seconds: float):
+        """Soma a uma etapa segundos medidos em outro lugar."""
+        if self.enabled and seconds:
+            self.stages[name] += seconds
+
+    def count(self, category: str, size: int, seconds: float = None):
+        """Registra um arquivo organizado e o tempo que sua transferência levou."""
+        if not self.enabled:
+            return
+        stats = self.categories.setdefault(category, [0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += size
+        if seconds:
+            stats[2] += seconds
+            self.stages["transfer"] += seconds
+
+    def summary(self) -> dict:
+        """Retorna os tempos registrados como um dict serializável em JSON."""
+        categories = {}
+        for category, (files, size, seconds) in sorted(self.categories.items()):
+            categories[category] = {
+                "files": files,
+                "bytes": size,
+                "transfer_seconds": round(seconds, 6),
+                "files_per_s": round(files / seconds, 1) if seconds else None,
+                "mb_per_s": round(size / seconds / 1e6, 2) if seconds else None
+            }
+        files = sum(stats["files"] for stats in categories.values())
+        result = {
+            "seconds": round(self.seconds, 6) if self.seconds is not None else None,
+            "files": files,
+            "bytes": sum(stats["bytes"] for stats in categories.values()),
+            "files_per_s": round(files / self.seconds, 1) if self.seconds else None,
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "categories": categories
+        }
+        if self.cpu_file:
+            result["cpu_profile"] = str(self.cpu_file)
+        if self._allocations is not None:
+            result["memory"] = self._allocations
+        return result
+
+    def write(self, path: Path):
+        """Grava summary() em path como JSON."""
+        Path(path).write_text(json.dumps(self.summary(), indent=2), encoding="utf-8")
+
+def print_profile(profile: dict):
+    """Imprime os tempos por etapa e a vazão por categoria de um resumo do Profiler."""
+    print(f"\nPerfil: {profile['seconds']:.2f} segundos, {profile['files_per_s']} arquivos/s")
+    for name, seconds in profile["stages"].items():
+        if seconds:
+            print(f"- {name}: {seconds:.3f} s")
+    for category, stats in profile["categories"].items():
+        throughput = f", {stats['mb_per_s']} MB/s" if stats["mb_per_s"] is not None else ""
+        print(f"- {category}: {stats['files']} arquivos{throughput}")
+    if "memory" in profile:
+        print(f"Pico de memória rastreada: {profile['memory']['peak_bytes'] / 1e6:.1f} MB")
+
+# ----------------------------
+# RELATÓRIO
+# ----------------------------
+
+REPORT_FORMATS = ("csv", "jsonl")
+
+class ReportWriter:
+    """
+    Escreve o relatório uma linha por vez através de um buffer grande, para que a memória
+    não cresça com o número de arquivos e uma falha perca no máximo o
+    último buffer. report_format é "csv" ou "jsonl" (JSON Lines); por padrão ele
+    vem do nome do arquivo, e um nome terminado em ".gz" é compactado.
+    """
+
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, path: Path, fieldnames, report_format: str = None):
+        suffixes = [suffix.lower() for suffix in Path(path).suffixes]
+        if report_format is None:
+            report_format = "jsonl" if ".jsonl" in suffixes else "csv"
+        self.path = path
+        self.fieldnames = fieldnames
+        if suffixes[-1:] == [".gz"]:
+            self._file = gzip.open(path, "wt", newline="", encoding="utf-8")
+        else:
+            self._file = open(
+                path, "w", newline="", encoding="utf-8", buffering=self.BUFFER_SIZE
+            )
+        self._csv = None
+        if report_format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=fieldnames)
+            self._csv.writeheader()
+
+    def write(self, row: dict):
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps({key: row.get(key) for key in self.fieldnames}) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def open_report(report_file: Path, report_format: str = None, dedupe: bool = False,
+                pack: bool = False):
+    """
+    Abre o ReportWriter da execução; retorna None se report_file for None ou
+    não puder ser criado. dedupe acrescenta a coluna duplicado_de, pack a
+    coluna membro (o nome de um arquivo empacotado dentro do seu pacote).
+    """
+    if not report_file:
+        return None
+    fieldnames = [
+        "origem", "destino", "acao", "tamanho", "categoria",
+        "segundos", "mb_por_s", "erro"
+    ]
+    if dedupe:
+        fieldnames.append("duplicado_de")
+    if pack:
+        fieldnames.append("membro")
+    try:
+        return ReportWriter(report_file, fieldnames, report_format)
+    except Exception as e:
+        print(f"[ERRO] Não foi possível gerar relatório: {e}")
+        return None
+
+def read_report(path: Path):
+    """
+    Devolve as linhas de um relatório gravado pelo ReportWriter como dicts. CSV e
+    JSON Lines são diferenciados pelo primeiro caractere; nomes ".gz" são
+    descompactados.
+    """
+    opener = gzip.open if Path(path).suffix.lower() == ".gz" else open
+    with opener(path, "rt", newline="", encoding="utf-8") as f:
+        first = f.read(1)
+        f.seek(0)
+        if first == "{":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+def merge_reports(report_files, report_file: Path, report_format: str = None):
+    """
+    Junta os relatórios de várias execuções, como as fatias de uma, em
+    report_file, um depois do outro. As colunas duplicado_de e membro são
+    mantidas se algum deles as tiver. Retorna o número de linhas gravadas,
+    ou None se report_file não puder ser criado.
+    """
+    dedupe = pack = False
+    for path in report_files:
+        rows = read_report(path)
+        first = next(rows, {})
+        dedupe = dedupe or "duplicado_de" in first
+        pack = pack or "membro" in first
+        rows.close()
+    report = open_report(report_file, report_format, dedupe, pack)
+    if report is None:
+        return None
+    written = 0
+    try:
+        for path in report_files:
+            for row in read_report(path):
+                report.write(row)
+                written += 1
+    finally:
+        report.close()
+    return written
+
+class RunRecorder:
+    """
+    Escreve o resultado de cada arquivo no relatório, no diário e no
+    índice incremental, os que estiverem em uso, e o contabiliza no
+    Profiler. Compartilhado pelos motores do organizador para que a saída seja a mesma.
+    """
+
+    def __init__(self, names: NameIndex, report: ReportWriter = None,
+                 journal: "Journal" = None, index: "IncrementalIndex" = None,
+                 profiler: Profiler = None):
+        self.names = names
+        self.report = report
+        self.journal = journal
+        self.index = index
+        self.profiler = profiler or Profiler(enabled=False)
+
+    def _write_row(self, entry, destination, action, original=None, seconds=None,
+                   error=None, member=None):
+        if self.report is None:
+            return
+        row = {
+            "origem": entry.path,
+            "destino": str(destination),
+            "acao": action,
+            "tamanho": entry.size,
+            "categoria": entry.category
+        }
+        if original is not None:
+            row["duplicado_de"] = str(original.target)
+        if member is not None:
+            row["membro"] = member
+        if seconds is not None:
+            row["segundos"] = round(seconds, 6)
+            if seconds > 0 and error is None:
+                row["mb_por_s"] = round(entry.size / seconds / 1e6, 2)
+        if error is not None:
+            row["erro"] = error
+        self.report.write(row)
+
+    def done(self, entry, destination, action: str, original=None, seconds=None,
+             member=None):
+        """
+        Registra um arquivo organizado (ou que seria, em uma simulação); o
+        destino de um arquivo empacotado é o seu pacote, member o nome nele.
+        """
+        self.profiler.count(entry.category, entry.size, seconds)
+        with self.profiler.stage("report"):
+            if self.index is not None:
+                self.index.record(entry, destination)
+            if self.journal is not None:
+                self.journal.done(entry.path, destination, action, member)
+            self._write_row(entry, destination, action, original, seconds, member=member)
+
+    def failed(self, entry, target: Path, action: str, seconds=None, error=None,
+               original=None, member=None):
+        """
+        Registra uma transferência que falhou e libera o nome de destino. Para
+        um arquivo empacotado, target é o pacote, que mantém o seu nome.
+        """
+        if member is None:
+            self.names.release(target)
+        self.profiler.add("transfer", seconds)
+        with self.profiler.stage("report"):
+            if self.index is not None:
+                self.index.mark_failed(entry)
+            if self.journal is not None:
+                self.journal.abort(entry.path, target)
+            self._write_row(entry, target, action, original, seconds, error, member)
+
+    def finish(self, entry, target: Path, action: str, original, result):
+        """Registra uma transferência a partir do que timed_transfer() retornou para ela."""
+        destination, seconds, error = result
+        if destination is None:
+            self.failed(entry, target, action, seconds, error, original)
+        else:
+            self.done(entry, destination, action, original, seconds)
+
+# ----------------------------
+# DIÁRIO
+# ----------------------------
+
+class Journal:
+    """
+    Diário (write-ahead log) de uma execução, mantido no destino em JSON Lines.
+
+    Cada transferência é escrita como "begin" antes de começar e como "done" ou
+    "abort" quando termina; as linhas de um arquivo empacotado também dão
+    o membro no pacote que é o seu destino. Cada linha é enviada ao SO na
+    hora, então um processo encerrado não perde nada; o fsync roda a cada
+    SYNC_EVERY linhas, então uma queda de energia custa no máximo essas linhas.
+    Uma execução concluída termina com "end"; um diário sem ele pode ser retomado,
+    e undo_journal() desfaz a execução que ele registra.
+    """
+
+    PREFIX = ".maestro_journal_"
+    SYNC_EVERY = 100
+
+    def __init__(self, path: Path, header: dict = None):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._unsynced = 0
+        if header is not None:
+            self._write(dict(header, op="start"))
+
+    @classmethod
+    def create(cls, source_dir: Path, dest_dir: Path, move: bool, shard=None):
+        """Começa um novo diário para esta execução (ou esta fatia dela) no destino."""
+        name = f"{cls.PREFIX}{datetime.now():%Y%m%d_%H%M%S_%f}"
+        if shard is not None:
+            name += "_shard" + str(shard).replace("/", "of")
+        header = {
+            "source": str(source_dir),
+            "destination": str(dest_dir),
+            "move": move,
+            "started": datetime.now().isoformat(timespec="seconds")
+        }
+        if shard is not None:
+            header["shard"] = str(shard)
+        return cls(dest_dir / f"{name}.jsonl", header)
+
+    @classmethod
+    def find_interrupted(cls, dest_dir: Path, shard=None):
+        """
+        Retorna o diário mais recente em dest_dir cuja execução não terminou, ou
+        None. Só contam diários da mesma fatia (ou de execuções sem fatia, para
+        None), então cada fatia é retomada por conta própria.
+        """
+        shard = None if shard is None else str(shard)
+        for path in sorted(dest_dir.glob(cls.PREFIX + "*.jsonl"), reverse=True):
+            header, _, _, status = read_journal(path)
+            if status == "interrupted" and header.get("shard") == shard:
+                return path
+        return None
+
+    def _write(self, record: dict):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.SYNC_EVERY:
+            self.sync()
+
+    def begin(self, source, target, action: str, member: str = None):
+        record = {"op": "begin", "source": str(source), "target": str(target), "action": action}
+        if member is not None:
+            record["member"] = member
+        self._write(record)
+
+    def done(self, source, target, action: str, member: str = None):
+        record = {"op": "done", "source": str(source), "target": str(target), "action": action}
+        if member is not None:
+            record["member"] = member
+        self._write(record)
+
+    def abort(self, source, target):
+        self._write({"op": "abort", "source": str(source), "target": str(target)})
+
+    def sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self, op: str = None):
+        """Opcionalmente escreve uma linha final "end"/"undo", depois sincroniza e fecha."""
+        if op is not None:
+            self._write({"op": op})
+        self.sync()
+        self._file.close()
+
+def read_journal(path: Path):
+    """
+    Lê um diário. Retorna (header, done, pending, status): done e
+    pending mapeiam cada origem para sua última linha "done"/"begin", e status
+    é "completed", "undone" ou "interrupted". Uma linha cortada por uma falha
+    é ignorada.
+    """
+    header, done, pending, status = {}, {}, {}, "interrupted"
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            op = record.get("op")
+            if op == "start":
+                header = record
+            elif op == "begin":
+                pending[record["source"]] = record
+            elif op == "done":
+                pending.pop(record["source"], None)
+                done[record["source"]] = record
+            elif op == "abort":
+                pending.pop(record["source"], None)
+            elif op == "end":
+                status = "completed"
+            elif op == "undo":
+                status = "undone"
+    return header, done, pending, status
+
+def settle_pending(pending: dict, done: dict, journal: Journal = None,
+                   move: bool = False) -> dict:
+    """
+    Resolve transferências que começaram mas nunca terminaram. Se a origem
+    ainda existe, o destino pode estar incompleto: ele é apagado para que o arquivo
+    seja organizado de novo. Caso contrário a transferência foi concluída. O
+    resultado é escrito em journal, se informado. Retorna as concluídas.
+
+    Arquivos empacotados dividem o pacote, então são resolvidos pacote a
+    pacote: seus membros só são registrados como concluídos quando ele fica
+    completo, então um pacote com um membro em done é mantido, seus membros
+    pendentes também são concluídos e, num move, as origens que sobraram são
+    apagadas. Um pacote sem membro em done é parcial e é apagado.
+    """
+    finished = {}
+    archives = {}
+    for source, record in pending.items():
+        target = record["target"]
+        if "member" in record:
+            archives.setdefault(target, []).append((source, record))
+            continue
+        if os.path.lexists(source):
+            if os.path.lexists(target):
+                try:
+                    os.remove(target)
+                except OSError as e:
+                    print(f"[ERRO] Não foi possível remover {target}: {e}")
+                    continue
+            if journal is not None:
+                journal.abort(source, target)
+        elif os.path.lexists(target):
+            finished[source] = record
+            if journal is not None:
+                journal.done(source, target, record["action"])
+    # Pacote -> origens dos seus membros registrados como concluídos
+    packed = {}
+    if archives:
+        for source, record in done.items():
+            if "member" in record:
+                packed.setdefault(record["target"], []).append(source)
+    for target, records in archives.items():
+        if target not in packed:
+            if os.path.lexists(target):
+                try:
+                    os.remove(target)
+                except OSError as e:
+                    print(f"[ERRO] Não foi possível remover {target}: {e}")
+                    continue
+            if journal is not None:
+                for source, _ in records:
+                    journal.abort(source, target)
+            continue
+        for source, record in records:
+            finished[source] = record
+            if journal is not None:
+                journal.done(source, target, record["action"], record["member"])
+        if not move:
+            continue
+        if journal is not None:
+            journal.sync()
+        # A execução parou enquanto terminava o pacote (veja Packer._finish())
+        for source in packed[target] + [source for source, _ in records]:
+            if os.path.lexists(source):
+                try:
+                    os.remove(source)
+                except OSError as e:
+                    print(f"[ERRO] {source} foi empacotado, mas não pôde ser removido: {e}")
+    return finished
+
+def open_journal(source_dir: Path, dest_dir: Path, move: bool, resume: bool = False,
+                 shard=None):
+    """
+    Retorna (journal, completed) para uma execução: com resume, o diário
+    diário interrompido (da mesma fatia) é reaberto e completed mapeia as
+    origens que ele já tratou; senão, um novo diário é iniciado.
+    """
+    journal_path = Journal.find_interrupted(dest_dir, shard) if resume else None
+    if journal_path is None:
+        if resume:
+            print("Nenhuma execução interrompida encontrada; iniciando uma nova.")
+        return Journal.create(source_dir, dest_dir, move, shard), {}
+    print(f"Retomando a execução registrada em {journal_path}")
+    header, completed, pending, _ = read_journal(journal_path)
+    journal = Journal(journal_path)
+    completed.update(settle_pending(pending, completed, journal, header.get("move", move)))
+    return journal, completed
+
+def undo_journal(journal_path: Path, assume_yes: bool = False):
+    """
+    Desfaz a execução registrada em um diário, da operação mais recente à mais antiga:
+    arquivos movidos voltam à origem, cópias e links são apagados, e
+    pastas do destino que ficarem vazias são removidas. Arquivos empacotados
+    são extraídos de volta à origem (movidos) e cada pacote é apagado quando
+    nada nele resta a restaurar. assume_yes pula a confirmação.
+    """
+    if not journal_path.is_file():
+        print(f"[ERRO] Diário não encontrado: {journal_path}")
+        return
+    header, done, pending, status = read_journal(journal_path)
+    if status == "undone":
+        print("Esta execução já foi desfeita.")
+        return
+    move = header.get("move", True)
+    done.update(settle_pending(pending, done, move=move))
+    records = [record for record in done.values() if record["action"] != "DUPLICADO"]
+    dest_dir = Path(header.get("destination", journal_path.parent))
+
+    print(f"\n{len(records)} operações serão desfeitas.")
+    if not confirm(assume_yes):
+        return
+
+    reverted = []
+    folders = set()
+    archives = {}
+    for record in tqdm(reversed(records), total=len(records), desc="Desfazendo", unit="arquivo"):
+        source, target = record["source"], record["target"]
+        if record["action"] == "EMPACOTAR":
+            # Restaurados pacote a pacote, abaixo, para que cada um seja lido só uma vez
+            archives.setdefault(target, {})[record["member"]] = source
+            continue
+        try:
+            if move:
+                if os.path.lexists(source):
+                    print(f"[ERRO] Não foi possível restaurar {target}: {source} já existe")
+                    continue
+                os.makedirs(os.path.dirname(source), exist_ok=True)
+                shutil.move(target, source)
+            else:
+                os.remove(target)
+        except OSError as e:
+            print(f"[ERRO] Não foi possível desfazer {target}: {e}")
+            continue
+        reverted.append(source)
+        folders.add(Path(target).parent)
+
+    for archive, members in archives.items():
+        restored = unpack_files(Path(archive), members) if move else list(members.values())
+        reverted.extend(restored)
+        if len(restored) < len(members):
+            continue
+        try:
+            os.remove(archive)
+        except OSError as e:
+            print(f"[ERRO] Não foi possível remover {archive}: {e}")
+            continue
+        folders.add(Path(archive).parent)
+
+    # Remove pastas de ano/extensão, e depois de categoria, que ficaram vazias
+    for folder in sorted(folders, key=lambda p: len(p.parts), reverse=True):
+        while folder != dest_dir and dest_dir in folder.parents:
+            try:
+                folder.rmdir()
+            except OSError:
+                break
+            folder = folder.parent
+
+    # O índice incremental não pode pular os arquivos restaurados na próxima vez
+    index = IncrementalIndex(dest_dir)
+    index.forget(reverted)
+    index.close(save=False)
+
+    journal = Journal(journal_path)
+    journal.close(op="undo")
+    print(f"{len(reverted)} de {len(records)} operações desfeitas.")
+
+# ----------------------------
+# EMPACOTAMENTO DE ARQUIVOS PEQUENOS
+# ----------------------------
+
+# Sufixo do nome de um pacote para cada compressão
+PACK_SUFFIXES = {"none": ".tar", "gzip": ".tar.gz", "zstd": ".tar.zst"}
+
+# Os pacotes se chamam packed_<início da execução>_<n><sufixo> na sua pasta de destino
+PACK_PREFIX = "packed_"
+
+class PackArchive:
+    """
+    Um pacote sendo gravado: um fluxo tar, compactado na hora se pedido,
+    com os arquivos acrescentados até agora e o seu tamanho total. Em uma
+    simulação (write=False) nada é gravado; só o tamanho é contado.
+    broken é marcado quando um arquivo falha no meio do acréscimo, o que
+    deixa um membro parcial que o fluxo não tem como desfazer.
+    """
+
+    def __init__(self, path: Path, compression: str = "none", write: bool = True):
+        self.path = path
+        self.files = []
+        self.size = 0
+        self.broken = False
+        self.tar = None
+        if not write:
+            return
+        self._file = open(path, "wb")
+        self._compressor = None
+        if compression == "zstd":
+            self._compressor = zstandard.ZstdCompressor().stream_writer(self._file, closefd=False)
+            self.tar = tarfile.open(fileobj=self._compressor, mode="w|")
+        else:
+            self.tar = tarfile.open(fileobj=self._file, mode="w|gz" if compression == "gzip" else "w|")
+
+    def add(self, path: str, member: str):
+        """
+        Acrescenta um arquivo (ou link simbólico) como member, copiando-o em
+        blocos. O membro leva o tamanho do arquivo aberto; se o arquivo
+        diminuir ou crescer durante a cópia o pacote fica quebrado.
+        """
+        st = os.lstat(path)
+        info = tarfile.TarInfo(member)
+        info.mode = st.st_mode & 0o7777
+        # Um cabeçalho tar simples só guarda segundos inteiros: o mtime exato vai
+        # num cabeçalho pax, para que um undo devolva ao arquivo o que ele tinha
+        info.mtime = int(st.st_mtime)
+        info.pax_headers = {"mtime": str(Decimal(st.st_mtime_ns).scaleb(-9))}
+        if stat.S_ISLNK(st.st_mode):
+            info.type = tarfile.SYMTYPE
+            info.linkname = os.readlink(path)
+            self.tar.addfile(info)
+            return
+        with open(path, "rb") as f:
+            info.size = os.fstat(f.fileno()).st_size
+            try:
+                # Levanta OSError se o arquivo acabar antes de info.size bytes
+                self.tar.addfile(info, f)
+                if f.read(1):
+                    raise OSError(f"{path} cresceu enquanto era empacotado")
+            except OSError:
+                self.broken = True
+                raise
+        self.size += info.size
+
+    def close(self):
+        """Termina o pacote e o sincroniza com o disco."""
+        if self.tar is None:
+            return
+        self.tar.close()
+        if self._compressor is not None:
+            self._compressor.close()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def discard(self):
+        """Fecha e apaga um pacote que não será completado."""
+        if self.tar is None:
+            return
+        try:
+            self.tar.close()
+            if self._compressor is not None:
+                self._compressor.close()
+        except (OSError, ValueError):
+            pass
+        try:
+            self._file.close()
+            os.remove(self.path)
+        except OSError:
+            pass
+
+@contextmanager
+def read_pack(path: Path):
+    """Abre um pacote para uma passada pelos seus membros, qualquer que seja a compressão."""
+    with open(path, "rb") as f:
+        if path.name.endswith(".zst"):
+            if zstandard is None:
+                raise ValueError(f"o módulo zstandard é necessário para ler {path}")
+            f = zstandard.ZstdDecompressor().stream_reader(f)
+        with tarfile.open(fileobj=f, mode="r|*") as tar:
+            yield tar
+
+def unpack_files(archive: Path, members: dict) -> list:
+    """
+    Grava membros de um pacote de volta no disco, dados como nome do membro ->
+    caminho, mantendo modo e mtime; arquivos existentes não são sobrescritos.
+    Retorna os caminhos gravados.
+    """
+    written = []
+    try:
+        with read_pack(archive) as tar:
+            for info in tar:
+                path = members.get(info.name)
+                if path is None:
+                    continue
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if info.issym():
+                        os.symlink(info.linkname, path)
+                    else:
+                        with tar.extractfile(info) as src, open(path, "xb") as dst:
+                            shutil.copyfileobj(src, dst)
+                        os.chmod(path, info.mode)
+                        # Exato quando o membro tem um mtime pax (veja PackArchive.add())
+                        mtime = info.pax_headers.get("mtime", info.mtime)
+                        mtime_ns = int(Decimal(mtime).scaleb(9))
+                        os.utime(path, ns=(mtime_ns, mtime_ns))
+                except OSError as e:
+                    print(f"[ERRO] Não foi possível restaurar {path} de {archive}: {e}")
+                    continue
+                written.append(path)
+    except (OSError, ValueError, tarfile.TarError) as e:
+        print(f"[ERRO] Não foi possível ler {archive}: {e}")
+    return written
+
+class Packer:
+    """
+    Junta os arquivos que recebe (os que um Planner marca "EMPACOTAR", por
+    estarem abaixo do limite de tamanho) em um pacote tar por pasta de destino
+    em vez de transferi-los um a um, para que uma árvore de muitos arquivos
+    minúsculos chegue como alguns grandes. Os arquivos entram no pacote aberto
+    da pasta (veja PackArchive) conforme chegam; um pacote é fechado com
+    MAX_MEMBERS arquivos ou MAX_BYTES bytes e o próximo abre outro.
+
+    Os arquivos são registrados como feitos, com o pacote e o nome do membro,
+    só quando o pacote está completo e sincronizado, e só então os arquivos
+    movidos são apagados da origem. Se a execução parar antes, os pacotes
+    abertos são apagados e os seus arquivos ficam onde estavam; se ela
+    parar no meio do caminho, uma execução retomada ou um undo termina o pacote (veja
+    settle_pending()).
+
+    Os nomes dos membros são escolhidos como os de destino (veja NameIndex),
+    então arquivos com o mesmo nome ganham o sufixo "_1" de sempre no pacote.
+    Empacotar não se combina com dedupe ou link.
+    """
+
+    MAX_MEMBERS = 10000
+    MAX_BYTES = 1024 ** 3
+
+    def __init__(self, names: NameIndex, recorder: RunRecorder, compression: str = "none",
+                 move: bool = True, dry_run: bool = False):
+        self.names = names
+        self.recorder = recorder
+        self.compression = compression
+        self.move = move
+        self.dry_run = dry_run
+        self.members = NameIndex()
+        self._stamp = f"{datetime.now():%Y%m%d_%H%M%S}"
+        self._archives = {}
+        self._counts = {}
+
+    def _open(self, folder: Path) -> PackArchive:
+        count = self._counts.get(folder, 0) + 1
+        self._counts[folder] = count
+        name = f"{PACK_PREFIX}{self._stamp}_{count}{PACK_SUFFIXES[self.compression]}"
+        if self.dry_run:
+            archive = PackArchive(folder / name, write=False)
+        else:
+            archive = PackArchive(self.names.reserve(folder, name), self.compression)
+        self.members.add_folder(archive.path, ())
+        self._archives[folder] = archive
+        return archive
+
+    def add(self, entry: FileEntry, folder: Path):
+        """Empacota um arquivo no pacote aberto da sua pasta de destino."""
+        profiler = self.recorder.profiler
+        archive = self._archives.get(folder) or self._open(folder)
+        member = self.members.reserve(archive.path, entry.name).name
+        if self.dry_run:
+            archive.size += entry.size
+            archive.files.append(entry)
+            self.recorder.done(entry, archive.path, "EMPACOTAR", member=member)
+        else:
+            if self.recorder.journal is not None:
+                with profiler.stage("report"):
+                    self.recorder.journal.begin(entry.path, archive.path, "EMPACOTAR", member)
+            started = time.perf_counter()
+            try:
+                archive.add(entry.path, member)
+            except OSError as e:
+                print(f"[ERRO] Não foi possível empacotar {entry.path}: {e}")
+                self.recorder.failed(entry, archive.path, "EMPACOTAR",
+                                     time.perf_counter() - started, str(e), member=member)
+                if archive.broken:
+                    print(f"[ERRO] {archive.path} descartado; seus arquivos ficaram sem empacotar")
+                    self._discard(folder, f"o pacote foi descartado após a falha de {entry.path}")
+                return
+            archive.files.append((entry, member, time.perf_counter() - started))
+        if len(archive.files) >= self.MAX_MEMBERS or archive.size >= self.MAX_BYTES:
+            self._finish(folder)
+
+    def _finish(self, folder: Path):
+        archive = self._archives.pop(folder)
+        if self.dry_run:
+            return
+        with self.recorder.profiler.stage("transfer"):
+            archive.close()
+        for entry, member, seconds in archive.files:
+            self.recorder.done(entry, archive.path, "EMPACOTAR", seconds=seconds, member=member)
+        if not self.move:
+            return
+        if self.recorder.journal is not None:
+            self.recorder.journal.sync()
+        for entry, _, _ in archive.files:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                print(f"[ERRO] {entry.path} foi empacotado, mas não pôde ser removido: {e}")
+
+    def close(self, complete: bool = True):
+        """
+        Termina os pacotes abertos ou, se complete for False (a execução foi
+        interrompida), apaga-os e deixa os seus arquivos sem empacotar.
+        """
+        for folder in list(self._archives):
+            if complete:
+                self._finish(folder)
+            else:
+                self._discard(folder, "execução interrompida antes de o pacote ficar completo")
+
+    def _discard(self, folder: Path, reason: str):
+        archive = self._archives.pop(folder)
+        if self.dry_run:
+            return
+        archive.discard()
+        for entry, member, seconds in archive.files:
+            self.recorder.failed(entry, archive.path, "EMPACOTAR", seconds, reason, member=member)
+
+# ----------------------------
+# FUNÇÃO PRINCIPAL
+# ----------------------------
+
+def organize_files(
+    source_dir: Path,
+    dest_dir: Path,
+    move: bool = True,
+    dry_run: bool = False,
+    report_file: Path = None,
+    stream: bool = False,
+    workers: int = 1,
+    per_device: int = None,
+    dedupe: str = None,
+    incremental: bool = False,
+    link: str = None,
+    buffer_size: int = COPY_BUFFER_SIZE,
+    fadvise: bool = False,
+    resume: bool = False,
+    report_format: str = None,
+    scan_threads: int = 1,
+    date_source=None,
+    sniff: bool = False,
+    assume_yes: bool = False,
+    shard: Shard = None,
+    scan_filter: ScanFilter = None,
+    pack_under: int = None,
+    pack_compression: str = "none",
+    profiler: Profiler = None
+):
+    """
+    Organiza arquivos do diretório de origem para o destino.
+
+    Os arquivos passam da varredura por um Planner direto para um Executor,
+    então a memória fica limitada seja qual for o tamanho da árvore, e cada
+    um vai para onde a primeira regra que casa do RuleSet ativo (veja use_rules())
+    o manda. Sem stream, uma pré-contagem mostra um resumo antes.
+
+    move: mover os arquivos (simples renames no mesmo dispositivo) em vez de copiar.
+    dry_run: só informar o que seria feito.
+    report_file, report_format: o relatório, veja ReportWriter.
+    stream: pular a pré-contagem; o resumo é mostrado no final.
+    workers, per_device: threads de transferência, e o limite por dispositivo.
+    dedupe: "skip", "hardlink" ou "report" para duplicados (veja DuplicateIndex)
+        de arquivos organizados nesta execução, na que ela retoma ou, com
+        incremental, em execuções anteriores.
+    incremental: pular arquivos e pastas sem mudança desde a última execução (veja
+        IncrementalIndex).
+    link: "hard", "reflink" ou "symlink" em vez de cópias; só quando move
+        é False.
+    buffer_size, fadvise: como os dados são copiados, veja copy_file().
+    resume: retomar o Journal interrompido mais recente do destino.
+    scan_threads: listar pastas com um ParallelScanner (não com
+        incremental); arquivos de mesmo nome podem então ganhar o "_1" em qualquer ordem.
+    date_source: de onde as categorias com data tiram o ano, veja
+        read_capture_time(); por padrão a data de modificação.
+    sniff: classificar extensões desconhecidas pelo conteúdo (veja sniff_entries()),
+        o que o resumo da pré-contagem não faz.
+    assume_yes: pular a pergunta de confirmação.
+    shard: organizar só este Shard da origem.
+    scan_filter: o ScanFilter da varredura.
+    pack_under, pack_compression: empacotar arquivos menores em pacotes tar,
+        veja Packer.
+    profiler: um Profiler, aberto por quem chama, para medir as etapas da execução.
+    """
+    started = time.perf_counter()
+    profiler = profiler or Profiler(enabled=False)
+    total = None
+    extensions = ()
+    index = IncrementalIndex(dest_dir) if incremental else None
+
+    # 1️⃣ Contar arquivos por categoria (só nomes, nenhum caminho é guardado)
+    if not stream:
+        with profiler.stage("count"):
+            summary, total, extensions = count_files(
+                source_dir, dest_dir, index, scan_threads, shard, scan_filter
+            )
+
+        # 2️⃣ Mostrar resumo para o usuário
+        print_summary(summary, total)
+    else:
+        print("\nModo streaming: os arquivos serão organizados conforme forem encontrados.")
+    if shard is not None:
+        print(f"Fatia {shard} (por {shard.by}): só esta parte da origem será organizada.")
+
+    # 3️⃣ Confirmar execução
+    with profiler.stage("prompt"):
+        proceed = confirm(assume_yes)
+    if not proceed:
+        if index is not None:
+            index.close(save=False)
+        return
+
+    # O destino precisa existir antes da varredura para ser reconhecido
+    # (e ignorado) por dispositivo/inode quando fica dentro da origem
+    if not dry_run:
+        dest_dir.mkdir(parents=True, exist_ok=True)
+    dirs = DirectoryCache(dest_dir, create=not dry_run)
+    with profiler.stage("mkdir"):
+        dirs.create_for_extensions(extensions)
+
+    journal = None
+    completed = {}
+    if not dry_run:
+        journal, completed = open_journal(source_dir, dest_dir, move, resume, shard)
+    # As linhas do relatório são escritas conforme os arquivos são processados
+    report = open_report(report_file, report_format, dedupe=bool(dedupe), pack=bool(pack_under))
+    dates = None
+    if date_source and tuple(date_source) != ("mtime",):
+        dates = CaptureDateCache(dest_dir, date_source, persist=not dry_run)
+    types = FileTypeCache(dest_dir, persist=not dry_run) if sniff else None
+
+    # 4️⃣ Percorrer e processar arquivos com barra de progresso
+    summary = {}
+    progress = tqdm(total=total, desc="Organizando", unit="arquivo")
+    names = NameIndex(claim=shard is not None and not dry_run)
+    duplicates = None
+    if dedupe:
+        duplicates = DuplicateIndex()
+        if index is not None:
+            # Arquivos pulados por não terem mudado, inclusive pastas inteiras, ainda
+            # podem ser os originais dos arquivos desta execução (pacotes não)
+            duplicates.add_organized(
+                (size, destination) for size, destination in index.organized()
+                if not os.path.basename(destination).startswith(PACK_PREFIX)
+            )
+    action = "MOVER" if move else LINK_ACTIONS.get(link, "COPIAR")
+    planner = Planner(names, dirs, action, dates, duplicates, dedupe, pack_under, profiler)
+    recorder = RunRecorder(names, report, journal, index if not dry_run else None, profiler)
+    packer = None
+    if pack_under:
+        packer = Packer(names, recorder, pack_compression, move, dry_run)
+    executor = Executor(
+        recorder, dest_dir, move, link, workers, per_device, buffer_size, fadvise, dry_run,
+        duplicates=duplicates, packer=packer, advance=lambda: progress.update(1)
+    )
+    unchanged = 0
+    resumed = 0
+    finished = False
+
+    entries = iter_files(source_dir, dest_dir, index, scan_threads, profiler, shard, scan_filter)
+    if types is not None:
+        entries = sniff_entries(entries, types, profiler=profiler)
+
+    try:
+        for entry in entries:
+            category = entry.category
+            summary[category] = summary.get(category, 0) + 1
+            if entry.path in completed:
+                # Tratado antes de a execução anterior ser interrompida
+                resumed += 1
+                progress.update(1)
+                record = completed[entry.path]
+                if (duplicates is not None and record["action"] != "DUPLICADO"
+                        and "member" not in record):
+                    duplicates.add_organized([(entry.size, record["target"])])
+                continue
+            if index is not None and index.is_unchanged(entry):
+                # Já organizado por uma execução anterior
+                unchanged += 1
+                progress.update(1)
+                continue
+            op, candidate = planner.plan(entry)
+            executor.run(op, entry, candidate)
+
+        executor.drain()
+        if packer is not None:
+            packer.close()
+        finished = True
+    finally:
+        # Alcançado também com Ctrl-C: espera as transferências em andamento e fecha
+        # o diário e o relatório para que um --resume saiba onde esta execução parou
+        executor.close()
+        if packer is not None and not finished:
+            packer.close(complete=False)
+        if duplicates is not None:
+            duplicates.close()
+        progress.close()
+        if dates is not None:
+            dates.close()
+        if types is not None:
+            types.close()
+        if journal is not None:
+            journal.close(op="end" if finished else None)
+        if report is not None:
+            report.close()
+    if index is not None:
+        index.close(save=not dry_run)
+        print(f"{unchanged} arquivos sem alteração desde a última execução foram pulados.")
+    if resumed:
+        print(f"{resumed} arquivos já tratados pela execução interrompida foram pulados.")
+
+    if stream:
+        print_summary(summary, sum(summary.values()))
+
+    # 5️⃣ Locais do relatório e do diário
+    if report is not None:
+        print(f"Relatório salvo em: {report_file}")
+    if journal is not None:
+        print(f"Diário salvo em: {journal.path}")
+
+    print("\nOrganização concluída!")
+    print(f"Tempo total de execução: {time.perf_counter() - started:.2f} segundos")
+
+# ----------------------------
+# PLANO E EXECUÇÃO
+# ----------------------------
+
+PLAN_VERSION = 1
+
+class PlanOp(NamedTuple):
+    """Um arquivo de um Plan: para onde vai, como, e como ele era ao ser planejado."""
+    source: str
+    target: str
+    action: str
+    category: str
+    size: int
+    mtime: float
+    duplicate_of: str = None
+
+    @property
+    def path(self) -> str:
+        """A origem, com o nome que o RunRecorder lê de um FileEntry."""
+        return self.source
+
+class Planner:
+    """
+    Calcula a PlanOp de cada arquivo: a pasta de destino pelo RuleSet ativo,
+    um nome livre nela (reservado em names) e, com um DuplicateIndex, se o
+    conteúdo dele já está planejado. make_plan() junta as ops num Plan;
+    organize_files(), watch_files() e o motor assíncrono entregam cada uma
+    a um Executor assim que ela é planejada.
+    """
+
+    def __init__(self, names: NameIndex, dirs: DirectoryCache, action: str,
+                 dates: CaptureDateCache = None, duplicates: DuplicateIndex = None,
+                 dedupe: str = None, pack_under: int = None, profiler: Profiler = None):
+        self.names = names
+        self.dirs = dirs
+        self.action = action
+        self.dates = dates
+        self.duplicates = duplicates
+        self.dedupe = dedupe
+        self.pack_under = pack_under
+        self.profiler = profiler or Profiler(enabled=False)
+
+    def target_folder(self, entry: FileEntry, mtime: float = None) -> str:
+        """
+        Retorna a pasta para onde o arquivo vai, relativa ao destino. mtime
+        é a data dele quando já conhecida; senão ela é lida do
+        CaptureDateCache, se houver, ou tirada do arquivo.
+        """
+        if mtime is None:
+            mtime = entry.mtime
+            if self.dates is not None and entry.rule.dated:
+                with self.profiler.stage("dates"):
+                    mtime = self.dates.capture_time(entry)
+        with self.profiler.stage("classify"):
+            return get_target_folder(entry, mtime)
+
+    def place(self, entry: FileEntry, folder: Path):
+        """
+        Planeja um arquivo destinado a folder. Retorna (op, candidate): candidate,
+        se não for None, vai para DuplicateIndex.add() quando o arquivo chegar.
+        """
+        profiler = self.profiler
+        if self.pack_under and entry.size < self.pack_under:
+            # O Packer escolhe o pacote e o nome do membro quando ele chegar lá
+            return PlanOp(
+                entry.path, str(folder / entry.name), "EMPACOTAR", entry.category, entry.size,
+                entry.mtime
+            ), None
+        action = self.action
+        candidate = original = None
+        if self.duplicates is not None:
+            with profiler.stage("dedupe"):
+                candidate, original = self.duplicates.match(entry)
+            if original is not None:
+                candidate = None
+                if self.dedupe == "skip":
+                    # O conteúdo já está planejado: esta cópia fica onde está
+                    return PlanOp(
+                        entry.path, str(original.target), "DUPLICADO", entry.category,
+                        entry.size, entry.mtime, str(original.target)
+                    ), None
+                if self.dedupe == "hardlink":
+                    action = "HARDLINK"
+        with profiler.stage("collision"):
+            target = self.names.reserve(folder, entry.name)
+        return PlanOp(
+            entry.path, str(target), action, entry.category, entry.size, entry.mtime,
+            str(original.target) if original is not None else None
+        ), candidate
+
+    def plan(self, entry: FileEntry):
+        """Planeja um arquivo; retorna (op, candidate) como place()."""
+        folder = self.target_folder(entry)
+        with self.profiler.stage("mkdir"):
+            folder = self.dirs.get(folder)
+        return self.place(entry, folder)
+
+class Transfer(NamedTuple):
+    """Um move/cópia que Executor.start() deixou para rodar, e como registrá-lo."""
+    file: object
+    source: str
+    target: Path
+    action: str
+    original: DuplicateCandidate
+    dev: int
+
+class Executor:
+    """
+    Aplica PlanOps: move, copia ou cria link de cada arquivo (ou o entrega a um
+    Packer), mantém o diário e registra o resultado com um RunRecorder.
+    execute_plan(), organize_files(), watch_files() e o motor assíncrono
+    passam todos por ele, então organizam os arquivos do mesmo jeito.
+
+    Com recheck (as ops de um plano salvo), cada origem é conferida antes:
+    uma que sumiu, ou cujo tamanho ou mtime mudou desde que o plano foi
+    feito, falha em vez de ser organizada, e um nome de destino ocupado desde
+    então ganha o próximo nome livre _1, _2, ... Senão a op é aplicada como
+    planejada nesta execução, com os dados de stat do seu FileEntry.
+
+    Com workers > 1 as transferências rodam num pool de threads, no máximo
+    workers * 4 em andamento, e são registradas na ordem das ops. counts tem
+    as ops "done" e "failed"; advance, se dado, é chamado uma vez por op.
+    """
+
+    def __init__(self, recorder: RunRecorder, dest_dir: Path, move: bool = True,
+                 link: str = None, workers: int = 1, per_device: int = None,
+                 buffer_size: int = COPY_BUFFER_SIZE, fadvise: bool = False,
+                 dry_run: bool = False, recheck: bool = False,
+                 duplicates: DuplicateIndex = None, packer: Packer = None, advance=None):
+        self.recorder = recorder
+        self.move = move
+        self.action = "MOVER" if move else LINK_ACTIONS.get(link, "COPIAR")
+        self.dry_run = dry_run
+        self.recheck = recheck
+        self.duplicates = duplicates
+        self.packer = packer
+        self.advance = advance
+        self.options = {
+            "move": move, "link": link, "buffer_size": buffer_size, "fadvise": fadvise
+        }
+        self.dest_dev = None if dry_run else os.stat(dest_dir).st_dev
+        self.pool = None
+        if workers > 1 and not dry_run:
+            self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.limiter = DeviceLimiter(per_device)
+        self.window = workers * 4
+        self.counts = {"done": 0, "failed": 0}
+        self._folders = set()
+        # Destino planejado -> destino real, para destinos renomeados na execução
+        self._placed = {}
+        self._pending = deque()
+
+    def _count(self, done: bool):
+        self.counts["done" if done else "failed"] += 1
+        if self.advance is not None:
+            self.advance()
+
+    def _recheck(self, op: PlanOp, item, target: Path):
+        # Retorna o dispositivo da origem, ou None se ela não puder ser organizada
+        try:
+            st = os.stat(op.source)
+            if (st.st_size, st.st_mtime) != (op.size, op.mtime):
+                raise OSError("mudou desde que o plano foi feito")
+        except OSError as e:
+            print(f"[ERRO] Não foi possível processar {op.source}: {e}")
+            self.recorder.failed(item, target, op.action, error=str(e))
+            self._count(False)
+            return None
+        if target.parent not in self._folders:
+            with self.recorder.profiler.stage("mkdir"):
+                target.parent.mkdir(parents=True, exist_ok=True)
+            self._folders.add(target.parent)
+        return st.st_dev
+
+    def start(self, op: PlanOp, entry: FileEntry = None) -> Transfer:
+        """
+        Faz tudo o que uma op precisa menos o move/cópia: registra duplicados,
+        simulações e arquivos empacotados, cria hard links e grava o diário.
+        Retorna a Transfer que falta rodar e entregar a finish(), ou None.
+        entry é o FileEntry da op, se ela foi planejada nesta execução.
+        """
+        recorder = self.recorder
+        profiler = recorder.profiler
+        item = op if entry is None else entry
+        original = None
+        if op.duplicate_of is not None:
+            original = DuplicateCandidate(op.duplicate_of, op.size)
+            original.target = self._placed.get(op.duplicate_of, Path(op.duplicate_of))
+        if op.action == "DUPLICADO":
+            recorder.done(item, original.target, "DUPLICADO", original)
+            self._count(True)
+            return None
+        target = Path(op.target)
+        if op.action == "EMPACOTAR":
+            self.packer.add(entry, target.parent)
+            if self.advance is not None:
+                self.advance()
+            return None
+        if self.dry_run:
+            # Apenas simulação
+            recorder.done(item, target, op.action, original)
+            self._count(True)
+            return None
+
+        dev = None if entry is None else entry.dev
+        if self.recheck:
+            with profiler.stage("collision"):
+                target = recorder.names.reserve(target.parent, target.name)
+            if target != Path(op.target):
+                self._placed[op.target] = target
+            dev = self._recheck(op, item, target)
+            if dev is None:
+                return None
+
+        action = op.action
+        if original is not None and action == "HARDLINK":
+            # O original precisa ter chegado antes de receber um link
+            self.drain()
+            with profiler.stage("report"):
+                recorder.journal.begin(op.source, target, action)
+            with profiler.stage("transfer"):
+                linked = link_duplicate(original.target, target, op.source, move=self.move)
+            if linked:
+                recorder.done(item, target, action, original)
+                self._count(True)
+                return None
+            # Não foi possível criar o link: voltar ao move/cópia normal
+            recorder.journal.abort(op.source, target)
+            action = self.action
+        with profiler.stage("report"):
+            recorder.journal.begin(op.source, target, action)
+        return Transfer(item, op.source, target, action, original, dev)
+
+    def transfer_options(self, transfer: Transfer) -> dict:
+        """Os argumentos nomeados de timed_transfer() para uma Transfer."""
+        return dict(self.options, same_device=transfer.dev == self.dest_dev)
+
+    def finish(self, transfer: Transfer, result):
+        """Registra uma Transfer a partir do que timed_transfer() retornou para ela."""
+        self.recorder.finish(
+            transfer.file, transfer.target, transfer.action, transfer.original, result
+        )
+        self._count(result[0] is not None)
+
+    def run(self, op: PlanOp, entry: FileEntry = None, candidate: DuplicateCandidate = None):
+        """
+        Aplica uma op, como start() e finish(), rodando a transferência aqui
+        ou no pool. candidate, de Planner.place(), é somado ao DuplicateIndex
+        com o novo caminho do arquivo.
+        """
+        transfer = self.start(op, entry)
+        if transfer is None:
+            if candidate is not None and self.dry_run:
+                self.duplicates.add(candidate, op.source, Path(op.target))
+            return
+        options = self.transfer_options(transfer)
+        if self.pool is None:
+            result = timed_transfer(op.source, transfer.target, **options)
+            self.finish(transfer, result)
+            if candidate is not None and result[0] is not None:
+                self.duplicates.add(candidate, transfer.target, transfer.target)
+            return
+        future = self.pool.submit(
+            limited_transfer, self.limiter, (transfer.dev, self.dest_dev), op.source,
+            transfer.target, **options
+        )
+        if candidate is not None:
+            self.duplicates.add(candidate, transfer.target, transfer.target, future)
+        self._pending.append((transfer, future))
+        # Manter uma janela limitada de transferências em andamento
+        while self._pending and (
+                len(self._pending) >= self.window or self._pending[0][1].done()):
+            self._collect()
+
+    def _collect(self):
+        # Os resultados são coletados na ordem de envio para manter o relatório ordenado
+        transfer, future = self._pending.popleft()
+        self.finish(transfer, future.result())
+
+    def drain(self):
+        """Espera as transferências ainda em andamento e as registra."""
+        while self._pending:
+            self._collect()
+
+    def close(self):
+        """Encerra o pool, depois das transferências já em andamento."""
+        if self.pool is not None:
+            self.pool.shutdown()
+
+class PlanTable:
+    """
+    As ops de um Plan, guardadas por coluna para que planos de dezenas de
+    milhões de arquivos caibam na memória. Cada caminho de pasta é guardado
+    uma vez e as ops ficam com o id dele; os nomes vão em UTF-8 num único
+    buffer; categorias e ações são ids em listas de rótulos separadas
+    (--rules pode somar milhares de categorias; as ações são poucas e fixas);
+    tamanhos e mtimes ficam em arrays tipados. Nomes de destino e duplicate_of
+    só são guardados para as ops que os têm (um destino renomeado, um
+    duplicado). Indexar e iterar montam as tuplas PlanOp na hora. Uma tabela
+    é preenchida uma vez, com as ops com que é criada, e depois só é lida.
+    """
+    __slots__ = (
+        "_folders", "_folder_ids", "_category_labels", "_category_ids", "_action_labels",
+        "_action_ids", "_names", "_name_ends", "_source_dirs", "_target_dirs", "_categories",
+        "_actions", "_sizes", "_mtimes", "_renamed", "_duplicate_of"
+    )
+
+    def __init__(self, ops=()):
+        self._folders = []
+        self._folder_ids = {}
+        self._category_labels = []
+        self._category_ids = {}
+        self._action_labels = []
+        self._action_ids = {}
+        self._names = bytearray()
+        self._name_ends = array("Q")
+        self._source_dirs = array("I")
+        self._target_dirs = array("I")
+        self._categories = array("I")
+        self._actions = array("B")
+        self._sizes = array("q")
+        self._mtimes = array("d")
+        # Colunas esparsas: número da op -> valor
+        self._renamed = {}
+        self._duplicate_of = {}
+        for op in ops:
+            self._append(op)
+
+    def _folder_id(self, folder: str) -> int:
+        folder_id = self._folder_ids.get(folder)
+        if folder_id is None:
+            folder_id = self._folder_ids[folder] = len(self._folders)
+            self._folders.append(folder)
+        return folder_id
+
+    @staticmethod
+    def _label_id(labels: list, ids: dict, label: str) -> int:
+        label_id = ids.get(label)
+        if label_id is None:
+            label_id = ids[label] = len(labels)
+            labels.append(label)
+        return label_id
+
+    def _append(self, op: PlanOp):
+        source_dir, name = os.path.split(op.source)
+        target_dir, target_name = os.path.split(op.target)
+        number = len(self._sizes)
+        # surrogatepass mantém intactos nomes de arquivo que não decodificam
+        self._names += name.encode("utf-8", "surrogatepass")
+        self._name_ends.append(len(self._names))
+        self._source_dirs.append(self._folder_id(source_dir))
+        self._target_dirs.append(self._folder_id(target_dir))
+        self._categories.append(
+            self._label_id(self._category_labels, self._category_ids, op.category)
+        )
+        self._actions.append(self._label_id(self._action_labels, self._action_ids, op.action))
+        self._sizes.append(op.size)
+        self._mtimes.append(op.mtime)
+        if target_name != name:
+            self._renamed[number] = target_name
+        if op.duplicate_of is not None:
+            self._duplicate_of[number] = op.duplicate_of
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def __getitem__(self, number: int) -> PlanOp:
+        if number < 0:
+            number += len(self)
+        start = self._name_ends[number - 1] if number else 0
+        name = self._names[start:self._name_ends[number]].decode("utf-8", "surrogatepass")
+        return PlanOp(
+            os.path.join(self._folders[self._source_dirs[number]], name),
+            os.path.join(
+                self._folders[self._target_dirs[number]], self._renamed.get(number, name)
+            ),
+            self._action_labels[self._actions[number]],
+            self._category_labels[self._categories[number]],
+            self._sizes[number],
+            self._mtimes[number],
+            self._duplicate_of.get(number)
+        )
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self[number]
+
+    def __eq__(self, other):
+        if not isinstance(other, PlanTable):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def has_duplicates(self) -> bool:
+        return bool(self._duplicate_of)
+
+    def summary(self) -> dict:
+        """Retorna a quantidade de ops por categoria, na ordem em que aparecem."""
+        counts = [0] * len(self._category_labels)
+        for label_id in self._categories:
+            counts[label_id] += 1
+        return {label: count for label, count in zip(self._category_labels, counts) if count}
+
+class Plan(NamedTuple):
+    """
+    O que uma execução faria, calculado por make_plan() e aplicado por
+    execute_plan(). É imutável (ops é uma PlanTable só de leitura). save() grava
+    o plano em JSON Lines (cabeçalho e uma op por linha na ordem da varredura;
+    gzip para nomes ".gz") e load() o lê de volta, então um plano pode ser
+    revisado, comparado e executado depois ou em outra máquina.
+    shard é o "i/N" da fatia que ele cobre, ou None para a origem inteira.
+    """
+    source_dir: str
+    dest_dir: str
+    move: bool
+    link: str
+    created: str
+    ops: PlanTable
+    shard: str = None
+
+    def save(self, path: Path):
+        opener = gzip.open if str(path).endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8") as f:
+            header = {
+                "plan": PLAN_VERSION, "source": self.source_dir, "destination": self.dest_dir,
+                "move": self.move, "link": self.link, "created": self.created
+            }
+            if self.shard is not None:
+                header["shard"] = self.shard
+            f.write(json.dumps(header) + "\n")
+            for op in self.ops:
+                f.write(json.dumps(op._asdict()) + "\n")
+
+    @classmethod
+    def load(cls, path: Path) -> "Plan":
+        opener = gzip.open if str(path).endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("plan") != PLAN_VERSION:
+                raise ValueError(f"{path} não é um plano que esta versão consiga ler")
+            ops = PlanTable(PlanOp(**json.loads(line)) for line in f if line.strip())
+        return cls(
+            header["source"], header["destination"], header["move"], header["link"],
+            header["created"], ops, header.get("shard")
+        )
+
+    def summary(self) -> dict:
+        """Retorna a quantidade de arquivos por categoria."""
+        return self.ops.summary()
+
+    def diff(self, other: "Plan"):
+        """
+        Compara dois planos arquivo de origem a arquivo de origem. Retorna
+        (added, removed, changed): as ops só em other, as ops só neste plano e
+        pares (antigo, novo) das origens planejadas de forma diferente.
+        """
+        mine = {op.source: op for op in self.ops}
+        theirs = {op.source: op for op in other.ops}
+        added = [op for source, op in theirs.items() if source not in mine]
+        removed = [op for source, op in mine.items() if source not in theirs]
+        changed = [
+            (op, theirs[source]) for source, op in mine.items()
+            if source in theirs and theirs[source] != op
+        ]
+        return added, removed, changed
+
+def make_plan(
+    source_dir: Path,
+    dest_dir: Path,
+    move: bool = True,
+    link: str = None,
+    dedupe: str = None,
+    scan_threads: int = 1,
+    date_source=None,
+    sniff: bool = False,
+    shard: Shard = None,
+    scan_filter: ScanFilter = None,
+    profiler: Profiler = None
+) -> Plan:
+    """
+    Calcula o que organize_files() faria, sem alterar nenhum arquivo nem
+    perguntar nada, e retorna isso como um Plan. As opções significam o
+    mesmo que em organize_files(). Os nomes de destino são escolhidos
+    conforme o destino está agora. Os caches de datas e de tipos no destino
+    são lidos, mas não gravados.
+    """
+    profiler = profiler or Profiler(enabled=False)
+    duplicates = DuplicateIndex() if dedupe else None
+    dates = None
+    if date_source and tuple(date_source) != ("mtime",):
+        dates = CaptureDateCache(dest_dir, date_source, persist=False)
+    types = FileTypeCache(dest_dir, persist=False) if sniff else None
+    action = "MOVER" if move else LINK_ACTIONS.get(link, "COPIAR")
+    planner = Planner(
+        NameIndex(), DirectoryCache(dest_dir, create=False), action, dates, duplicates, dedupe,
+        profiler=profiler
+    )
+
+    entries = iter_files(source_dir, dest_dir, None, scan_threads, profiler, shard, scan_filter)
+    if types is not None:
+        entries = sniff_entries(entries, types, profiler=profiler)
+
+    def planned():
+        for entry in entries:
+            op, candidate = planner.plan(entry)
+            if candidate is not None:
+                duplicates.add(candidate, entry.path, Path(op.target))
+            yield op
+
+    try:
+        ops = PlanTable(planned())
+    finally:
+        if duplicates is not None:
+            duplicates.close()
+        if dates is not None:
+            dates.close()
+        if types is not None:
+            types.close()
+    return Plan(
+        str(source_dir), str(dest_dir), move, link,
+        datetime.now().isoformat(timespec="seconds"), ops,
+        None if shard is None else str(shard)
+    )
+
+def execute_plan(
+    plan: Plan,
+    workers: int = 1,
+    per_device: int = None,
+    report_file: Path = None,
+    report_format: str = None,
+    buffer_size: int = COPY_BUFFER_SIZE,
+    fadvise: bool = False,
+    resume: bool = False,
+    progress: bool = False,
+    profiler: Profiler = None
+) -> dict:
+    """
+    Aplica um Plan, sem perguntar nada. Cada origem é verificada antes:
+    uma que sumiu, ou cujo tamanho ou mtime mudou desde que o plano foi
+    feito, falha (com uma linha no relatório) em vez de ser organizada. Um
+    nome de destino ocupado desde então recebe o próximo nome _1, _2, ...
+    livre. Transferências, diário, relatório e retomada funcionam como em
+    progress mostra uma barra de progresso. O plano de uma fatia reserva
+    seus nomes no disco, então os planos de todas as fatias podem rodar juntos.
+
+    Retorna contagens das ops do plano ("done", "failed", "skipped" porque
+    uma execução retomada já as tratou) e o caminho do diário ("journal").
+    """
+    profiler = profiler or Profiler(enabled=False)
+    dest_dir = Path(plan.dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    journal, completed = open_journal(
+        Path(plan.source_dir), dest_dir, plan.move, resume, plan.shard
+    )
+    report = open_report(
+        report_file, report_format, dedupe=plan.ops.has_duplicates()
+    )
+    recorder = RunRecorder(NameIndex(claim=plan.shard is not None), report, journal,
+                           profiler=profiler)
+    bar = tqdm(total=len(plan.ops), desc="Organizando", unit="arquivo", disable=not progress)
+    executor = Executor(
+        recorder, dest_dir, plan.move, plan.link, workers, per_device, buffer_size, fadvise,
+        recheck=True, advance=lambda: bar.update(1)
+    )
+    skipped = 0
+    finished = False
+    try:
+        for op in plan.ops:
+            if op.source in completed:
+                # Tratado antes de a execução anterior ser interrompida
+                skipped += 1
+                bar.update(1)
+                continue
+            executor.run(op)
+        executor.drain()
+        finished = True
+    finally:
+        executor.close()
+        bar.close()
+        journal.close(op="end" if finished else None)
+        if report is not None:
+            report.close()
+    return dict(executor.counts, skipped=skipped, journal=str(journal.path))
+
 # ----------------------------
-# FUNÇÕES AUXILIARES
+# MODO DE OBSERVAÇÃO
 # ----------------------------
 
-def get_file_category(file_path: Path) -> str:
-    """Retorna a categoria principal do arquivo baseado na extensão."""
-    ext = file_path.suffix.lower()
-    for category, extensions in CATEGORIES.items():
-        if ext in extensions:
-            return category
-    return "Outros"
-
-def get_subfolder_name(file_path: Path, category: str) -> str:
-    """Retorna o subfolder baseado em ano ou extensão."""
-    if category in ["Imagens", "Videos"]:
-        try:
-            timestamp = file_path.stat().st_mtime
-            year = datetime.fromtimestamp(timestamp).year
-            return f"{year}"
-        except Exception:
-            return "AnoDesconhecido"
-    elif category in ["Documentos","Compactados","Executáveis","Fontes","Scripts e Código","Imagens de Disco","Modelos 3D","Outros"]:
-        return file_path.suffix.lower().lstrip(".")
-    else:
-        return "Desconhecido"
+# Segundos que um arquivo deve ficar sem mudar antes de ser organizado
+WATCH_SETTLE = 2.0
 
-def safe_move_or_copy(src: Path, dst: Path, move: bool = True):
-    """Move ou copia arquivo, renomeando se já existir."""
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    counter = 1
-    target = dst
-    while target.exists():
-        target = dst.with_name(f"{dst.stem}_{counter}{dst.suffix}")
-        counter += 1
+# Segundos entre verificações quando o inotify não está disponível
+WATCH_POLL_INTERVAL = 5.0
+
+# Máximo de arquivos organizados num lote
+WATCH_BATCH_SIZE = 256
+
+# Espera máxima por mudanças, para que um pedido de parada seja notado
+WATCH_TICK = 1.0
+
+class InotifyWatcher:
+    """
+    Informa os arquivos gravados numa árvore de pastas, pelo inotify do Linux
+    (chamado com ctypes, então nenhum pacote é necessário). Cada pasta recebe
+    um watch e as pastas criadas depois são incluídas quando aparecem, então
+    nada é percorrido enquanto a árvore está parada. O número de pastas é
+    limitado pelo sysctl fs.inotify.max_user_watches. As pastas que um
+    ScanFilter poda não são vigiadas, e os arquivos que ele deixa de fora não são informados.
+    """
+
+    KIND = "inotify"
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    # struct inotify_event: wd, mask, cookie, len e depois len bytes de nome
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, source_dir: Path, dest_dir: Path, scan_filter: ScanFilter = None):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.source_dir = source_dir
+        self.dest_dir = dest_dir
+        self.scan_filter = scan_filter
+        self._dest_key = _dir_key(dest_dir)
+        self._dest_path = str(dest_dir)
+        # Descritor do watch -> pasta
+        self._folders = {}
+        try:
+            self._watch_tree(str(source_dir))
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _watch_tree(self, root: str) -> list:
+        """Observa root e todas as pastas abaixo dela; retorna os arquivos que já estão nelas."""
+        paths = []
+        stack = [root]
+        while stack:
+            folder = stack.pop()
+            # Observada antes de ser listada, para não perder arquivos criados nesse meio tempo
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), self.MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code in (errno.ENOSPC, errno.ENOMEM):
+                    raise OSError(code, "pastas demais para observar (veja fs.inotify.max_user_watches)")
+                # Ilegível ou já removida: ignorada, como na varredura
+                continue
+            self._folders[wd] = folder
+            listing = scan_dir(folder, self._dest_key, self._dest_path, self.scan_filter)
+            if listing is None:
+                continue
+            files, subdirs = listing
+            paths.extend(entry.path for entry in files)
+            stack.extend(reversed(subdirs))
+        return paths
+
+    def changes(self, timeout: float) -> list:
+        """Espera até timeout segundos; retorna os caminhos dos arquivos criados ou gravados."""
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+        paths = []
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = self.EVENT.unpack_from(data, pos)
+                pos += self.EVENT.size
+                name = data[pos:pos + length].rstrip(b"\0")
+                pos += length
+                if mask & self.IN_Q_OVERFLOW:
+                    # Eventos foram perdidos: olha a árvore inteira de novo
+                    paths.extend(
+                        entry.path for entry in iter_dir_entries(
+                            self.source_dir, self.dest_dir, scan_filter=self.scan_filter
+                        )
+                    )
+                    continue
+                if mask & self.IN_IGNORED:
+                    self._folders.pop(wd, None)
+                    continue
+                folder = self._folders.get(wd)
+                if folder is None or not name:
+                    continue
+                name = os.fsdecode(name)
+                path = os.path.join(folder, name)
+                if not mask & self.IN_ISDIR:
+                    if self.scan_filter is None or self.scan_filter.takes_file(path, name):
+                        paths.append(path)
+                elif (mask & (self.IN_CREATE | self.IN_MOVED_TO) and path != self._dest_path
+                      and (self.scan_filter is None or self.scan_filter.takes_dir(path, name))):
+                    try:
+                        paths.extend(self._watch_tree(path))
+                    except OSError as e:
+                        print(f"[ERRO] Não foi possível observar {path}: {e}")
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+class PollingWatcher:
+    """
+    Alternativa para sistemas sem inotify. A cada interval segundos faz stat
+    de cada pasta conhecida e lista só aquelas cujo mtime mudou (um arquivo
+    foi incluído, removido ou renomeado nelas), então uma verificação sem
+    mudanças custa um stat por pasta. Só arquivos novos são notados: regravar
+    um arquivo no lugar não muda o mtime da pasta. Um ScanFilter funciona como no InotifyWatcher.
+    """
+
+    KIND = "polling"
+
+    def __init__(self, source_dir: Path, dest_dir: Path, interval: float = WATCH_POLL_INTERVAL,
+                 scan_filter: ScanFilter = None):
+        self.interval = interval
+        self.scan_filter = scan_filter
+        self._dest_key = _dir_key(dest_dir)
+        self._dest_path = str(dest_dir)
+        # Pasta -> (mtime, nomes dos seus arquivos)
+        self._folders = {}
+        self._list(str(source_dir))
+        self._next_poll = time.monotonic() + interval
+
+    def _list(self, root: str, known=frozenset()) -> list:
+        """Lista root e suas subpastas novas; retorna os arquivos que não estão em known."""
+        paths = []
+        stack = [(root, known)]
+        while stack:
+            folder, known = stack.pop()
+            try:
+                # Lido antes de listar, para que uma mudança feita nesse meio tempo apareça na próxima verificação
+                mtime = os.stat(folder).st_mtime
+            except OSError:
+                self._folders.pop(folder, None)
+                continue
+            listing = scan_dir(folder, self._dest_key, self._dest_path, self.scan_filter)
+            if listing is None:
+                self._folders.pop(folder, None)
+                continue
+            files, subdirs = listing
+            self._folders[folder] = (mtime, {entry.name for entry in files})
+            paths.extend(entry.path for entry in files if entry.name not in known)
+            stack.extend(
+                (subdir, frozenset()) for subdir in subdirs if subdir not in self._folders
+            )
+        return paths
+
+    def changes(self, timeout: float) -> list:
+        """Espera até timeout segundos; retorna os caminhos dos arquivos incluídos desde a última verificação."""
+        wait = self._next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+        self._next_poll = time.monotonic() + self.interval
+        paths = []
+        for folder, (mtime, names) in list(self._folders.items()):
+            try:
+                changed = os.stat(folder).st_mtime != mtime
+            except OSError:
+                self._folders.pop(folder, None)
+                continue
+            if changed:
+                paths.extend(self._list(folder, names))
+        return paths
+
+    def close(self):
+        pass
+
+def open_watcher(source_dir: Path, dest_dir: Path, poll_interval: float = None,
+                 scan_filter: ScanFilter = None):
+    """
+    Retorna um InotifyWatcher, ou um PollingWatcher quando poll_interval é
+    passado ou o inotify não pode ser usado.
+    """
+    if poll_interval is None:
+        try:
+            return InotifyWatcher(source_dir, dest_dir, scan_filter)
+        except (OSError, AttributeError) as e:
+            print(f"inotify indisponível ({e}); verificando a cada {WATCH_POLL_INTERVAL:g} segundos.")
+    return PollingWatcher(source_dir, dest_dir, poll_interval or WATCH_POLL_INTERVAL, scan_filter)
+
+class SettlingFiles:
+    """
+    Arquivos vistos mudando, guardados até terminarem de ser gravados: um
+    arquivo está pronto quando seu tamanho e mtime ficaram iguais por settle
+    segundos desde o último evento de mudança. root é a origem vigiada,
+    para o FileEntry de cada arquivo pronto.
+    """
+
+    def __init__(self, settle: float = WATCH_SETTLE, root: str = None):
+        self.settle = settle
+        self.root = root
+        # Caminho -> (tamanho, mtime, hora da última mudança vista)
+        self._files = {}
+
+    def __len__(self):
+        return len(self._files)
+
+    def add(self, path: str, now: float):
+        if path in self._files:
+            # Mudou de novo: a espera recomeça
+            size, mtime, _ = self._files[path]
+            self._files[path] = (size, mtime, now)
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        self._files[path] = (st.st_size, st.st_mtime, now)
+
+    def wait(self, now: float) -> float:
+        """Segundos até o próximo arquivo poder ficar pronto (no máximo WATCH_TICK)."""
+        if not self._files:
+            return WATCH_TICK
+        due = min(since for _, _, since in self._files.values()) + self.settle
+        return min(max(due - now, 0), WATCH_TICK)
+
+    def ready(self, now: float) -> list:
+        """Retorna um FileEntry para cada arquivo que parou de mudar, e os esquece."""
+        entries = []
+        for path, (size, mtime, since) in list(self._files.items()):
+            if now - since < self.settle:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Apagado ou movido nesse meio tempo
+                del self._files[path]
+                continue
+            if (st.st_size, st.st_mtime) != (size, mtime):
+                self._files[path] = (st.st_size, st.st_mtime, now)
+                continue
+            del self._files[path]
+            entries.append(FileEntry(
+                path, os.path.basename(path), st.st_size, st.st_mtime, st.st_dev, st.st_ino,
+                self.root
+            ))
+        return entries
+
+def watch_files(
+    source_dir: Path,
+    dest_dir: Path,
+    move: bool = True,
+    link: str = None,
+    incremental: bool = False,
+    report_file: Path = None,
+    report_format: str = None,
+    buffer_size: int = COPY_BUFFER_SIZE,
+    fadvise: bool = False,
+    date_source=None,
+    sniff: bool = False,
+    settle: float = WATCH_SETTLE,
+    batch_size: int = WATCH_BATCH_SIZE,
+    poll_interval: float = None,
+    stop: threading.Event = None,
+    scan_filter: ScanFilter = None,
+    profiler: Profiler = None
+) -> dict:
+    """
+    Continua organizando arquivos conforme aparecem em source_dir, até stop
+    ser acionado ou Ctrl-C ser pressionado. Os arquivos que já estão lá são
+    organizados primeiro. Depois os novos são achados pelo inotify, ou
+    verificando a cada poll_interval segundos quando ele é passado ou o
+    inotify está indisponível (veja InotifyWatcher e PollingWatcher), então
+    uma árvore parada quase não custa nada, não importa o tamanho.
+
+    Um arquivo é organizado depois de passar settle segundos sem mudar,
+    então downloads ainda sendo gravados ficam quietos. Arquivos prontos são
+    classificados e transferidos em lotes de até batch_size como
+    organize_files() faria; as outras opções significam o mesmo que lá. Um
+    único diário cobre a sessão inteira. Arquivos que um ScanFilter deixa de
+    fora não são vigiados nem organizados.
+
+    Retorna o número de arquivos organizados ("done") e com falha ("failed"),
+    e o caminho do diário ("journal").
+    """
+    profiler = profiler or Profiler(enabled=False)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    index = IncrementalIndex(dest_dir) if incremental else None
+    journal, _ = open_journal(source_dir, dest_dir, move)
+    report = open_report(report_file, report_format)
+    dates = None
+    if date_source and tuple(date_source) != ("mtime",):
+        dates = CaptureDateCache(dest_dir, date_source)
+    types = FileTypeCache(dest_dir) if sniff else None
+    action = "MOVER" if move else LINK_ACTIONS.get(link, "COPIAR")
+    counts = {"done": 0, "failed": 0}
+
+    def organize(batch):
+        # Novos a cada lote: outros programas podem mudar o destino entre eles
+        recorder = RunRecorder(NameIndex(), report, journal, index, profiler)
+        planner = Planner(recorder.names, DirectoryCache(dest_dir), action, dates,
+                          profiler=profiler)
+        executor = Executor(recorder, dest_dir, move, link, buffer_size=buffer_size,
+                            fadvise=fadvise)
+        if types is not None:
+            batch = list(sniff_entries(batch, types, profiler=profiler))
+        for entry in batch:
+            if index is not None and index.is_unchanged(entry):
+                continue
+            if scan_filter is not None and not scan_filter.takes_size(entry.size):
+                continue
+            op, _ = planner.plan(entry)
+            executor.run(op, entry)
+        organized = executor.counts["done"]
+        failed = executor.counts["failed"]
+        # Gravados agora em vez de só quando a sessão terminar
+        for store in (index, dates, types, report):
+            if store is not None:
+                store.flush()
+        counts["done"] += organized
+        counts["failed"] += failed
+        if organized or failed:
+            print(f"[{datetime.now():%H:%M:%S}] {organized} arquivos organizados ({failed} com falha)")
+
+    pending = SettlingFiles(settle, str(source_dir))
+    # Aberto antes da primeira varredura, para não perder nada criado durante ela
+    watcher = open_watcher(source_dir, dest_dir, poll_interval, scan_filter)
+    busy = False
+    finished = False
     try:
-        if move:
-            shutil.move(str(src), str(target))
-        else:
-            shutil.copy2(str(src), str(target))
-        return target
-    except Exception as e:
-        print(f"[ERRO] Não foi possível processar {src}: {e}")
-        return None
+        now = time.monotonic()
+        for entry in iter_files(source_dir, dest_dir, index, profiler=profiler,
+                                scan_filter=scan_filter):
+            pending.add(entry.path, now)
+        print(f"Observando {source_dir} ({watcher.KIND}); pressione Ctrl-C para parar.")
+        while stop is None or not stop.is_set():
+            for path in watcher.changes(pending.wait(time.monotonic())):
+                pending.add(path, time.monotonic())
+            ready = pending.ready(time.monotonic())
+            for start in range(0, len(ready), batch_size):
+                busy = True
+                organize(ready[start:start + batch_size])
+                busy = False
+        finished = True
+    except KeyboardInterrupt:
+        print("\nObservação encerrada.")
+        # Interrompido entre lotes, nada fica pela metade
+        finished = not busy
+    finally:
+        watcher.close()
+        if dates is not None:
+            dates.close()
+        if types is not None:
+            types.close()
+        journal.close(op="end" if finished else None)
+        if report is not None:
+            report.close()
+        if index is not None:
+            index.close()
+    counts["journal"] = str(journal.path)
+    return counts
 
 # ----------------------------
-# FUNÇÃO PRINCIPAL
+# MOTOR ASSÍNCRONO
 # ----------------------------
 
-def organize_files(
+class LocalFS:
+    """
+    As chamadas bloqueantes ao sistema de arquivos feitas pelo motor assíncrono. Cada uma
+    roda em uma thread de trabalho, então em montagens de rede muitas idas e voltas podem estar
+    em andamento ao mesmo tempo.
+    """
+
+    def scan_dir(self, root: str, dest_key, dest_path: str, scan_filter: ScanFilter = None):
+        return scan_dir(root, dest_key, dest_path, scan_filter)
+
+    def stat(self, entry: os.DirEntry):
+        return entry.stat()
+
+    def dir_key(self, path: Path):
+        return _dir_key(path)
+
+    def makedirs(self, folder: Path):
+        folder.mkdir(parents=True, exist_ok=True)
+
+    def listdir(self, folder: Path) -> list:
+        try:
+            return os.listdir(folder)
+        except FileNotFoundError:
+            return []
+
+    def capture_time(self, path: str, sources) -> float:
+        return read_capture_time(path, sources)
+
+    def sniff_type(self, path: str) -> str:
+        return sniff_type(path)
+
+    def transfer(self, src, target: Path, options: dict):
+        return timed_transfer(src, target, **options)
+
+class LatencyFS(LocalFS):
+    """
+    LocalFS com um atraso fixo somado a cada chamada, para testar o motor assíncrono
+    localmente como se os arquivos estivessem em uma montagem de rede. latency é em segundos.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def scan_dir(self, root, dest_key, dest_path, scan_filter=None):
+        time.sleep(self.latency)
+        return super().scan_dir(root, dest_key, dest_path, scan_filter)
+
+    def stat(self, entry):
+        time.sleep(self.latency)
+        return super().stat(entry)
+
+    def dir_key(self, path):
+        time.sleep(self.latency)
+        return super().dir_key(path)
+
+    def makedirs(self, folder):
+        time.sleep(self.latency)
+        super().makedirs(folder)
+
+    def listdir(self, folder):
+        time.sleep(self.latency)
+        return super().listdir(folder)
+
+    def capture_time(self, path, sources):
+        time.sleep(self.latency)
+        return super().capture_time(path, sources)
+
+    def sniff_type(self, path):
+        time.sleep(self.latency)
+        return super().sniff_type(path)
+
+    def transfer(self, src, target, options):
+        time.sleep(self.latency)
+        return super().transfer(src, target, options)
+
+async def iter_files_async(source_dir: Path, dest_dir: Path, fs: LocalFS, run,
+                           stat: bool = True, lookahead: int = 32,
+                           scan_filter: ScanFilter = None):
+    """
+    Equivalente assíncrono de iter_files(): produz os arquivos de cada pasta como
+    uma lista, na mesma ordem. As pastas são listadas por scan_dir(), via fs;
+    as próximas lookahead da pilha do percurso são listadas com antecedência,
+    e os arquivos de uma pasta passam por stat em paralelo. Com stat=False os
+    objetos os.DirEntry são produzidos como estão, que é tudo de que
+    count_files_async() precisa. Um ScanFilter vale como em iter_files();
+    seus limites de tamanho só com stat. run(func, *args) executa uma chamada
+    bloqueante no pool de threads do motor.
+    """
+    dest_key = await run(fs.dir_key, dest_dir)
+    dest_path = str(dest_dir)
+
+    async def list_dir(root):
+        listing = await run(fs.scan_dir, root, dest_key, dest_path, scan_filter)
+        if listing is None:
+            return [], []
+        files, subdirs = listing
+        if not stat:
+            return files, subdirs
+        results = await asyncio.gather(
+            *(run(fs.stat, entry) for entry in files), return_exceptions=True
+        )
+        found = []
+        for entry, st in zip(files, results):
+            if isinstance(st, OSError):
+                print(f"[ERRO] Não foi possível ler {entry.path}: {st}")
+            elif isinstance(st, BaseException):
+                raise st
+            elif scan_filter is None or scan_filter.takes_size(st.st_size):
+                found.append(FileEntry(
+                    entry.path, entry.name, st.st_size, st.st_mtime, st.st_dev, st.st_ino,
+                    str(source_dir)
+                ))
+        return found, subdirs
+
+    stack = [[str(source_dir), None]]
+    while stack:
+        # Começa a listar as pastas que serão visitadas em seguida
+        for item in stack[-lookahead:]:
+            if item[1] is None:
+                item[1] = asyncio.ensure_future(list_dir(item[0]))
+        files, subdirs = await stack.pop()[1]
+        yield files
+        # Invertido para visitar as subpastas na ordem da listagem, como o os.walk
+        stack.extend([path, None] for path in reversed(subdirs))
+
+@asynccontextmanager
+async def thread_runner(in_flight: int):
+    """
+    Produz run(func, *args), que aguarda func em um pool de threads com no máximo
+    in_flight chamadas ao mesmo tempo. Na saída (um erro, por exemplo) as tarefas ainda em espera são
+    canceladas antes de o pool ser encerrado.
+    """
+    pool = ThreadPoolExecutor(max_workers=in_flight)
+    limit = asyncio.Semaphore(in_flight)
+    loop = asyncio.get_running_loop()
+
+    async def run(func, *args):
+        async with limit:
+            return await loop.run_in_executor(pool, func, *args)
+
+    try:
+        yield run
+    finally:
+        others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in others:
+            task.cancel()
+        await asyncio.gather(*others, return_exceptions=True)
+        pool.shutdown()
+
+async def count_files_async(source_dir: Path, dest_dir: Path, fs: LocalFS = None,
+                            in_flight: int = 32, scan_filter: ScanFilter = None):
+    """Equivalente assíncrono de count_files(); retorna (summary, total, extensions)."""
+    fs = fs or LocalFS()
+    ext_counts = {}
+    matched = {}
+    decides = {}
+    root = str(source_dir)
+    # Os arquivos recebem stat para checar os limites de tamanho; senão só
+    # aqueles cuja extensão não decide a regra, para comparar como na execução
+    stat = scan_filter is not None and scan_filter.sized
+    async with thread_runner(in_flight) as run:
+        async for files in iter_files_async(source_dir, dest_dir, fs, run, stat=stat,
+                                            lookahead=in_flight, scan_filter=scan_filter):
+            undecided = []
+            for entry in files:
+                ext = split_extension(entry.name)
+                decided = decides.get(ext)
+                if decided is None:
+                    decided = decides[ext] = RULES.extension_rule(ext) is not None
+                if decided:
+                    ext_counts[ext] = ext_counts.get(ext, 0) + 1
+                elif stat:
+                    # Um FileEntry, já classificado com os dados do stat
+                    ext_counts[ext] = ext_counts.get(ext, 0) + 1
+                    matched[entry.category] = matched.get(entry.category, 0) + 1
+                else:
+                    undecided.append((entry, ext))
+            if not undecided:
+                continue
+            results = await asyncio.gather(
+                *(run(fs.stat, entry) for entry, _ in undecided), return_exceptions=True
+            )
+            for (entry, ext), st in zip(undecided, results):
+                if isinstance(st, OSError):
+                    continue
+                if isinstance(st, BaseException):
+                    raise st
+                rule = RULES.match(entry.name, ext, st.st_size, st.st_mtime, entry.path, root)
+                ext_counts[ext] = ext_counts.get(ext, 0) + 1
+                matched[rule.category] = matched.get(rule.category, 0) + 1
+    return _count_summary(ext_counts, matched)
+
+async def _organize_async(source_dir, dest_dir, fs, in_flight, executor, extensions,
+                          completed, dates=None, types=None, scan_filter=None):
+    """
+    O laço de percurso e transferência de organize_files_async(). A criação
+    e a listagem de pastas começam assim que um arquivo destinado à pasta é encontrado;
+    os arquivos são planejados por um Planner e aplicados pelo Executor na
+    ordem do percurso, como organize_files() faz, com as transferências via fs.
+    Retorna (resumo de arquivos encontrados por categoria, arquivos pulados
+    porque a execução retomada já os tratou).
+
+    A etapa walk é o tempo gasto esperando os arquivos de cada pasta, stat
+    incluído, e mkdir o tempo gasto esperando uma pasta ficar pronta.
+    Com um CaptureDateCache, os cabeçalhos das fotos e vídeos de uma pasta
+    que faltam nele são lidos em paralelo, e o mesmo com um
+    FileTypeCache para os arquivos que precisam de detecção.
+    """
+    recorder = executor.recorder
+    names = recorder.names
+    profiler = recorder.profiler
+    planner = Planner(names, None, executor.action, profiler=profiler)
+    summary = {}
+    folders = {}
+    pending = deque()
+    resumed = 0
+
+    async with thread_runner(in_flight) as run:
+
+        async def prepare(folder):
+            if not executor.dry_run:
+                await run(fs.makedirs, folder)
+            names.add_folder(folder, await run(fs.listdir, folder))
+
+        def folder_for(name):
+            # Retorna a pasta e a tarefa que a prepara, iniciada uma única vez
+            if name not in folders:
+                folder = dest_dir / name
+                folders[name] = (folder, asyncio.ensure_future(prepare(folder)))
+            return folders[name]
+
+        async def capture_times(entries):
+            # Cabeçalhos de arquivos que faltam no cache de datas são lidos em paralelo
+            times = [entry.mtime for entry in entries]
+            if dates is None:
+                return times
+            reads = []
+            for n, entry in enumerate(entries):
+                if not entry.rule.dated:
+                    continue
+                row = dates.cached(entry)
+                if row is None:
+                    reads.append(n)
+                elif row[0] is not None:
+                    times[n] = row[0]
+            found = await asyncio.gather(
+                *(run(fs.capture_time, entries[n].path, dates.sources) for n in reads)
+            )
+            for n, taken in zip(reads, found):
+                dates.store(entries[n], taken)
+                if taken is not None:
+                    times[n] = taken
+            return times
+
+        async def sniff(entries):
+            # Arquivos que faltam no cache de tipos são examinados em paralelo
+            unknown = []
+            for entry in entries:
+                if not needs_sniffing(entry):
+                    continue
+                row = types.cached(entry)
+                if row is None:
+                    unknown.append(entry)
+                elif row[0] is not None:
+                    apply_sniffed_type(entry, row[0])
+            found = await asyncio.gather(*(run(fs.sniff_type, entry.path) for entry in unknown))
+            for entry, ext in zip(unknown, found):
+                types.store(entry, ext)
+                if ext is not None:
+                    apply_sniffed_type(entry, ext)
+
+        async def collect():
+            # Os resultados são coletados na ordem de envio para manter o relatório ordenado
+            transfer, task = pending.popleft()
+            executor.finish(transfer, await task)
+
+        for ext in sorted(extensions):
+            rule = RULES.extension_rule(ext)
+            if rule is not None and not rule.dated:
+                folder_for(rule.folder(ext))
+
+        waited = time.perf_counter()
+        async for files in iter_files_async(source_dir, dest_dir, fs, run,
+                                            lookahead=in_flight, scan_filter=scan_filter):
+            profiler.add("walk", time.perf_counter() - waited)
+            if types is not None:
+                with profiler.stage("sniff"):
+                    await sniff(files)
+            todo = []
+            for entry in files:
+                category = entry.category
+                summary[category] = summary.get(category, 0) + 1
+                if entry.path in completed:
+                    # Tratado antes de a execução anterior ser interrompida
+                    resumed += 1
+                    executor.advance()
+                    continue
+                todo.append(entry)
+            with profiler.stage("dates"):
+                times = await capture_times(todo)
+            batch = []
+            for entry, mtime in zip(todo, times):
+                batch.append((entry, folder_for(planner.target_folder(entry, mtime))))
+
+            for entry, (folder, ready) in batch:
+                with profiler.stage("mkdir"):
+                    await ready
+                op, _ = planner.place(entry, folder)
+                transfer = executor.start(op, entry)
+                if transfer is None:
+                    continue
+                pending.append((transfer, asyncio.ensure_future(run(
+                    fs.transfer, op.source, transfer.target, executor.transfer_options(transfer)
+                ))))
+                # Como em Executor.run(), mas aguardado: no máximo in_flight * 4 pendentes
+                while pending and (len(pending) >= in_flight * 4 or pending[0][1].done()):
+                    await collect()
+            waited = time.perf_counter()
+
+        while pending:
+            await collect()
+        # Pastas criadas de antemão podem não ter recebido nenhum arquivo
+        await asyncio.gather(*(task for _, task in folders.values()))
+    return summary, resumed
+
+def organize_files_async(
     source_dir: Path,
     dest_dir: Path,
     move: bool = True,
     dry_run: bool = False,
-    report_file: Path = None
+    report_file: Path = None,
+    stream: bool = False,
+    link: str = None,
+    buffer_size: int = COPY_BUFFER_SIZE,
+    fadvise: bool = False,
+    resume: bool = False,
+    report_format: str = None,
+    in_flight: int = 32,
+    fs: LocalFS = None,
+    date_source=None,
+    sniff: bool = False,
+    assume_yes: bool = False,
+    scan_filter: ScanFilter = None,
+    profiler: Profiler = None
 ):
     """
-    Organiza arquivos do diretório de origem para o destino.
-    """
-    files_to_process = []
+    Ponto de entrada alternativo a organize_files() para sistemas de arquivos
+    de rede com alta latência, construído sobre asyncio.
 
-    # 1️⃣ Percorrer recursivamente o diretório de origem
-    for root, dirs, files in os.walk(source_dir):
-        # Ignorar a própria pasta de destino
-        dirs[:] = [d for d in dirs if Path(root, d) != dest_dir]
-        for file in files:
-            files_to_process.append(Path(root) / file)
+    Toda chamada bloqueante (listagem, stat, mkdir, mover/copiar) passa por fs
+    e roda em um pool de threads, com até in_flight delas ao mesmo tempo, para que
+    suas idas e voltas se sobreponham em vez de se somarem. A saída é a mesma
+    de organize_files(): mesmos destinos e nomes de colisão, mesmo
+    diário, e o mesmo relatório, linha por linha. dedupe e incremental só
+    existem em organize_files(). Passe um LatencyFS como fs para testá-lo
+    com atrasos de rede simulados, e um Profiler para cronometrar as etapas
+    da execução como organize_files() faz. date_source, sniff, assume_yes e
+    scan_filter funcionam como em organize_files().
+    """
+    started = time.perf_counter()
+    fs = fs or LocalFS()
+    profiler = profiler or Profiler(enabled=False)
+    total = None
+    extensions = ()
 
-    # 2️⃣ Preparar contagem para resumo
-    summary = {}
-    for file_path in files_to_process:
-        category = get_file_category(file_path)
-        summary.setdefault(category, 0)
-        summary[category] += 1
+    # 1️⃣ Contar arquivos por categoria
+    if not stream:
+        with profiler.stage("count"):
+            summary, total, extensions = asyncio.run(
+                count_files_async(source_dir, dest_dir, fs, in_flight, scan_filter)
+            )
 
-    # 3️⃣ Mostrar resumo para o usuário
-    print("\nResumo de arquivos encontrados por categoria:")
-    for cat, count in summary.items():
-        print(f"- {cat}: {count}")
-    print(f"Total: {len(files_to_process)} arquivos\n")
+        # 2️⃣ Mostrar resumo para o usuário
+        print_summary(summary, total)
+    else:
+        print("\nModo streaming: os arquivos serão organizados conforme forem encontrados.")
 
-    # 4️⃣ Confirmar execução
-    proceed = input("Deseja continuar? (s/n): ").lower()
-    if proceed != "s":
-        print("Operação cancelada pelo usuário.")
+    # 3️⃣ Confirmar execução
+    with profiler.stage("prompt"):
+        proceed = confirm(assume_yes)
+    if not proceed:
         return
 
-    # 5️⃣ Processar arquivos com barra de progresso
-    processed_files = []
-    for file_path in tqdm(files_to_process, desc="Organizando", unit="arquivo"):
-        category = get_file_category(file_path)
-        subfolder = get_subfolder_name(file_path, category)
-        target_dir = dest_dir / category / subfolder
-        target_path = target_dir / file_path.name
+    journal = None
+    completed = {}
+    if not dry_run:
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        journal, completed = open_journal(source_dir, dest_dir, move, resume)
+    report = open_report(report_file, report_format)
+    dates = None
+    if date_source and tuple(date_source) != ("mtime",):
+        dates = CaptureDateCache(dest_dir, date_source, persist=not dry_run)
+    types = FileTypeCache(dest_dir, persist=not dry_run) if sniff else None
 
-        if dry_run:
-            # Apenas simulação
-            processed_files.append({
-                "origem": str(file_path),
-                "destino": str(target_path),
-                "acao": "MOVER" if move else "COPIAR"
-            })
-            continue
-
-        result = safe_move_or_copy(file_path, target_path, move=move)
-        if result:
-            processed_files.append({
-                "origem": str(file_path),
-                "destino": str(result),
-                "acao": "MOVER" if move else "COPIAR"
-            })
-
-    # 6️⃣ Gerar relatório opcional
-    if report_file:
-        try:
-            with open(report_file, "w", newline="", encoding="utf-8") as csvfile:
-                fieldnames = ["origem", "destino", "acao"]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                for row in processed_files:
-                    writer.writerow(row)
-            print(f"Relatório salvo em: {report_file}")
-        except Exception as e:
-            print(f"[ERRO] Não foi possível gerar relatório: {e}")
+    # 4️⃣ Percorrer e processar arquivos com barra de progresso
+    progress = tqdm(total=total, desc="Organizando", unit="arquivo")
+    recorder = RunRecorder(NameIndex(), report, journal, profiler=profiler)
+    executor = Executor(
+        recorder, dest_dir, move, link, buffer_size=buffer_size, fadvise=fadvise,
+        dry_run=dry_run, advance=lambda: progress.update(1)
+    )
+    finished = False
+    try:
+        summary, resumed = asyncio.run(_organize_async(
+            source_dir, dest_dir, fs, in_flight, executor, extensions, completed, dates,
+            types, scan_filter
+        ))
+        finished = True
+    finally:
+        progress.close()
+        if dates is not None:
+            dates.close()
+        if types is not None:
+            types.close()
+        if journal is not None:
+            journal.close(op="end" if finished else None)
+        if report is not None:
+            report.close()
+    if resumed:
+        print(f"{resumed} arquivos já tratados pela execução interrompida foram pulados.")
+
+    if stream:
+        print_summary(summary, sum(summary.values()))
+
+    # 5️⃣ Locais do relatório e do diário
+    if report is not None:
+        print(f"Relatório salvo em: {report_file}")
+    if journal is not None:
+        print(f"Diário salvo em: {journal.path}")
 
     print("\nOrganização concluída!")
-    print(f"Tempo total de execução: {time.perf_counter() - start_time:.2f} segundos")
+    print(f"Tempo total de execução: {time.perf_counter() - started:.2f} segundos")
 
 # ----------------------------
 # EXECUÇÃO VIA ARGPARSE
 # ----------------------------
 
+def positive_int(text: str) -> int:
+    """Tipo do argparse para threads, chamadas e buffer: inteiro de pelo menos 1."""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"inteiro inválido: {text!r}")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"deve ser pelo menos 1, não {value}")
+    return value
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Organizador de Arquivos Automático"
     )
     parser.add_argument(
-        "-o", "--origem", required=True, type=Path,
+        "-o", "--origem", type=Path,
         help="Diretório raiz de origem"
     )
     parser.add_argument(
-        "-d", "--destino", required=True, type=Path,
+        "-d", "--destino", type=Path,
         help="Diretório de destino"
     )
     parser.add_argument(
@@ -189,9 +4689,264 @@ def parse_args():
     )
     parser.add_argument(
         "-r", "--report", type=Path,
-        help="Gerar relatório em CSV após execução"
+        help="Escreve um relatório de cada arquivo conforme é processado (JSON Lines se "
+             "o nome terminar em .jsonl, CSV caso contrário; acrescente .gz para compactar)"
+    )
+    parser.add_argument(
+        "--report-format", choices=REPORT_FORMATS,
+        help="Formato do relatório, substituindo o indicado pelo nome do arquivo"
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Organizar arquivos conforme são encontrados, sem a pré-contagem"
+    )
+    parser.add_argument(
+        "--workers", type=positive_int, default=1,
+        help="Número de threads movendo/copiando arquivos em paralelo"
+    )
+    parser.add_argument(
+        "--per-device", type=positive_int,
+        help="Máximo de transferências simultâneas por dispositivo de origem/destino"
+    )
+    parser.add_argument(
+        "--dedupe", choices=["skip", "hardlink", "report"],
+        help="Detectar arquivos com conteúdo idêntico: pulá-los, criar hardlink "
+             "para a primeira cópia, ou só marcá-los no relatório"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Manter um índice no destino para que novas execuções pulem "
+             "arquivos já organizados"
+    )
+    parser.add_argument(
+        "--link", choices=["hard", "reflink", "symlink"],
+        help="Em vez de copiar, criar hard links, clones copy-on-write ou "
+             "links simbólicos (volta à cópia onde não houver suporte)"
+    )
+    parser.add_argument(
+        "--buffer-size", type=positive_int, default=COPY_BUFFER_SIZE // 1024,
+        help="Buffer de cópia em KiB, usado quando o kernel não consegue copiar sozinho"
+    )
+    parser.add_argument(
+        "--fadvise", action="store_true",
+        help="Indica leitura sequencial e descarta arquivos copiados do cache de páginas"
+    )
+    parser.add_argument(
+        "--scan-threads", type=positive_int, default=1,
+        help="Threads listando pastas de origem em paralelo (os arquivos são então "
+             "processados sem ordem fixa)"
+    )
+    parser.add_argument(
+        "--date-source", nargs="+", choices=DATE_SOURCES, default=["mtime"],
+        help="De onde Imagens e Videos tiram o ano, tentado em ordem: "
+             "exif (JPEG/HEIC), container (cabeçalho MP4/MOV) ou mtime, que é "
+             "também o último recurso; datas dos cabeçalhos ficam em cache no destino"
+    )
+    parser.add_argument(
+        "--sniff", action="store_true",
+        help="Classifica arquivos de extensão desconhecida ou sem extensão pelo número "
+             "mágico no início do conteúdo (resultados ficam em cache no "
+             "destino)"
+    )
+    parser.add_argument(
+        "--rules", type=Path, metavar="JSON",
+        help="Classifica arquivos com as regras deste arquivo, olhando "
+             "extensão, glob do nome, caminho, tamanho e idade, com pastas de "
+             "destino como {category}/{year}/{month}; as regras embutidas vêm depois"
+    )
+    parser.add_argument(
+        "--exclude", action="append", default=[], metavar="PADRAO",
+        help=f"Deixa de fora arquivos e pastas que casam com este glob: um nome, um "
+             f"caminho relativo à origem se tiver /, só pastas se terminar em "
+             f"/. Pastas excluídas nunca são listadas. Pode repetir; os "
+             f"padrões do {IGNORE_FILE} no topo da origem são somados"
+    )
+    parser.add_argument(
+        "--include", action="append", default=[], metavar="PADRAO",
+        help="Só organiza arquivos que casam com um destes globs (pode repetir)"
+    )
+    parser.add_argument(
+        "--max-depth", type=int, metavar="N",
+        help="Não desce mais de N pastas abaixo da origem (0: só os "
+             "arquivos direto nela)"
+    )
+    parser.add_argument(
+        "--min-size", metavar="TAMANHO",
+        help="Pula arquivos menores que isto, em bytes ou como 10K, 5M, 1G"
+    )
+    parser.add_argument(
+        "--max-size", metavar="TAMANHO",
+        help="Pula arquivos maiores que isto, em bytes ou como 10K, 5M, 1G"
+    )
+    parser.add_argument(
+        "--skip-hidden", action="store_true",
+        help="Pula arquivos e pastas ocultos (nomes começando com ponto)"
+    )
+    parser.add_argument(
+        "--pack-under", metavar="TAMANHO",
+        help="Empacota arquivos menores que TAMANHO (bytes, ou como 64K, 1M) em "
+             "um tar por pasta de destino em vez de movê-los/copiá-los um a "
+             "um; o relatório dá o pacote e o membro de cada arquivo"
+    )
+    parser.add_argument(
+        "--pack-compression", choices=list(PACK_SUFFIXES), default="none",
+        help="Compressão dos pacotes de --pack-under (zstd precisa do "
+             "módulo zstandard)"
+    )
+    parser.add_argument(
+        "--engine", choices=["threads", "async"], default="threads",
+        help="Motor do organizador: threads, ou async para sobrepor muitas chamadas "
+             "ao sistema de arquivos (para montagens de rede com alta latência)"
+    )
+    parser.add_argument(
+        "--in-flight", type=positive_int, default=32,
+        help="Máximo de chamadas ao sistema de arquivos em andamento com --engine async"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0,
+        help="Soma um atraso simulado em milissegundos a cada chamada ao sistema de arquivos "
+             "do --engine async, para testá-lo como se estivesse em uma montagem de rede"
+    )
+    parser.add_argument(
+        "--profile", type=Path, metavar="JSON",
+        help="Cronometra cada etapa da execução e a vazão por categoria, "
+             "e salva o resumo neste arquivo JSON"
+    )
+    parser.add_argument(
+        "--profile-cpu", type=Path, metavar="FILE",
+        help="Salva um dump do cProfile da execução (leia com python -m pstats)"
+    )
+    parser.add_argument(
+        "--profile-memory", action="store_true",
+        help="Adiciona ao --profile o pico e os maiores pontos de alocação do tracemalloc"
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="Continua rodando e organiza arquivos novos conforme aparecem (inotify no "
+             "Linux, verificação periódica nos demais); Ctrl-C para"
+    )
+    parser.add_argument(
+        "--watch-poll", type=float, metavar="SEGUNDOS",
+        help="Com --watch, verifica a cada SEGUNDOS segundos em vez de usar o inotify"
+    )
+    parser.add_argument(
+        "--settle", type=float, default=WATCH_SETTLE, metavar="SEGUNDOS",
+        help=f"Com --watch, quanto tempo um arquivo deve ficar sem mudar antes de ser "
+             f"organizado (padrão: {WATCH_SETTLE:g})"
+    )
+    parser.add_argument(
+        "-y", "--yes", action="store_true",
+        help="Não pede confirmação (para execuções sem ninguém olhando)"
+    )
+    parser.add_argument(
+        "--save-plan", type=Path, metavar="PLANO",
+        help="Só calcula o que seria feito e grava isso num arquivo de plano "
+             "(JSON Lines, .gz para compactar); nenhum arquivo é alterado"
+    )
+    parser.add_argument(
+        "--execute-plan", type=Path, metavar="PLANO",
+        help="Aplica um plano gravado com --save-plan"
+    )
+    parser.add_argument(
+        "--shard", metavar="I/N",
+        help="Organiza só a fatia I de N da origem, para que N processos a "
+             "dividam; os nomes são reservados no disco e as fatias nunca colidem"
+    )
+    parser.add_argument(
+        "--shard-by", choices=SHARD_MODES, default="path",
+        help="Divide a origem pelo caminho do arquivo (fatias iguais) ou pela "
+             "pasta de primeiro nível (cada fatia só lista as suas pastas)"
+    )
+    parser.add_argument(
+        "--merge-reports", type=Path, nargs="+", metavar="RELATORIO",
+        help="Junta estes relatórios (ex.: um por fatia) no arquivo de "
+             "-r/--report e sai"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Continua a execução interrompida registrada no diário do destino"
+    )
+    parser.add_argument(
+        "--undo", type=Path, metavar="JOURNAL",
+        help="Desfaz a execução registrada em um arquivo de diário e sai"
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.merge_reports:
+        if args.report is None:
+            parser.error("--merge-reports exige -r/--report")
+        missing = [str(path) for path in args.merge_reports if not path.is_file()]
+        if missing:
+            parser.error(f"relatório não encontrado: {', '.join(missing)}")
+        return args
+    if args.rules is not None:
+        try:
+            args.rules = RuleSet.load(args.rules)
+        except (OSError, ValueError) as e:
+            parser.error(f"--rules: {e}")
+    if (args.undo is None and args.execute_plan is None
+            and (args.origem is None or args.destino is None)):
+        parser.error("os seguintes argumentos são obrigatórios: -o/--origem, -d/--destino")
+    filters = (args.exclude or args.include or args.max_depth is not None
+               or args.min_size is not None or args.max_size is not None or args.skip_hidden)
+    args.scan_filter = None
+    if args.undo is not None or args.execute_plan is not None:
+        if filters:
+            parser.error("--exclude, --include, --max-depth, --min-size, --max-size e "
+                         "--skip-hidden não valem para --execute-plan nem --undo")
+    else:
+        if args.max_depth is not None and args.max_depth < 0:
+            parser.error("--max-depth não pode ser negativo")
+        try:
+            min_size = None if args.min_size is None else parse_size(args.min_size)
+            max_size = None if args.max_size is None else parse_size(args.max_size)
+        except ValueError as e:
+            parser.error(f"--min-size/--max-size: {e}")
+        try:
+            args.scan_filter = ScanFilter.for_source(
+                args.origem.resolve(), args.exclude, args.include, args.max_depth,
+                min_size, max_size, args.skip_hidden
+            )
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    if args.shard is not None:
+        try:
+            args.shard = Shard.parse(args.shard, args.shard_by)
+        except ValueError as e:
+            parser.error(f"--shard: {e}")
+        if args.engine == "async" or args.watch or args.execute_plan or args.undo:
+            parser.error("--shard não pode ser combinado com --engine async, --watch, "
+                         "--execute-plan ou --undo")
+        if args.incremental and args.shard.by != "top":
+            parser.error("--incremental com --shard exige --shard-by top")
+    if args.save_plan is not None and args.execute_plan is not None:
+        parser.error("--save-plan e --execute-plan não podem ser usados juntos")
+    if (args.save_plan or args.execute_plan) and (args.engine == "async" or args.incremental):
+        parser.error("planos não estão disponíveis com --engine async ou --incremental")
+    if args.watch and (args.dry_run or args.dedupe or args.resume or args.engine == "async"
+                       or args.save_plan or args.execute_plan or args.undo):
+        parser.error("--watch não pode ser combinado com --dry-run, --dedupe, --resume, "
+                     "--engine async, planos ou --undo")
+    if args.engine == "async" and (args.dedupe or args.incremental):
+        parser.error("--dedupe e --incremental não estão disponíveis com --engine async")
+    if args.profile_memory and args.profile is None:
+        parser.error("--profile-memory exige --profile")
+    if args.pack_under is not None:
+        try:
+            args.pack_under = parse_size(args.pack_under)
+        except ValueError as e:
+            parser.error(f"--pack-under: {e}")
+        if args.pack_under > Packer.MAX_BYTES:
+            # Arquivos maiores ocupariam cada um um pacote próprio
+            parser.error(f"--pack-under não pode passar de {Packer.MAX_BYTES} bytes (1G)")
+        if (args.engine == "async" or args.watch or args.save_plan or args.execute_plan
+                or args.undo or args.dedupe or args.link):
+            parser.error("--pack-under não pode ser combinado com --engine async, --watch, "
+                         "planos, --undo, --dedupe ou --link")
+        if args.pack_compression == "zstd" and zstandard is None:
+            parser.error("--pack-compression zstd requer o módulo zstandard")
+    elif args.pack_compression != "none":
+        parser.error("--pack-compression requer --pack-under")
+    return args
 
 # ----------------------------
 # PONTO DE ENTRADA
@@ -199,11 +4954,139 @@ def parse_args():
 
 if __name__ == "__main__":
     args = parse_args()
-    start_time = time.perf_counter()
-    organize_files(
-        source_dir=args.origem.resolve(),
-        dest_dir=args.destino.resolve(),
-        move=not args.copia,
-        dry_run=args.dry_run,
-        report_file=args.report.resolve() if args.report else None
-    )
\ No newline at end of file
+    if args.rules is not None:
+        use_rules(args.rules)
+    profiler = None
+    if args.profile or args.profile_cpu:
+        profiler = Profiler(cpu_file=args.profile_cpu, memory=args.profile_memory)
+    with profiler or nullcontext():
+        if args.merge_reports:
+            rows = merge_reports(
+                [path.resolve() for path in args.merge_reports],
+                args.report.resolve(), args.report_format
+            )
+            if rows is not None:
+                print(f"{rows} linhas de {len(args.merge_reports)} relatórios juntadas "
+                      f"em {args.report.resolve()}")
+        elif args.undo is not None:
+            undo_journal(args.undo.resolve(), assume_yes=args.yes)
+        elif args.execute_plan is not None:
+            plan = Plan.load(args.execute_plan.resolve())
+            print(f"\nPlano de {plan.created}: {plan.source_dir} -> {plan.dest_dir}")
+            print_summary(plan.summary(), len(plan.ops))
+            if confirm(args.yes):
+                result = execute_plan(
+                    plan,
+                    workers=args.workers,
+                    per_device=args.per_device,
+                    report_file=args.report.resolve() if args.report else None,
+                    report_format=args.report_format,
+                    buffer_size=args.buffer_size * 1024,
+                    fadvise=args.fadvise,
+                    resume=args.resume,
+                    progress=True,
+                    profiler=profiler
+                )
+                print(f"{result['done']} arquivos organizados, {result['failed']} com falha, "
+                      f"{result['skipped']} pulados.")
+                if args.report:
+                    print(f"Relatório salvo em: {args.report.resolve()}")
+                print(f"Diário salvo em: {result['journal']}")
+        elif args.save_plan is not None:
+            plan = make_plan(
+                source_dir=args.origem.resolve(),
+                dest_dir=args.destino.resolve(),
+                move=not (args.copia or args.link),
+                link=args.link,
+                dedupe=args.dedupe,
+                scan_threads=args.scan_threads,
+                date_source=args.date_source,
+                sniff=args.sniff,
+                shard=args.shard,
+                scan_filter=args.scan_filter,
+                profiler=profiler
+            )
+            plan.save(args.save_plan)
+            print_summary(plan.summary(), len(plan.ops))
+            print(f"Plano salvo em: {args.save_plan}")
+        elif args.watch:
+            print(f"\nOs arquivos de {args.origem.resolve()} serão organizados em "
+                  f"{args.destino.resolve()} conforme aparecerem.")
+            if confirm(args.yes):
+                result = watch_files(
+                    source_dir=args.origem.resolve(),
+                    dest_dir=args.destino.resolve(),
+                    move=not (args.copia or args.link),
+                    link=args.link,
+                    incremental=args.incremental,
+                    report_file=args.report.resolve() if args.report else None,
+                    report_format=args.report_format,
+                    buffer_size=args.buffer_size * 1024,
+                    fadvise=args.fadvise,
+                    date_source=args.date_source,
+                    sniff=args.sniff,
+                    settle=args.settle,
+                    poll_interval=args.watch_poll,
+                    scan_filter=args.scan_filter,
+                    profiler=profiler
+                )
+                print(f"{result['done']} arquivos organizados, {result['failed']} com falha.")
+                if args.report:
+                    print(f"Relatório salvo em: {args.report.resolve()}")
+                print(f"Diário salvo em: {result['journal']}")
+        elif args.engine == "async":
+            organize_files_async(
+                source_dir=args.origem.resolve(),
+                dest_dir=args.destino.resolve(),
+                move=not (args.copia or args.link),
+                dry_run=args.dry_run,
+                report_file=args.report.resolve() if args.report else None,
+                stream=args.stream,
+                link=args.link,
+                buffer_size=args.buffer_size * 1024,
+                fadvise=args.fadvise,
+                resume=args.resume,
+                report_format=args.report_format,
+                in_flight=args.in_flight,
+                fs=LatencyFS(args.latency / 1000) if args.latency else None,
+                date_source=args.date_source,
+                sniff=args.sniff,
+                assume_yes=args.yes,
+                scan_filter=args.scan_filter,
+                profiler=profiler
+            )
+        else:
+            organize_files(
+                source_dir=args.origem.resolve(),
+                dest_dir=args.destino.resolve(),
+                move=not (args.copia or args.link),
+                dry_run=args.dry_run,
+                report_file=args.report.resolve() if args.report else None,
+                stream=args.stream,
+                workers=args.workers,
+                per_device=args.per_device,
+                dedupe=args.dedupe,
+                incremental=args.incremental,
+                link=args.link,
+                buffer_size=args.buffer_size * 1024,
+                fadvise=args.fadvise,
+                resume=args.resume,
+                report_format=args.report_format,
+                scan_threads=args.scan_threads,
+                date_source=args.date_source,
+                sniff=args.sniff,
+                assume_yes=args.yes,
+                shard=args.shard,
+                scan_filter=args.scan_filter,
+                pack_under=args.pack_under,
+                pack_compression=args.pack_compression,
+                profiler=profiler
+            )
+    if profiler is not None:
+        profile = profiler.summary()
+        print_profile(profile)
+        if args.profile:
+            profiler.write(args.profile)
+            print(f"Perfil salvo em: {args.profile}")
+        if args.profile_cpu:
+            print(f"Perfil de CPU salvo em: {args.profile_cpu}")
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Verificações de regressão do maestro
+
+Cada verificação recria, numa pasta temporária, um caso que já quebrou o
+maestro.py e confere que ele continua resolvido. Rode sem argumentos para
+todas, ou passe os nomes das que quer (veja --lista). Sai com código 1 se
+alguma falhar.
+"""
+
+import io
+import os
+import csv
+import asyncio
+import sys
+import shutil
+import struct
+import tempfile
+import argparse
+import traceback
+from pathlib import Path
+
+PASTA = Path(__file__).resolve().parent
+sys.path.insert(0, str(PASTA))
+import maestro
+
+
+def plano_com_muitas_categorias(pasta: Path):
+    """Um plano com mais de 256 categorias é salvo e carregado igual."""
+    quantidade = 300
+    origem = pasta / "origem"
+    origem.mkdir()
+    for n in range(quantidade):
+        (origem / f"arquivo_{n}.e{n}").write_bytes(b"x")
+    regras = [maestro.Rule(f"Categoria_{n}", extensions=[f".e{n}"]) for n in range(quantidade)]
+    embutidas = maestro.RULES
+    maestro.use_rules(maestro.RuleSet(regras + maestro.default_rules()))
+    try:
+        plano = maestro.make_plan(origem, pasta / "destino")
+    finally:
+        maestro.use_rules(embutidas)
+    assert len(plano.summary()) == quantidade, len(plano.summary())
+    arquivo = pasta / "plano.jsonl"
+    plano.save(arquivo)
+    carregado = maestro.Plan.load(arquivo)
+    assert carregado.ops == plano.ops
+    assert carregado.summary() == plano.summary()
+
+
+def _exif(data: str) -> bytes:
+    """Um segmento Exif cujo TIFF só tem a tag DateTime (0x0132) com data."""
+    texto = data.encode("ascii") + b"\0"
+    tiff = b"II*\0" + struct.pack("<IHHHII", 8, 1, 0x0132, 2, len(texto), 26)
+    return b"Exif\0\0" + tiff + struct.pack("<I", 0) + texto
+
+
+class LeituraVigiada(io.BytesIO):
+    """BytesIO que guarda o tamanho de cada read() e os saltos de cada seek()."""
+
+    def __init__(self, dados: bytes):
+        super().__init__(dados)
+        self.leituras = []
+        self.saltos = []
+
+    def read(self, tamanho=-1):
+        self.leituras.append(tamanho)
+        return super().read(tamanho)
+
+    def seek(self, posicao, de=0):
+        if de == 1:
+            self.saltos.append(posicao)
+        return super().seek(posicao, de)
+
+
+def jpeg_com_tamanho_corrompido(pasta: Path):
+    """Um segmento JPEG com tamanho menor que 2 não faz ler nem voltar no arquivo."""
+    exif = _exif("2020:01:02 03:04:05")
+    valido = b"\xff\xd8\xff\xe1" + struct.pack(">H", len(exif) + 2) + exif
+    arquivo = pasta / "valido.jpg"
+    arquivo.write_bytes(valido + b"\xff\xd9")
+    assert maestro.read_capture_time(arquivo, ("exif",)) is not None
+    for marcador in (b"\xff\xe1", b"\xff\xe0"):
+        for tamanho in (0, 1):
+            # Sem a verificação, tamanho - 2 é negativo: o APP1 pedia um read()
+            # negativo (o arquivo inteiro) e os outros segmentos um seek() para trás
+            dados = b"\xff\xd8" + marcador + struct.pack(">H", tamanho) + exif + bytes(200000)
+            arquivo = pasta / f"segmento_{marcador[1]:x}_{tamanho}.jpg"
+            arquivo.write_bytes(dados)
+            assert maestro.read_capture_time(arquivo, ("exif",)) is None, arquivo.name
+            f = LeituraVigiada(dados)
+            assert maestro._jpeg_exif_date(f) is None, arquivo.name
+            assert all(0 <= n <= 64 * 1024 for n in f.leituras), (arquivo.name, f.leituras)
+            assert all(n >= 0 for n in f.saltos), (arquivo.name, f.saltos)
+
+
+def duplicado_de_execucao_anterior(pasta: Path):
+    """Com incremental, um duplicado de arquivo organizado antes é detectado."""
+    origem = pasta / "origem"
+    (origem / "a").mkdir(parents=True)
+    conteudo = bytes(range(256)) * 400
+    (origem / "a" / "original.bin").write_bytes(conteudo)
+    (origem / "a" / "outro.bin").write_bytes(b"y" * 1000)
+    destino = pasta / "destino"
+    opcoes = dict(move=False, dedupe="skip", incremental=True, assume_yes=True)
+    maestro.organize_files(origem, destino, **opcoes)
+    # O original é pulado por não ter mudado, mas continua valendo como original
+    (origem / "b").mkdir()
+    (origem / "b" / "copia.bin").write_bytes(conteudo)
+    relatorio = pasta / "relatorio.csv"
+    maestro.organize_files(origem, destino, report_file=relatorio, **opcoes)
+    with open(relatorio, newline="", encoding="utf-8") as f:
+        acoes = [linha["acao"] for linha in csv.DictReader(f)]
+    assert acoes == ["DUPLICADO"], acoes
+    assert len(list(destino.rglob("*.bin"))) == 2
+
+
+def resumo_com_regras_condicionais(pasta: Path):
+    """O resumo da pré-contagem usa as mesmas regras que a organização."""
+    origem = pasta / "origem"
+    (origem / "a" / "b").mkdir(parents=True)
+    for n in range(4):
+        (origem / f"foto_{n}.jpg").write_bytes(b"x" * (10 if n < 2 else 5000))
+    (origem / "rascunho.txt").write_bytes(b"x")
+    (origem / "a" / "b" / "nota.txt").write_bytes(b"x")
+    regras = [
+        maestro.Rule("Miniaturas", extensions=[".jpg"], max_size=100),
+        maestro.Rule("Rascunhos", globs=["rascunho*"]),
+        maestro.Rule("Fundo", paths=["a/b"]),
+    ]
+    embutidas = maestro.RULES
+    maestro.use_rules(maestro.RuleSet(regras + maestro.default_rules()))
+    try:
+        esperado = {}
+        for arquivo in maestro.iter_files(origem, pasta / "destino"):
+            esperado[arquivo.category] = esperado.get(arquivo.category, 0) + 1
+        resumo, total, _ = maestro.count_files(origem, pasta / "destino")
+        assincrono, _, _ = asyncio.run(maestro.count_files_async(origem, pasta / "destino"))
+    finally:
+        maestro.use_rules(embutidas)
+    assert esperado == {"Miniaturas": 2, "Imagens": 2, "Rascunhos": 1, "Fundo": 1}, esperado
+    assert resumo == esperado and total == 6, resumo
+    assert assincrono == esperado, assincrono
+
+
+def pacote_interrompido_ao_registrar(pasta: Path):
+    """Uma queda entre as linhas "done" de um pacote não perde arquivos ao retomar."""
+    origem = pasta / "origem"
+    origem.mkdir()
+    conteudos = {f"f{n}.txt": f"arquivo {n}".encode() for n in range(1, 6)}
+    for nome, conteudo in conteudos.items():
+        (origem / nome).write_bytes(conteudo)
+    destino = pasta / "destino"
+    opcoes = dict(move=True, pack_under=1024, assume_yes=True)
+    original = maestro.Journal.done
+    empacotados = []
+
+    def done(journal, source, target, action, member=None):
+        if action == "EMPACOTAR":
+            empacotados.append(source)
+            if len(empacotados) == 3:
+                raise RuntimeError("queda simulada")
+        return original(journal, source, target, action, member)
+
+    maestro.Journal.done = done
+    try:
+        maestro.organize_files(origem, destino, **opcoes)
+        raise AssertionError("a queda simulada não aconteceu")
+    except RuntimeError:
+        pass
+    finally:
+        maestro.Journal.done = original
+    maestro.organize_files(origem, destino, resume=True, **opcoes)
+    assert not list(origem.iterdir()), list(origem.iterdir())
+    empacotado = {}
+    for pacote in destino.rglob(maestro.PACK_PREFIX + "*"):
+        with maestro.read_pack(pacote) as tar:
+            for info in tar:
+                empacotado[info.name] = tar.extractfile(info).read()
+    assert empacotado == conteudos, sorted(empacotado)
+    diario = max(destino.glob(maestro.Journal.PREFIX + "*"))
+    maestro.undo_journal(diario, assume_yes=True)
+    assert {f.name: f.read_bytes() for f in origem.iterdir()} == conteudos
+    assert not list(destino.rglob(maestro.PACK_PREFIX + "*"))
+
+
+def pacote_desfeito_com_mtime_exato(pasta: Path):
+    """Desfazer um move empacotado devolve o mtime exato, frações de segundo inclusive."""
+    origem = pasta / "origem"
+    origem.mkdir()
+    esperado = {}
+    for n, mtime_ns in enumerate((1_600_000_000_123_456_789, 1_600_000_000_999_999_999)):
+        arquivo = origem / f"f{n}.txt"
+        arquivo.write_bytes(b"x")
+        os.utime(arquivo, ns=(mtime_ns, mtime_ns))
+        esperado[arquivo.name] = arquivo.stat().st_mtime_ns
+    destino = pasta / "destino"
+    maestro.organize_files(origem, destino, move=True, pack_under=1024, assume_yes=True)
+    assert not list(origem.iterdir())
+    maestro.undo_journal(max(destino.glob(maestro.Journal.PREFIX + "*")), assume_yes=True)
+    obtido = {arquivo.name: arquivo.stat().st_mtime_ns for arquivo in origem.iterdir()}
+    assert obtido == esperado, obtido
+
+
+# Nome -> verificação; cada uma recebe uma pasta temporária vazia
+VERIFICACOES = {
+    "plano-categorias": plano_com_muitas_categorias,
+    "jpeg-tamanho": jpeg_com_tamanho_corrompido,
+    "duplicado-incremental": duplicado_de_execucao_anterior,
+    "resumo-regras": resumo_com_regras_condicionais,
+    "pacote-retomado": pacote_interrompido_ao_registrar,
+    "pacote-mtime": pacote_desfeito_com_mtime_exato,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificações de regressão do maestro")
+    parser.add_argument("nomes", nargs="*", help="Verificações a rodar (padrão: todas)")
+    parser.add_argument("--lista", action="store_true", help="Lista as verificações e sai")
+    args = parser.parse_args()
+
+    if args.lista:
+        for nome, verificacao in VERIFICACOES.items():
+            print(f"{nome:<24}{verificacao.__doc__}")
+        return
+    desconhecidas = [nome for nome in args.nomes if nome not in VERIFICACOES]
+    if desconhecidas:
+        parser.error(f"verificação desconhecida: {', '.join(desconhecidas)}")
+
+    falhas = 0
+    for nome in args.nomes or VERIFICACOES:
+        pasta = Path(tempfile.mkdtemp(prefix="maestro_verifica_"))
+        try:
+            VERIFICACOES[nome](pasta)
+            print(f"ok     {nome}")
+        except Exception:
+            falhas += 1
+            print(f"FALHOU {nome}")
+            traceback.print_exc()
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == "__main__":
+    main()